@@ -0,0 +1,424 @@
+# Tabelas de resumo mantidas incrementalmente para as perguntas de agregação mais comuns (saldo por cliente,
+# totais diários por tipo de movimentação e totais mensais de pagamentos).
+#
+# Cada resumo guarda, por tabela de origem, a marca d'água (maior id auto-incremento já somado) em
+# resumo_marcas_dagua. A atualização soma apenas as linhas novas (id > marca) em lotes; cada lote aplica o
+# upsert e avança a marca na mesma transação, então uma interrupção não conta nada duas vezes.
+#
+# A marca não vai direto ao MAX(id): o InnoDB reserva o id no INSERT, mas as transações podem confirmar fora de
+# ordem. Cada passada anota uma candidata (MAX(id) e o instante da leitura) e só a consome quando nenhuma
+# transação que escrevia naquele instante continua ativa (information_schema.INNODB_TRX) ou, sem privilégio
+# para ler essa tabela, depois de uma janela de segurança.
+# UPDATE/DELETE em linhas já somadas são vistos por gatilhos que marcam o resumo como sujo; a próxima
+# atualização o reconstrói. Só resumos limpos, verificados há pouco e com a marca perto do MAX(id) entram no prompt.
+#
+# Uso:
+#     python agregados.py                     (cria o que faltar e atualiza tudo)
+#     python agregados.py --intervalo 60      (atualiza a cada 60s)
+#     python agregados.py --reconstruir resumo_saldo_cliente
+import os
+import time
+import argparse
+import threading
+from dotenv import load_dotenv
+from pool_conexoes import conexao_mysql
+
+LOTE_IDS = int(os.getenv("QUERYFLOW_RESUMOS_LOTE", "500000"))  # faixa de ids somada por transação
+JANELA_S = int(os.getenv("QUERYFLOW_RESUMOS_JANELA_S", "300"))  # atraso da marca quando INNODB_TRX não pode ser lida
+MAX_ATRASO_S = int(os.getenv("QUERYFLOW_RESUMOS_MAX_ATRASO_S", "900"))  # resumo não verificado há mais que isso sai do prompt
+MAX_PENDENTES = int(os.getenv("QUERYFLOW_RESUMOS_MAX_PENDENTES", "10000"))  # ids da origem ainda não somados tolerados no prompt
+VALIDADE_DICAS_S = 30.0  # o motor relê o estado dos resumos no máximo a cada 30s
+# tipo_movimentacao que entra no saldo com sinal positivo; os demais (saque, transferência) são saídas
+TIPOS_ENTRADA = tuple(t.strip() for t in os.getenv("QUERYFLOW_TIPOS_ENTRADA", "depósito").split(",") if t.strip())
+
+DDL_MARCAS = """
+    CREATE TABLE IF NOT EXISTS resumo_marcas_dagua (
+        resumo VARCHAR(64) NOT NULL,
+        tabela_origem VARCHAR(64) NOT NULL,
+        ultimo_id BIGINT NOT NULL DEFAULT 0,
+        atualizado_em TIMESTAMP NULL,
+        pendente_id BIGINT NULL,
+        pendente_em DATETIME NULL,
+        sujo TINYINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (resumo, tabela_origem)
+    )"""
+# atualizado_em: última passada completa; pendente_id/pendente_em: candidata à próxima marca;
+# sujo: uma linha já somada mudou (UPDATE/DELETE), o resumo precisa ser reconstruído
+COLUNAS_NOVAS_MARCAS = {
+    "pendente_id": "ADD COLUMN pendente_id BIGINT NULL",
+    "pendente_em": "ADD COLUMN pendente_em DATETIME NULL",
+    "sujo": "ADD COLUMN sujo TINYINT NOT NULL DEFAULT 0",
+}
+
+# Gatilhos por tabela de origem: qualquer UPDATE/DELETE numa linha abaixo da marca suja os resumos que a somaram
+DDL_GATILHO = """
+    CREATE TRIGGER {nome} AFTER {evento} ON {tabela} FOR EACH ROW
+        UPDATE resumo_marcas_dagua SET sujo = 1
+        WHERE tabela_origem = '{tabela}' AND sujo = 0 AND ultimo_id >= OLD.{coluna_id}"""
+
+_CASO_ENTRADA = "tipo_movimentacao IN ({tipos})"
+
+# resumo -> DDL, dica para o prompt e uma fonte por tabela de origem: (tabela, coluna_id, upsert da faixa de ids)
+# Os upserts recebem (id_inicial_exclusivo, id_final_inclusivo) e somam ao que já existe na tabela de resumo.
+RESUMOS = {
+    "resumo_saldo_cliente": {
+        "ddl": """
+            CREATE TABLE IF NOT EXISTS resumo_saldo_cliente (
+                cliente_id INT PRIMARY KEY,
+                entradas DECIMAL(16, 2) NOT NULL DEFAULT 0,
+                saidas DECIMAL(16, 2) NOT NULL DEFAULT 0,
+                pagamentos DECIMAL(16, 2) NOT NULL DEFAULT 0,
+                saldo DECIMAL(16, 2) AS (entradas - saidas - pagamentos) STORED,
+                INDEX idx_resumo_saldo (saldo)
+            )""",
+        "dica": "Para saldo de clientes, use a tabela resumo_saldo_cliente (cliente_id, entradas, saidas, pagamentos e "
+                "saldo já calculado) em vez de somar as movimentações e os pagamentos",
+        "fontes": [
+            ("movimentacoes", "movimentacao_id", """
+                INSERT INTO resumo_saldo_cliente (cliente_id, entradas, saidas)
+                SELECT * FROM (
+                    SELECT cliente_id,
+                           SUM(CASE WHEN {entrada} THEN valor ELSE 0 END) AS entradas,
+                           SUM(CASE WHEN {entrada} THEN 0 ELSE valor END) AS saidas
+                    FROM movimentacoes
+                    WHERE movimentacao_id > %s AND movimentacao_id <= %s AND cliente_id IS NOT NULL AND valor IS NOT NULL
+                    GROUP BY cliente_id
+                ) AS novo
+                ON DUPLICATE KEY UPDATE entradas = resumo_saldo_cliente.entradas + novo.entradas,
+                                        saidas = resumo_saldo_cliente.saidas + novo.saidas"""),
+            ("pagamentos", "pagamento_id", """
+                INSERT INTO resumo_saldo_cliente (cliente_id, pagamentos)
+                SELECT * FROM (
+                    SELECT cliente_id, SUM(valor) AS pagamentos
+                    FROM pagamentos
+                    WHERE pagamento_id > %s AND pagamento_id <= %s AND cliente_id IS NOT NULL AND valor IS NOT NULL
+                    GROUP BY cliente_id
+                ) AS novo
+                ON DUPLICATE KEY UPDATE pagamentos = resumo_saldo_cliente.pagamentos + novo.pagamentos"""),
+        ],
+    },
+    "resumo_movimentacoes_dia": {
+        "ddl": """
+            CREATE TABLE IF NOT EXISTS resumo_movimentacoes_dia (
+                data_movimentacao DATE NOT NULL,
+                tipo_movimentacao VARCHAR(50) NOT NULL,
+                quantidade BIGINT NOT NULL DEFAULT 0,
+                valor_total DECIMAL(16, 2) NOT NULL DEFAULT 0,
+                PRIMARY KEY (data_movimentacao, tipo_movimentacao)
+            )""",
+        "dica": "Para totais de movimentações por dia, mês, ano ou tipo_movimentacao, agregue a tabela "
+                "resumo_movimentacoes_dia (quantidade e valor_total por data_movimentacao e tipo_movimentacao)",
+        "fontes": [
+            ("movimentacoes", "movimentacao_id", """
+                INSERT INTO resumo_movimentacoes_dia (data_movimentacao, tipo_movimentacao, quantidade, valor_total)
+                SELECT * FROM (
+                    SELECT data_movimentacao, tipo_movimentacao, COUNT(*) AS quantidade, COALESCE(SUM(valor), 0) AS valor_total
+                    FROM movimentacoes
+                    WHERE movimentacao_id > %s AND movimentacao_id <= %s
+                      AND data_movimentacao IS NOT NULL AND tipo_movimentacao IS NOT NULL
+                    GROUP BY data_movimentacao, tipo_movimentacao
+                ) AS novo
+                ON DUPLICATE KEY UPDATE quantidade = resumo_movimentacoes_dia.quantidade + novo.quantidade,
+                                        valor_total = resumo_movimentacoes_dia.valor_total + novo.valor_total"""),
+        ],
+    },
+    "resumo_pagamentos_mes": {
+        "ddl": """
+            CREATE TABLE IF NOT EXISTS resumo_pagamentos_mes (
+                mes CHAR(7) NOT NULL PRIMARY KEY,
+                quantidade BIGINT NOT NULL DEFAULT 0,
+                valor_total DECIMAL(16, 2) NOT NULL DEFAULT 0
+            )""",
+        "dica": "Para totais de pagamentos por mês ou ano, use a tabela resumo_pagamentos_mes "
+                "(mes no formato 'AAAA-MM', quantidade e valor_total)",
+        "fontes": [
+            ("pagamentos", "pagamento_id", """
+                INSERT INTO resumo_pagamentos_mes (mes, quantidade, valor_total)
+                SELECT * FROM (
+                    SELECT DATE_FORMAT(data_pagamento, '%%Y-%%m') AS mes, COUNT(*) AS quantidade, COALESCE(SUM(valor), 0) AS valor_total
+                    FROM pagamentos
+                    WHERE pagamento_id > %s AND pagamento_id <= %s AND data_pagamento IS NOT NULL
+                    GROUP BY DATE_FORMAT(data_pagamento, '%%Y-%%m')
+                ) AS novo
+                ON DUPLICATE KEY UPDATE quantidade = resumo_pagamentos_mes.quantidade + novo.quantidade,
+                                        valor_total = resumo_pagamentos_mes.valor_total + novo.valor_total"""),
+        ],
+    },
+}
+
+
+def _sql_fonte(sql) -> str:
+    # tipos de entrada entram como literais escapados: o upsert já usa %s para a faixa de ids
+    tipos = ", ".join("'" + t.replace("\\", "\\\\").replace("'", "''").replace("%", "%%") + "'" for t in TIPOS_ENTRADA)
+    return sql.replace("{entrada}", _CASO_ENTRADA.format(tipos=tipos or "NULL"))
+
+
+def _fontes(nomes=None) -> dict:
+    """tabela de origem -> coluna de id, para os resumos pedidos."""
+    return {tabela: coluna_id for nome in nomes or RESUMOS for tabela, coluna_id, _ in RESUMOS[nome]["fontes"]}
+
+
+def _nome_gatilho(tabela, evento) -> str:
+    return f"trg_resumo_{tabela}_{evento.lower()}"
+
+
+def criar_resumos(conn, nomes=None):
+    """Cria as tabelas de resumo, a de marcas d'água (migrando colunas novas) e os gatilhos que ainda não existem."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(DDL_MARCAS)
+        cursor.execute(
+            "SELECT COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'resumo_marcas_dagua'"
+        )
+        colunas = {linha[0] for linha in cursor.fetchall()}
+        alteracoes = [ddl for nome, ddl in COLUNAS_NOVAS_MARCAS.items() if nome not in colunas]
+        if alteracoes:
+            cursor.execute(f"ALTER TABLE resumo_marcas_dagua {', '.join(alteracoes)}")
+        for nome in nomes or RESUMOS:
+            cursor.execute(RESUMOS[nome]["ddl"])
+            for tabela, _, _ in RESUMOS[nome]["fontes"]:
+                cursor.execute(
+                    "INSERT IGNORE INTO resumo_marcas_dagua (resumo, tabela_origem, ultimo_id) VALUES (%s, %s, 0)",
+                    (nome, tabela),
+                )
+        cursor.execute("SELECT TRIGGER_NAME FROM information_schema.TRIGGERS WHERE TRIGGER_SCHEMA = DATABASE()")
+        gatilhos = {linha[0] for linha in cursor.fetchall()}
+        for tabela, coluna_id in _fontes(nomes).items():
+            for evento in ("UPDATE", "DELETE"):
+                nome_gatilho = _nome_gatilho(tabela, evento)
+                if nome_gatilho not in gatilhos:
+                    cursor.execute(DDL_GATILHO.format(nome=nome_gatilho, evento=evento, tabela=tabela, coluna_id=coluna_id))
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def _candidata_segura(cursor, pendente_em) -> bool:
+    """Os ids até a candidata foram reservados antes de `pendente_em`; valem quando toda transação que já estava
+    aberta naquele instante terminou (confirmada ou desfeita)."""
+    if pendente_em is None:
+        return False
+    try:
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.INNODB_TRX
+            WHERE trx_started <= %s AND trx_mysql_thread_id <> CONNECTION_ID()
+              AND (trx_rows_modified > 0 OR trx_query IS NOT NULL)""", (pendente_em,))
+        return int(cursor.fetchone()[0]) == 0
+    except Exception:
+        # sem o privilégio PROCESS: só a janela de segurança
+        cursor.execute("SELECT TIMESTAMPDIFF(SECOND, %s, NOW())", (pendente_em,))
+        return int(cursor.fetchone()[0]) >= JANELA_S
+
+
+def _atualizar_fonte(conn, nome, tabela, coluna_id, sql, lote):
+    """Soma as linhas de uma tabela de origem até a candidata segura, um lote de ids por transação, e anota a
+    próxima candidata (consumida na mesma passada se já estiver segura). Retorna os ids consumidos."""
+    cursor = conn.cursor()
+    consumidos = 0
+    try:
+        for _ in range(2):
+            cursor.execute(
+                "SELECT pendente_id, pendente_em FROM resumo_marcas_dagua WHERE resumo = %s AND tabela_origem = %s",
+                (nome, tabela),
+            )
+            pendente, pendente_em = cursor.fetchone()
+            conn.commit()
+            segura = pendente is not None and _candidata_segura(cursor, pendente_em)
+            while segura:
+                # FOR UPDATE: duas atualizações simultâneas do mesmo resumo esperam uma pela outra
+                cursor.execute(
+                    "SELECT ultimo_id FROM resumo_marcas_dagua WHERE resumo = %s AND tabela_origem = %s FOR UPDATE",
+                    (nome, tabela),
+                )
+                ultimo = int(cursor.fetchone()[0])
+                if ultimo >= pendente:
+                    conn.rollback()
+                    break
+                ate = min(ultimo + lote, int(pendente))
+                try:
+                    cursor.execute(_sql_fonte(sql), (ultimo, ate))
+                    cursor.execute(
+                        "UPDATE resumo_marcas_dagua SET ultimo_id = %s WHERE resumo = %s AND tabela_origem = %s",
+                        (ate, nome, tabela),
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                consumidos += ate - ultimo
+            if not segura and pendente is not None:
+                break  # a candidata só é trocada depois de consumida: transações longas atrasam a marca, não a travam
+            cursor.execute(f"SELECT COALESCE(MAX({coluna_id}), 0), NOW() FROM {tabela}")
+            maximo, agora = cursor.fetchone()
+            cursor.execute(
+                "UPDATE resumo_marcas_dagua SET pendente_id = %s, pendente_em = %s WHERE resumo = %s AND tabela_origem = %s",
+                (int(maximo), agora, nome, tabela),
+            )
+            conn.commit()
+        cursor.execute(
+            "UPDATE resumo_marcas_dagua SET atualizado_em = NOW() WHERE resumo = %s AND tabela_origem = %s", (nome, tabela)
+        )
+        conn.commit()
+    finally:
+        cursor.close()
+    return consumidos
+
+
+def _sujos(conn, nomes) -> list:
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT DISTINCT resumo FROM resumo_marcas_dagua WHERE sujo = 1")
+        sujos = {linha[0] for linha in cursor.fetchall()}
+        conn.commit()
+    finally:
+        cursor.close()
+    return [nome for nome in nomes if nome in sujos]
+
+
+def _zerar_resumo(conn, nome):
+    # esvazia o resumo e zera as marcas (e a sujeira) na mesma transação
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DELETE FROM {nome}")
+        cursor.execute("""
+            UPDATE resumo_marcas_dagua SET ultimo_id = 0, atualizado_em = NULL, pendente_id = NULL, pendente_em = NULL, sujo = 0
+            WHERE resumo = %s""", (nome,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def _atualizar(conn, nomes, lote) -> dict:
+    estatisticas = {}
+    for nome in nomes:
+        for tabela, coluna_id, sql in RESUMOS[nome]["fontes"]:
+            estatisticas.setdefault(nome, {})[tabela] = _atualizar_fonte(conn, nome, tabela, coluna_id, sql, lote)
+    return estatisticas
+
+
+def atualizar_resumos(conn, nomes=None, lote=LOTE_IDS) -> dict:
+    """Atualiza incrementalmente os resumos pedidos (todos, por padrão); os sujos por UPDATE/DELETE são reconstruídos.
+    Retorna resumo -> {tabela_origem: ids consumidos}."""
+    nomes = list(nomes or RESUMOS)
+    criar_resumos(conn, nomes)
+    for nome in _sujos(conn, nomes):
+        print(f"{nome}: linhas já somadas mudaram (UPDATE/DELETE); reconstruindo.")
+        _zerar_resumo(conn, nome)
+    return _atualizar(conn, nomes, lote)
+
+
+def reconstruir_resumo(conn, nome, lote=LOTE_IDS) -> dict:
+    """Esvazia o resumo e zera as marcas d'água na mesma transação, depois soma tudo de novo."""
+    criar_resumos(conn, [nome])
+    _zerar_resumo(conn, nome)
+    return _atualizar(conn, [nome], lote)
+
+
+# --- RESUMOS ANUNCIADOS AO PROMPT ---
+def resumos_em_dia(conn, tabelas_existentes, max_atraso_s=MAX_ATRASO_S, max_pendentes=MAX_PENDENTES) -> set:
+    """Resumos que podem ir para o prompt: existem, não estão sujos, foram verificados há menos de `max_atraso_s`,
+    a marca está a até `max_pendentes` ids do MAX(id) de cada origem e os gatilhos de UPDATE/DELETE existem."""
+    candidatos = [nome for nome in RESUMOS if nome in tabelas_existentes]
+    if not candidatos or "resumo_marcas_dagua" not in tabelas_existentes:
+        return set()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT resumo, tabela_origem, ultimo_id, sujo, atualizado_em >= NOW() - INTERVAL %s SECOND FROM resumo_marcas_dagua",
+            (int(max_atraso_s),),
+        )
+        marcas = {(resumo, tabela): (int(ultimo), bool(sujo), bool(recente))
+                  for resumo, tabela, ultimo, sujo, recente in cursor.fetchall()}
+        cursor.execute("SELECT TRIGGER_NAME FROM information_schema.TRIGGERS WHERE TRIGGER_SCHEMA = DATABASE()")
+        gatilhos = {linha[0] for linha in cursor.fetchall()}
+        maximos = {}
+        for tabela, coluna_id in _fontes(candidatos).items():
+            cursor.execute(f"SELECT COALESCE(MAX({coluna_id}), 0) FROM {tabela}")
+            maximos[tabela] = int(cursor.fetchone()[0])
+        conn.commit()
+    finally:
+        cursor.close()
+
+    def em_dia(nome, tabela):
+        ultimo, sujo, recente = marcas.get((nome, tabela), (0, True, False))
+        return (not sujo and recente and maximos[tabela] - ultimo <= max_pendentes
+                and all(_nome_gatilho(tabela, evento) in gatilhos for evento in ("UPDATE", "DELETE")))
+    return {nome for nome in candidatos if all(em_dia(nome, tabela) for tabela, _, _ in RESUMOS[nome]["fontes"])}
+
+
+_em_dia = {}  # (host, usuário, banco) -> (instante, resumos em dia)
+_em_dia_lock = threading.Lock()
+
+
+def obter_resumos_em_dia(conexao, chave, tabelas_existentes) -> set:
+    """resumos_em_dia com cache curto por banco; `conexao` é uma fábrica de context manager. Em erro, nenhum resumo."""
+    agora = time.monotonic()
+    with _em_dia_lock:
+        guardado = _em_dia.get(chave)
+    if guardado is not None and agora - guardado[0] < VALIDADE_DICAS_S:
+        return guardado[1]
+    if not any(nome in tabelas_existentes for nome in RESUMOS):
+        return set()
+    try:
+        with conexao() as conn:
+            resumos = resumos_em_dia(conn, tabelas_existentes)
+    except Exception as e:
+        print(f"Aviso: Não foi possível verificar as tabelas de resumo; o prompt segue sem elas: {e}")
+        resumos = set()
+    with _em_dia_lock:
+        _em_dia[chave] = (agora, resumos)
+    return resumos
+
+
+def dicas_resumos(resumos_disponiveis) -> list:
+    """Instruções para o prompt sobre os resumos disponíveis (os ausentes ou atrasados não são anunciados)."""
+    return [info["dica"] for nome, info in RESUMOS.items() if nome in resumos_disponiveis]
+
+
+def com_dicas_resumos(contexto_prompt: dict, resumos_disponiveis) -> dict:
+    """Cópia do contexto do prompt com as dicas dos resumos disponíveis antes das instruções originais."""
+    dicas = dicas_resumos(resumos_disponiveis)
+    if not dicas or not isinstance(contexto_prompt, dict) or contexto_prompt.get("error"):
+        return contexto_prompt
+    return {**contexto_prompt, "instrucoes_sql": dicas + list(contexto_prompt.get("instrucoes_sql", []))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cria e atualiza incrementalmente as tabelas de resumo do QueryFlow.")
+    parser.add_argument("resumos", nargs="*", help=f"Resumos a atualizar (padrão: todos): {', '.join(RESUMOS)}")
+    parser.add_argument("--reconstruir", action="store_true", help="Recalcula do zero (os sujos por UPDATE/DELETE já são refeitos sozinhos)")
+    parser.add_argument("--lote", type=int, default=LOTE_IDS, help="Faixa de ids somada por transação")
+    parser.add_argument("--intervalo", type=float, default=0, help="> 0 repete a atualização a cada N segundos")
+    args = parser.parse_args()
+    desconhecidos = sorted(set(args.resumos) - set(RESUMOS))
+    if desconhecidos:
+        parser.error(f"resumo(s) desconhecido(s): {', '.join(desconhecidos)}")
+    nomes = args.resumos or list(RESUMOS)
+
+    load_dotenv()
+    credenciais = (os.getenv("MYSQL_HOST", "localhost"), os.getenv("MYSQL_USER", "root"),
+                   os.getenv("MYSQL_PASSWORD", ""), os.getenv("MYSQL_DB", "querypilot"))
+    if args.reconstruir:
+        with conexao_mysql(*credenciais) as conn:
+            for nome in nomes:
+                inicio = time.perf_counter()
+                reconstruir_resumo(conn, nome, args.lote)
+                print(f"{nome} reconstruído em {time.perf_counter() - inicio:.1f}s.")
+        if args.intervalo <= 0:
+            return
+    while True:
+        inicio = time.perf_counter()
+        with conexao_mysql(*credenciais) as conn:
+            estatisticas = atualizar_resumos(conn, nomes, args.lote)
+        novos = sum(n for fontes in estatisticas.values() for n in fontes.values())
+        print(f"Resumos atualizados em {time.perf_counter() - inicio:.1f}s ({novos} id(s) novos somados).")
+        if args.intervalo <= 0:
+            break
+        time.sleep(args.intervalo)
+
+
+if __name__ == "__main__":
+    main()
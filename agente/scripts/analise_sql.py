@@ -0,0 +1,591 @@
+import re
+
+# --- TOKENIZAÇÃO LEVE DE SQL (dialeto MySQL) ---
+# Reconhece comentários (--, #, /* */), strings, identificadores com crase, números, palavras, variáveis e símbolos.
+_PADRAO_TOKEN = re.compile(r"""
+    (?P<comentario>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+  | (?P<identificador>`(?:[^`]|``)*`)
+  | (?P<numero>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<variavel>@@?[\w.$]+)
+  | (?P<palavra>[A-Za-z_$][\w$]*)
+  | (?P<espaco>\s+)
+  | (?P<simbolo><=>|<>|!=|<=|>=|:=|\|\||&&|.)
+""", re.VERBOSE | re.DOTALL)
+
+PALAVRAS_CHAVE = {
+    "SELECT", "FROM", "WHERE", "AND", "OR", "NOT", "IN", "IS", "NULL", "AS", "ON", "USING", "JOIN", "INNER", "LEFT",
+    "RIGHT", "OUTER", "CROSS", "NATURAL", "STRAIGHT_JOIN", "GROUP", "BY", "ORDER", "HAVING", "LIMIT", "OFFSET", "ASC",
+    "DESC", "DISTINCT", "ALL", "UNION", "EXCEPT", "INTERSECT", "WITH", "RECURSIVE", "CASE", "WHEN", "THEN", "ELSE",
+    "END", "BETWEEN", "LIKE", "REGEXP", "EXISTS", "ANY", "SOME", "INSERT", "INTO", "VALUES", "UPDATE", "SET",
+    "DELETE", "REPLACE", "CREATE", "DROP", "ALTER", "TRUNCATE", "RENAME", "TABLE", "DATABASE", "SCHEMA", "INDEX",
+    "VIEW", "SHOW", "DESCRIBE", "DESC", "EXPLAIN", "FOR", "LOCK", "SHARE", "MODE", "WINDOW", "OVER", "PARTITION",
+    "ROWS", "RANGE", "TRUE", "FALSE", "DIV", "MOD", "XOR", "INTERVAL", "CAST", "CONVERT", "CALL", "GRANT", "REVOKE",
+}
+
+# Funções e construções cujo resultado muda entre execuções mesmo sem escrita nas tabelas
+FUNCOES_NAO_DETERMINISTICAS = {
+    "NOW", "SYSDATE", "CURDATE", "CURTIME", "CURRENT_DATE", "CURRENT_TIME", "CURRENT_TIMESTAMP", "LOCALTIME",
+    "LOCALTIMESTAMP", "UTC_DATE", "UTC_TIME", "UTC_TIMESTAMP", "UNIX_TIMESTAMP", "RAND", "UUID", "UUID_SHORT",
+    "CONNECTION_ID", "LAST_INSERT_ID", "FOUND_ROWS", "ROW_COUNT", "USER", "CURRENT_USER", "SESSION_USER",
+    "SYSTEM_USER", "DATABASE", "SLEEP", "GET_LOCK", "RELEASE_LOCK", "IS_FREE_LOCK", "BENCHMARK", "RANDOM_BYTES",
+}
+
+_INICIOS_LEITURA = {"SELECT", "WITH", "SHOW", "DESCRIBE", "DESC", "EXPLAIN", "TABLE", "VALUES"}
+_PALAVRAS_ESCRITA = {"INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "DROP", "ALTER", "TRUNCATE", "RENAME",
+                     "GRANT", "REVOKE", "CALL", "LOCK", "SET", "LOAD", "HANDLER", "DO"}
+
+
+_IDENTIFICADOR_SIMPLES = re.compile(r"^[A-Za-z_$][\w$]*$")
+
+
+def tokenizar(sql: str, manter_comentarios=False) -> list:
+    """Retorna a lista de tokens (tipo, texto) sem espaços (e sem comentários, por padrão)."""
+    tokens = []
+    for m in _PADRAO_TOKEN.finditer(sql or ""):
+        tipo = m.lastgroup
+        if tipo == "espaco" or (tipo == "comentario" and not manter_comentarios):
+            continue
+        tokens.append((tipo, m.group()))
+    return tokens
+
+
+def _palavra(token) -> str:
+    return token[1].upper() if token[0] == "palavra" else ""
+
+
+def _nome_identificador(token) -> str:
+    if token[0] == "identificador":
+        return token[1][1:-1].replace("``", "`")
+    return token[1]
+
+
+def normalizar_sql(sql: str) -> str:
+    """Forma canônica para chaves de cache: sem comentários, espaços colapsados, palavras-chave em maiúsculas,
+    identificadores simples sem crase e sem ';' final."""
+    partes = []
+    for tipo, texto in tokenizar(sql):
+        if tipo == "palavra" and texto.upper() in PALAVRAS_CHAVE | FUNCOES_NAO_DETERMINISTICAS:
+            texto = texto.upper()
+        elif tipo == "identificador" and _IDENTIFICADOR_SIMPLES.match(texto[1:-1]) and texto[1:-1].upper() not in PALAVRAS_CHAVE:
+            texto = texto[1:-1]  # `clientes` e clientes são a mesma consulta
+        partes.append(texto)
+    while partes and partes[-1] == ";":
+        partes.pop()
+    return " ".join(partes)
+
+
+def primeira_palavra(sql: str) -> str:
+    for token in tokenizar(sql):
+        if token[0] == "palavra":
+            return token[1].upper()
+        if token[1] != "(":
+            return ""
+    return ""
+
+
+def dividir_instrucoes(sql: str) -> list:
+    """Separa um texto com várias instruções nos ';' de nível zero (fora de strings, comentários e parênteses).
+    Trechos só com comentários ou vazios são descartados; o texto de cada instrução é preservado."""
+    instrucoes, inicio = [], 0
+    for tipo, texto, pos_inicio, pos_fim, profundidade in _tokens_posicionados(sql):
+        if tipo == "simbolo" and texto == ";" and profundidade == 0:
+            instrucoes.append(sql[inicio:pos_inicio])
+            inicio = pos_fim
+    instrucoes.append((sql or "")[inicio:])
+    return [i.strip() for i in instrucoes if tokenizar(i)]
+
+
+def _palavras_de_instrucao(sql: str) -> set:
+    # palavras no nível zero que não são chamada de função: REPLACE(...) e INSERT(...) são funções de string
+    tokens = [t for t in _tokens_posicionados(sql) if t[0] != "comentario"]
+    return {texto.upper() for i, (tipo, texto, _, _, profundidade) in enumerate(tokens)
+            if tipo == "palavra" and profundidade == 0 and (i + 1 == len(tokens) or tokens[i + 1][1] != "(")}
+
+
+def retorna_linhas(sql: str) -> bool:
+    """Se a instrução devolve um conjunto de linhas (SELECT, WITH ... SELECT, SHOW, ...), ignorando comentários iniciais."""
+    if primeira_palavra(sql) not in _INICIOS_LEITURA:
+        return False
+    palavras = _palavras_de_instrucao(sql)
+    if "INTO" in palavras:
+        return False  # SELECT ... INTO OUTFILE/@variável
+    # WITH ... UPDATE/DELETE é escrita
+    return not (primeira_palavra(sql) == "WITH" and palavras & {"INSERT", "UPDATE", "DELETE", "REPLACE"})
+
+
+def e_somente_leitura(sql: str) -> bool:
+    tokens = tokenizar(sql)
+    if not tokens or primeira_palavra(sql) not in _INICIOS_LEITURA:
+        return False
+    # WITH ... seguido de DML, SELECT ... INTO OUTFILE e SELECT ... FOR UPDATE também escrevem/travam.
+    # Só vale a palavra da instrução (nível zero, sem parênteses em seguida), não funções como REPLACE(...)
+    palavras = _palavras_de_instrucao(sql)
+    if palavras & (_PALAVRAS_ESCRITA - {"SET"}):
+        return False
+    if "INTO" in palavras or ("FOR" in palavras and "UPDATE" in palavras):
+        return False
+    return True
+
+
+def e_nao_deterministica(sql: str) -> bool:
+    tokens = tokenizar(sql)
+    for i, token in enumerate(tokens):
+        if token[0] == "variavel":
+            return True
+        palavra = _palavra(token)
+        if palavra in FUNCOES_NAO_DETERMINISTICAS:
+            # CURRENT_DATE etc. aparecem sem parênteses; as demais só contam como chamada de função
+            seguinte = tokens[i + 1][1] if i + 1 < len(tokens) else ""
+            if seguinte == "(" or palavra.startswith(("CURRENT_", "LOCAL", "UTC_")):
+                return True
+    return False
+
+
+def _nomes_cte(tokens) -> set:
+    nomes = set()
+    if not tokens or _palavra(tokens[0]) != "WITH":
+        return nomes
+    i = 1
+    if i < len(tokens) and _palavra(tokens[i]) == "RECURSIVE":
+        i += 1
+    profundidade = 0
+    esperando_nome = True
+    while i < len(tokens):
+        texto = tokens[i][1]
+        if texto == "(":
+            profundidade += 1
+        elif texto == ")":
+            profundidade -= 1
+        elif profundidade == 0:
+            if esperando_nome and tokens[i][0] in ("palavra", "identificador"):
+                nomes.add(_nome_identificador(tokens[i]).lower())
+                esperando_nome = False
+            elif texto == ",":
+                esperando_nome = True
+            elif _palavra(tokens[i]) in ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE"):
+                break
+        i += 1
+    return nomes
+
+
+def _ler_nome_tabela(tokens, i):
+    """Lê `banco`.`tabela` a partir de i; retorna (banco ou None, nome_tabela, próximo_índice) ou (None, None, i)."""
+    if i >= len(tokens) or tokens[i][0] not in ("palavra", "identificador") or (
+            tokens[i][0] == "palavra" and tokens[i][1].upper() in PALAVRAS_CHAVE):
+        return None, None, i
+    banco, nome = None, _nome_identificador(tokens[i])
+    i += 1
+    if i + 1 < len(tokens) and tokens[i][1] == "." and tokens[i + 1][0] in ("palavra", "identificador"):
+        banco, nome = nome, _nome_identificador(tokens[i + 1])
+        i += 2
+    return banco, nome, i
+
+
+def _referencias(tokens):
+    """Percorre as listas de FROM/JOIN/UPDATE/INTO e gera (banco ou None, nome_tabela, alias ou None).
+    Só lê essas palavras no nível de uma consulta: o FROM de EXTRACT(YEAR FROM x) ou TRIM(... FROM x) não é tabela."""
+    niveis = []  # por parêntese aberto: True se ele abre uma consulta (subquery, tabela derivada, junção aninhada)
+    i = 0
+    while i < len(tokens):
+        texto = tokens[i][1]
+        if texto == "(":
+            seguinte = _palavra(tokens[i + 1]) if i + 1 < len(tokens) else ""
+            anterior = _palavra(tokens[i - 1]) if i > 0 else ""
+            juncao_aninhada = anterior in ("FROM", "JOIN", "STRAIGHT_JOIN") and seguinte not in ("SELECT", "WITH")
+            niveis.append(seguinte in ("SELECT", "WITH") or juncao_aninhada)
+            if not juncao_aninhada:
+                i += 1
+                continue
+            palavra = "FROM"  # "FROM (a JOIN b ON ...)": a primeira tabela vem logo depois do parêntese
+        elif texto == ")":
+            if niveis:
+                niveis.pop()
+            i += 1
+            continue
+        else:
+            palavra = _palavra(tokens[i])
+        if palavra in ("FROM", "JOIN", "UPDATE", "INTO", "TABLE", "STRAIGHT_JOIN") and (not niveis or niveis[-1]):
+            i += 1
+            while True:
+                banco, nome, i = _ler_nome_tabela(tokens, i)
+                if nome is None:
+                    break
+                alias = None
+                # alias opcional ([AS] alias) e continua em listas "FROM a, b"
+                if i < len(tokens) and _palavra(tokens[i]) == "AS":
+                    i += 1
+                if i < len(tokens) and tokens[i][0] in ("palavra", "identificador") and (
+                        tokens[i][0] == "identificador" or tokens[i][1].upper() not in PALAVRAS_CHAVE):
+                    alias = _nome_identificador(tokens[i])
+                    i += 1
+                yield banco, nome, alias
+                if palavra in ("FROM", "UPDATE") and i < len(tokens) and tokens[i][1] == ",":
+                    i += 1
+                    continue
+                break
+            continue
+        i += 1
+
+
+def _tabelas_com_alias(tokens):
+    """(nome_tabela, alias ou None) de cada referência em FROM/JOIN/UPDATE/INTO."""
+    for _, nome, alias in _referencias(tokens):
+        yield nome, alias
+
+
+def referencias_tabelas(sql: str) -> list:
+    """Lista de (banco ou None, tabela, alias ou None), na ordem do texto; inclui referências a CTEs."""
+    return list(_referencias(tokenizar(sql)))
+
+
+def nomes_cte(sql: str) -> set:
+    return _nomes_cte(tokenizar(sql))
+
+
+def tabelas_referenciadas(sql: str) -> set:
+    """Tabelas lidas ou escritas pela instrução (nomes em minúsculas, sem CTEs)."""
+    tokens = tokenizar(sql)
+    return {nome.lower() for nome, _ in _tabelas_com_alias(tokens)} - _nomes_cte(tokens)
+
+
+# --- USO DE COLUNAS POR CLÁUSULA (base do consultor de índices) ---
+_INICIO_CLAUSULA = {"SELECT": "projecao", "WHERE": "filtro", "HAVING": "having", "ON": "juncao", "USING": "juncao",
+                    "FROM": None, "JOIN": None, "LIMIT": None, "SET": None, "VALUES": None, "INTO": None}
+_OPERADORES_IGUALDADE = {"=", "<=>", "IN", "IS"}
+_OPERADORES_INTERVALO = {"<", ">", "<=", ">=", "BETWEEN", "LIKE"}
+
+
+def _e_coluna(tokens, i) -> bool:
+    tipo, texto = tokens[i]
+    if tipo == "identificador":
+        return True
+    if tipo != "palavra" or texto.upper() in PALAVRAS_CHAVE or texto.upper() in FUNCOES_NAO_DETERMINISTICAS:
+        return False
+    return not (i + 1 < len(tokens) and tokens[i + 1][1] == "(")  # nome de função
+
+
+def _ler_coluna(tokens, i):
+    """Lê `qualificador`.`coluna` (ou só a coluna) a partir de i; retorna (qualificador, coluna, próximo_índice)."""
+    if i + 2 < len(tokens) and tokens[i + 1][1] == "." and tokens[i + 2][0] in ("palavra", "identificador"):
+        return _nome_identificador(tokens[i]), _nome_identificador(tokens[i + 2]), i + 3
+    return None, _nome_identificador(tokens[i]), i + 1
+
+
+def uso_colunas(sql: str):
+    """Retorna (aliases, usos): aliases mapeia alias -> tabela (minúsculas) e usos é a lista de
+    (clausula, qualificador, coluna, operador) com clausula em filtro/juncao/agrupamento/ordenacao/projecao/having
+    e operador em igualdade/intervalo/funcao/outro. Colunas sem qualificador ficam com qualificador None."""
+    tokens = tokenizar(sql)
+    aliases = {}
+    for nome, alias in _tabelas_com_alias(tokens):
+        aliases[nome.lower()] = nome.lower()
+        if alias:
+            aliases[alias.lower()] = nome.lower()
+    usos = []
+    pilha, clausula = [], None  # a cláusula de cada nível de parênteses (subconsultas têm a própria)
+    i = 0
+    while i < len(tokens):
+        tipo, texto = tokens[i]
+        palavra = _palavra(tokens[i])
+        if texto == "(":
+            pilha.append(clausula)
+            i += 1
+            continue
+        if texto == ")":
+            clausula = pilha.pop() if pilha else None
+            i += 1
+            continue
+        if palavra in ("GROUP", "ORDER", "PARTITION") and i + 1 < len(tokens) and _palavra(tokens[i + 1]) == "BY":
+            clausula = {"GROUP": "agrupamento", "ORDER": "ordenacao"}.get(palavra)
+            i += 2
+            continue
+        if palavra in _INICIO_CLAUSULA:
+            clausula = _INICIO_CLAUSULA[palavra]
+            i += 1
+            continue
+        anterior = _palavra(tokens[i - 1]) if i else ""
+        if clausula is None or anterior == "AS" or not _e_coluna(tokens, i):
+            i += 1
+            continue
+        inicio = i
+        qualificador, coluna, i = _ler_coluna(tokens, i)
+        qualificador = qualificador.lower() if qualificador else None
+        seguinte = tokens[i][1].upper() if i < len(tokens) else ""
+        if seguinte in _OPERADORES_IGUALDADE:
+            operador = "igualdade"
+        elif seguinte in _OPERADORES_INTERVALO:
+            operador = "intervalo"
+        else:
+            operador = "outro"  # inclui NOT IN / NOT LIKE, que não aproveitam índice como prefixo
+        if inicio >= 2 and tokens[inicio - 1][1] == "(" and tokens[inicio - 2][0] == "palavra" and (
+                tokens[inicio - 2][1].upper() not in PALAVRAS_CHAVE):
+            operador = "funcao"  # YEAR(coluna) = 2024 não usa índice na coluna
+        # coluna = coluna no WHERE é junção implícita
+        if seguinte == "=" and i + 1 < len(tokens) and _e_coluna(tokens, i + 1) and clausula == "filtro":
+            outro_qualificador, outra_coluna, proximo = _ler_coluna(tokens, i + 1)
+            usos.append(("juncao", qualificador, coluna, "igualdade"))
+            usos.append(("juncao", outro_qualificador.lower() if outro_qualificador else None, outra_coluna, "igualdade"))
+            i = proximo
+            continue
+        usos.append((clausula, qualificador, coluna, operador))
+    return aliases, usos
+
+
+# --- ESTRUTURA PARA VALIDAÇÃO LOCAL ---
+FUNCOES_AGREGACAO = {
+    "COUNT", "SUM", "AVG", "MIN", "MAX", "GROUP_CONCAT", "JSON_ARRAYAGG", "JSON_OBJECTAGG", "STD", "STDDEV",
+    "STDDEV_POP", "STDDEV_SAMP", "VARIANCE", "VAR_POP", "VAR_SAMP", "BIT_AND", "BIT_OR", "BIT_XOR", "ANY_VALUE",
+}
+
+
+def palavras_nivel_zero(sql: str) -> set:
+    """Palavras fora de parênteses (ex.: o WHERE de um UPDATE, e não o de uma subconsulta)."""
+    return {t[1].upper() for t in _tokens_posicionados(sql) if t[0] == "palavra" and t[4] == 0}
+
+
+def nomes_definidos(sql: str) -> set:
+    """Nomes criados pela própria instrução (minúsculas): aliases com ou sem AS, CTEs e tabelas derivadas.
+    Uma referência a eles não precisa existir no catálogo."""
+    tokens = tokenizar(sql)
+    nomes = set(_nomes_cte(tokens))
+    for i, token in enumerate(tokens):
+        if token[0] not in ("palavra", "identificador") or (token[0] == "palavra" and token[1].upper() in PALAVRAS_CHAVE):
+            continue
+        anterior = tokens[i - 1] if i else None
+        if anterior is None:
+            continue
+        if _palavra(anterior) == "AS":
+            nomes.add(_nome_identificador(token).lower())
+        elif anterior[1] == ")" or _palavra(anterior) == "END" or (
+                anterior[0] in ("palavra", "identificador", "numero", "string") and _palavra(anterior) not in PALAVRAS_CHAVE):
+            # alias implícito: "SELECT nome n", "(SELECT ...) x", "CASE ... END faixa"
+            nomes.add(_nome_identificador(token).lower())
+    return nomes
+
+
+def _separar_itens(tokens) -> list:
+    # tokens posicionados de uma lista (projeção, GROUP BY) separados nas vírgulas do nível da lista
+    if not tokens:
+        return []
+    base = tokens[0][4]
+    itens, atual = [], []
+    for token in tokens:
+        if token[1] == "," and token[4] == base:
+            itens.append(atual)
+            atual = []
+        else:
+            atual.append(token)
+    itens.append(atual)
+    return [item for item in itens if item]
+
+
+def _classificar_item(item) -> dict:
+    """Um item de projeção/GROUP BY: coluna simples ([q.]coluna), estrela, posição numérica ou expressão."""
+    alias = None
+    if len(item) >= 2 and item[-1][0] in ("palavra", "identificador") and item[-1][1].upper() not in PALAVRAS_CHAVE:
+        anterior = item[-2]
+        if anterior[1].upper() == "AS":
+            alias, item = item[-1], item[:-2]
+        elif anterior[1] == ")" or anterior[1].upper() == "END" or (
+                anterior[0] in ("palavra", "identificador", "numero", "string") and anterior[1].upper() not in PALAVRAS_CHAVE):
+            alias, item = item[-1], item[:-1]
+    alias = _nome_identificador(alias[:2]).lower() if alias else None
+    textos = [t[1] for t in item]
+    if textos == ["*"] or (len(item) == 3 and textos[1:] == [".", "*"]):
+        return {"tipo": "estrela", "qualificador": _nome_identificador(item[0][:2]).lower() if len(item) == 3 else None, "alias": alias}
+    if len(item) == 1 and item[0][0] == "numero":
+        return {"tipo": "posicao", "posicao": int(float(item[0][1])), "alias": alias}
+    simples = [t for t in item if t[0] in ("palavra", "identificador")]
+    if len(item) in (1, 3) and len(simples) == (len(item) + 1) // 2 and (len(item) == 1 or textos[1] == ".") and (
+            item[-1][0] == "identificador" or item[-1][1].upper() not in PALAVRAS_CHAVE | FUNCOES_NAO_DETERMINISTICAS):
+        return {"tipo": "coluna", "qualificador": _nome_identificador(item[0][:2]).lower() if len(item) == 3 else None,
+                "coluna": _nome_identificador(item[-1][:2]).lower(), "alias": alias}
+    # agregações dentro de subconsultas ("(SELECT MAX(...) ...)") não agregam o SELECT de fora
+    agregada, subconsultas = False, []
+    for i, t in enumerate(item):
+        seguinte = item[i + 1][1] if i + 1 < len(item) else ""
+        if t[1] == "(":
+            subconsultas.append(seguinte.upper() == "SELECT")
+        elif t[1] == ")" and subconsultas:
+            subconsultas.pop()
+        elif t[0] == "palavra" and t[1].upper() in FUNCOES_AGREGACAO and seguinte == "(" and not any(subconsultas):
+            agregada = True
+    return {"tipo": "expressao", "agregada": agregada, "alias": alias}
+
+
+def estrutura_agrupamento(sql: str):
+    """Projeção e GROUP BY do SELECT principal, para checar ONLY_FULL_GROUP_BY sem ir ao banco.
+    Retorna None quando a instrução não é um SELECT simples (UNION, sem SELECT no nível zero, WITH ROLLUP)."""
+    tokens = [t for t in _tokens_posicionados(sql) if t[0] != "comentario"]
+    topo = [(i, t[1].upper()) for i, t in enumerate(tokens) if t[0] == "palavra" and t[4] == 0]
+    palavras = [p for _, p in topo]
+    if "SELECT" not in palavras or palavras.count("SELECT") > 1 or {"UNION", "EXCEPT", "INTERSECT", "ROLLUP"} & set(palavras):
+        return None
+    posicoes = dict((p, i) for i, p in reversed(topo))  # primeira ocorrência de cada palavra no nível zero
+    inicio = posicoes["SELECT"] + 1
+    while inicio < len(tokens) and tokens[inicio][1].upper() in ("DISTINCT", "ALL", "DISTINCTROW", "SQL_NO_CACHE", "STRAIGHT_JOIN"):
+        inicio += 1
+    fim = min([i for i, p in topo if p in ("FROM", "INTO") and i > inicio] or [len(tokens)])
+    projecao = [_classificar_item(item) for item in _separar_itens(tokens[inicio:fim])]
+    agrupamento = []
+    for i, (j, palavra) in enumerate(topo):
+        if palavra == "GROUP" and i + 1 < len(topo) and topo[i + 1][1] == "BY":
+            comeco = topo[i + 1][0] + 1
+            termino = min([k for k, p in topo if k > comeco and p in ("HAVING", "ORDER", "LIMIT", "WINDOW", "FOR", "LOCK", "WITH")]
+                          + [len(tokens) - (1 if tokens[-1][1] == ";" else 0)])
+            agrupamento = [_classificar_item(item) for item in _separar_itens(tokens[comeco:termino])]
+            break
+    return {"projecao": projecao, "agrupamento": agrupamento, "tem_group_by": "GROUP" in palavras,
+            "igualdades": [] if "OR" in palavras else _igualdades_nivel_zero(tokens)}
+
+
+def _referencia_coluna(tokens, i):
+    """[q.]coluna a partir de i, se ela for um operando inteiro; retorna ((qualificador, coluna), próximo_índice)."""
+    if i >= len(tokens) or tokens[i][0] not in ("palavra", "identificador") or \
+            (tokens[i][0] == "palavra" and tokens[i][1].upper() in PALAVRAS_CHAVE | FUNCOES_NAO_DETERMINISTICAS):
+        return None, i
+    if i + 2 < len(tokens) and tokens[i + 1][1] == "." and tokens[i + 2][0] in ("palavra", "identificador"):
+        return (_nome_identificador(tokens[i][:2]).lower(), _nome_identificador(tokens[i + 2][:2]).lower()), i + 3
+    if i + 1 < len(tokens) and tokens[i + 1][1] in (".", "("):
+        return None, i
+    return (None, _nome_identificador(tokens[i][:2]).lower()), i + 1
+
+
+def _igualdades_nivel_zero(tokens) -> list:
+    """Pares de colunas igualadas em ON/WHERE do nível zero, ligados só por AND (ex.: c.id = m.cliente_id)."""
+    igualdades = []
+    for i, t in enumerate(tokens):
+        if t[4] != 0 or t[1].upper() not in ("ON", "WHERE", "AND"):
+            continue
+        esquerda, j = _referencia_coluna(tokens, i + 1)
+        if esquerda is None or j >= len(tokens) or tokens[j][1] != "=":
+            continue
+        direita, k = _referencia_coluna(tokens, j + 1)
+        if direita is None:
+            continue
+        if k < len(tokens) and tokens[k][1] != ";" and (tokens[k][0] != "palavra" or tokens[k][1].upper() not in PALAVRAS_CHAVE):
+            continue  # o operando continua (c.id = m.id + 1): não é igualdade simples entre colunas
+        igualdades.append((esquerda, direita))
+    return igualdades
+
+
+# --- REESCRITAS (preservam o texto original, inclusive comentários e formatação) ---
+def _tokens_posicionados(sql: str) -> list:
+    # (tipo, texto, início, fim, profundidade de parênteses antes do token)
+    tokens, profundidade = [], 0
+    for m in _PADRAO_TOKEN.finditer(sql or ""):
+        tipo = m.lastgroup
+        if tipo == "espaco":
+            continue
+        if m.group() == ")":
+            profundidade -= 1
+        tokens.append((tipo, m.group(), m.start(), m.end(), profundidade))
+        if m.group() == "(":
+            profundidade += 1
+    return tokens
+
+
+def inserir_dica_otimizador(sql: str, dica: str):
+    """Insere /*+ dica */ logo após o SELECT principal (o primeiro no nível zero, depois das CTEs).
+    Retorna None se não houver SELECT principal ou se a dica já estiver presente."""
+    tokens = _tokens_posicionados(sql)
+    for i, (tipo, texto, _, fim, profundidade) in enumerate(tokens):
+        if tipo == "palavra" and profundidade == 0 and texto.upper() == "SELECT":
+            seguinte = tokens[i + 1] if i + 1 < len(tokens) else None
+            if seguinte and seguinte[0] == "comentario" and seguinte[1].startswith("/*+"):
+                # só pode haver um comentário de dicas por bloco: junta a nova às existentes
+                nome_dica = dica.split("(")[0].strip().upper()
+                if nome_dica in seguinte[1].upper():
+                    return None
+                return sql[:seguinte[3] - 2].rstrip() + f" {dica} */" + sql[seguinte[3]:]
+            return sql[:fim] + f" /*+ {dica} */" + sql[fim:]
+    return None
+
+
+def reescrever_tokens(sql: str, substituir) -> str:
+    """Troca tokens preservando o resto do texto. `substituir(tokens, i)` recebe os tokens posicionados e devolve
+    (texto novo, quantidade de tokens consumidos) ou None para manter o token i como está."""
+    tokens = _tokens_posicionados(sql)
+    partes, ultimo, i = [], 0, 0
+    while i < len(tokens):
+        troca = substituir(tokens, i)
+        if troca is None:
+            i += 1
+            continue
+        texto, consumidos = troca
+        partes.append(sql[ultimo:tokens[i][2]] + texto)
+        ultimo = tokens[i + consumidos - 1][3]
+        i += consumidos
+    partes.append(sql[ultimo:])
+    return "".join(partes)
+
+
+def _fim_da_leitura(sql: str):
+    # (posição depois do último token antes do ';' final, palavras do nível zero) de uma leitura que ainda não
+    # limita o resultado; None quando não é seguro acrescentar cláusulas (LIMIT, INTO, FOR UPDATE/LOCK IN SHARE MODE)
+    tokens = [t for t in _tokens_posicionados(sql) if t[0] != "comentario"]
+    if not tokens or primeira_palavra(sql) not in ("SELECT", "WITH"):
+        return None
+    topo = {t[1].upper() for t in tokens if t[0] == "palavra" and t[4] == 0}
+    if topo & {"LIMIT", "INTO", "FOR", "LOCK"}:
+        return None
+    while tokens and tokens[-1][1] == ";":
+        tokens.pop()
+    if not tokens:
+        return None
+    # entra antes do ';' final e de comentários de fim de linha
+    return tokens[-1][3], topo
+
+
+def adicionar_limite(sql: str, limite: int):
+    """Acrescenta LIMIT ao fim da instrução de leitura se ela ainda não limita o resultado no nível zero.
+    Retorna None quando não é seguro (já tem LIMIT, INTO, FOR UPDATE/LOCK IN SHARE MODE)."""
+    fim = _fim_da_leitura(sql)
+    if fim is None:
+        return None
+    corte = fim[0]
+    return sql[:corte] + f" LIMIT {int(limite)}" + sql[corte:]
+
+
+def colunas_desempate(sql: str, chaves_primarias: dict) -> list:
+    """Colunas (`alias`.`coluna`) das chaves primárias das tabelas do FROM principal, que completam um ORDER BY até
+    uma ordem total. Lista vazia quando não é seguro: DISTINCT, agrupamento ou UNION no nível zero (o MySQL não aceita
+    ordenar por coluna fora da projeção/agrupamento), tabela derivada, CTE ou tabela sem chave primária no catálogo."""
+    posicionados = [t for t in _tokens_posicionados(sql) if t[0] != "comentario"]
+    if {t[1].upper() for t in posicionados if t[0] == "palavra" and t[4] == 0} & {"DISTINCT", "GROUP", "HAVING", "UNION"}:
+        return []
+    if any(t[4] == 0 and t[1].upper() in FUNCOES_AGREGACAO and i + 1 < len(posicionados) and posicionados[i + 1][1] == "("
+           for i, t in enumerate(posicionados)):
+        return []  # agregação sem GROUP BY: uma linha só, e a chave não agregada seria recusada
+    # só o nível zero: subconsultas somem e "FROM (SELECT ...) d" vira uma referência a "d", que não está no catálogo
+    tokens = [(t[0], t[1]) for t in posicionados if t[4] == 0 and t[1] not in ("(", ")")]
+    chaves = {tabela.lower(): colunas for tabela, colunas in (chaves_primarias or {}).items()}
+    desempate = []
+    for _, nome, alias in _referencias(tokens):
+        colunas = chaves.get(nome.lower())
+        if not colunas:
+            return []
+        desempate.extend(f"`{alias or nome}`.`{coluna}`" for coluna in colunas)
+    return desempate
+
+
+def paginar(sql: str, inicio: int, quantidade: int, desempate=()):
+    """Acrescenta LIMIT inicio, quantidade: o servidor pula as linhas anteriores sem mandá-las. Um ORDER BY existente
+    ganha as colunas de `desempate` (ver colunas_desempate) para que linhas empatadas não mudem de página; sem ORDER BY
+    nada é ordenado e a primeira página sai assim que o servidor encontra as linhas. Um "LIMIT n" simples no fim
+    (da SQL ou da guarda de custo) é combinado com a página. Retorna None nos mesmos casos de adicionar_limite."""
+    tokens = [t for t in _tokens_posicionados(sql) if t[0] != "comentario"]
+    while tokens and tokens[-1][1] == ";":
+        tokens.pop()
+    if len(tokens) > 2 and tokens[-2][1].upper() == "LIMIT" and tokens[-2][4] == 0 and tokens[-1][0] == "numero" \
+            and tokens[-1][1].isdigit():
+        limite = int(tokens[-1][1])
+        base = sql[:tokens[-2][2]].rstrip()
+        return paginar(base + sql[tokens[-1][3]:], inicio, max(min(quantidade, limite - inicio), 0), desempate)
+    fim = _fim_da_leitura(sql)
+    if fim is None:
+        return None
+    corte, topo = fim
+    ordem = f", {', '.join(desempate)}" if "ORDER" in topo and desempate else ""
+    return sql[:corte] + f"{ordem} LIMIT {int(inicio)}, {int(quantidade)}" + sql[corte:]
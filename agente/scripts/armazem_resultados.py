@@ -0,0 +1,198 @@
+import os
+import time
+import atexit
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from execucao_sql import ResultadoConsulta, ResultadoLote, TAMANHO_PAGINA, MAX_LINHAS_INSTRUCAO
+from metricas import metricas
+
+# --- MEMÓRIA DOS RESULTADOS POR SESSÃO (via .env) ---
+MEMORIA_MAX = int(float(os.getenv("QUERYFLOW_RESULTADOS_MEMORIA_MB", "256")) * 1024 * 1024)  # todas as sessões do processo
+MEMORIA_SESSAO = int(float(os.getenv("QUERYFLOW_RESULTADOS_SESSAO_MB", "16")) * 1024 * 1024)
+# Resultados com até essas linhas ficam inteiros na memória (o padrão cobre uma página); maiores vão para o disco
+LINHAS_MEMORIA = int(os.getenv("QUERYFLOW_RESULTADOS_LINHAS_MEMORIA", str(max(TAMANHO_PAGINA, MAX_LINHAS_INSTRUCAO))))
+LINHAS_INICIO = 100  # linhas de um resultado descarregado que continuam na memória
+OCIOSA_S = float(os.getenv("QUERYFLOW_RESULTADOS_OCIOSA_S", "1800"))  # sessão sem acesso há mais que isso perde o resultado
+DIR_DESCARGA = os.getenv("QUERYFLOW_RESULTADOS_DIR") or None  # padrão: diretório temporário do sistema
+
+
+class _Entrada:
+    def __init__(self, resultado):
+        self.resultado = resultado
+        self.bytes_memoria = _bytes_memoria(resultado)
+        self.bytes_disco = _bytes_disco(self.arquivos)
+        self.ultimo_acesso = time.monotonic()
+
+    @property
+    def arquivos(self) -> list:
+        # inclui os downloads gravados em disco depois de guardar
+        return self.resultado.arquivos if isinstance(self.resultado, (ResultadoConsulta, ResultadoLote)) else []
+
+
+def _bytes_disco(arquivos) -> int:
+    return sum(os.path.getsize(a) for a in arquivos if os.path.exists(a))
+
+
+def _bytes_memoria(resultado) -> int:
+    if isinstance(resultado, (ResultadoConsulta, ResultadoLote)):
+        return resultado.bytes_em_memoria
+    return 1024  # dict de status ou erro
+
+
+def _linhas(resultado) -> int:
+    if isinstance(resultado, ResultadoLote):
+        return sum(len(r) for r in resultado.resultados if isinstance(r, ResultadoConsulta))
+    return len(resultado) if isinstance(resultado, ResultadoConsulta) else 0
+
+
+def _apagar(arquivos):
+    for arquivo in arquivos:
+        try:
+            os.remove(arquivo)
+        except OSError:
+            pass
+
+
+class ArmazemResultados:
+    """Último resultado de cada sessão da interface, com orçamento de memória global e por sessão.
+    Resultados além de LINHAS_MEMORIA linhas (ou do orçamento da sessão) guardam só o início na memória e o resto em
+    Arrow IPC no disco, lido mapeado; sessões ociosas e, se preciso, as menos usadas (LRU) perdem o resultado."""
+
+    def __init__(self, memoria_max=MEMORIA_MAX, memoria_sessao=MEMORIA_SESSAO, linhas_memoria=LINHAS_MEMORIA,
+                 ociosa_s=OCIOSA_S, diretorio=DIR_DESCARGA, linhas_inicio=LINHAS_INICIO):
+        self._memoria_max = memoria_max
+        self._memoria_sessao = memoria_sessao
+        self._linhas_memoria = linhas_memoria
+        self._linhas_inicio = linhas_inicio
+        self._ociosa_s = ociosa_s
+        self._diretorio = tempfile.mkdtemp(prefix="queryflow_resultados_", dir=diretorio)
+        self._entradas = OrderedDict()  # sessão -> _Entrada, da menos para a mais recentemente usada
+        self._sequencia = 0
+        self._lock = threading.Lock()
+        atexit.register(shutil.rmtree, self._diretorio, True)
+
+    # --- GRAVAÇÃO ---
+    def _descarregar(self, resultado):
+        if not isinstance(resultado, (ResultadoConsulta, ResultadoLote)):
+            return resultado
+        grande = len(resultado) > self._linhas_memoria if isinstance(resultado, ResultadoConsulta) else \
+            any(isinstance(r, ResultadoConsulta) and len(r) > self._linhas_memoria for r in resultado.resultados)
+        if not grande and resultado.bytes_em_memoria <= self._memoria_sessao:
+            return resultado
+        with self._lock:
+            self._sequencia += 1
+            caminho = os.path.join(self._diretorio, f"resultado_{self._sequencia}.arrow")
+        return resultado.descarregado(caminho, self._linhas_inicio)
+
+    def guardar(self, sessao, resultado):
+        """Substitui o resultado da sessão. A gravação em disco acontece fora do lock."""
+        try:
+            guardado = self._descarregar(resultado)
+        except Exception as e:
+            # sem pyarrow ou sem disco: fica na memória e o orçamento global decide quem sai
+            print(f"Aviso: Não foi possível descarregar o resultado em disco: {e}")
+            guardado = resultado
+        entrada = _Entrada(guardado)
+        with self._lock:
+            anterior = self._entradas.pop(sessao, None)
+            self._entradas[sessao] = entrada
+            removidas = self._aplicar_limites(sessao)
+        _apagar(anterior.arquivos if anterior else [])
+        for arquivos_removidos in removidas:
+            _apagar(arquivos_removidos)
+        return guardado
+
+    def _aplicar_limites(self, sessao_atual) -> list:
+        # com o lock: primeiro as ociosas, depois as menos usadas até caber no orçamento global
+        agora, removidas = time.monotonic(), []
+        for sessao, entrada in list(self._entradas.items()):
+            if sessao != sessao_atual and agora - entrada.ultimo_acesso > self._ociosa_s:
+                removidas.append(self._entradas.pop(sessao).arquivos)
+                metricas.incrementar("queryflow_resultados_despejados_total", motivo="ociosa")
+        while self._memoria_total() > self._memoria_max:
+            sessao = next((s for s in self._entradas if s != sessao_atual), None)
+            if sessao is None:
+                break
+            removidas.append(self._entradas.pop(sessao).arquivos)
+            metricas.incrementar("queryflow_resultados_despejados_total", motivo="memoria")
+        return removidas
+
+    # --- LEITURA ---
+    def obter(self, sessao):
+        """Resultado atual da sessão, ou None se nunca houve ou se foi despejado."""
+        with self._lock:
+            entrada = self._entradas.get(sessao)
+            if entrada is None:
+                return None
+            entrada.ultimo_acesso = time.monotonic()
+            self._entradas.move_to_end(sessao)
+            return entrada.resultado
+
+    def descartar(self, sessao):
+        with self._lock:
+            entrada = self._entradas.pop(sessao, None)
+        if entrada is not None:
+            _apagar(entrada.arquivos)
+
+    def atualizar_uso(self, sessao):
+        # a tabela Arrow e os downloads são montados depois de guardar (na exibição): remede a sessão
+        with self._lock:
+            entrada = self._entradas.get(sessao)
+            if entrada is not None:
+                entrada.bytes_memoria = _bytes_memoria(entrada.resultado)
+                entrada.bytes_disco = _bytes_disco(entrada.arquivos)
+                removidas = self._aplicar_limites(sessao)
+            else:
+                removidas = []
+        for arquivos_removidos in removidas:
+            _apagar(arquivos_removidos)
+
+    # --- USO ---
+    def _memoria_total(self) -> int:
+        return sum(e.bytes_memoria for e in self._entradas.values())
+
+    def uso(self, sessao=None) -> dict:
+        """Memória e disco por sessão (ou de uma sessão), com segundos desde o último acesso."""
+        agora = time.monotonic()
+        with self._lock:
+            sessoes = {s: {"bytes_memoria": e.bytes_memoria, "bytes_disco": e.bytes_disco,
+                           "linhas": _linhas(e.resultado),
+                           "ociosa_s": round(agora - e.ultimo_acesso, 1)}
+                       for s, e in self._entradas.items()}
+        if sessao is not None:
+            return sessoes.get(sessao, {"bytes_memoria": 0, "bytes_disco": 0, "linhas": 0, "ociosa_s": 0.0})
+        return sessoes
+
+    @property
+    def bytes_memoria(self) -> int:
+        with self._lock:
+            return self._memoria_total()
+
+    @property
+    def bytes_disco(self) -> int:
+        with self._lock:
+            return sum(e.bytes_disco for e in self._entradas.values())
+
+
+_armazem = None
+_armazem_lock = threading.Lock()
+
+
+def obter_armazem() -> ArmazemResultados:
+    global _armazem
+    with _armazem_lock:
+        if _armazem is None:
+            _armazem = ArmazemResultados()
+        return _armazem
+
+
+metricas.registrar_medidor(
+    "queryflow_resultados_memoria_bytes", lambda: _armazem.bytes_memoria if _armazem is not None else 0,
+    "Memória ocupada pelos resultados guardados das sessões",
+)
+metricas.registrar_medidor(
+    "queryflow_resultados_disco_bytes", lambda: _armazem.bytes_disco if _armazem is not None else 0,
+    "Resultados das sessões descarregados em disco",
+)
@@ -0,0 +1,422 @@
+import os
+import io
+import csv
+import gzip
+import time
+import random
+import hashlib
+import datetime
+import threading
+import sqlite3
+from contextlib import contextmanager
+from catalogo_schema import CatalogoSchema, INTERVALO_VERIFICACAO
+from analise_sql import reescrever_tokens, dividir_instrucoes, retorna_linhas, e_somente_leitura, adicionar_limite
+from execucao_sql import ler_pagina, ResultadoConsulta, ResultadoLote, TAMANHO_PAGINA, MAX_LINHAS_INSTRUCAO
+from guarda_custo import ConsultaInterrompidaError, TEMPO_MAX_MS
+from metricas import metricas
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+# --- BACKEND LOCAL (via .env) ---
+BACKEND = os.getenv("QUERYFLOW_BACKEND", "mysql")  # mysql | local (datasets em processo, sem servidor)
+DIR_DATASETS = os.getenv("QUERYFLOW_DATASETS_PATH", os.path.join(RAIZ, "banco_de_dados", "datasets"))
+MOTOR_LOCAL = os.getenv("QUERYFLOW_MOTOR_LOCAL", "auto")  # auto (duckdb se instalado) | duckdb | sqlite
+
+BACKENDS = ("mysql", "local")
+
+# Mesmo DDL de banco_de_dados/scripts/create_table.py (chave primária primeiro, FKs para clientes)
+ESQUEMA = {
+    "clientes": [("cliente_id", "int"), ("nome", "varchar(100)"), ("cpf", "varchar(11)"), ("email", "varchar(100)")],
+    "enderecos": [("endereco_id", "int"), ("cliente_id", "int"), ("rua", "varchar(255)"), ("cidade", "varchar(100)"),
+                  ("estado", "varchar(50)"), ("cep", "varchar(8)")],
+    "movimentacoes": [("movimentacao_id", "int"), ("cliente_id", "int"), ("tipo_movimentacao", "varchar(50)"),
+                      ("valor", "decimal(10,2)"), ("data_movimentacao", "date")],
+    "pagamentos": [("pagamento_id", "int"), ("cliente_id", "int"), ("valor", "decimal(10,2)"), ("data_pagamento", "date")],
+}
+CHAVES_ESTRANGEIRAS = {tabela: "cliente_id" for tabela in ("enderecos", "movimentacoes", "pagamentos")}
+
+# Parquet primeiro: é lido direto do arquivo (colunar, só as colunas usadas), sem carga prévia
+EXTENSOES = (".parquet", ".csv", ".csv.gz", ".csv.zst")
+
+# Funções MySQL que o DuckDB não tem ou tem com outra assinatura; viram macros com o comportamento do MySQL
+MACROS_DUCKDB = {
+    # o formato precisa ser constante no strftime do DuckDB: a tradução já o converte para os códigos do strftime
+    "DATE_FORMAT": ("mysql_date_format", "(d, f) AS strftime(CAST(d AS TIMESTAMP), f)"),
+    "DATE_SUB": ("mysql_date_sub", "(d, i) AS CAST(d AS TIMESTAMP) - i"),
+    "DATE_ADD": ("mysql_date_add", "(d, i) AS CAST(d AS TIMESTAMP) + i"),
+    "DATEDIFF": ("mysql_datediff", "(a, b) AS CAST(a AS DATE) - CAST(b AS DATE)"),
+    "CURDATE": ("mysql_curdate", "() AS current_date"),
+    "DATE": ("mysql_date", "(d) AS CAST(d AS DATE)"),
+    "RAND": ("mysql_rand", "() AS random()"),
+}
+_FORMATO_DATA_MYSQL = {"%i": "%M", "%s": "%S", "%M": "%B", "%W": "%A", "%e": "%d", "%c": "%m", "%h": "%I"}
+
+
+def _literal(texto) -> str:
+    # strings do MySQL aceitam aspas duplas e escapes com barra; os dois motores locais só entendem '...' com ''
+    aspa, corpo, valor, i = texto[0], texto[1:-1], [], 0
+    while i < len(corpo):
+        c = corpo[i]
+        if c == "\\" and i + 1 < len(corpo):
+            seguinte = corpo[i + 1]
+            valor.append({"n": "\n", "t": "\t", "0": "\0", "%": "\\%", "_": "\\_"}.get(seguinte, seguinte))
+            i += 2
+        elif c == aspa and corpo[i + 1:i + 2] == aspa:
+            valor.append(aspa)
+            i += 2
+        else:
+            valor.append(c)
+            i += 1
+    return "'" + "".join(valor).replace("'", "''") + "'"
+
+
+def converter_formato_data(formato: str) -> str:
+    """Códigos do DATE_FORMAT do MySQL (%i minuto, %M nome do mês...) nos equivalentes do strftime."""
+    for mysql, strftime in _FORMATO_DATA_MYSQL.items():
+        formato = formato.replace(mysql, "\x00" + strftime[1])
+    return formato.replace("\x00", "%")
+
+
+def _formatos_data(tokens) -> set:
+    # posições dos literais que são o 2º argumento de um DATE_FORMAT(...)
+    posicoes = set()
+    for i, token in enumerate(tokens):
+        if token[0] == "palavra" and token[1].upper() == "DATE_FORMAT" and i + 1 < len(tokens) and tokens[i + 1][1] == "(":
+            profundidade = tokens[i + 1][4] + 1
+            for j in range(i + 2, len(tokens)):
+                if tokens[j][1] == ")" and tokens[j][4] == profundidade - 1:
+                    if tokens[j - 1][0] == "string" and tokens[j - 2][1] == "," and tokens[j - 2][4] == profundidade:
+                        posicoes.add(j - 1)
+                    break
+    return posicoes
+
+
+_UNIDADES_SQLITE = {"SECOND": ("seconds", 1), "MINUTE": ("minutes", 1), "HOUR": ("hours", 1), "DAY": ("days", 1),
+                    "WEEK": ("days", 7), "MONTH": ("months", 1), "QUARTER": ("months", 3), "YEAR": ("years", 1)}
+
+
+def _intervalos_sqlite(tokens) -> dict:
+    # DATE_ADD/DATE_SUB(x, INTERVAL n UNIDADE) -> date/datetime(x, '+n unidade'): posição -> (texto, tokens consumidos)
+    trocas = {}
+    for i, token in enumerate(tokens):
+        nome = token[1].upper() if token[0] == "palavra" else ""
+        if nome not in ("DATE_ADD", "DATE_SUB") or i + 1 >= len(tokens) or tokens[i + 1][1] != "(":
+            continue
+        profundidade = tokens[i + 1][4]
+        j = next((j for j in range(i + 2, len(tokens)) if tokens[j][1] == ")" and tokens[j][4] == profundidade), None)
+        if j is None or j < i + 6:
+            continue
+        virgula, intervalo, numero, unidade = tokens[j - 4:j]
+        if virgula[1] != "," or intervalo[1].upper() != "INTERVAL" or numero[0] != "numero" \
+                or unidade[1].upper() not in _UNIDADES_SQLITE:
+            continue
+        modificador, fator = _UNIDADES_SQLITE[unidade[1].upper()]
+        sinal = "-" if nome == "DATE_SUB" else "+"
+        trocas[i] = ("datetime" if modificador in ("seconds", "minutes", "hours") else "date", 1)
+        trocas[j - 3] = (f"'{sinal}{float(numero[1]) * fator:g} {modificador}'", 3)
+    return trocas
+
+
+def traduzir_sql(sql: str, motor: str, banco=None) -> str:
+    """SQL gerada para o MySQL no dialeto do motor local: crases viram aspas duplas, strings ficam entre aspas simples,
+    o prefixo `banco.` some (só há um banco) e funções de data do MySQL (e, no DuckDB, LIMIT a, b) são adaptadas."""
+    formatos, intervalos = None, None
+
+    def substituir(tokens, i):
+        nonlocal formatos, intervalos
+        if formatos is None:
+            formatos = _formatos_data(tokens) if motor == "duckdb" else set()
+            intervalos = _intervalos_sqlite(tokens) if motor == "sqlite" else {}
+        if i in intervalos:
+            return intervalos[i]
+        tipo, texto = tokens[i][0], tokens[i][1]
+        seguintes = tokens[i + 1:i + 4]
+        proximo = seguintes[0][1] if seguintes else ""
+        nome = texto[1:-1].replace("``", "`") if tipo == "identificador" else texto
+        if banco and tipo in ("palavra", "identificador") and nome.lower() == banco.lower() and proximo == "." \
+                and (i == 0 or tokens[i - 1][1] != "."):
+            return "", 2
+        if tipo == "identificador":
+            return '"' + nome.replace('"', '""') + '"', 1
+        if tipo == "string":
+            literal = _literal(texto)
+            return (converter_formato_data(literal) if i in formatos else literal), 1
+        if tipo == "comentario" and texto.startswith("#"):
+            return "--" + texto[1:], 1
+        if motor == "duckdb" and tipo == "palavra" and texto.upper() in MACROS_DUCKDB and proximo == "(":
+            return MACROS_DUCKDB[texto.upper()][0], 1
+        if motor == "duckdb" and texto.upper() == "LIMIT" and [t[0] for t in seguintes] == ["numero", "simbolo", "numero"] \
+                and seguintes[1][1] == ",":
+            return f"LIMIT {seguintes[2][1]} OFFSET {seguintes[0][1]}", 4
+        return None
+
+    return reescrever_tokens(sql, substituir)
+
+
+def _tipo_duckdb(tipo) -> str:
+    return "INTEGER" if tipo == "int" else "VARCHAR" if tipo.startswith("varchar") else tipo.upper()
+
+
+def _arquivo_tabela(diretorio, tabela):
+    for extensao in EXTENSOES:
+        caminho = os.path.join(diretorio, tabela + extensao)
+        if os.path.exists(caminho):
+            return caminho
+    return None
+
+
+def _abrir_csv(caminho):
+    if caminho.endswith(".gz"):
+        return gzip.open(caminho, "rt", newline="", encoding="utf-8")
+    if caminho.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("CSV zstd no sqlite requer o pacote 'zstandard' (pip install zstandard).")
+        bruto = open(caminho, "rb")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(bruto), newline="", encoding="utf-8")
+    return open(caminho, newline="", encoding="utf-8")
+
+
+def _data_mysql(valor):
+    if valor is None:
+        return None
+    texto = str(valor)
+    return datetime.datetime.fromisoformat(texto if len(texto) > 10 else texto[:10] + " 00:00:00")
+
+
+def _date_format(valor, formato):
+    data = _data_mysql(valor)
+    if data is None or formato is None:
+        return None
+    return data.strftime(converter_formato_data(formato))
+
+
+def _se(condicao, verdadeiro, falso):
+    # IF() do MySQL: NULL e zero (inclusive '0' e '0.0') são falsos
+    try:
+        return verdadeiro if condicao is not None and float(condicao) != 0 else falso
+    except (TypeError, ValueError):
+        return falso
+
+
+def _rand(*semente):
+    return random.Random(semente[0]).random() if semente and semente[0] is not None else random.random()
+
+
+def _registrar_funcoes_sqlite(conn):
+    # o mínimo de funções do MySQL que o Gemini costuma usar; datas ficam como texto ISO
+    conn.create_function("YEAR", 1, lambda d: _data_mysql(d).year if d else None, deterministic=True)
+    conn.create_function("MONTH", 1, lambda d: _data_mysql(d).month if d else None, deterministic=True)
+    conn.create_function("DAY", 1, lambda d: _data_mysql(d).day if d else None, deterministic=True)
+    conn.create_function("DATE_FORMAT", 2, _date_format, deterministic=True)
+    conn.create_function("DATEDIFF", 2, lambda a, b: (_data_mysql(a) - _data_mysql(b)).days if a and b else None,
+                         deterministic=True)
+    conn.create_function("CURDATE", 0, lambda: datetime.date.today().isoformat())
+    conn.create_function("NOW", 0, lambda: datetime.datetime.now().isoformat(sep=" ", timespec="seconds"))
+    conn.create_function("CONCAT", -1, lambda *v: None if any(x is None for x in v) else "".join(str(x) for x in v),
+                         deterministic=True)
+    conn.create_function("IF", 3, _se, deterministic=True)
+    conn.create_function("RAND", -1, _rand)
+
+
+def _escolher_motor(preferido):
+    if preferido in ("auto", "duckdb"):
+        try:
+            import duckdb
+            return "duckdb", duckdb
+        except ImportError:
+            if preferido == "duckdb":
+                raise RuntimeError("O motor local duckdb requer o pacote 'duckdb' (pip install duckdb).")
+            print("Aviso: duckdb não instalado; backend local usando sqlite3 (sem execução vetorizada).")
+    return "sqlite", None
+
+
+class BancoLocal:
+    """Os datasets de banco_de_dados/datasets num motor SQL em processo, com o schema do create_table.py.
+    DuckDB (colunar, vetorizado): Parquet é consultado direto do arquivo e CSV é carregado uma vez em tabelas colunares.
+    Sem duckdb, cai para sqlite3 da biblioteca padrão. Somente leitura: recarrega quando um arquivo muda."""
+
+    def __init__(self, diretorio=DIR_DATASETS, motor=MOTOR_LOCAL, nome_banco="local"):
+        self.diretorio = diretorio
+        self.nome_banco = nome_banco
+        self.motor, self._duckdb = _escolher_motor(motor)
+        self._conn = None
+        self._catalogo = None
+        self._impressao = None
+        self._ultima_verificacao = 0.0
+        self._lock = threading.RLock()  # sqlite: uma instrução por vez na conexão compartilhada
+
+    # --- CARGA ---
+    def _arquivos(self) -> dict:
+        arquivos = {}
+        for tabela in ESQUEMA:
+            caminho = _arquivo_tabela(self.diretorio, tabela)
+            if caminho is not None:
+                estado = os.stat(caminho)
+                arquivos[tabela] = (caminho, f"{os.path.basename(caminho)}|{estado.st_size}|{estado.st_mtime_ns}")
+        return arquivos
+
+    def _carregar_duckdb(self, arquivos):
+        conn = self._duckdb.connect(":memory:")
+        for nome, definicao in MACROS_DUCKDB.values():
+            conn.execute(f"CREATE MACRO {nome}{definicao}")
+        for tabela, (caminho, _) in arquivos.items():
+            colunas = ESQUEMA[tabela]
+            caminho_sql = caminho.replace("'", "''")
+            if caminho.endswith(".parquet"):
+                # view: cada consulta varre o Parquet (mapeado em memória), lendo só as colunas e row groups usados
+                projecao = ", ".join(f'CAST("{c}" AS {_tipo_duckdb(t)}) AS "{c}"' for c, t in colunas)
+                conn.execute(f'CREATE VIEW "{tabela}" AS SELECT {projecao} FROM read_parquet(\'{caminho_sql}\')')
+            else:
+                tipos = ", ".join(f"'{c}': '{_tipo_duckdb(t)}'" for c, t in colunas)
+                conn.execute(f'CREATE TABLE "{tabela}" AS SELECT * FROM read_csv(\'{caminho_sql}\', header = true, '
+                             f'columns = {{{tipos}}})')
+        return conn
+
+    def _carregar_sqlite(self, arquivos):
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        _registrar_funcoes_sqlite(conn)
+        for tabela, (caminho, _) in arquivos.items():
+            if caminho.endswith(".parquet"):
+                raise RuntimeError(f"'{os.path.basename(caminho)}': Parquet no backend local requer o pacote 'duckdb' (pip install duckdb).")
+            colunas = ESQUEMA[tabela]
+            definicao = ", ".join(f'"{c}" {t.upper()}' + (" PRIMARY KEY" if n == 0 else "") for n, (c, t) in enumerate(colunas))
+            conn.execute(f'CREATE TABLE "{tabela}" ({definicao})')
+            nomes = [c for c, _ in colunas]
+            with _abrir_csv(caminho) as arquivo:
+                leitor = csv.DictReader(arquivo)
+                conn.executemany(f'INSERT INTO "{tabela}" VALUES ({", ".join("?" * len(nomes))})',
+                                 ([linha.get(c) or None for c in nomes] for linha in leitor))
+        conn.commit()
+        return conn
+
+    def _montar_catalogo(self, arquivos, impressao) -> CatalogoSchema:
+        catalogo = CatalogoSchema(self.nome_banco)
+        tabelas = {}
+        for tabela in arquivos:
+            colunas = ESQUEMA[tabela]
+            chave = colunas[0][0]
+            fks = [{"coluna": CHAVES_ESTRANGEIRAS[tabela], "tabela_ref": "clientes", "coluna_ref": "cliente_id",
+                    "nome": f"{tabela}_ibfk_1"}] if tabela in CHAVES_ESTRANGEIRAS else []
+            tabelas[tabela] = {"colunas": [{"nome": c, "tipo": t, "nulo": c != chave} for c, t in colunas],
+                               "chave_primaria": [chave], "chaves_estrangeiras": fks,
+                               "indices": {"PRIMARY": {"colunas": [chave], "unico": True}}}
+        catalogo.tabelas = tabelas
+        catalogo.impressoes = {tabela: marcador for tabela, (_, marcador) in arquivos.items()}
+        catalogo.marcadores_dados = dict(catalogo.impressoes)
+        catalogo.impressao = impressao
+        catalogo.ultima_verificacao = time.monotonic()
+        return catalogo
+
+    def verificar(self, forcar=False) -> bool:
+        """Recarrega tudo se algum dataset mudou (tamanho/mtime). Retorna True se houve carga."""
+        with self._lock:
+            agora = time.monotonic()
+            if not forcar and self._conn is not None and agora - self._ultima_verificacao < INTERVALO_VERIFICACAO:
+                return False
+            self._ultima_verificacao = agora
+            arquivos = self._arquivos()
+            impressao = hashlib.sha256(
+                (self.motor + "\n" + "\n".join(f"{t}={m}" for t, (_, m) in sorted(arquivos.items()))).encode("utf-8")
+            ).hexdigest()
+            if not forcar and impressao == self._impressao:
+                return False
+            inicio = time.perf_counter()
+            conn = self._carregar_duckdb(arquivos) if self.motor == "duckdb" else self._carregar_sqlite(arquivos)
+            anterior, self._conn = self._conn, conn
+            self._catalogo = self._montar_catalogo(arquivos, impressao)
+            self._impressao = impressao
+            if anterior is not None:
+                anterior.close()
+            print(f"Banco local ({self.motor}): {len(arquivos)} tabela(s) de '{self.diretorio}' carregada(s) em "
+                  f"{(time.perf_counter() - inicio) * 1000:.0f} ms.")
+            return True
+
+    def catalogo(self, forcar=False) -> CatalogoSchema:
+        self.verificar(forcar)
+        return self._catalogo
+
+    # --- EXECUÇÃO ---
+    @contextmanager
+    def _cursor(self, tempo_max_ms):
+        self.verificar()
+        with self._lock:
+            conn = self._conn
+            if self.motor == "duckdb":
+                # cada execução ganha a própria conexão ao mesmo banco em memória: consultas em paralelo
+                conn = conn.cursor()
+        expirou = threading.Event()
+
+        def interromper():
+            expirou.set()
+            conn.interrupt()
+
+        timer = threading.Timer(tempo_max_ms / 1000, interromper)
+        timer.daemon = True
+        try:
+            if self.motor == "sqlite":
+                self._lock.acquire()
+            timer.start()
+            try:
+                yield conn.cursor() if self.motor == "sqlite" else conn
+            except Exception as e:
+                if expirou.is_set():
+                    metricas.incrementar("queryflow_consultas_interrompidas_total")
+                    raise ConsultaInterrompidaError(
+                        f"Consulta interrompida após {tempo_max_ms / 1000:.0f}s (limite QUERYFLOW_TEMPO_MAX_MS)."
+                    ) from e
+                raise
+        finally:
+            timer.cancel()
+            if self.motor == "sqlite":
+                self._lock.release()
+            else:
+                conn.close()
+
+    def _ler(self, cursor, sql, inicio, tamanho_pagina, max_linhas=None):
+        cursor.execute(sql)
+        colunas = [d[0] for d in cursor.description or ()]
+        linhas, parou_cedo, truncado, motivo, lidas, bytes_lidos = ler_pagina(
+            cursor, inicio, tamanho_pagina, **({"max_linhas": max_linhas} if max_linhas else {})
+        )
+        return colunas, linhas, parou_cedo, truncado, motivo, lidas, bytes_lidos
+
+    def executar(self, query_sql, inicio=0, tempo_max_ms=TEMPO_MAX_MS, banco=None):
+        """Mesmo contrato da execução no MySQL: ResultadoConsulta (uma página) ou ResultadoLote. Só leituras."""
+        instrucoes = dividir_instrucoes(query_sql)
+        escritas = [i for i in instrucoes if not e_somente_leitura(i)]
+        if escritas:
+            raise ValueError("O backend local é somente leitura; use o MySQL para comandos que alteram dados.")
+        with self._cursor(tempo_max_ms) as cursor:
+            if len(instrucoes) == 1:
+                colunas, linhas, parou_cedo, truncado, motivo, lidas, bytes_lidos = self._ler(
+                    cursor, traduzir_sql(query_sql, self.motor, banco), inicio, TAMANHO_PAGINA
+                )
+                return ResultadoConsulta(colunas, linhas, inicio=inicio, tem_mais=parou_cedo and not truncado,
+                                         truncado=truncado, motivo=motivo, linhas_lidas=lidas, bytes_lidos=bytes_lidos)
+            resultados = []
+            for instrucao in instrucoes:
+                if retorna_linhas(instrucao):
+                    instrucao = adicionar_limite(instrucao, MAX_LINHAS_INSTRUCAO + 1) or instrucao
+                colunas, linhas, parou_cedo, truncado, motivo, lidas, bytes_lidos = self._ler(
+                    cursor, traduzir_sql(instrucao, self.motor, banco), 0, MAX_LINHAS_INSTRUCAO, MAX_LINHAS_INSTRUCAO
+                )
+                resultados.append(ResultadoConsulta(
+                    colunas, linhas, truncado=parou_cedo,
+                    motivo=motivo or (f"limite de {MAX_LINHAS_INSTRUCAO} linhas por instrução" if parou_cedo else ""),
+                    linhas_lidas=lidas, bytes_lidos=bytes_lidos,
+                ))
+            return ResultadoLote(instrucoes, resultados)
+
+
+_banco_local = None
+_banco_local_lock = threading.Lock()
+
+
+def obter_banco_local() -> BancoLocal:
+    global _banco_local
+    with _banco_local_lock:
+        if _banco_local is None:
+            _banco_local = BancoLocal()
+        return _banco_local
@@ -0,0 +1,461 @@
+# Benchmark de ponta a ponta do pipeline do QueryFlow, sem rede e sem MySQL.
+#
+# Cada pergunta passa por MotorQueryFlow.perguntar, o mesmo código do app (catálogo, cache de geração, seleção de
+# schema, prompt, gateway do Gemini, validação, execução e gravador de histórico). Só as dependências externas são
+# trocadas: o banco é o backend local (banco_local.py) sobre banco_de_dados/datasets/*.csv replicados na escala pedida,
+# o Gemini é um dublê com latência configurável e o histórico vai para um SQLite. Os tempos por estágio saem dos spans
+# do rastro de cada pergunta. A cota do gateway (QUERYFLOW_GEMINI_RPM/TPM) vale também para o dublê.
+#
+# Uso:
+#     python benchmark_pipeline.py --sessoes 16 --requisicoes 50 --escala 10 --saida base.json
+#     python benchmark_pipeline.py --sessoes 16 --requisicoes 50 --escala 10 --comparar base.json
+import os
+import sys
+import csv
+import json
+import math
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+from pool_conexoes import PoolConexoes
+from cache_geracao import CacheGeracao
+from banco_local import BancoLocal, MOTOR_LOCAL
+from selecao_schema import estimar_tokens
+from gravador_historico import GravadorHistorico
+from motor_queryflow import MotorQueryFlow
+from metricas import span
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+DIR_DATASETS = os.path.join(RAIZ, "banco_de_dados", "datasets")
+NOME_BANCO = "querypilot_benchmark"
+# nomes dos spans do motor que viram estágios do relatório ("total" é o rastro inteiro)
+ESTAGIOS = ("cache_geracao", "selecao_schema", "gemini", "validacao", "execucao", "historico", "total")
+
+DDL_HISTORICO_SQLITE = """CREATE TABLE historico_interacoes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, pergunta TEXT, query_gerada TEXT, resultado LONGTEXT,
+    resultado_previa BLOB, resultado_linhas INT, resultado_colunas TEXT, resultado_hash BLOB,
+    feedback VARCHAR(10), data TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"""
+DONO_CHAVE = {"cliente_id": "clientes", "endereco_id": "enderecos", "movimentacao_id": "movimentacoes", "pagamento_id": "pagamentos"}
+
+# Perguntas padrão com a SQL que o Gemini falso devolve (SQL que roda igual no MySQL e nos motores locais)
+PERGUNTAS_PADRAO = [
+    ("Quantos clientes existem?", "SELECT COUNT(*) AS total FROM clientes"),
+    ("Qual o total movimentado por tipo de movimentação?",
+     "SELECT tipo_movimentacao, COUNT(*) AS quantidade, SUM(valor) AS total FROM movimentacoes GROUP BY tipo_movimentacao"),
+    ("Quantos clientes temos em cada estado?",
+     "SELECT estado, COUNT(*) AS clientes FROM enderecos GROUP BY estado ORDER BY clientes DESC"),
+    ("Quais foram os 50 últimos pagamentos e de quem?",
+     "SELECT p.pagamento_id, c.nome, p.valor, p.data_pagamento FROM pagamentos p "
+     "JOIN clientes c ON c.cliente_id = p.cliente_id ORDER BY p.data_pagamento DESC, p.pagamento_id DESC LIMIT 50"),
+    ("Qual o valor pago por mês?",
+     "SELECT DATE_FORMAT(data_pagamento, '%Y-%m') AS mes, SUM(valor) AS total FROM pagamentos "
+     "GROUP BY DATE_FORMAT(data_pagamento, '%Y-%m') ORDER BY mes"),
+    ("Quais os 10 clientes com maior saldo?",
+     "SELECT c.cliente_id, c.nome, COALESCE(m.total, 0) - COALESCE(p.total, 0) AS saldo FROM clientes c "
+     "LEFT JOIN (SELECT cliente_id, SUM(CASE WHEN tipo_movimentacao = 'depósito' THEN valor ELSE -valor END) AS total "
+     "FROM movimentacoes GROUP BY cliente_id) m ON m.cliente_id = c.cliente_id "
+     "LEFT JOIN (SELECT cliente_id, SUM(valor) AS total FROM pagamentos GROUP BY cliente_id) p ON p.cliente_id = c.cliente_id "
+     "ORDER BY saldo DESC LIMIT 10"),
+    ("Liste todas as movimentações", "SELECT movimentacao_id, cliente_id, tipo_movimentacao, valor, data_movimentacao FROM movimentacoes"),
+    ("Quais clientes moram em cada cidade?",
+     "SELECT e.cidade, c.nome, c.email FROM clientes c JOIN enderecos e ON e.cliente_id = c.cliente_id ORDER BY e.cidade, c.nome"),
+]
+
+
+# --- DATASETS NA ESCALA DO TESTE ---
+def preparar_datasets(destino, dir_datasets=DIR_DATASETS, escala=1.0):
+    """Grava em `destino` os CSVs do backend local. Escala > 1 replica os dados deslocando os ids; < 1 usa uma fração."""
+    os.makedirs(destino, exist_ok=True)
+    contagens = {}
+    for tabela in DONO_CHAVE.values():
+        with open(os.path.join(dir_datasets, f"{tabela}.csv"), newline="", encoding="utf-8") as f:
+            leitor = csv.reader(f)
+            colunas = next(leitor)
+            linhas = list(leitor)
+        posicoes_id = [(i, DONO_CHAVE[c]) for i, c in enumerate(colunas) if c in DONO_CHAVE]
+        contagens[tabela] = (colunas, linhas, posicoes_id)
+    maiores = {t: max((int(l[0]) for l in contagens[t][1]), default=0) for t in contagens}
+
+    total_linhas = 0
+    for tabela, (colunas, linhas, posicoes_id) in contagens.items():
+        alvo = int(round(len(linhas) * escala))
+        with open(os.path.join(destino, f"{tabela}.csv"), "w", newline="", encoding="utf-8") as f:
+            escritor = csv.writer(f)
+            escritor.writerow(colunas)
+            copia = 0
+            while alvo > 0:
+                lote = linhas[:alvo]
+                if copia:
+                    lote = [list(l) for l in lote]
+                    for linha in lote:
+                        for i, dono in posicoes_id:
+                            linha[i] = int(linha[i]) + copia * maiores[dono]
+                escritor.writerows(lote)
+                total_linhas += len(lote)
+                alvo -= len(lote)
+                copia += 1
+    return total_linhas
+
+
+# --- HISTÓRICO NUM SQLITE NO LUGAR DO MYSQL ---
+class _CursorSqlite:
+    """Cursor com placeholders %s (estilo mysql-connector), para o gravador rodar sem alterações."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=None):
+        if params is None:
+            return self._cursor.execute(sql)
+        return self._cursor.execute(sql.replace("%s", "?"), params)
+
+    def executemany(self, sql, linhas):
+        return self._cursor.executemany(sql.replace("%s", "?"), linhas)
+
+    def __getattr__(self, nome):
+        return getattr(self._cursor, nome)
+
+
+class _ConexaoSqlite:
+    def __init__(self, caminho):
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA busy_timeout = 30000")
+
+    def cursor(self, **_):
+        return _CursorSqlite(self._conn.cursor())
+
+    def __getattr__(self, nome):
+        return getattr(self._conn, nome)
+
+
+def criar_banco_historico(caminho_db):
+    conn = sqlite3.connect(caminho_db)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(DDL_HISTORICO_SQLITE)
+    conn.commit()
+    conn.close()
+
+
+class _GravadorSqlite(GravadorHistorico):
+    def _aplicar_ddl(self, conn):
+        # A tabela já foi criada por criar_banco_historico; AUTOINCREMENT do SQLite não garante ids de lote consecutivos
+        self._ids_consecutivos, self._incremento = False, 1
+        self._ddl_aplicada = True
+
+
+# --- GEMINI FALSO ---
+class _RespostaFalsa:
+    """Resposta em streaming no formato do SDK: iterável de pedaços com `.text`, `usage_metadata` no fim."""
+
+    def __init__(self, pedacos, uso, atraso):
+        self._pedacos = pedacos
+        self._atraso = atraso
+        self.usage_metadata = uso
+
+    def __iter__(self):
+        time.sleep(self._atraso)
+        for pedaco in self._pedacos:
+            yield SimpleNamespace(text=pedaco)
+
+    @property
+    def text(self):
+        return "".join(self._pedacos)
+
+
+class GeminiFalso:
+    """Substitui genai.GenerativeModel: devolve a SQL pronta da pergunta após uma latência sorteada."""
+
+    def __init__(self, respostas: dict, latencia_ms=800.0, variacao_ms=200.0, taxa_markdown=0.3, semente=0,
+                 nome_modelo="gemini-falso"):
+        self.respostas = respostas
+        self.latencia_ms = latencia_ms
+        self.variacao_ms = variacao_ms
+        self.taxa_markdown = taxa_markdown
+        self.model_name = nome_modelo
+        self._rnd = random.Random(semente)
+        self._lock = threading.Lock()
+        self.chamadas = 0
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        pergunta = prompt.rsplit("Pergunta: ", 1)[-1].rsplit("\nQuery SQL:", 1)[0].strip()
+        sql = self.respostas.get(pergunta, "SELECT 1")
+        with self._lock:
+            atraso = max(0.0, self._rnd.gauss(self.latencia_ms, self.variacao_ms)) / 1000
+            markdown = self._rnd.random() < self.taxa_markdown
+            self.chamadas += 1
+        if request_options and request_options.get("timeout") is not None:
+            atraso = min(atraso, request_options["timeout"])
+        texto = f"```sql\n{sql}\n```" if markdown else sql
+        uso = SimpleNamespace(prompt_token_count=estimar_tokens(prompt), candidates_token_count=estimar_tokens(texto))
+        uso.total_token_count = uso.prompt_token_count + uso.candidates_token_count
+        # dois pedaços, como um stream curto do SDK
+        meio = len(texto) // 2
+        resposta = _RespostaFalsa([texto[:meio], texto[meio:]], uso, atraso)
+        if not stream:
+            list(resposta)
+        return resposta
+
+
+# --- MOTOR DO APP COM AS DEPENDÊNCIAS TROCADAS ---
+class MotorBenchmark(MotorQueryFlow):
+    """MotorQueryFlow com backend local sobre os datasets do teste, Gemini falso (ou real, com `modelo=None`),
+    cache de geração em arquivo temporário e histórico gravado pelo GravadorHistorico num SQLite."""
+
+    def __init__(self, banco_local, cache_geracao, gravador, modelo=None, nome_modelo="gemini-falso", chave_api="benchmark"):
+        super().__init__("", "", "", NOME_BANCO, chave_api=chave_api, modelo=nome_modelo, backend="local")
+        self._banco_local = banco_local
+        self._cache_geracao = cache_geracao
+        self._gravador = gravador
+        self._modelo_falso = modelo
+
+    def banco_local(self):
+        return self._banco_local
+
+    def cache_geracao(self):
+        return self._cache_geracao
+
+    def modelo_gemini(self):
+        return self._modelo_falso if self._modelo_falso is not None else super().modelo_gemini()
+
+    def salvar_historico(self, pergunta, query, resultado):
+        # o backend local não grava histórico no app; aqui o mesmo gravador do MySQL escreve no SQLite
+        with span("historico"):
+            return self._gravador.registrar_interacao(pergunta, query, resultado)
+
+
+class _CacheDesligado(CacheGeracao):
+    """--sem-cache: toda pergunta vai ao Gemini."""
+
+    def obter(self, chave):
+        return None
+
+    def guardar(self, *args, **kwargs):
+        pass
+
+
+# --- ESTATÍSTICAS ---
+def percentil(valores_ordenados, p):
+    # Posto mais próximo: p99 de 100 amostras é a 99ª, sem interpolação
+    if not valores_ordenados:
+        return None
+    return valores_ordenados[max(0, math.ceil(p / 100 * len(valores_ordenados)) - 1)]
+
+
+def resumir_amostras(amostras) -> dict:
+    ordenados = sorted(amostras)
+    if not ordenados:
+        return {"n": 0}
+    return {
+        "n": len(ordenados),
+        "p50_ms": round(percentil(ordenados, 50), 3),
+        "p95_ms": round(percentil(ordenados, 95), 3),
+        "p99_ms": round(percentil(ordenados, 99), 3),
+        "media_ms": round(sum(ordenados) / len(ordenados), 3),
+        "max_ms": round(ordenados[-1], 3),
+    }
+
+
+def _rss_pico_mb():
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024, 1)  # macOS em bytes, Linux em KB
+    except Exception:
+        return None
+
+
+# --- EXECUÇÃO ---
+class Benchmark:
+    def __init__(self, dir_datasets, caminho_historico, modelo, perguntas, sessoes=8, requisicoes=25, tamanho_pool=5,
+                 usar_caches=True, pausa_ms=0.0, semente=42, dir_temp=None, nome_modelo="gemini-falso",
+                 motor_local=MOTOR_LOCAL, chave_api="benchmark"):
+        self.modelo = modelo
+        self.perguntas = [p for p, _ in perguntas]
+        # Popularidade tipo Zipf: poucas perguntas quentes, cauda de perguntas raras
+        self.pesos = [1.0 / (i + 1) for i in range(len(self.perguntas))]
+        self.sessoes = sessoes
+        self.requisicoes = requisicoes
+        self.usar_caches = usar_caches
+        self.pausa_ms = pausa_ms
+        self.semente = semente
+        self.banco_local = BancoLocal(dir_datasets, motor_local, nome_banco=NOME_BANCO)
+        caminho_cache = os.path.join(dir_temp or tempfile.gettempdir(), "cache_geracao_benchmark.sqlite3")
+        self.cache_geracao = CacheGeracao(caminho_cache) if usar_caches else _CacheDesligado(caminho_cache)
+        self.pool = PoolConexoes(lambda: _ConexaoSqlite(caminho_historico), tamanho=tamanho_pool,
+                                 verificar=lambda c: c.execute("SELECT 1") is not None)
+        self.gravador = _GravadorSqlite(self.pool.conexao)
+        self.motor = MotorBenchmark(self.banco_local, self.cache_geracao, self.gravador, modelo, nome_modelo, chave_api)
+        self.motor.catalogo()  # carga dos datasets fora da medição
+        self.amostras = {estagio: [] for estagio in ESTAGIOS}
+        self._amostras_lock = threading.Lock()
+        self.erros = []
+        self.tokens_prompt = 0
+        self.pico_conexoes = {"abertas": 0, "em_uso": 0}
+        self._parar_monitor = threading.Event()
+
+    def _requisicao(self, pergunta):
+        resposta = self.motor.perguntar(pergunta, tipo="benchmark")
+        if not resposta.ok:
+            raise RuntimeError(f"{resposta.etapa_erro}: {resposta.erro}")
+        rastro = resposta.rastro
+        duracoes = {}
+        for registro in rastro["spans"]:
+            if registro["nome"] in self.amostras:
+                duracoes[registro["nome"]] = duracoes.get(registro["nome"], 0.0) + registro["duracao_ms"]
+            if registro["nome"] == "gemini":
+                self.tokens_prompt += registro["atributos"].get("tokens_prompt", 0) or 0
+        duracoes["total"] = rastro["duracao_ms"]
+        with self._amostras_lock:
+            for estagio, duracao in duracoes.items():
+                self.amostras[estagio].append(duracao)
+
+    def _sessao(self, numero):
+        rnd = random.Random(self.semente + numero)
+        for _ in range(self.requisicoes):
+            pergunta = rnd.choices(self.perguntas, weights=self.pesos)[0]
+            try:
+                self._requisicao(pergunta)
+            except Exception as e:
+                self.erros.append(f"{pergunta}: {e}")
+            if self.pausa_ms:
+                time.sleep(self.pausa_ms / 1000)
+
+    def _monitorar(self):
+        while not self._parar_monitor.wait(0.005):
+            r = self.pool.resumo()
+            self.pico_conexoes["abertas"] = max(self.pico_conexoes["abertas"], r["abertas"])
+            self.pico_conexoes["em_uso"] = max(self.pico_conexoes["em_uso"], r["abertas"] - r["livres"])
+
+    def rodar(self) -> dict:
+        monitor = threading.Thread(target=self._monitorar, daemon=True)
+        monitor.start()
+        threads = [threading.Thread(target=self._sessao, args=(n,), name=f"sessao-{n}") for n in range(self.sessoes)]
+        inicio = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        duracao = time.perf_counter() - inicio
+        inicio_flush = time.perf_counter()
+        self.gravador.fechar(timeout=30)
+        flush_ms = (time.perf_counter() - inicio_flush) * 1000
+        self._parar_monitor.set()
+        monitor.join()
+        self.pool.fechar()
+
+        concluidas = len(self.amostras["total"])
+        return {
+            "duracao_s": round(duracao, 3),
+            "requisicoes": concluidas,
+            "erros": len(self.erros),
+            "exemplos_erros": self.erros[:5],
+            "vazao_rps": round(concluidas / duracao, 2) if duracao else 0.0,
+            "estagios": {estagio: resumir_amostras(self.amostras[estagio]) for estagio in ESTAGIOS},
+            "llm": {"chamadas": getattr(self.modelo, "chamadas", None), "tokens_prompt": self.tokens_prompt},
+            "caches": {"geracao": self.cache_geracao.resumo() if self.usar_caches else None},
+            "banco_local": {"motor": self.banco_local.motor},
+            "conexoes_historico": {"pool": self.pool.resumo(), "pico_abertas": self.pico_conexoes["abertas"],
+                                   "pico_em_uso": self.pico_conexoes["em_uso"]},
+            "historico": {**self.gravador.resumo(), "flush_final_ms": round(flush_ms, 1)},
+        }
+
+
+def comparar(atual: dict, base: dict, tolerancia=0.2) -> list:
+    """Lista as regressões: p95 de algum estágio ou vazão piores que a base além da tolerância."""
+    regressoes = []
+    for estagio, r in atual["estagios"].items():
+        anterior = base.get("estagios", {}).get(estagio, {})
+        if r.get("p95_ms") is not None and anterior.get("p95_ms"):
+            if r["p95_ms"] > anterior["p95_ms"] * (1 + tolerancia):
+                regressoes.append(f"{estagio}: p95 {anterior['p95_ms']} ms -> {r['p95_ms']} ms")
+    if base.get("vazao_rps") and atual["vazao_rps"] < base["vazao_rps"] * (1 - tolerancia):
+        regressoes.append(f"vazão: {base['vazao_rps']} -> {atual['vazao_rps']} req/s")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline do pipeline do QueryFlow (MotorQueryFlow + backend local + Gemini falso).")
+    parser.add_argument("--sessoes", type=int, default=8, help="Sessões simultâneas (uma thread cada)")
+    parser.add_argument("--requisicoes", type=int, default=25, help="Perguntas por sessão")
+    parser.add_argument("--escala", type=float, default=1.0, help="Multiplicador do volume dos CSVs")
+    parser.add_argument("--datasets", default=DIR_DATASETS)
+    parser.add_argument("--perguntas", help="JSON com [{\"pergunta\": ..., \"sql\": ...}] para o Gemini falso")
+    parser.add_argument("--llm", choices=["falso", "gemini"], default="falso", help="gemini usa a API real (GEMINI_API_KEY)")
+    parser.add_argument("--modelo", default=os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash-latest"))
+    parser.add_argument("--latencia-llm-ms", type=float, default=800.0)
+    parser.add_argument("--variacao-llm-ms", type=float, default=200.0)
+    parser.add_argument("--motor-local", default=MOTOR_LOCAL, choices=["auto", "duckdb", "sqlite"],
+                        help="Motor do backend local que executa as consultas")
+    parser.add_argument("--pool", type=int, default=5, help="Tamanho do pool de conexões do histórico")
+    parser.add_argument("--pausa-ms", type=float, default=0.0, help="Pausa entre perguntas de uma sessão")
+    parser.add_argument("--sem-cache", action="store_true", help="Desliga o cache de geração")
+    parser.add_argument("--tracemalloc", action="store_true", help="Mede o pico de memória Python (deixa tudo mais lento)")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--saida", help="Arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior; sai com código 1 se houver regressão")
+    parser.add_argument("--tolerancia", type=float, default=0.2)
+    args = parser.parse_args()
+
+    perguntas = PERGUNTAS_PADRAO
+    if args.perguntas:
+        with open(args.perguntas, encoding="utf-8") as f:
+            perguntas = [(p["pergunta"], p["sql"]) for p in json.load(f)]
+
+    dir_temp = tempfile.mkdtemp(prefix="queryflow_benchmark_")
+    try:
+        dir_datasets = os.path.join(dir_temp, "datasets")
+        caminho_historico = os.path.join(dir_temp, "historico.sqlite3")
+        inicio = time.perf_counter()
+        linhas = preparar_datasets(dir_datasets, args.datasets, args.escala)
+        criar_banco_historico(caminho_historico)
+        carga_s = time.perf_counter() - inicio
+        print(f"Datasets de teste: {linhas} linhas em {carga_s:.1f}s", file=sys.stderr)
+
+        if args.llm == "gemini":
+            # modelo real criado pelo próprio motor (obter_modelo), com a chave do ambiente
+            modelo, nome_modelo, chave_api = None, args.modelo, os.environ["GEMINI_API_KEY"]
+        else:
+            modelo = GeminiFalso(dict(perguntas), args.latencia_llm_ms, args.variacao_llm_ms, semente=args.semente)
+            nome_modelo, chave_api = modelo.model_name, "benchmark"
+        if args.tracemalloc:
+            tracemalloc.start()
+        # os prints do motor vão para o stderr: o stdout fica só com o JSON do resultado
+        with redirect_stdout(sys.stderr):
+            benchmark = Benchmark(dir_datasets, caminho_historico, modelo, perguntas, args.sessoes, args.requisicoes,
+                                  args.pool, usar_caches=not args.sem_cache, pausa_ms=args.pausa_ms,
+                                  semente=args.semente, dir_temp=dir_temp, nome_modelo=nome_modelo,
+                                  motor_local=args.motor_local, chave_api=chave_api)
+            resultado = benchmark.rodar()
+        resultado["memoria"] = {
+            "rss_pico_mb": _rss_pico_mb(),
+            "tracemalloc_pico_mb": round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1) if args.tracemalloc else None,
+        }
+        resultado["configuracao"] = {**vars(args), "linhas_banco": linhas, "carga_banco_s": round(carga_s, 2)}
+    finally:
+        shutil.rmtree(dir_temp, ignore_errors=True)
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regressoes = comparar(resultado, json.load(f), args.tolerancia)
+        for r in regressoes:
+            print(f"REGRESSÃO: {r}", file=sys.stderr)
+        if regressoes:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+
+CAMINHO_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "dados", "cache_geracao.sqlite3")
+CAMINHO_CACHE = os.getenv("QUERYFLOW_CACHE_GERACAO_PATH", CAMINHO_PADRAO)
+TTL_SEGUNDOS = float(os.getenv("QUERYFLOW_CACHE_GERACAO_TTL", str(7 * 24 * 3600)))
+TTL_PROMOVIDO_SEGUNDOS = float(os.getenv("QUERYFLOW_CACHE_GERACAO_TTL_PROMOVIDO", str(90 * 24 * 3600)))
+MAX_ENTRADAS = int(os.getenv("QUERYFLOW_CACHE_GERACAO_MAX", "5000"))
+USAR_FEEDBACK = os.getenv("QUERYFLOW_CACHE_GERACAO_FEEDBACK", "1") == "1"
+
+# Palavras que não mudam o sentido da pergunta ("Me mostre todos os clientes" == "mostre todos clientes").
+# Negações e quantificadores ficam de fora de propósito.
+STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "uns", "umas", "de", "do", "da", "dos", "das", "em", "no", "na", "nos", "nas",
+    "me", "mim", "por", "favor", "pf", "pfv", "e", "que", "qual", "quais", "para", "pra", "ao", "aos", "se", "eu",
+    "sao", "voce", "poderia", "pode", "consegue", "gostaria", "quero", "queria",
+}
+
+FEEDBACK_POSITIVO = 1
+FEEDBACK_NEGATIVO = -1
+
+
+# Operadores mudam a resposta ("valor > 100" != "valor < 100"): viram palavras antes de a pontuação sair
+OPERADORES = [
+    (r">=|=>", " maior_igual "), (r"<=|=<", " menor_igual "), (r"<>|!=", " diferente "), (r">", " maior "),
+    (r"<", " menor "), (r"=", " igual "), (r"%", " porcento "), (r"\+", " mais "),
+    (r"(?<!\w)-(?=\d)|(?<=\d)\s*-\s*(?=\d)", " menos "),  # -5 e 10-5; o hífen de "e-mail" continua separador
+]
+
+
+def normalizar_pergunta(pergunta: str) -> str:
+    texto = unicodedata.normalize("NFKD", pergunta or "").encode("ascii", "ignore").decode("ascii").lower()
+    for padrao, palavra in OPERADORES:
+        texto = re.sub(padrao, palavra, texto)
+    texto = re.sub(r"[^\w\s]", " ", texto)
+    return " ".join(p for p in texto.split() if p not in STOPWORDS)
+
+
+def hash_contexto_prompt(contexto_prompt) -> str:
+    return hashlib.sha256(json.dumps(contexto_prompt, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class CacheGeracao:
+    """Cache persistente (SQLite) de SQL gerada, com expiração por TTL e despejo LRU."""
+
+    def __init__(self, caminho=CAMINHO_CACHE, ttl=TTL_SEGUNDOS, ttl_promovido=TTL_PROMOVIDO_SEGUNDOS, max_entradas=MAX_ENTRADAS):
+        self.caminho = caminho
+        self.ttl = ttl
+        self.ttl_promovido = ttl_promovido
+        self.max_entradas = max_entradas
+        self.estatisticas = {"acertos": 0, "faltas": 0, "rejeitadas": 0}
+        self._lock = threading.Lock()
+        if caminho != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_geracao (
+                chave TEXT PRIMARY KEY,
+                pergunta_normalizada TEXT,
+                modelo TEXT,
+                query_sql TEXT NOT NULL,
+                criado_em REAL NOT NULL,
+                ultimo_acesso REAL NOT NULL,
+                acessos INTEGER NOT NULL DEFAULT 0,
+                feedback INTEGER NOT NULL DEFAULT 0
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_geracao_acesso ON cache_geracao (feedback, ultimo_acesso)")
+
+    @staticmethod
+    def chave(pergunta, impressao_schema, modelo, hash_prompt) -> str:
+        partes = [normalizar_pergunta(pergunta), impressao_schema or "", modelo or "", hash_prompt or ""]
+        return hashlib.sha256("\x1f".join(partes).encode("utf-8")).hexdigest()
+
+    def _expirada(self, criado_em, feedback, agora) -> bool:
+        ttl = self.ttl_promovido if feedback == FEEDBACK_POSITIVO else self.ttl
+        return agora - criado_em > ttl
+
+    def obter(self, chave):
+        agora = time.time()
+        with self._lock:
+            linha = self._conn.execute(
+                "SELECT query_sql, criado_em, feedback FROM cache_geracao WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha is None:
+                self.estatisticas["faltas"] += 1
+                return None
+            query_sql, criado_em, feedback = linha
+            if USAR_FEEDBACK and feedback == FEEDBACK_NEGATIVO:
+                self.estatisticas["rejeitadas"] += 1
+                return None
+            if self._expirada(criado_em, feedback, agora):
+                self._conn.execute("DELETE FROM cache_geracao WHERE chave = ?", (chave,))
+                self.estatisticas["faltas"] += 1
+                return None
+            self._conn.execute(
+                "UPDATE cache_geracao SET ultimo_acesso = ?, acessos = acessos + 1 WHERE chave = ?", (agora, chave)
+            )
+            self.estatisticas["acertos"] += 1
+            return query_sql
+
+    def guardar(self, chave, pergunta, modelo, query_sql):
+        agora = time.time()
+        with self._lock:
+            # Uma nova geração substitui a anterior (inclusive uma rejeitada) e zera o feedback
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_geracao (chave, pergunta_normalizada, modelo, query_sql, criado_em, ultimo_acesso) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (chave, normalizar_pergunta(pergunta), modelo, query_sql, agora, agora),
+            )
+            self._despejar(agora)
+
+    def _despejar(self, agora):
+        self._conn.execute(
+            "DELETE FROM cache_geracao WHERE (feedback = ? AND criado_em < ?) OR (feedback <> ? AND criado_em < ?)",
+            (FEEDBACK_POSITIVO, agora - self.ttl_promovido, FEEDBACK_POSITIVO, agora - self.ttl),
+        )
+        excesso = self._conn.execute("SELECT COUNT(*) FROM cache_geracao").fetchone()[0] - self.max_entradas
+        if excesso > 0:
+            # Entradas promovidas só saem depois de todas as outras
+            self._conn.execute(
+                "DELETE FROM cache_geracao WHERE chave IN ("
+                "SELECT chave FROM cache_geracao ORDER BY feedback = ?, ultimo_acesso LIMIT ?)",
+                (FEEDBACK_POSITIVO, excesso),
+            )
+
+    def descartar(self, chave):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_geracao WHERE chave = ?", (chave,))
+
+    def registrar_feedback(self, chave, feedback: str):
+        if not USAR_FEEDBACK or not chave or not feedback:
+            return
+        valor = FEEDBACK_POSITIVO if "👍" in feedback else FEEDBACK_NEGATIVO if "👎" in feedback else 0
+        with self._lock:
+            self._conn.execute("UPDATE cache_geracao SET feedback = ? WHERE chave = ?", (valor, chave))
+
+    def resumo(self) -> dict:
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM cache_geracao").fetchone()[0]
+        return {"entradas": total, **self.estatisticas}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def obter_cache_geracao() -> CacheGeracao:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheGeracao()
+        return _cache
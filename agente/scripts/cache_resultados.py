@@ -0,0 +1,173 @@
+import os
+import sys
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from analise_sql import normalizar_sql, tabelas_referenciadas, referencias_tabelas, e_somente_leitura, e_nao_deterministica
+
+ORCAMENTO_BYTES = int(float(os.getenv("QUERYFLOW_CACHE_RESULTADOS_MB", "256")) * 1024 * 1024)
+FRACAO_MAXIMA_ENTRADA = 0.25  # um único resultado não pode ocupar mais que isso do orçamento
+
+CONSULTA_MARCADORES = """
+    SELECT TABLE_NAME, CONCAT_WS('|', CREATE_TIME, IFNULL(UPDATE_TIME, '')), UPDATE_TIME >= NOW() - INTERVAL 1 SECOND,
+           TABLE_TYPE = 'BASE TABLE'
+    FROM information_schema.TABLES
+    WHERE TABLE_SCHEMA = %s AND TABLE_NAME IN ({marcadores})
+"""
+
+
+def chave_resultado(query_sql: str, banco: str, inicio=0) -> str:
+    return hashlib.sha256(f"{banco}\x1f{normalizar_sql(query_sql)}\x1f{inicio}".encode("utf-8")).hexdigest()
+
+
+def consulta_cacheavel(query_sql: str) -> bool:
+    # DML, SELECT ... FOR UPDATE/INTO, funções como NOW()/RAND() e tabelas de outro banco (banco.tabela, cujo
+    # marcador não é lido) sempre vão ao banco
+    return e_somente_leitura(query_sql) and not e_nao_deterministica(query_sql) and bool(tabelas_referenciadas(query_sql)) \
+        and not any(banco for banco, _, _ in referencias_tabelas(query_sql))
+
+
+def estimar_bytes(resultado, amostra=200) -> int:
+    """Estimativa do tamanho em memória de uma lista de linhas (dicts ou tuplas), por amostragem."""
+    if hasattr(resultado, "bytes_em_memoria"):
+        return resultado.bytes_em_memoria  # linhas + tabela Arrow e downloads já montados
+    if not isinstance(resultado, list) or not resultado:
+        return sys.getsizeof(resultado)
+    linhas = resultado[:amostra]
+    tamanho_amostra = 0
+    for linha in linhas:
+        tamanho_amostra += sys.getsizeof(linha)
+        valores = linha.values() if isinstance(linha, dict) else linha
+        tamanho_amostra += sum(sys.getsizeof(v) for v in valores)
+    return sys.getsizeof(resultado) + int(tamanho_amostra * len(resultado) / len(linhas))
+
+
+def ler_marcadores(conn, banco: str, tabelas) -> dict:
+    """Lê os marcadores de mudança (CREATE_TIME|UPDATE_TIME) das tabelas. Viram None (e o resultado não é guardado):
+    tabelas escritas há menos de 1s, pois UPDATE_TIME tem resolução de segundos e uma escrita no mesmo segundo não
+    mudaria o marcador; views, que não têm UPDATE_TIME; e nomes que o information_schema não resolve."""
+    tabelas = sorted(tabelas)
+    if not tabelas:
+        return {}
+    cursor = conn.cursor()
+    try:
+        try:
+            cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+        except Exception:
+            pass
+        cursor.execute(CONSULTA_MARCADORES.format(marcadores=", ".join(["%s"] * len(tabelas))), [banco] + tabelas)
+        marcadores = dict.fromkeys(tabelas)
+        for tabela, marcador, escrita_recente, tabela_base in cursor.fetchall():
+            marcadores[tabela.lower()] = marcador if tabela_base and not escrita_recente else None
+        return marcadores
+    finally:
+        cursor.close()
+
+
+def _copia(resultado):
+    return resultado.copia() if hasattr(resultado, "copia") else resultado
+
+
+class _Entrada:
+    __slots__ = ("resultado", "marcadores", "tamanho", "acertos", "criado_em", "ultimo_acesso", "query_sql")
+
+    def __init__(self, resultado, marcadores, tamanho, query_sql):
+        self.resultado = resultado
+        self.marcadores = marcadores
+        self.tamanho = tamanho
+        self.acertos = 0
+        self.criado_em = self.ultimo_acesso = time.time()
+        self.query_sql = query_sql
+
+
+class CacheResultados:
+    """Cache em memória de resultados de SELECT, invalidado por marcadores de mudança de cada tabela referenciada
+    e limitado por um orçamento de bytes (despejo LRU ponderado pelo tamanho)."""
+
+    def __init__(self, orcamento_bytes=ORCAMENTO_BYTES):
+        self.orcamento_bytes = orcamento_bytes
+        self.bytes_em_uso = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.estatisticas = {"acertos": 0, "faltas": 0, "invalidadas": 0, "despejadas": 0, "recusadas": 0}
+
+    def _remover(self, chave):
+        entrada = self._entradas.pop(chave, None)
+        if entrada is not None:
+            self.bytes_em_uso -= entrada.tamanho
+
+    def obter(self, chave, marcadores_atuais: dict):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self.estatisticas["faltas"] += 1
+                return None
+            if any(m is None or marcadores_atuais.get(t) != m for t, m in entrada.marcadores.items()):
+                self._remover(chave)
+                self.estatisticas["invalidadas"] += 1
+                self.estatisticas["faltas"] += 1
+                return None
+            self._entradas.move_to_end(chave)
+            entrada.acertos += 1
+            entrada.ultimo_acesso = time.time()
+            self.estatisticas["acertos"] += 1
+            return _copia(entrada.resultado)
+
+    def guardar(self, chave, query_sql, resultado, marcadores: dict):
+        # Sem marcador confiável (escrita no último segundo ou tabela desconhecida) não vale guardar
+        if not marcadores or any(m is None for m in marcadores.values()):
+            self.estatisticas["recusadas"] += 1
+            return False
+        # o cache guarda uma cópia própria: o que a exibição pendura no resultado devolvido não cresce a entrada
+        resultado = _copia(resultado)
+        tamanho = estimar_bytes(resultado)
+        if tamanho > self.orcamento_bytes * FRACAO_MAXIMA_ENTRADA:
+            self.estatisticas["recusadas"] += 1
+            return False
+        with self._lock:
+            self._remover(chave)
+            while self._entradas and self.bytes_em_uso + tamanho > self.orcamento_bytes:
+                self._despejar_uma()
+            self._entradas[chave] = _Entrada(resultado, dict(marcadores), tamanho, query_sql)
+            self.bytes_em_uso += tamanho
+            return True
+
+    def _despejar_uma(self):
+        # Entre as menos usadas recentemente (início do OrderedDict), sai a de pior relação acertos/byte
+        candidatos = list(self._entradas.items())[:8]
+        chave, _ = min(candidatos, key=lambda item: (item[1].acertos + 1) / item[1].tamanho)
+        self._remover(chave)
+        self.estatisticas["despejadas"] += 1
+
+    def invalidar_tabelas(self, tabelas):
+        tabelas = {t.lower() for t in tabelas}
+        with self._lock:
+            for chave in [c for c, e in self._entradas.items() if tabelas & set(e.marcadores)]:
+                self._remover(chave)
+                self.estatisticas["invalidadas"] += 1
+
+    def resumo(self, top=10) -> dict:
+        with self._lock:
+            entradas = sorted(self._entradas.values(), key=lambda e: e.acertos, reverse=True)[:top]
+            return {
+                "entradas": len(self._entradas),
+                "bytes_em_uso": self.bytes_em_uso,
+                "orcamento_bytes": self.orcamento_bytes,
+                **self.estatisticas,
+                "mais_acessadas": [
+                    {"query": e.query_sql[:200], "acertos": e.acertos, "bytes": e.tamanho} for e in entradas
+                ],
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def obter_cache_resultados() -> CacheResultados:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheResultados()
+        return _cache
@@ -0,0 +1,154 @@
+import os
+import time
+import hashlib
+import threading
+from pool_conexoes import obter_pool
+
+# Intervalo mínimo entre duas sondagens de mudança no information_schema
+INTERVALO_VERIFICACAO = float(os.getenv("QUERYFLOW_SCHEMA_CHECK_SECONDS", "30"))
+
+# Uma ida ao servidor: impressão estrutural (colunas + índices) e marcadores de tempo de cada tabela.
+# SUM(CRC32(...)) evita o limite de group_concat_max_len e a posição ordinal entra no texto somado.
+CONSULTA_IMPRESSOES = """
+    SELECT TABLE_NAME, 'colunas', CAST(SUM(CRC32(CONCAT_WS(':', ORDINAL_POSITION, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY))) AS CHAR)
+    FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = %s GROUP BY TABLE_NAME
+    UNION ALL
+    SELECT TABLE_NAME, 'indices', CAST(SUM(CRC32(CONCAT_WS(':', INDEX_NAME, SEQ_IN_INDEX, COLUMN_NAME, NON_UNIQUE))) AS CHAR)
+    FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = %s GROUP BY TABLE_NAME
+    UNION ALL
+    SELECT TABLE_NAME, 'tempos', CONCAT_WS('|', TABLE_TYPE, CREATE_TIME, IFNULL(UPDATE_TIME, ''))
+    FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s
+"""
+
+CONSULTA_COLUNAS = """
+    SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY
+    FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = %s{filtro}
+    ORDER BY TABLE_NAME, ORDINAL_POSITION
+"""
+
+# Chaves estrangeiras e índices compartilham o formato: (tipo, tabela, nome, coluna, seq, tabela_ref, coluna_ref, nao_unico)
+CONSULTA_CHAVES_INDICES = """
+    SELECT 'fk', TABLE_NAME, CONSTRAINT_NAME, COLUMN_NAME, ORDINAL_POSITION, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME, 0
+    FROM information_schema.KEY_COLUMN_USAGE
+    WHERE TABLE_SCHEMA = %s AND REFERENCED_TABLE_NAME IS NOT NULL{filtro}
+    UNION ALL
+    SELECT 'idx', TABLE_NAME, INDEX_NAME, COLUMN_NAME, SEQ_IN_INDEX, NULL, NULL, NON_UNIQUE
+    FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = %s{filtro}
+    ORDER BY 2, 3, 5
+"""
+
+
+def _filtro_tabelas(tabelas):
+    if tabelas is None:
+        return "", []
+    return f" AND TABLE_NAME IN ({', '.join(['%s'] * len(tabelas))})", list(tabelas)
+
+
+class CatalogoSchema:
+    """Catálogo do schema de um banco, carregado do information_schema em lote e atualizado por tabela."""
+
+    def __init__(self, nome_banco):
+        self.nome_banco = nome_banco
+        self.tabelas = {}  # tabela -> {"colunas": [...], "chave_primaria": [...], "chaves_estrangeiras": [...], "indices": {...}}
+        self.impressoes = {}  # tabela -> impressão estrutural
+        self.marcadores_dados = {}  # tabela -> "CREATE_TIME|UPDATE_TIME", muda a cada escrita (usado para invalidar caches)
+        self.impressao = ""  # impressão global do schema
+        self.ultima_verificacao = 0.0
+        self._lock = threading.Lock()
+
+    def _ler_impressoes(self, cursor):
+        try:
+            # MySQL 8 guarda as estatísticas do information_schema em cache por 24h por padrão
+            cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+        except Exception:
+            pass  # MySQL 5.7 / MariaDB não têm a variável e não fazem esse cache
+        cursor.execute(CONSULTA_IMPRESSOES, (self.nome_banco,) * 3)
+        partes = {}
+        for tabela, tipo, valor in cursor.fetchall():
+            partes.setdefault(tabela, {})[tipo] = valor or ""
+        impressoes, marcadores = {}, {}
+        for tabela, p in partes.items():
+            tipo_tabela, _, tempos = p.get("tempos", "").partition("|")
+            criacao = tempos.split("|")[0]
+            impressoes[tabela] = f"{tipo_tabela}|{criacao}|{p.get('colunas', '')}|{p.get('indices', '')}"
+            marcadores[tabela] = tempos
+        return impressoes, marcadores
+
+    def _carregar_tabelas(self, cursor, tabelas=None):
+        filtro, params = _filtro_tabelas(tabelas)
+        novas = {}
+        cursor.execute(CONSULTA_COLUNAS.format(filtro=filtro), [self.nome_banco] + params)
+        for tabela, coluna, tipo, nulo, chave in cursor.fetchall():
+            t = novas.setdefault(tabela, {"colunas": [], "chave_primaria": [], "chaves_estrangeiras": [], "indices": {}})
+            t["colunas"].append({"nome": coluna, "tipo": tipo, "nulo": nulo == "YES"})
+            if chave == "PRI":
+                t["chave_primaria"].append(coluna)
+
+        cursor.execute(CONSULTA_CHAVES_INDICES.format(filtro=filtro), [self.nome_banco] + params + [self.nome_banco] + params)
+        for tipo, tabela, nome, coluna, _, tabela_ref, coluna_ref, nao_unico in cursor.fetchall():
+            t = novas.get(tabela)
+            if t is None:
+                continue
+            if tipo == "fk":
+                t["chaves_estrangeiras"].append({"coluna": coluna, "tabela_ref": tabela_ref, "coluna_ref": coluna_ref, "nome": nome})
+            else:
+                idx = t["indices"].setdefault(nome, {"colunas": [], "unico": not int(nao_unico)})
+                idx["colunas"].append(coluna)
+        return novas
+
+    def atualizar(self, conn, forcar=False) -> set:
+        """Sonda o information_schema e recarrega apenas as tabelas cuja impressão mudou. Retorna as tabelas alteradas."""
+        with self._lock:
+            cursor = conn.cursor()
+            try:
+                impressoes, marcadores = self._ler_impressoes(cursor)
+                if forcar or not self.tabelas:
+                    alteradas = set(impressoes)
+                    carregadas = self._carregar_tabelas(cursor) if impressoes else {}
+                else:
+                    alteradas = {t for t, imp in impressoes.items() if self.impressoes.get(t) != imp}
+                    carregadas = self._carregar_tabelas(cursor, sorted(alteradas)) if alteradas else {}
+            finally:
+                cursor.close()
+
+            removidas = set(self.tabelas) - set(impressoes)
+            # troca o dicionário inteiro para leitores concorrentes nunca verem um estado parcial
+            tabelas = {t: info for t, info in self.tabelas.items() if t not in removidas}
+            tabelas.update(carregadas)
+            self.tabelas = tabelas
+            self.impressoes = impressoes
+            self.marcadores_dados = marcadores
+            self.impressao = hashlib.sha256(
+                "\n".join(f"{t}={imp}" for t, imp in sorted(impressoes.items())).encode("utf-8")
+            ).hexdigest()
+            self.ultima_verificacao = time.monotonic()
+            return alteradas | removidas
+
+    def precisa_verificar(self) -> bool:
+        return not self.tabelas or time.monotonic() - self.ultima_verificacao >= INTERVALO_VERIFICACAO
+
+    def como_dicionario(self) -> dict:
+        # Formato antigo ({tabela: [colunas]}) usado no prompt
+        return {tabela: [c["nome"] for c in info["colunas"]] for tabela, info in sorted(self.tabelas.items())}
+
+
+# --- CATÁLOGOS COMPARTILHADOS POR (host, usuário, banco) ---
+_catalogos = {}
+_catalogos_lock = threading.Lock()
+
+
+def obter_catalogo(_mysql_host, _mysql_user, _mysql_password, _mysql_db, forcar=False) -> CatalogoSchema:
+    # obter_pool confere a senha antes de tudo (conexão de teste se ela difere da do pool): o catálogo em cache
+    # não é entregue a uma sessão que não conseguiria conectar
+    pool = obter_pool(_mysql_host, _mysql_user, _mysql_password, _mysql_db)
+    chave = (_mysql_host, _mysql_user, _mysql_db)
+    with _catalogos_lock:
+        catalogo = _catalogos.setdefault(chave, CatalogoSchema(_mysql_db))
+    if forcar or catalogo.precisa_verificar():
+        with pool.conexao() as conn:
+            alteradas = catalogo.atualizar(conn, forcar=forcar)
+        if alteradas:
+            print(f"Catálogo '{_mysql_db}': {len(alteradas)} tabela(s) recarregada(s).")
+    return catalogo
@@ -0,0 +1,126 @@
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+import google.generativeai as genai
+from analise_sql import dividir_instrucoes
+from prompt_sql import limpar_resposta_sql
+from metricas import anotar
+
+CONFIG_GERACAO_PADRAO = {"temperature": 0.05, "max_output_tokens": 2048}
+
+# --- MODELOS REAPROVEITADOS POR (chave da API, modelo, configuração de geração) ---
+# genai.configure é global no processo. Um GenerativeModel pega o cliente padrão do SDK na primeira chamada e fica
+# com ele; então a primeira chamada de cada modelo (e a listagem de modelos) acontece com _lock_sdk adquirido e a
+# configuração apontando para a chave dele: duas sessões com chaves diferentes não trocam a chave uma da outra.
+_modelos = {}
+_identidades = {}  # id(modelo) -> (digest da chave, modelo, configuração): os modelos ficam vivos em _modelos
+_sem_cliente = {}  # id(modelo) -> chave da API, até a primeira chamada
+_lock = threading.Lock()
+_lock_sdk = threading.Lock()
+_chave_configurada = None
+
+
+def _digest(chave_api: str) -> str:
+    return hashlib.sha256(chave_api.encode("utf-8")).hexdigest()
+
+
+def _configurar(chave_api: str):
+    # chamada com _lock_sdk adquirido
+    global _chave_configurada
+    digest = _digest(chave_api)
+    if _chave_configurada != digest:
+        genai.configure(api_key=chave_api)
+        _chave_configurada = digest
+
+
+@contextmanager
+def _cliente_da_chave(modelo):
+    """Envolve a chamada ao modelo; na primeira, o cliente que ele guarda é criado com a chave dele."""
+    if id(modelo) in _sem_cliente:
+        with _lock_sdk:
+            chave_api = _sem_cliente.pop(id(modelo), None)
+            if chave_api is not None:
+                _configurar(chave_api)
+                yield
+                return
+    yield
+
+
+def obter_modelo(chave_api: str, nome_modelo: str, config_geracao: dict = None):
+    """GenerativeModel compartilhado entre requisições; depois da primeira chamada ele reaproveita o próprio cliente
+    gRPC (e a conexão). Chaves diferentes nunca compartilham modelo nem cliente."""
+    config = dict(config_geracao or CONFIG_GERACAO_PADRAO)
+    chave = (_digest(chave_api), nome_modelo, tuple(sorted(config.items())))
+    with _lock:
+        modelo = _modelos.get(chave)
+        if modelo is None:
+            modelo = genai.GenerativeModel(model_name=nome_modelo, generation_config=config)
+            _modelos[chave] = modelo
+            _identidades[id(modelo)] = chave
+            _sem_cliente[id(modelo)] = chave_api
+    return modelo
+
+
+def identidade_modelo(modelo) -> tuple:
+    """(digest da chave da API, nome do modelo, configuração) de um modelo criado por obter_modelo. Modelos de
+    fora (ex.: dublês do benchmark) são identificados pelo próprio objeto."""
+    with _lock:
+        identidade = _identidades.get(id(modelo))
+    if identidade is not None:
+        return identidade
+    return f"objeto-{id(modelo)}", getattr(modelo, "model_name", ""), repr(getattr(modelo, "_generation_config", None))
+
+
+def listar_modelos(chave_api: str) -> list:
+    """Modelos disponíveis para a chave; a listagem inteira roda com o SDK configurado só com ela."""
+    with _lock_sdk:
+        _configurar(chave_api)
+        return list(genai.list_models())
+
+
+def _instrucoes_completas(texto: str) -> list:
+    # a última instrução só está completa se já chegou o ';' que a encerra
+    instrucoes = dividir_instrucoes(limpar_resposta_sql(texto))
+    return instrucoes if texto.rstrip().rstrip("`").rstrip().endswith(";") else instrucoes[:-1]
+
+
+def gerar_em_streaming(modelo, prompt: str, ao_receber=None, ao_completar_instrucao=None, prazo=None):
+    """Gera com stream=True. `ao_receber(texto_parcial)` é chamado a cada pedaço e `ao_completar_instrucao(sql)`
+    uma vez por instrução assim que o ';' dela chega, para validação/EXPLAIN começarem antes do fim da resposta.
+    Com `prazo` (time.monotonic) a chamada leva o timeout restante e o stream é abandonado quando ele vence.
+    Retorna (texto_completo, resposta); a resposta traz usage_metadata depois de consumida."""
+    inicio = time.perf_counter()
+    with _cliente_da_chave(modelo):
+        if prazo is None:
+            resposta = modelo.generate_content(prompt, stream=True)
+        else:
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                raise TimeoutError("Prazo da requisição esgotado antes da chamada ao Gemini.")
+            resposta = modelo.generate_content(prompt, stream=True, request_options={"timeout": restante})
+    partes, avisadas = [], 0
+    for pedaco in resposta:
+        if prazo is not None and time.monotonic() > prazo:
+            raise TimeoutError("Prazo da requisição esgotado durante a geração da SQL.")
+        try:
+            texto_pedaco = pedaco.text
+        except ValueError:
+            continue  # pedaço sem texto (ex.: só metadados de segurança)
+        if not partes:
+            anotar(primeiro_token_ms=round((time.perf_counter() - inicio) * 1000, 1))
+        partes.append(texto_pedaco)
+        texto = "".join(partes)
+        if ao_receber is not None:
+            ao_receber(texto)
+        if ao_completar_instrucao is not None:
+            completas = _instrucoes_completas(texto)
+            for instrucao in completas[avisadas:]:
+                ao_completar_instrucao(instrucao)
+            avisadas = max(avisadas, len(completas))
+    texto = "".join(partes)
+    if ao_completar_instrucao is not None:
+        # a última instrução pode terminar sem ';'
+        for instrucao in dividir_instrucoes(limpar_resposta_sql(texto))[avisadas:]:
+            ao_completar_instrucao(instrucao)
+    return texto, resposta
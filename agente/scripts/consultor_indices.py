@@ -0,0 +1,347 @@
+# Consultor de índices guiado pela carga real: lê as SQL geradas em historico_interacoes.query_gerada,
+# conta em quais cláusulas (filtro, junção, GROUP BY, ORDER BY) cada coluna aparece e monta índices candidatos.
+# Com --verificar, confere cada um com EXPLAIN antes/depois usando um índice INVISIBLE (MySQL 8), que o otimizador
+# só enxerga na sessão com use_invisible_indexes=on. A construção do índice de teste ainda lê a tabela inteira e
+# disputa I/O com a produção, por isso só roda quando pedida (de preferência numa réplica).
+#
+# Uso:
+#     python consultor_indices.py --dias 30 --top 10       (só frequência, sem criar nada no banco)
+#     python consultor_indices.py --verificar              (constrói índices de teste INVISIBLE e compara o EXPLAIN)
+#     python consultor_indices.py --verificar --aplicar --saida indices.json
+import os
+import json
+import argparse
+from collections import Counter, defaultdict
+from dotenv import load_dotenv
+from pool_conexoes import conexao_mysql
+from catalogo_schema import CatalogoSchema
+from analise_sql import normalizar_sql, e_somente_leitura, uso_colunas
+from guarda_custo import estimar_custo
+
+MAX_COLUNAS_INDICE = 3
+PREFIXO_TESTE = "idx_qf_teste_"  # índices de teste; os que sobrarem de uma execução interrompida são removidos
+TAMANHO_LOTE = 500
+# Tipos que não entram num índice sem prefixo de tamanho
+_TIPOS_NAO_INDEXAVEIS = ("text", "tinytext", "mediumtext", "longtext", "blob", "tinyblob", "mediumblob", "longblob", "json")
+
+
+def ler_carga(conn, dias=None, limite=None) -> dict:
+    """Agrupa as consultas de leitura do histórico pela forma normalizada: sql_normalizada -> (frequência, sql original)."""
+    filtro = " AND data >= NOW() - INTERVAL %s DAY" if dias else ""
+    cursor = conn.cursor(buffered=False)
+    carga = {}
+    try:
+        cursor.execute(
+            f"SELECT query_gerada FROM historico_interacoes WHERE query_gerada IS NOT NULL{filtro} ORDER BY id DESC"
+            + (f" LIMIT {int(limite)}" if limite else ""),
+            (int(dias),) if dias else (),
+        )
+        while True:
+            linhas = cursor.fetchmany(TAMANHO_LOTE)
+            if not linhas:
+                break
+            for (sql,) in linhas:
+                if not sql or sql.startswith("Erro") or not e_somente_leitura(sql):
+                    continue
+                chave = normalizar_sql(sql)
+                frequencia, original = carga.get(chave, (0, sql))
+                carga[chave] = (frequencia + 1, original)
+    finally:
+        cursor.close()
+    return carga
+
+
+def _colunas_indexaveis(catalogo) -> dict:
+    return {
+        tabela: {c["nome"].lower(): c["nome"] for c in info["colunas"]
+                 if not c["tipo"].lower().startswith(_TIPOS_NAO_INDEXAVEIS)}
+        for tabela, info in catalogo.tabelas.items()
+    }
+
+
+def resolver_usos(sql, colunas_por_tabela) -> dict:
+    """Atribui cada coluna usada à tabela real (pelo alias ou, sem qualificador, pela única tabela da consulta que a tem).
+    Retorna tabela -> lista de (clausula, coluna, operador)."""
+    aliases, usos = uso_colunas(sql)
+    tabelas_consulta = {t for t in aliases.values() if t in colunas_por_tabela}
+    resolvidos = defaultdict(list)
+    for clausula, qualificador, coluna, operador in usos:
+        if qualificador is not None:
+            tabela = aliases.get(qualificador, qualificador)
+            donas = [tabela] if coluna.lower() in colunas_por_tabela.get(tabela, {}) else []
+        else:
+            donas = [t for t in tabelas_consulta if coluna.lower() in colunas_por_tabela[t]]
+        if len(donas) == 1:
+            tabela = donas[0]
+            resolvidos[tabela].append((clausula, colunas_por_tabela[tabela][coluna.lower()], operador))
+    return resolvidos
+
+
+def _sem_repetir(colunas) -> list:
+    vistas = []
+    for coluna in colunas:
+        if coluna not in vistas:
+            vistas.append(coluna)
+    return vistas
+
+
+def candidatos_da_consulta(usos, frequencia_colunas, tabela) -> set:
+    """Índices candidatos para uma tabela de uma consulta: igualdades primeiro (as mais frequentes na carga à frente),
+    depois uma única coluna de intervalo ou as colunas de GROUP BY / ORDER BY, que o índice pode entregar já ordenadas."""
+    def ordenar(colunas):
+        return sorted(_sem_repetir(colunas), key=lambda c: (-frequencia_colunas[(tabela, c)], c))
+
+    igualdades = ordenar([c for cl, c, op in usos if cl == "filtro" and op == "igualdade"])
+    juncoes = [c for c in ordenar([c for cl, c, _ in usos if cl == "juncao"]) if c not in igualdades]
+    intervalos = ordenar([c for cl, c, op in usos if cl == "filtro" and op == "intervalo"])
+    agrupamento = _sem_repetir([c for cl, c, _ in usos if cl == "agrupamento"])
+    ordenacao = _sem_repetir([c for cl, c, _ in usos if cl == "ordenacao"])
+
+    candidatos = set()
+    for prefixo in (igualdades, igualdades + juncoes):
+        if intervalos:
+            candidatos.add(tuple(_sem_repetir(prefixo + intervalos[:1])))
+        if agrupamento:
+            candidatos.add(tuple(_sem_repetir(prefixo + agrupamento)))
+        elif ordenacao and not intervalos:
+            candidatos.add(tuple(_sem_repetir(prefixo + ordenacao)))
+        if prefixo:
+            candidatos.add(tuple(prefixo))
+    for coluna in juncoes:
+        candidatos.add((coluna,))
+    return {c[:MAX_COLUNAS_INDICE] for c in candidatos if c}
+
+
+def _coberto(colunas, indices_existentes) -> bool:
+    # um índice existente que começa pelas mesmas colunas já atende o candidato
+    alvo = [c.lower() for c in colunas]
+    return any([c.lower() for c in existente[:len(alvo)]] == alvo for existente in indices_existentes)
+
+
+def nome_indice(tabela, colunas) -> str:
+    return f"idx_{tabela}_{'_'.join(colunas)}"[:64]
+
+
+def nome_indice_teste(tabela, colunas) -> str:
+    return f"{PREFIXO_TESTE}{tabela}_{'_'.join(colunas)}"[:64]
+
+
+def remover_indices_de_teste(conn) -> int:
+    """Remove índices de teste INVISIBLE que ficaram de uma verificação interrompida (queda, Ctrl+C, KILL)."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT DISTINCT TABLE_NAME, INDEX_NAME FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND INDEX_NAME LIKE %s AND IS_VISIBLE = 'NO'",
+            (PREFIXO_TESTE.replace("_", "\\_") + "%",),
+        )
+        sobras = cursor.fetchall()
+        for tabela, nome in sobras:
+            print(f"Removendo índice de teste que sobrou: {tabela}.{nome}")
+            cursor.execute(f"ALTER TABLE `{tabela}` DROP INDEX `{nome}`")
+        return len(sobras)
+    finally:
+        cursor.close()
+
+
+def indices_do_plano(plano, campo="key") -> set:
+    """Valores exatos de `key` (índice escolhido) ou `possible_keys` em todos os nós do EXPLAIN FORMAT=JSON."""
+    encontrados = set()
+    if isinstance(plano, dict):
+        for nome, valor in plano.items():
+            if nome == campo:
+                encontrados.update(valor if isinstance(valor, list) else [valor])
+            else:
+                encontrados |= indices_do_plano(valor, campo)
+    elif isinstance(plano, list):
+        for item in plano:
+            encontrados |= indices_do_plano(item, campo)
+    return encontrados
+
+
+def analisar_carga(carga, catalogo):
+    """Conta o uso das colunas e agrega os candidatos. Retorna (contagem_colunas, candidatos)."""
+    colunas_por_tabela = _colunas_indexaveis(catalogo)
+    usos_por_consulta = {}
+    contagem = Counter()  # (tabela, coluna, clausula) -> frequência ponderada pela carga
+    frequencia_colunas = Counter()  # (tabela, coluna) -> frequência em filtros/junções/ordenação
+    for chave, (frequencia, sql) in carga.items():
+        usos = resolver_usos(sql, colunas_por_tabela)
+        usos_por_consulta[chave] = usos
+        for tabela, lista in usos.items():
+            for clausula, coluna, _ in set(lista):
+                if clausula == "projecao":
+                    continue
+                contagem[(tabela, coluna, clausula)] += frequencia
+                frequencia_colunas[(tabela, coluna)] += frequencia
+
+    candidatos = {}
+    for chave, usos in usos_por_consulta.items():
+        frequencia = carga[chave][0]
+        for tabela, lista in usos.items():
+            existentes = [idx["colunas"] for idx in catalogo.tabelas[tabela]["indices"].values()]
+            for colunas in candidatos_da_consulta(lista, frequencia_colunas, tabela):
+                if _coberto(colunas, existentes):
+                    continue
+                c = candidatos.setdefault((tabela, colunas), {"tabela": tabela, "colunas": list(colunas),
+                                                              "frequencia": 0, "consultas": []})
+                c["frequencia"] += frequencia
+                c["consultas"].append(chave)
+    return contagem, sorted(candidatos.values(), key=lambda c: (-c["frequencia"], -len(c["colunas"])))
+
+
+def _custo_sessao(conn, sql, usar_invisiveis):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SET SESSION optimizer_switch = 'use_invisible_indexes={'on' if usar_invisiveis else 'off'}'")
+    finally:
+        cursor.close()
+    return estimar_custo(conn, sql)
+
+
+def verificar_candidato(conn, candidato, carga, custos_base):
+    """Cria o índice como INVISIBLE, compara o EXPLAIN de cada consulta afetada sem e com ele e remove o índice.
+    Preenche beneficio (custo economizado x frequência), beneficio_pct e consultas_que_usam."""
+    tabela, colunas = candidato["tabela"], candidato["colunas"]
+    nome = nome_indice_teste(tabela, colunas)
+    lista = ", ".join(f"`{c}`" for c in colunas)
+    cursor = conn.cursor()
+    criado = False
+    try:
+        cursor.execute(f"ALTER TABLE `{tabela}` ADD INDEX `{nome}` ({lista}) INVISIBLE")
+        criado = True
+        beneficio = custo_total = 0.0
+        usam = 0
+        for chave in candidato["consultas"]:
+            frequencia, sql = carga[chave]
+            if chave not in custos_base:
+                antes = _custo_sessao(conn, sql, usar_invisiveis=False)
+                custos_base[chave] = antes.custo if antes and antes.custo is not None else None
+            if custos_base[chave] is None:
+                continue
+            depois = _custo_sessao(conn, sql, usar_invisiveis=True)
+            custo_total += frequencia * custos_base[chave]
+            if depois and depois.custo is not None and nome in indices_do_plano(depois.plano):
+                usam += 1
+                beneficio += frequencia * max(0.0, custos_base[chave] - depois.custo)
+        candidato.update(beneficio=round(beneficio, 1), consultas_que_usam=usam,
+                         beneficio_pct=round(beneficio / custo_total, 3) if custo_total else 0.0)
+    finally:
+        if criado:
+            try:
+                cursor.execute(f"ALTER TABLE `{tabela}` DROP INDEX `{nome}`")
+            except Exception as e:
+                print(f"Aviso: não foi possível remover o índice de teste {nome}: {e}")
+        try:
+            cursor.execute("SET SESSION optimizer_switch = 'use_invisible_indexes=off'")
+        except Exception:
+            pass
+        cursor.close()
+    return candidato
+
+
+def recomendar(candidatos, top, min_beneficio, verificados):
+    """Ordena por benefício estimado (ou frequência sem verificação) e descarta os redundantes:
+    entre dois candidatos da mesma tabela em que um é prefixo do outro, fica só o mais longo."""
+    if verificados:
+        candidatos = [c for c in candidatos if c.get("consultas_que_usam") and c["beneficio_pct"] >= min_beneficio]
+        candidatos.sort(key=lambda c: (-c["beneficio"], len(c["colunas"])))
+    escolhidos = []
+    for c in candidatos:
+        if any(e["tabela"] == c["tabela"] and e["colunas"][:len(c["colunas"])] == c["colunas"] for e in escolhidos):
+            continue
+        escolhidos = [e for e in escolhidos if not (e["tabela"] == c["tabela"] and c["colunas"][:len(e["colunas"])] == e["colunas"])]
+        escolhidos.append(c)
+        if len(escolhidos) >= top:
+            break
+    for c in escolhidos:
+        c["nome"] = nome_indice(c["tabela"], c["colunas"])
+        c["ddl"] = f"CREATE INDEX `{c['nome']}` ON `{c['tabela']}` ({', '.join(f'`{col}`' for col in c['colunas'])});"
+    return escolhidos
+
+
+def aplicar(conn, recomendacoes):
+    # o índice de teste já foi removido: a construção definitiva é feita de novo, online
+    cursor = conn.cursor()
+    try:
+        for r in recomendacoes:
+            lista = ", ".join(f"`{c}`" for c in r["colunas"])
+            print(f"Criando {r['nome']}...")
+            cursor.execute(f"ALTER TABLE `{r['tabela']}` ADD INDEX `{r['nome']}` ({lista}), ALGORITHM=INPLACE, LOCK=NONE")
+    finally:
+        cursor.close()
+
+
+def imprimir_relatorio(contagem, recomendacoes, verificados):
+    print("\nCOLUNAS MAIS USADAS (frequência na carga):")
+    for (tabela, coluna, clausula), frequencia in contagem.most_common(15):
+        print(f"  {tabela}.{coluna:<22} {clausula:<12} {frequencia}")
+    if not recomendacoes:
+        print("\nNenhum índice recomendado.")
+        return
+    print("\nÍNDICES RECOMENDADOS:")
+    for posicao, r in enumerate(recomendacoes, 1):
+        if verificados:
+            detalhe = (f"benefício ~{r['beneficio']:,.0f} de custo ({r['beneficio_pct']:.0%} da carga afetada), "
+                       f"usado em {r['consultas_que_usam']}/{len(r['consultas'])} consulta(s)")
+        else:
+            detalhe = f"{r['frequencia']} execução(ões) na carga, sem verificação por EXPLAIN"
+        print(f"  {posicao}. {r['ddl']}\n     {detalhe}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recomenda índices a partir das SQL registradas em historico_interacoes.")
+    parser.add_argument("--dias", type=int, help="Considera só o histórico dos últimos N dias")
+    parser.add_argument("--limite", type=int, default=10000, help="Máximo de registros do histórico lidos")
+    parser.add_argument("--top", type=int, default=5, help="Quantidade de recomendações")
+    parser.add_argument("--max-candidatos", type=int, default=20, help="Candidatos verificados com EXPLAIN (os mais frequentes)")
+    parser.add_argument("--min-beneficio", type=float, default=0.05, help="Redução mínima de custo (fração) para recomendar")
+    parser.add_argument("--verificar", action="store_true",
+                        help="Constrói cada candidato como índice INVISIBLE e compara o EXPLAIN (lê as tabelas; prefira uma réplica)")
+    parser.add_argument("--aplicar", action="store_true", help="Cria os índices recomendados")
+    parser.add_argument("--saida", help="Grava as recomendações em JSON")
+    args = parser.parse_args()
+
+    load_dotenv()
+    nome_banco = os.getenv("MYSQL_DB", "querypilot")
+    with conexao_mysql(os.getenv("MYSQL_HOST", "localhost"), os.getenv("MYSQL_USER", "root"),
+                       os.getenv("MYSQL_PASSWORD", ""), nome_banco) as conn:
+        try:
+            remover_indices_de_teste(conn)
+        except Exception as e:
+            print(f"Aviso: não foi possível procurar índices de teste que sobraram: {e}")
+        catalogo = CatalogoSchema(nome_banco)
+        catalogo.atualizar(conn, forcar=True)
+        carga = ler_carga(conn, args.dias, args.limite)
+        print(f"{sum(f for f, _ in carga.values())} consulta(s) de leitura no histórico, {len(carga)} distinta(s).")
+        contagem, candidatos = analisar_carga(carga, catalogo)
+        candidatos = candidatos[:args.max_candidatos]
+
+        verificados = args.verificar
+        if verificados:
+            custos_base = {}
+            for candidato in candidatos:
+                try:
+                    verificar_candidato(conn, candidato, carga, custos_base)
+                except Exception as e:
+                    # MariaDB e MySQL < 8 não têm índices invisíveis: cai para o ranking por frequência
+                    print(f"Aviso: não foi possível verificar {nome_indice(candidato['tabela'], candidato['colunas'])}: {e}")
+                    verificados = False
+                    break
+        recomendacoes = recomendar(candidatos, args.top, args.min_beneficio, verificados)
+        imprimir_relatorio(contagem, recomendacoes, verificados)
+
+        if args.aplicar and recomendacoes:
+            aplicar(conn, recomendacoes)
+            print(f"{len(recomendacoes)} índice(s) criado(s).")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"verificados": verificados, "recomendacoes": recomendacoes,
+                       "colunas": [{"tabela": t, "coluna": c, "clausula": cl, "frequencia": n}
+                                   for (t, c, cl), n in contagem.most_common()]},
+                      f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+import os
+import copy
+from analise_sql import retorna_linhas, adicionar_limite, paginar
+from resultado_colunar import montar_tabela, exportar_tabela, gravar_arquivo, ler_arquivo, linhas_da_tabela, FORMATOS_DOWNLOAD
+
+# --- LIMITES DE LEITURA (via .env) ---
+TAMANHO_PAGINA = int(os.getenv("QUERYFLOW_TAMANHO_PAGINA", "500"))
+TAMANHO_LOTE = int(os.getenv("QUERYFLOW_TAMANHO_LOTE", "1000"))
+MAX_LINHAS = int(os.getenv("QUERYFLOW_MAX_LINHAS", "100000"))  # nenhuma página além desse total é lida
+MAX_BYTES = int(float(os.getenv("QUERYFLOW_MAX_MB", "64")) * 1024 * 1024)  # volume máximo trafegado por execução
+# Em várias instruções numa ida só não há paginação: cada resultado traz no máximo estas linhas
+MAX_LINHAS_INSTRUCAO = int(os.getenv("QUERYFLOW_MAX_LINHAS_INSTRUCAO", str(TAMANHO_PAGINA)))
+
+
+class ResultadoConsulta:
+    """Uma página de resultado: cabeçalho único + linhas em tuplas (sem um dict por linha)."""
+
+    def __init__(self, colunas, linhas, inicio=0, tem_mais=False, truncado=False, motivo="", linhas_lidas=0, bytes_lidos=0):
+        self.colunas = tuple(colunas)
+        self._linhas = linhas
+        self._total = len(linhas)
+        self.inicio = inicio
+        self.tem_mais = tem_mais
+        self.truncado = truncado
+        self.motivo = motivo
+        self.linhas_lidas = linhas_lidas
+        self.bytes_lidos = bytes_lidos
+        self.avisos = []  # ex.: reescritas da guarda de custo, mostradas na interface
+        self.bytes_estimados = sum(_bytes_linha(l) for l in linhas) + 64 * len(linhas)
+        self._tabela = None  # Arrow, montada na primeira exibição
+        self._exportados = {}  # formato -> bytes do download
+        self.arquivo = None  # resultado inteiro em disco (Arrow IPC) quando só o início ficou na memória
+        self._tabela_mapeada = None  # tabela lida do arquivo com memory_map: aponta para o disco, não ocupa heap
+        self._exportados_em_disco = {}  # formato -> caminho do download gravado ao lado do arquivo
+
+    def __len__(self):
+        return self._total
+
+    @property
+    def linhas(self) -> list:
+        if self.arquivo is None:
+            return self._linhas
+        # descarregado: as tuplas além do início são refeitas do arquivo (a interface usa tabela(), que não converte)
+        return self._linhas + linhas_da_tabela(self.tabela().slice(len(self._linhas)))
+
+    def tabela(self):
+        """Tabela Arrow do resultado, montada uma vez: reruns da interface e downloads reaproveitam os mesmos buffers.
+        Descarregado, é o arquivo mapeado (sem cópia): as páginas ficam no cache do sistema operacional, não no heap."""
+        if self.arquivo is not None:
+            if self._tabela_mapeada is None:
+                self._tabela_mapeada = ler_arquivo(self.arquivo)
+            return self._tabela_mapeada
+        if self._tabela is None:
+            self._tabela = montar_tabela(self.colunas, self._linhas)
+        return self._tabela
+
+    def exportar(self, formato) -> bytes:
+        if self.arquivo is not None:
+            # descarregado: o download também fica em disco, gravado uma vez ao lado do arquivo do resultado
+            caminho = self._exportados_em_disco.get(formato)
+            if caminho is None:
+                caminho = os.path.splitext(self.arquivo)[0] + FORMATOS_DOWNLOAD[formato][1]
+                exportar_tabela(self.tabela(), formato, caminho)
+                self._exportados_em_disco[formato] = caminho
+            with open(caminho, "rb") as arquivo:
+                return arquivo.read()
+        if formato not in self._exportados:
+            self._exportados[formato] = exportar_tabela(self.tabela(), formato)
+        return self._exportados[formato]
+
+    @property
+    def bytes_em_memoria(self) -> int:
+        total = self.bytes_estimados + sum(len(b) for b in self._exportados.values())
+        return total + (self._tabela.nbytes if self._tabela is not None else 0)
+
+    @property
+    def arquivos(self) -> list:
+        """Arquivos em disco deste resultado (o descarregado e os downloads gravados), para quem o guarda apagar."""
+        return ([self.arquivo] if self.arquivo else []) + list(self._exportados_em_disco.values())
+
+    def copia(self):
+        """Cópia rasa: compartilha as linhas (e a tabela Arrow, imutável) mas tem avisos e downloads próprios, para o
+        que a exibição monta depois não crescer um objeto compartilhado (cache de resultados)."""
+        nova = copy.copy(self)
+        nova.avisos = list(self.avisos)
+        nova._exportados = {}
+        return nova
+
+    def descarregado(self, caminho, linhas_inicio):
+        """Cópia com só as primeiras `linhas_inicio` linhas na memória e o resultado inteiro em `caminho`.
+        O original não muda: pode estar no cache de resultados, compartilhado entre sessões."""
+        gravar_arquivo(self._tabela if self._tabela is not None else montar_tabela(self.colunas, self._linhas), caminho)
+        copia = ResultadoConsulta(self.colunas, self._linhas[:linhas_inicio], inicio=self.inicio, tem_mais=self.tem_mais,
+                                  truncado=self.truncado, motivo=self.motivo, linhas_lidas=self.linhas_lidas,
+                                  bytes_lidos=self.bytes_lidos)
+        copia.avisos = list(self.avisos)
+        copia.arquivo = caminho
+        copia._total = self._total
+        return copia
+
+    @property
+    def pagina(self) -> int:
+        return self.inicio // TAMANHO_PAGINA
+
+    def como_dicionarios(self) -> list:
+        return [dict(zip(self.colunas, linha)) for linha in self.linhas]
+
+
+class ResultadoLote:
+    """Resultados de várias instruções enviadas juntas: um ResultadoConsulta (leitura) ou dict de status (escrita) por instrução."""
+
+    def __init__(self, instrucoes, resultados):
+        self.instrucoes = list(instrucoes)
+        self.resultados = list(resultados)
+        self.avisos = []
+
+    def __len__(self):
+        return len(self.resultados)
+
+    @property
+    def linhas_lidas(self) -> int:
+        return sum(r.linhas_lidas for r in self.resultados if isinstance(r, ResultadoConsulta))
+
+    @property
+    def bytes_lidos(self) -> int:
+        return sum(r.bytes_lidos for r in self.resultados if isinstance(r, ResultadoConsulta))
+
+    @property
+    def houve_escrita(self) -> bool:
+        return any(isinstance(r, dict) for r in self.resultados)
+
+    @property
+    def bytes_em_memoria(self) -> int:
+        return sum(r.bytes_em_memoria for r in self.resultados if isinstance(r, ResultadoConsulta))
+
+    @property
+    def arquivos(self) -> list:
+        return [a for r in self.resultados if isinstance(r, ResultadoConsulta) for a in r.arquivos]
+
+    def descarregado(self, caminho, linhas_inicio):
+        """Como ResultadoConsulta.descarregado, um arquivo por leitura (`caminho` com o número da instrução)."""
+        raiz, extensao = os.path.splitext(caminho)
+        copia = ResultadoLote(self.instrucoes, [
+            r.descarregado(f"{raiz}_{numero}{extensao}", linhas_inicio) if isinstance(r, ResultadoConsulta) and len(r) > linhas_inicio else r
+            for numero, r in enumerate(self.resultados, 1)
+        ])
+        copia.avisos = list(self.avisos)
+        return copia
+
+    def como_dicionarios(self) -> list:
+        return [{"instrucao": instrucao, "resultado": r.como_dicionarios() if isinstance(r, ResultadoConsulta) else r}
+                for instrucao, r in zip(self.instrucoes, self.resultados)]
+
+
+def _bytes_linha(linha) -> int:
+    total = 0
+    for valor in linha:
+        total += len(valor) if isinstance(valor, (str, bytes, bytearray)) else 8
+    return total
+
+
+def ler_pagina(cursor, inicio=0, tamanho_pagina=TAMANHO_PAGINA, tamanho_lote=TAMANHO_LOTE,
+               max_linhas=MAX_LINHAS, max_bytes=MAX_BYTES, puladas=0):
+    """Lê um cursor em lotes (fetchmany), descartando as linhas antes de `inicio` e guardando no máximo uma página.
+    `puladas` são as linhas que o servidor já pulou (LIMIT com deslocamento): o cursor começa na linha `puladas`.
+    Retorna (linhas, parou_cedo, truncado, motivo, linhas_lidas, bytes_lidos)."""
+    linhas, lidas, bytes_lidos = [], puladas, 0
+    fim = inicio + tamanho_pagina
+    while True:
+        lote = cursor.fetchmany(tamanho_lote)
+        if not lote:
+            return linhas, False, False, "", lidas - puladas, bytes_lidos
+        for linha in lote:
+            if lidas >= fim:
+                # existe ao menos mais uma linha depois da página: o resto não é lido
+                return linhas, True, False, "", lidas - puladas, bytes_lidos
+            if lidas >= max_linhas:
+                return linhas, True, True, f"limite de {max_linhas} linhas atingido", lidas - puladas, bytes_lidos
+            bytes_lidos += _bytes_linha(linha)
+            if bytes_lidos > max_bytes:
+                return linhas, True, True, f"limite de {max_bytes / (1024 * 1024):.1f} MB atingido", lidas - puladas, bytes_lidos
+            if lidas >= inicio:
+                linhas.append(tuple(linha))
+            lidas += 1
+
+
+def cancelar_consulta(conn, conexao_auxiliar):
+    """Interrompe no servidor a instrução em andamento em `conn` (KILL QUERY por outra conexão).
+    `conexao_auxiliar` deve ser a conexão de controle do pool (PoolConexoes.conexao_controle), não uma vaga do pool."""
+    try:
+        with conexao_auxiliar() as aux:
+            cursor = aux.cursor()
+            cursor.execute(f"KILL QUERY {int(conn.connection_id)}")
+            cursor.close()
+        return True
+    except Exception as e:
+        print(f"Aviso: Não foi possível cancelar a consulta no servidor: {e}")
+        return False
+
+
+def _drenar(cursor, tamanho_lote=TAMANHO_LOTE):
+    # Após o KILL QUERY sobra só o que já estava no buffer de rede
+    try:
+        while cursor.fetchmany(tamanho_lote):
+            pass
+    except Exception:
+        pass
+
+
+def _abandonar(conn):
+    # Sem KILL o resto do resultado ainda viria inteiro pela rede: a conexão é fechada sem ler e o pool a descarta
+    conn.reutilizavel = False
+    try:
+        conn.shutdown()
+    except Exception:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def executar_paginado(conn, query_sql, inicio=0, tamanho_pagina=TAMANHO_PAGINA, conexao_auxiliar=None,
+                      max_linhas=MAX_LINHAS, max_bytes=MAX_BYTES, desempate=()) -> ResultadoConsulta:
+    """Executa um SELECT com cursor sem buffer e materializa só a página pedida. Quando dá, a página vai na própria
+    SQL (LIMIT inicio, tamanho+1, com `desempate` completando um ORDER BY existente): o servidor pula as anteriores.
+    Senão (a SQL já tem LIMIT, por exemplo) lê do começo e descarta até `inicio`."""
+    paginada = paginar(query_sql, inicio, min(tamanho_pagina + 1, max(max_linhas - inicio, 0) + 1), desempate)
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(paginada or query_sql)
+        colunas = cursor.column_names or ()
+        linhas, parou_cedo, truncado, motivo, lidas, bytes_lidos = ler_pagina(
+            cursor, inicio, tamanho_pagina, max_linhas=max_linhas, max_bytes=max_bytes,
+            puladas=inicio if paginada else 0
+        )
+        if parou_cedo:
+            # com a página na SQL sobra no máximo uma linha; sem ela, o resto só para com KILL ou fechando a conexão
+            if paginada is not None or (conexao_auxiliar is not None and cancelar_consulta(conn, conexao_auxiliar)):
+                _drenar(cursor)
+            else:
+                _abandonar(conn)
+        return ResultadoConsulta(colunas, linhas, inicio=inicio, tem_mais=parou_cedo and not truncado,
+                                 truncado=truncado, motivo=motivo, linhas_lidas=lidas, bytes_lidos=bytes_lidos)
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+
+def _resultados_multiplos(cursor, sql):
+    # mysql-connector < 9.2: execute(multi=True) devolve um cursor por resultado; nas versões novas o
+    # execute aceita várias instruções direto e os resultados seguintes vêm por nextset()
+    try:
+        iterador = cursor.execute(sql, multi=True)
+    except TypeError:
+        iterador = None
+    if iterador is not None:
+        yield from iterador
+        return
+    cursor.execute(sql)
+    yield cursor
+    while cursor.nextset():
+        yield cursor
+
+
+def executar_lote(conn, instrucoes, max_linhas=MAX_LINHAS_INSTRUCAO, max_bytes=MAX_BYTES) -> ResultadoLote:
+    """Envia todas as instruções numa ida ao servidor e lê um resultado por instrução (até max_linhas linhas cada).
+    Não faz commit: quem chama decide, e o pool desfaz tudo se a conexão voltar com a transação aberta."""
+    # LIMIT em cada leitura: o servidor para de gerar linhas logo depois do limite da instrução
+    enviadas = [(adicionar_limite(i, max_linhas + 1) or i) if retorna_linhas(i) else i for i in instrucoes]
+    cursor = conn.cursor(buffered=False)
+    resultados = []
+    try:
+        # quebra de linha antes do ';': a instrução pode terminar num comentário "--"
+        for atual in _resultados_multiplos(cursor, "\n;\n".join(enviadas)):
+            if atual.with_rows:
+                linhas, parou_cedo, truncado, motivo, lidas, bytes_lidos = ler_pagina(
+                    atual, 0, max_linhas, max_linhas=max_linhas, max_bytes=max_bytes
+                )
+                if parou_cedo:
+                    # o resultado seguinte só chega depois deste ser consumido; KILL derrubaria o lote inteiro
+                    _drenar(atual)
+                resultados.append(ResultadoConsulta(
+                    atual.column_names or (), linhas, tem_mais=False, truncado=parou_cedo,
+                    motivo=motivo or (f"limite de {max_linhas} linhas por instrução" if parou_cedo else ""),
+                    linhas_lidas=lidas, bytes_lidos=bytes_lidos,
+                ))
+            else:
+                resultados.append({"status": "Comando executado com sucesso", "linhas_afetadas": atual.rowcount})
+        return ResultadoLote(instrucoes, resultados)
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            pass
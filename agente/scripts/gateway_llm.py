@@ -0,0 +1,307 @@
+import os
+import time
+import heapq
+import random
+import hashlib
+import itertools
+import threading
+from cliente_gemini import gerar_em_streaming, identidade_modelo
+from metricas import metricas, anotar
+
+# --- COTA E RETENTATIVAS DO GEMINI (via .env) ---
+RPM = float(os.getenv("QUERYFLOW_GEMINI_RPM", "60"))  # requisições por minuto da cota
+TPM = float(os.getenv("QUERYFLOW_GEMINI_TPM", "1000000"))  # tokens (prompt + resposta) por minuto da cota
+TOKENS_RESPOSTA_ESTIMADOS = int(os.getenv("QUERYFLOW_GEMINI_TOKENS_RESPOSTA", "300"))  # reservados antes da chamada
+ESPERA_MAX = float(os.getenv("QUERYFLOW_GEMINI_ESPERA_MAX", "30"))  # tempo máximo na fila antes de desistir
+# Quem pega carona numa chamada idêntica espera o líder no máximo isso; depois chama o Gemini por conta própria
+ESPERA_CARONA = float(os.getenv("QUERYFLOW_GEMINI_ESPERA_CARONA", "60"))
+FILA_MAX = int(os.getenv("QUERYFLOW_GEMINI_FILA_MAX", "100"))  # chamadas aguardando cota; além disso recusa
+TENTATIVAS = int(os.getenv("QUERYFLOW_GEMINI_TENTATIVAS", "4"))
+ESPERA_BASE = float(os.getenv("QUERYFLOW_GEMINI_ESPERA_BASE", "0.5"))  # primeira espera entre tentativas (dobra a cada uma)
+ESPERA_TETO = 20.0
+
+PRIORIDADE_INTERATIVA = 0
+PRIORIDADE_FUNDO = 10  # pré-aquecimento e tarefas em lote: só usam a cota que sobra
+
+CODIGOS_TRANSITORIOS = {429, 500, 502, 503, 504}
+ERROS_TRANSITORIOS = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+                      "DeadlineExceeded", "GatewayTimeout", "BadGateway"}
+
+
+class CotaGeminiError(Exception):
+    pass
+
+
+def estimar_tokens(texto: str) -> int:
+    # ~4 caracteres por token; só precisa ser da ordem certa, o uso real corrige o balde depois
+    return len(texto) // 4 + 1
+
+
+def erro_transitorio(erro) -> bool:
+    if isinstance(erro, (ConnectionError, TimeoutError)):
+        return True
+    if type(erro).__name__ in ERROS_TRANSITORIOS:
+        return True
+    codigo = getattr(erro, "code", None)
+    codigo = getattr(codigo, "value", codigo)  # grpc.StatusCode ou int
+    return codigo in CODIGOS_TRANSITORIOS or "429" in str(erro)
+
+
+class Balde:
+    """Token bucket: enche `capacidade` por minuto, de forma contínua; o saldo pode ficar negativo após uma correção."""
+
+    def __init__(self, capacidade_por_minuto):
+        self.capacidade = capacidade_por_minuto
+        self.saldo = capacidade_por_minuto
+        self._atualizado = time.monotonic()
+
+    def _encher(self, agora):
+        self.saldo = min(self.capacidade, self.saldo + (agora - self._atualizado) * self.capacidade / 60)
+        self._atualizado = agora
+
+    def espera_para(self, quantidade, agora) -> float:
+        self._encher(agora)
+        # um pedido maior que a capacidade espera o balde cheio, senão nunca passaria
+        falta = min(quantidade, self.capacidade) - self.saldo
+        return max(0.0, falta * 60 / self.capacidade)
+
+    def consumir(self, quantidade):
+        self.saldo -= quantidade
+
+
+class _Cota:
+    """Cota RPM/TPM de uma chave da API (o Gemini limita cada chave separadamente) e a fila de quem espera por ela."""
+
+    def __init__(self, rpm, tpm):
+        self.requisicoes = Balde(rpm)
+        self.tokens = Balde(tpm)
+        self.fila = []  # heap de (prioridade, ordem de chegada)
+        self.pausa_ate = 0.0  # após um 429 ninguém com esta chave chama até esse instante
+
+
+class _Voo:
+    """Uma chamada ao Gemini em andamento; pedidos idênticos que chegam durante ela só acompanham."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.pronto = False
+        self.texto = ""
+        self.instrucoes = []
+        self.resultado = None
+        self.erro = None
+
+    def receber(self, texto):
+        with self.cond:
+            self.texto = texto
+            self.cond.notify_all()
+
+    def completar_instrucao(self, instrucao):
+        with self.cond:
+            self.instrucoes.append(instrucao)
+            self.cond.notify_all()
+
+    def encerrar(self, resultado=None, erro=None):
+        with self.cond:
+            self.resultado, self.erro, self.pronto = resultado, erro, True
+            self.cond.notify_all()
+
+    def acompanhar(self, ao_receber, ao_completar_instrucao, prazo=None):
+        # roda na thread de quem pegou carona: os callbacks (ex.: st.empty da sessão) precisam ser chamados nela
+        texto_visto, instrucoes_vistas = "", 0
+        while True:
+            with self.cond:
+                while not self.pronto and self.texto == texto_visto and len(self.instrucoes) == instrucoes_vistas:
+                    restante = None if prazo is None else prazo - time.monotonic()
+                    if restante is not None and restante <= 0:
+                        raise TimeoutError("Prazo da requisição esgotado aguardando a geração da SQL.")
+                    self.cond.wait(restante)
+                texto, novas, pronto = self.texto, self.instrucoes[instrucoes_vistas:], self.pronto
+            if ao_receber is not None and texto != texto_visto:
+                ao_receber(texto)
+            if ao_completar_instrucao is not None:
+                for instrucao in novas:
+                    ao_completar_instrucao(instrucao)
+            texto_visto, instrucoes_vistas = texto, instrucoes_vistas + len(novas)
+            if pronto:
+                if self.erro is not None:
+                    raise self.erro
+                return self.resultado
+
+
+class GatewayLLM:
+    """Porta única para o Gemini no processo: junta pedidos idênticos em andamento (mesma chave da API, modelo,
+    configuração e prompt) numa chamada só (single-flight), segura as chamadas numa fila com prioridade até caberem
+    na cota RPM/TPM da chave e repete erros transitórios (429, 5xx) com espera exponencial e jitter."""
+
+    def __init__(self, rpm=RPM, tpm=TPM, espera_max=ESPERA_MAX, fila_max=FILA_MAX, tentativas=TENTATIVAS,
+                 espera_base=ESPERA_BASE, tokens_resposta=TOKENS_RESPOSTA_ESTIMADOS, espera_carona=ESPERA_CARONA):
+        self._rpm, self._tpm = rpm, tpm
+        self._cotas = {}  # digest da chave da API -> _Cota
+        self._espera_max = espera_max
+        self._espera_carona = espera_carona
+        self._fila_max = fila_max
+        self._tentativas = max(1, tentativas)
+        self._espera_base = espera_base
+        self._tokens_resposta = tokens_resposta
+        self._cond = threading.Condition()
+        self._ordem = itertools.count()
+        self._voos = {}
+        self._voos_lock = threading.Lock()
+
+    @property
+    def tamanho_fila(self) -> int:
+        with self._cond:
+            return sum(len(cota.fila) for cota in self._cotas.values())
+
+    # --- COTA ---
+    def _cota(self, chave_api) -> _Cota:
+        with self._cond:
+            cota = self._cotas.get(chave_api)
+            if cota is None:
+                cota = self._cotas[chave_api] = _Cota(self._rpm, self._tpm)
+            return cota
+
+    def _aguardar_cota(self, cota, tokens, prioridade, prazo=None):
+        """Bloqueia até ser o primeiro da fila da chave e haver cota para 1 requisição e `tokens` tokens
+        (no máximo até `prazo`)."""
+        inicio = time.monotonic()
+        limite = inicio + self._espera_max if prazo is None else min(inicio + self._espera_max, prazo)
+        with self._cond:
+            if len(cota.fila) >= self._fila_max:
+                metricas.incrementar("queryflow_gemini_recusadas_total", motivo="fila_cheia")
+                raise CotaGeminiError(f"Fila do Gemini cheia ({self._fila_max} chamadas aguardando cota).")
+            vez = (prioridade, next(self._ordem))
+            heapq.heappush(cota.fila, vez)
+            try:
+                while True:
+                    agora = time.monotonic()
+                    if cota.fila[0] == vez:
+                        espera = max(cota.pausa_ate - agora, cota.requisicoes.espera_para(1, agora),
+                                     cota.tokens.espera_para(tokens, agora))
+                        if espera <= 0:
+                            cota.requisicoes.consumir(1)
+                            cota.tokens.consumir(tokens)
+                            break
+                    else:
+                        espera = self._espera_max  # acordado por notify_all quando a fila anda
+                    restante = limite - agora
+                    if restante <= 0:
+                        metricas.incrementar("queryflow_gemini_recusadas_total", motivo="espera")
+                        if prazo is not None and prazo < inicio + self._espera_max:
+                            raise TimeoutError("Prazo da requisição esgotado aguardando cota do Gemini.")
+                        raise CotaGeminiError(f"Cota do Gemini esgotada: mais de {self._espera_max:g}s na fila.")
+                    self._cond.wait(min(espera, restante))
+            finally:
+                cota.fila.remove(vez)
+                heapq.heapify(cota.fila)
+                self._cond.notify_all()
+        esperado = time.monotonic() - inicio
+        metricas.observar("queryflow_gemini_espera_segundos", esperado, prioridade=str(prioridade))
+        return esperado
+
+    def _corrigir_tokens(self, cota, reservados, resposta):
+        # a reserva foi estimada; o usage_metadata traz o consumo real
+        uso = getattr(resposta, "usage_metadata", None)
+        total = getattr(uso, "total_token_count", None) if uso is not None else None
+        if total:
+            with self._cond:
+                cota.tokens.consumir(total - reservados)
+
+    def _pausar(self, cota, segundos):
+        with self._cond:
+            cota.pausa_ate = max(cota.pausa_ate, time.monotonic() + segundos)
+
+    # --- CHAMADA COM RETENTATIVAS ---
+    def _chamar(self, cota, modelo, prompt, prioridade, voo, ao_receber, ao_completar_instrucao, prazo=None):
+        def receber(texto):
+            voo.receber(texto)
+            if ao_receber is not None:
+                ao_receber(texto)
+
+        def completar_instrucao(instrucao):
+            voo.completar_instrucao(instrucao)
+            if ao_completar_instrucao is not None:
+                ao_completar_instrucao(instrucao)
+
+        tokens = estimar_tokens(prompt) + self._tokens_resposta
+        espera_total = 0.0
+        for tentativa in range(1, self._tentativas + 1):
+            espera_total += self._aguardar_cota(cota, tokens, prioridade, prazo)
+            try:
+                texto, resposta = gerar_em_streaming(modelo, prompt, receber, completar_instrucao, prazo)
+            except Exception as e:
+                # depois que o texto começou a chegar os ouvintes já o exibiram: não recomeça do zero
+                sem_tempo = prazo is not None and time.monotonic() >= prazo
+                if not erro_transitorio(e) or voo.texto or tentativa == self._tentativas or sem_tempo:
+                    metricas.incrementar("queryflow_gemini_tentativas_total", resultado="erro")
+                    raise
+                metricas.incrementar("queryflow_gemini_tentativas_total", resultado="repetida")
+                atraso = random.uniform(0, min(ESPERA_TETO, self._espera_base * 2 ** (tentativa - 1)))
+                if prazo is not None:
+                    atraso = min(atraso, max(0.0, prazo - time.monotonic()))
+                if "429" in str(e) or type(e).__name__ in ("ResourceExhausted", "TooManyRequests"):
+                    self._pausar(cota, atraso)  # a cota real acabou: segura também as outras chamadas da chave
+                print(f"Aviso: Gemini falhou ({e}); tentativa {tentativa + 1} de {self._tentativas} em {atraso:.1f}s.")
+                time.sleep(atraso)
+                continue
+            metricas.incrementar("queryflow_gemini_tentativas_total", resultado="ok")
+            self._corrigir_tokens(cota, tokens, resposta)
+            anotar(espera_cota_ms=round(espera_total * 1000, 1), tentativas=tentativa)
+            return texto, resposta
+
+    def gerar(self, modelo, prompt: str, ao_receber=None, ao_completar_instrucao=None, prioridade=PRIORIDADE_INTERATIVA,
+              prazo=None):
+        """Mesmo contrato de `gerar_em_streaming`: retorna (texto, resposta) e chama os callbacks durante a geração.
+        Quem pega carona numa chamada idêntica recebe a resposta do líder (não consome cota nem tokens); se o líder
+        demorar mais que a espera da carona ou falhar por prazo, a carona chama o Gemini por conta própria.
+        `prazo` (time.monotonic) limita fila, tentativas e streaming; vencido, levanta TimeoutError."""
+        digest_chave, nome_modelo, config = identidade_modelo(modelo)
+        chave = hashlib.sha256(f"{digest_chave}\x00{nome_modelo}\x00{config}\x00{prompt}".encode("utf-8")).hexdigest()
+        cota = self._cota(digest_chave)
+        with self._voos_lock:
+            voo = self._voos.get(chave)
+            lider = voo is None
+            if lider:
+                voo = self._voos[chave] = _Voo()
+        if not lider:
+            metricas.incrementar("queryflow_gemini_coalescidas_total")
+            anotar(coalescida=True)
+            espera = time.monotonic() + self._espera_carona
+            try:
+                texto, _ = voo.acompanhar(ao_receber, ao_completar_instrucao, espera if prazo is None else min(prazo, espera))
+                return texto, None  # o uso de tokens fica só no rastro do líder
+            except TimeoutError:
+                if prazo is not None and time.monotonic() >= prazo:
+                    raise
+            # líder lento ou vencido pelo próprio prazo: esta requisição ainda tem tempo e segue sozinha
+            metricas.incrementar("queryflow_gemini_caronas_abandonadas_total")
+            print("Aviso: chamada idêntica ao Gemini demorou demais; chamando diretamente.")
+            return self._chamar(cota, modelo, prompt, prioridade, _Voo(), ao_receber, ao_completar_instrucao, prazo)
+        try:
+            resultado = self._chamar(cota, modelo, prompt, prioridade, voo, ao_receber, ao_completar_instrucao, prazo)
+        except Exception as e:
+            voo.encerrar(erro=e)
+            raise
+        finally:
+            with self._voos_lock:
+                self._voos.pop(chave, None)
+        voo.encerrar(resultado)
+        return resultado
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def obter_gateway() -> GatewayLLM:
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = GatewayLLM()
+        return _gateway
+
+
+metricas.registrar_medidor(
+    "queryflow_gemini_fila", lambda: _gateway.tamanho_fila if _gateway is not None else 0,
+    "Chamadas ao Gemini aguardando cota",
+)
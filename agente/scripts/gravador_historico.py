@@ -0,0 +1,252 @@
+import os
+import time
+import queue
+import atexit
+import threading
+from pool_conexoes import obter_pool
+from schema_historico import migrar, ler_modo_autoincremento, compactar_resultado, SQL_INSERIR
+from metricas import metricas
+
+# --- CONFIGURAÇÃO DO GRAVADOR (via .env) ---
+TAMANHO_FILA = int(os.getenv("QUERYFLOW_HISTORICO_FILA", "1000"))
+TAMANHO_LOTE = int(os.getenv("QUERYFLOW_HISTORICO_LOTE", "100"))
+ESPERA_LOTE = float(os.getenv("QUERYFLOW_HISTORICO_ESPERA_LOTE", "0.5"))  # tempo para juntar um lote depois do 1º item
+POLITICA_FILA_CHEIA = os.getenv("QUERYFLOW_HISTORICO_POLITICA", "descartar")  # "descartar" ou "bloquear"
+ESPERA_BLOQUEIO = float(os.getenv("QUERYFLOW_HISTORICO_ESPERA_BLOQUEIO", "0.2"))
+TENTATIVAS = 3
+
+_FIM = object()
+
+
+class RegistroHistorico:
+    """Referência a uma interação enfileirada; `id` é preenchido pela thread quando o INSERT é gravado."""
+
+    __slots__ = ("pergunta", "id", "gravado")
+
+    def __init__(self, pergunta):
+        self.pergunta = pergunta
+        self.id = None
+        self.gravado = threading.Event()
+
+
+class GravadorHistorico:
+    """Grava o histórico fora da requisição: fila limitada + thread que faz INSERTs de várias linhas por lote."""
+
+    def __init__(self, abrir_conexao, tamanho_fila=TAMANHO_FILA, tamanho_lote=TAMANHO_LOTE,
+                 espera_lote=ESPERA_LOTE, politica=POLITICA_FILA_CHEIA, espera_bloqueio=ESPERA_BLOQUEIO):
+        self._abrir_conexao = abrir_conexao
+        self._fila = queue.Queue(maxsize=tamanho_fila)
+        self._tamanho_lote = tamanho_lote
+        self._espera_lote = espera_lote
+        self._politica = politica
+        self._espera_bloqueio = espera_bloqueio
+        self._ddl_aplicada = False
+        self._ids_consecutivos, self._incremento = False, 1
+        self.estatisticas = {"enfileirados": 0, "gravados": 0, "descartados_fila_cheia": 0, "descartados_erro": 0, "lotes": 0}
+        self._estatisticas_lock = threading.Lock()  # requisições e a thread do gravador contam ao mesmo tempo
+        self._thread = threading.Thread(target=self._trabalhar, name="gravador-historico", daemon=True)
+        self._thread.start()
+
+    def _contar(self, chave, quantidade=1):
+        with self._estatisticas_lock:
+            self.estatisticas[chave] += quantidade
+
+    # --- LADO DA REQUISIÇÃO: só enfileira ---
+    def _enfileirar(self, item) -> bool:
+        try:
+            if self._politica == "bloquear":
+                self._fila.put(item, timeout=self._espera_bloqueio)
+            else:
+                self._fila.put_nowait(item)
+        except queue.Full:
+            self._contar("descartados_fila_cheia")
+            print("Aviso: Fila do histórico cheia; registro descartado.")
+            return False
+        self._contar("enfileirados")
+        return True
+
+    def registrar_interacao(self, pergunta, query, resultado):
+        """Enfileira a interação e devolve o RegistroHistorico (ou None se a fila recusou)."""
+        registro = RegistroHistorico(pergunta)
+        return registro if self._enfileirar(("interacao", (registro, query, resultado))) else None
+
+    def registrar_feedback(self, registro, feedback, pergunta=None) -> bool:
+        return self._enfileirar(("feedback", (registro, feedback, pergunta)))
+
+    # --- LADO DO TRABALHADOR ---
+    def _proximo_lote(self):
+        item = self._fila.get()
+        lote = [item]
+        prazo = time.monotonic() + self._espera_lote
+        while item is not _FIM and len(lote) < self._tamanho_lote:
+            restante = prazo - time.monotonic()
+            try:
+                item = self._fila.get(timeout=max(0.0, restante)) if restante > 0 else self._fila.get_nowait()
+            except queue.Empty:
+                break
+            lote.append(item)
+        return lote
+
+    def _aplicar_ddl(self, conn):
+        migrar(conn)
+        self._ids_consecutivos, self._incremento = ler_modo_autoincremento(conn)
+        self._ddl_aplicada = True
+
+    def _inserir_interacoes(self, cursor, itens):
+        # prévia, contagem, esquema e hash calculados só aqui, fora da thread da requisição
+        compactos = [compactar_resultado(resultado) for _, _, resultado in itens]
+        linhas = [(registro.pergunta, query, c["previa"], c["linhas"], c["colunas"], c["hash"])
+                  for (registro, query, _), c in zip(itens, compactos)]
+        metricas.incrementar("queryflow_historico_bytes_total", sum(len(c["previa"]) for c in compactos))
+        sql = SQL_INSERIR
+        if self._ids_consecutivos:
+            # Um INSERT de várias linhas; lastrowid é o id da primeira e as demais seguem o incremento
+            cursor.executemany(sql, linhas)
+            ids = [cursor.lastrowid + k * self._incremento for k in range(len(linhas))]
+        else:
+            # innodb_autoinc_lock_mode=2 não garante ids consecutivos: uma instrução por linha, mesma transação
+            ids = []
+            for linha in linhas:
+                cursor.execute(sql, linha)
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def _atualizar_feedback(self, cursor, registro, feedback, pergunta):
+        if registro is not None and registro.id is not None:
+            cursor.execute("UPDATE historico_interacoes SET feedback = %s WHERE id = %s", (feedback, registro.id))
+        elif pergunta:
+            # Sem o id (registro descartado ou sessão antiga): interação mais recente da pergunta, pelo índice de hash
+            cursor.execute("""
+                UPDATE historico_interacoes SET feedback = %s
+                WHERE pergunta_hash = UNHEX(MD5(%s)) AND pergunta = %s
+                ORDER BY data DESC LIMIT 1""", (feedback, pergunta, pergunta))
+        else:
+            return
+        if cursor.rowcount == 0:
+            print("Aviso: Histórico não encontrado para salvar feedback.")
+
+    def _gravar_lote(self, conn, lote):
+        if not self._ddl_aplicada:
+            self._aplicar_ddl(conn)
+        cursor = conn.cursor()
+        gravados = []
+        try:
+            # Mantém a ordem: interações consecutivas viram um único INSERT de várias linhas
+            i = 0
+            while i < len(lote):
+                tipo, dados = lote[i]
+                if tipo == "interacao":
+                    itens = []
+                    while i < len(lote) and lote[i][0] == "interacao":
+                        itens.append(lote[i][1])
+                        i += 1
+                    for (registro, _, _), id_gravado in zip(itens, self._inserir_interacoes(cursor, itens)):
+                        registro.id = id_gravado
+                        gravados.append(registro)
+                    continue
+                self._atualizar_feedback(cursor, *dados)
+                i += 1
+            conn.commit()
+        except Exception:
+            for registro in gravados:
+                registro.id = None  # transação desfeita: os ids não valem mais
+            raise
+        finally:
+            cursor.close()
+        for registro in gravados:
+            registro.gravado.set()
+
+    def _gravar_um_a_um(self, itens, erro):
+        # O lote inteiro falhou: um registro ruim não pode levar os outros junto, então cada um vai na sua transação
+        if len(itens) == 1:
+            self._contar("descartados_erro")
+            print(f"Aviso: Erro ao salvar histórico (1 registro descartado): {erro}")
+            return
+        descartados = 0
+        for item in itens:
+            try:
+                with self._abrir_conexao() as conn:
+                    self._gravar_lote(conn, [item])
+                self._contar("gravados")
+            except Exception as e:
+                descartados += 1
+                erro = e
+        self._contar("lotes")
+        if descartados:
+            self._contar("descartados_erro", descartados)
+            print(f"Aviso: Erro ao salvar histórico ({descartados} de {len(itens)} registro(s) descartado(s)): {erro}")
+
+    def _trabalhar(self):
+        # DDL uma única vez, na partida; se o banco estiver fora, tenta de novo no primeiro lote
+        try:
+            with self._abrir_conexao() as conn:
+                self._aplicar_ddl(conn)
+        except Exception as e:
+            print(f"Aviso: Não foi possível preparar a tabela de histórico: {e}")
+        while True:
+            lote = self._proximo_lote()
+            encerrar = lote[-1] is _FIM
+            itens = [item for item in lote if item is not _FIM]
+            if itens:
+                for tentativa in range(1, TENTATIVAS + 1):
+                    try:
+                        with self._abrir_conexao() as conn:
+                            self._gravar_lote(conn, itens)
+                        self._contar("gravados", len(itens))
+                        self._contar("lotes")
+                        break
+                    except Exception as e:
+                        if tentativa == TENTATIVAS:
+                            self._gravar_um_a_um(itens, e)
+                        else:
+                            time.sleep(0.5 * 2 ** (tentativa - 1))
+            for _ in lote:
+                self._fila.task_done()
+            if encerrar:
+                return
+
+    def fechar(self, timeout=5.0):
+        """Grava o que estiver na fila e encerra a thread."""
+        if self._thread.is_alive():
+            try:
+                self._fila.put(_FIM, timeout=timeout)
+            except queue.Full:
+                return
+            self._thread.join(timeout)
+
+    def resumo(self) -> dict:
+        with self._estatisticas_lock:
+            estatisticas = dict(self.estatisticas)
+        return {"fila": self._fila.qsize(), "capacidade": self._fila.maxsize, **estatisticas}
+
+
+# --- UM GRAVADOR POR (host, usuário, banco), COMPARTILHADO PELAS SESSÕES ---
+_gravadores = {}
+_gravadores_lock = threading.Lock()
+
+
+def obter_gravador(_mysql_host, _mysql_user, _mysql_password, _mysql_db) -> GravadorHistorico:
+    """O gravador não guarda senha: pega conexões do pool do (host, usuário, banco), cuja fábrica só troca depois que
+    a senha nova conecta. Uma sessão com senha errada recebe o erro de autenticação aqui e não afeta o gravador."""
+    pool = obter_pool(_mysql_host, _mysql_user, _mysql_password, _mysql_db)
+    chave = (_mysql_host, _mysql_user, _mysql_db)
+    with _gravadores_lock:
+        gravador = _gravadores.get(chave)
+        if gravador is None:
+            gravador = _gravadores[chave] = GravadorHistorico(pool.conexao)
+        return gravador
+
+
+@atexit.register
+def _fechar_gravadores():
+    with _gravadores_lock:
+        gravadores = list(_gravadores.values())
+    for gravador in gravadores:
+        gravador.fechar()
+
+
+metricas.registrar_medidor(
+    "queryflow_historico_fila",
+    lambda: {(("banco", f"{u}@{h}/{d}"),): gravador.resumo()["fila"] for (h, u, d), gravador in list(_gravadores.items())},
+    "Itens aguardando gravação no histórico",
+)
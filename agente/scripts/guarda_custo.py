@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from analise_sql import primeira_palavra, e_somente_leitura, inserir_dica_otimizador, adicionar_limite, normalizar_sql
+from execucao_sql import cancelar_consulta, MAX_LINHAS
+from metricas import span, anotar, metricas
+
+# --- LIMITES DA GUARDA DE CUSTO (via .env) ---
+ATIVA = os.getenv("QUERYFLOW_GUARDA_CUSTO", "1") == "1"
+CUSTO_REESCREVER = float(os.getenv("QUERYFLOW_CUSTO_REESCREVER", "100000"))  # query_cost a partir do qual a leitura é reescrita
+CUSTO_MAX = float(os.getenv("QUERYFLOW_CUSTO_MAX", "5000000"))  # acima disso a instrução é rejeitada
+LINHAS_REESCREVER = float(os.getenv("QUERYFLOW_LINHAS_REESCREVER", "1000000"))  # linhas examinadas estimadas
+LINHAS_MAX = float(os.getenv("QUERYFLOW_LINHAS_EXAMINADAS_MAX", "50000000"))
+TEMPO_MAX_MS = int(os.getenv("QUERYFLOW_TEMPO_MAX_MS", "30000"))  # MAX_EXECUTION_TIME e prazo do KILL QUERY
+MARGEM_KILL_S = 2.0  # o KILL só entra se o servidor não tiver interrompido sozinho
+VALIDADE_ANTECIPADA_S = 60.0  # decisões antecipadas não usadas nesse prazo são descartadas
+# Próximas páginas da mesma SQL reaproveitam a decisão da primeira por esse tempo, sem novo EXPLAIN
+VALIDADE_PAGINACAO_S = float(os.getenv("QUERYFLOW_GUARDA_PAGINACAO_S", "600"))
+MAX_DECISOES_PAGINACAO = 256
+
+_EXPLICAVEIS = {"SELECT", "WITH", "TABLE", "UPDATE", "DELETE", "INSERT", "REPLACE"}
+
+
+class ConsultaInterrompidaError(Exception):
+    pass
+
+
+class EstimativaCusto:
+    def __init__(self, custo, linhas_examinadas, alertas, plano=None):
+        self.custo = custo  # query_cost do otimizador (None em UPDATE/DELETE sem cost_info)
+        self.linhas_examinadas = linhas_examinadas
+        self.alertas = alertas  # varreduras completas, junções sem índice
+        self.plano = plano or {}  # JSON do EXPLAIN, para quem precisa saber quais índices foram escolhidos
+
+    def como_dicionario(self) -> dict:
+        return {"custo": self.custo, "linhas_examinadas": round(self.linhas_examinadas), "alertas": self.alertas}
+
+    def __str__(self):
+        custo = f"custo estimado {self.custo:,.0f}" if self.custo is not None else "custo não informado"
+        return f"{custo}, ~{self.linhas_examinadas:,.0f} linhas examinadas"
+
+
+class DecisaoGuarda:
+    def __init__(self, decisao, query_sql, estimativa=None, motivo="", avisos=None):
+        self.decisao = decisao  # "aceitar", "reescrever" ou "rejeitar"
+        self.query_sql = query_sql  # instrução a executar (reescrita, se for o caso)
+        self.estimativa = estimativa
+        self.motivo = motivo
+        self.avisos = avisos or []
+
+    @property
+    def rejeitada(self) -> bool:
+        return self.decisao == "rejeitar"
+
+    def como_dicionario(self) -> dict:
+        return {"decisao": self.decisao, "motivo": self.motivo, "avisos": self.avisos,
+                **(self.estimativa.como_dicionario() if self.estimativa else {})}
+
+
+def _numero(valor, padrao=0.0) -> float:
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return padrao
+
+
+def _linhas_tabela(tabela, alertas) -> float:
+    linhas = _numero(tabela.get("rows_examined_per_scan"))
+    nome = tabela.get("table_name", "?")
+    if tabela.get("access_type") == "ALL" and linhas > 0:
+        alertas.append(f"varredura completa em {nome} (~{linhas:,.0f} linhas)")
+    if tabela.get("using_join_buffer"):
+        alertas.append(f"junção sem índice com {nome} ({tabela['using_join_buffer']})")
+    return linhas
+
+
+def _linhas_examinadas(no, alertas) -> float:
+    """Soma as linhas examinadas do plano: em um nested_loop, cada tabela é lida uma vez por linha
+    produzida pelas anteriores (rows_produced_per_join já é o acumulado da junção)."""
+    total = 0.0
+    if isinstance(no, list):
+        return sum(_linhas_examinadas(item, alertas) for item in no)
+    if not isinstance(no, dict):
+        return 0.0
+    for chave, valor in no.items():
+        if chave == "nested_loop":
+            anteriores = 1.0
+            for item in valor:
+                tabela = item.get("table", {})
+                total += anteriores * _linhas_tabela(tabela, alertas)
+                total += _linhas_examinadas({k: v for k, v in tabela.items() if isinstance(v, (dict, list))}, alertas)
+                anteriores = _numero(tabela.get("rows_produced_per_join"), anteriores) or anteriores
+        elif chave == "table" and isinstance(valor, dict):
+            total += _linhas_tabela(valor, alertas)
+            total += _linhas_examinadas({k: v for k, v in valor.items() if isinstance(v, (dict, list))}, alertas)
+        elif isinstance(valor, (dict, list)):
+            total += _linhas_examinadas(valor, alertas)
+    return total
+
+
+def estimar_custo(conn, query_sql):
+    """Roda EXPLAIN FORMAT=JSON e devolve a EstimativaCusto, ou None se a instrução não é explicável."""
+    if primeira_palavra(query_sql) not in _EXPLICAVEIS:
+        return None
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"EXPLAIN FORMAT=JSON {query_sql.strip().rstrip(';')}")
+        linha = cursor.fetchone()
+        while cursor.fetchone() is not None:
+            pass
+    finally:
+        cursor.close()
+    plano = json.loads(linha[0]) if linha else {}
+    alertas = []
+    linhas = _linhas_examinadas(plano, alertas)
+    cost_info = plano.get("query_block", {}).get("cost_info", {})
+    custo = _numero(cost_info.get("query_cost"), None) if cost_info else None
+    return EstimativaCusto(custo, linhas, alertas, plano)
+
+
+def avaliar(estimativa, somente_leitura=True):
+    """Compara a estimativa com os limites. Retorna (decisão, motivo)."""
+    custo = estimativa.custo or 0.0
+    if custo > CUSTO_MAX or estimativa.linhas_examinadas > LINHAS_MAX:
+        return "rejeitar", f"{estimativa} acima do limite (custo {CUSTO_MAX:,.0f}, {LINHAS_MAX:,.0f} linhas)"
+    if custo > CUSTO_REESCREVER or estimativa.linhas_examinadas > LINHAS_REESCREVER:
+        if not somente_leitura:
+            # LIMIT mudaria o efeito de um UPDATE/DELETE; escrita cara não roda
+            return "rejeitar", f"escrita com {estimativa} (limite {CUSTO_REESCREVER:,.0f})"
+        return "reescrever", f"{estimativa} acima de {CUSTO_REESCREVER:,.0f}"
+    return "aceitar", ""
+
+
+# --- AVALIAÇÃO ANTECIPADA (EXPLAIN enquanto o Gemini ainda gera o resto da resposta) ---
+_antecipadas = {}  # (host, usuário, banco, sql normalizada) -> (instante, Future[DecisaoGuarda])
+_antecipadas_lock = threading.Lock()
+_executor_antecipado = ThreadPoolExecutor(max_workers=2, thread_name_prefix="guarda_custo")
+
+
+def _preparar_em_segundo_plano(conexao, query_sql):
+    with conexao() as conn:
+        return _preparar(conn, query_sql)
+
+
+def antecipar_preparacao(conexao, query_sql, escopo=()):
+    """Dispara o EXPLAIN de uma instrução em segundo plano; preparar_execucao reaproveita o resultado.
+    `conexao` é uma fábrica de context manager (ex.: lambda: conexao_mysql(...)) e `escopo` é (host, usuário, banco):
+    a mesma SQL em outro servidor, banco ou com outras permissões tem outro plano."""
+    if not ATIVA:
+        return
+    chave = (*escopo, normalizar_sql(query_sql))
+    agora = time.monotonic()
+    with _antecipadas_lock:
+        for vencida in [k for k, (instante, _) in _antecipadas.items() if agora - instante > VALIDADE_ANTECIPADA_S]:
+            del _antecipadas[vencida]
+        if chave not in _antecipadas:
+            _antecipadas[chave] = (agora, _executor_antecipado.submit(_preparar_em_segundo_plano, conexao, query_sql))
+
+
+# --- DECISÕES DA PAGINAÇÃO (cada página reexecuta a SQL, mas o plano é o mesmo da primeira) ---
+_decisoes = OrderedDict()  # (host, usuário, banco, sql normalizada) -> (instante, DecisaoGuarda)
+_decisoes_lock = threading.Lock()
+
+
+def _lembrar_decisao(chave, decisao):
+    with _decisoes_lock:
+        _decisoes[chave] = (time.monotonic(), decisao)
+        _decisoes.move_to_end(chave)
+        while len(_decisoes) > MAX_DECISOES_PAGINACAO:
+            _decisoes.popitem(last=False)
+
+
+def _decisao_lembrada(chave):
+    with _decisoes_lock:
+        lembrada = _decisoes.get(chave)
+        if lembrada is None or time.monotonic() - lembrada[0] > VALIDADE_PAGINACAO_S:
+            return None
+        return lembrada[1]
+
+
+def preparar_execucao(conn, query_sql, escopo=(), paginacao=False) -> DecisaoGuarda:
+    """Estima o custo antes de executar e aceita, reescreve (LIMIT + MAX_EXECUTION_TIME) ou rejeita a instrução.
+    `escopo` é o mesmo (host, usuário, banco) passado a antecipar_preparacao. Com `paginacao` (páginas depois da
+    primeira) a decisão tomada para a mesma SQL é reaproveitada sem novo EXPLAIN."""
+    if not ATIVA:
+        return DecisaoGuarda("aceitar", query_sql)
+    chave = (*escopo, normalizar_sql(query_sql))
+    if paginacao:
+        lembrada = _decisao_lembrada(chave)
+        if lembrada is not None:
+            anotar(guarda_paginacao=True)
+            return lembrada
+    with _antecipadas_lock:
+        antecipada = _antecipadas.pop(chave, None)
+    decisao = None
+    if antecipada is not None:
+        try:
+            decisao = antecipada[1].result(timeout=TEMPO_MAX_MS / 1000)
+            anotar(guarda_antecipada=True)
+        except Exception as e:
+            print(f"Aviso: avaliação antecipada falhou, refazendo: {e}")
+    if decisao is None:
+        decisao = _preparar(conn, query_sql)
+    _lembrar_decisao(chave, decisao)
+    return decisao
+
+
+def _preparar(conn, query_sql) -> DecisaoGuarda:
+    with span("guarda_custo") as atributos:
+        try:
+            estimativa = estimar_custo(conn, query_sql)
+        except Exception as e:
+            # EXPLAIN falhou (sintaxe, permissão): a execução real mostra o erro verdadeiro
+            print(f"Aviso: EXPLAIN falhou, seguindo sem estimativa: {e}")
+            estimativa = None
+        if estimativa is None:
+            atributos["decisao"] = "sem_estimativa"
+            return DecisaoGuarda("aceitar", query_sql)
+        decisao, motivo = avaliar(estimativa, e_somente_leitura(query_sql))
+        avisos = list(estimativa.alertas)
+        sql_final = query_sql
+        if decisao == "reescrever":
+            com_limite = adicionar_limite(sql_final, MAX_LINHAS + 1)  # +1: a leitura ainda percebe que havia mais linhas
+            if com_limite:
+                sql_final = com_limite
+                avisos.append(f"LIMIT {MAX_LINHAS + 1} adicionado")
+            com_dica = inserir_dica_otimizador(sql_final, f"MAX_EXECUTION_TIME({TEMPO_MAX_MS})")
+            if com_dica:
+                sql_final = com_dica
+                avisos.append(f"tempo máximo de {TEMPO_MAX_MS / 1000:.0f}s no servidor")
+            avisos.insert(0, f"Consulta reescrita: {motivo}")
+        elif decisao == "rejeitar":
+            print(f"Consulta rejeitada pela guarda de custo: {motivo}")
+        atributos.update(decisao=decisao, custo_estimado=estimativa.custo, linhas_estimadas=round(estimativa.linhas_examinadas))
+        metricas.incrementar("queryflow_guarda_custo_total", decisao=decisao)
+        return DecisaoGuarda(decisao, sql_final, estimativa, motivo, avisos)
+
+
+@contextmanager
+def limite_execucao(conn, conexao_auxiliar, tempo_ms=TEMPO_MAX_MS):
+    """Prazo duro para qualquer instrução: ao expirar, KILL QUERY pela conexão de controle (`conexao_auxiliar`,
+    fora das vagas do pool). O KILL e a saída do bloco se excluem: depois que o bloco termina nenhum KILL é
+    enviado, então ele nunca acerta a próxima instrução da mesma conexão."""
+    expirou = threading.Event()
+    trava = threading.Lock()
+    encerrado = False
+
+    def matar():
+        with trava:
+            if encerrado:
+                return
+            expirou.set()
+            cancelar_consulta(conn, conexao_auxiliar)
+
+    timer = threading.Timer(tempo_ms / 1000 + MARGEM_KILL_S, matar)
+    timer.daemon = True
+    timer.start()
+    try:
+        yield expirou
+    except Exception as e:
+        if expirou.is_set() or "maximum statement execution time exceeded" in str(e):
+            metricas.incrementar("queryflow_consultas_interrompidas_total")
+            raise ConsultaInterrompidaError(
+                f"Consulta interrompida após {tempo_ms / 1000:.0f}s (limite QUERYFLOW_TEMPO_MAX_MS)."
+            ) from e
+        raise
+    finally:
+        with trava:  # espera um KILL já em andamento terminar antes de liberar a conexão
+            encerrado = True
+        timer.cancel()
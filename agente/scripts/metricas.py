@@ -0,0 +1,308 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# --- CONFIGURAÇÃO DA INSTRUMENTAÇÃO (via .env) ---
+DIR_DADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "dados")
+CAMINHO_TRACE = os.getenv("QUERYFLOW_TRACE_PATH", os.path.join(DIR_DADOS, "traces.jsonl"))  # vazio desliga
+CAMINHO_METRICAS = os.getenv("QUERYFLOW_METRICAS_PATH", os.path.join(DIR_DADOS, "metricas.prom"))  # vazio desliga
+PORTA_METRICAS = int(os.getenv("QUERYFLOW_METRICAS_PORTA", "0"))  # > 0 expõe GET /metrics nessa porta
+
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+DESCRICOES = {
+    "queryflow_estagio_segundos": ("histogram", "Duração de cada estágio do pipeline"),
+    "queryflow_pergunta_segundos": ("histogram", "Duração de ponta a ponta de uma pergunta"),
+    "queryflow_perguntas_total": ("counter", "Perguntas processadas"),
+    "queryflow_erros_total": ("counter", "Estágios que terminaram com erro"),
+    "queryflow_tokens_total": ("counter", "Tokens informados pelo Gemini (usage_metadata)"),
+    "queryflow_cache_total": ("counter", "Consultas aos caches por resultado"),
+    "queryflow_linhas_lidas_total": ("counter", "Linhas lidas do banco"),
+    "queryflow_bytes_lidos_total": ("counter", "Bytes lidos do banco"),
+    "queryflow_historico_bytes_total": ("counter", "Bytes da prévia comprimida de resultado gravados no histórico"),
+    "queryflow_guarda_custo_total": ("counter", "Decisões da guarda de custo (EXPLAIN)"),
+    "queryflow_consultas_interrompidas_total": ("counter", "Instruções interrompidas por tempo máximo"),
+    "queryflow_api_requisicoes_total": ("counter", "Requisições atendidas pela API HTTP por rota e status"),
+    "queryflow_api_rejeitadas_total": ("counter", "Requisições da API recusadas (lotado) ou expiradas (timeout)"),
+    "queryflow_gemini_espera_segundos": ("histogram", "Tempo na fila de cota antes de cada chamada ao Gemini"),
+    "queryflow_gemini_tentativas_total": ("counter", "Chamadas ao Gemini por resultado (ok, repetida, erro)"),
+    "queryflow_gemini_coalescidas_total": ("counter", "Gerações que aproveitaram uma chamada idêntica em andamento"),
+    "queryflow_gemini_recusadas_total": ("counter", "Chamadas ao Gemini recusadas por fila cheia ou espera excessiva"),
+    "queryflow_validacao_total": ("counter", "SQL conferidas pela validação local, por resultado"),
+    "queryflow_resultados_despejados_total": ("counter", "Resultados de sessões liberados (sessão ociosa ou memória esgotada)"),
+}
+
+
+def _rotulos(rotulos: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in rotulos.items()))
+
+
+def _formatar_rotulos(rotulos: tuple, extra=()) -> str:
+    pares = list(rotulos) + list(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metricas:
+    """Contadores e histogramas em memória, exportados no formato texto do Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores = {}  # (nome, rotulos) -> valor
+        self._histogramas = {}  # (nome, rotulos) -> [contagens por limite, soma, total]
+        self._medidores = {}  # nome -> função que devolve um número ou {((rotulo, valor), ...): número}
+
+    def incrementar(self, nome, valor=1, **rotulos):
+        chave = (nome, _rotulos(rotulos))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def observar(self, nome, valor, **rotulos):
+        chave = (nome, _rotulos(rotulos))
+        with self._lock:
+            h = self._histogramas.get(chave)
+            if h is None:
+                h = self._histogramas[chave] = [[0] * len(LIMITES_SEGUNDOS), 0.0, 0]
+            for i, limite in enumerate(LIMITES_SEGUNDOS):
+                if valor <= limite:
+                    h[0][i] += 1
+            h[1] += valor
+            h[2] += 1
+
+    def registrar_medidor(self, nome, funcao, descricao=""):
+        # Valores lidos só na exportação (ex.: conexões abertas do pool, tamanho da fila do histórico)
+        with self._lock:
+            self._medidores[nome] = funcao
+            DESCRICOES.setdefault(nome, ("gauge", descricao or nome))
+
+    def texto_prometheus(self) -> str:
+        with self._lock:
+            contadores = dict(self._contadores)
+            histogramas = {k: (list(v[0]), v[1], v[2]) for k, v in self._histogramas.items()}
+            medidores = dict(self._medidores)
+        linhas, cabecalhos = [], set()
+
+        def cabecalho(nome):
+            if nome not in cabecalhos:
+                tipo, descricao = DESCRICOES.get(nome, ("untyped", nome))
+                linhas.append(f"# HELP {nome} {descricao}")
+                linhas.append(f"# TYPE {nome} {tipo}")
+                cabecalhos.add(nome)
+
+        for (nome, rotulos), valor in sorted(contadores.items()):
+            cabecalho(nome)
+            linhas.append(f"{nome}{_formatar_rotulos(rotulos)} {valor}")
+        for (nome, rotulos), (contagens, soma, total) in sorted(histogramas.items()):
+            cabecalho(nome)
+            for limite, contagem in zip(LIMITES_SEGUNDOS, contagens):
+                linhas.append(f"{nome}_bucket{_formatar_rotulos(rotulos, [('le', str(limite))])} {contagem}")
+            linhas.append(f"{nome}_bucket{_formatar_rotulos(rotulos, [('le', '+Inf')])} {total}")
+            linhas.append(f"{nome}_sum{_formatar_rotulos(rotulos)} {soma:.6f}")
+            linhas.append(f"{nome}_count{_formatar_rotulos(rotulos)} {total}")
+        for nome, funcao in sorted(medidores.items()):
+            try:
+                valores = funcao()
+            except Exception as e:
+                print(f"Aviso: Medidor '{nome}' falhou: {e}")
+                continue
+            cabecalho(nome)
+            if isinstance(valores, dict):
+                for rotulos, valor in sorted(valores.items()):
+                    linhas.append(f"{nome}{_formatar_rotulos(_rotulos(dict(rotulos)))} {valor}")
+            else:
+                linhas.append(f"{nome} {valores}")
+        return "\n".join(linhas) + "\n"
+
+
+metricas = Metricas()
+
+
+# --- RASTROS (um por pergunta, com um span por estágio) ---
+class Rastro:
+    def __init__(self, pergunta, tipo="pergunta"):
+        self.id = uuid.uuid4().hex
+        self.pergunta = pergunta
+        self.tipo = tipo
+        self.inicio = time.time()
+        self._inicio_relogio = time.perf_counter()
+        self.duracao_ms = None
+        self.spans = []  # spans encerrados, na ordem de término
+        self.atributos = {}
+        self._abertos = []
+
+    @contextmanager
+    def span(self, nome, **atributos):
+        registro = {"nome": nome, "inicio_ms": round((time.perf_counter() - self._inicio_relogio) * 1000, 3),
+                    "atributos": dict(atributos)}
+        self._abertos.append(registro)
+        inicio = time.perf_counter()
+        try:
+            yield registro["atributos"]
+        except Exception as e:
+            registro["atributos"].setdefault("erro", str(e))
+            raise
+        finally:
+            registro["duracao_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+            self._abertos.remove(registro)
+            self.spans.append(registro)
+            _observar_span(nome, registro["duracao_ms"], registro["atributos"])
+
+    def anotar(self, **atributos):
+        (self._abertos[-1]["atributos"] if self._abertos else self.atributos).update(atributos)
+
+    def como_dicionario(self) -> dict:
+        return {
+            "id": self.id, "tipo": self.tipo, "pergunta": self.pergunta,
+            "inicio": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.inicio)),
+            "duracao_ms": self.duracao_ms, "atributos": self.atributos, "spans": self.spans,
+        }
+
+
+def _observar_span(nome, duracao_ms, atributos):
+    metricas.observar("queryflow_estagio_segundos", duracao_ms / 1000, estagio=nome)
+    if atributos.get("erro"):
+        metricas.incrementar("queryflow_erros_total", estagio=nome)
+
+
+_rastro_atual = contextvars.ContextVar("rastro_queryflow", default=None)
+_arquivos_lock = threading.Lock()
+
+
+@contextmanager
+def iniciar_rastro(pergunta, tipo="pergunta"):
+    """Abre o rastro de uma pergunta; os `span(...)` chamados dentro dele (em qualquer módulo) entram nele."""
+    _iniciar_servidor_se_configurado()
+    rastro = Rastro(pergunta, tipo)
+    token = _rastro_atual.set(rastro)
+    try:
+        yield rastro
+    finally:
+        _rastro_atual.reset(token)
+        rastro.duracao_ms = round((time.perf_counter() - rastro._inicio_relogio) * 1000, 3)
+        metricas.incrementar("queryflow_perguntas_total", tipo=tipo)
+        metricas.observar("queryflow_pergunta_segundos", rastro.duracao_ms / 1000, tipo=tipo)
+        exportar(rastro)
+
+
+def rastro_atual():
+    return _rastro_atual.get()
+
+
+@contextmanager
+def span(nome, **atributos):
+    """Mede um estágio. Sem rastro ativo, só alimenta as métricas."""
+    rastro = _rastro_atual.get()
+    if rastro is not None:
+        with rastro.span(nome, **atributos) as atributos_span:
+            yield atributos_span
+        return
+    inicio = time.perf_counter()
+    atributos = dict(atributos)
+    try:
+        yield atributos
+    except Exception as e:
+        atributos.setdefault("erro", str(e))
+        raise
+    finally:
+        _observar_span(nome, (time.perf_counter() - inicio) * 1000, atributos)
+
+
+def anotar(**atributos):
+    rastro = _rastro_atual.get()
+    if rastro is not None:
+        rastro.anotar(**atributos)
+
+
+def registrar_uso_tokens(resposta):
+    # usage_metadata do google-generativeai: prompt_token_count / candidates_token_count / total_token_count
+    uso = getattr(resposta, "usage_metadata", None)
+    if uso is None:
+        return
+    tokens_prompt = getattr(uso, "prompt_token_count", 0) or 0
+    tokens_resposta = getattr(uso, "candidates_token_count", 0) or 0
+    anotar(tokens_prompt=tokens_prompt, tokens_resposta=tokens_resposta)
+    metricas.incrementar("queryflow_tokens_total", tokens_prompt, tipo="prompt")
+    metricas.incrementar("queryflow_tokens_total", tokens_resposta, tipo="resposta")
+
+
+def registrar_cache(cache, acerto):
+    anotar(**{f"cache_{cache}": "acerto" if acerto else "falta"})
+    metricas.incrementar("queryflow_cache_total", cache=cache, resultado="acerto" if acerto else "falta")
+
+
+def registrar_leitura(linhas, bytes_lidos):
+    anotar(linhas=linhas, bytes=bytes_lidos)
+    metricas.incrementar("queryflow_linhas_lidas_total", linhas)
+    metricas.incrementar("queryflow_bytes_lidos_total", bytes_lidos)
+
+
+# --- EXPORTAÇÃO: JSONL de rastros + arquivo de métricas (+ endpoint opcional) ---
+def exportar(rastro):
+    try:
+        with _arquivos_lock:
+            if CAMINHO_TRACE:
+                os.makedirs(os.path.dirname(os.path.abspath(CAMINHO_TRACE)), exist_ok=True)
+                with open(CAMINHO_TRACE, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(rastro.como_dicionario(), ensure_ascii=False, default=str) + "\n")
+            if CAMINHO_METRICAS:
+                # escreve ao lado e troca: o coletor (node_exporter textfile) nunca lê um arquivo pela metade
+                temporario = CAMINHO_METRICAS + ".tmp"
+                with open(temporario, "w", encoding="utf-8") as f:
+                    f.write(metricas.texto_prometheus())
+                os.replace(temporario, CAMINHO_METRICAS)
+    except Exception as e:
+        print(f"Aviso: Erro ao exportar métricas: {e}")
+
+
+_servidor = None
+_servidor_lock = threading.Lock()
+
+
+def iniciar_servidor_metricas(porta, host="0.0.0.0"):
+    """Serve GET /metrics numa thread própria (uma vez por processo)."""
+    global _servidor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            corpo = metricas.texto_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass
+
+    with _servidor_lock:
+        if _servidor is None:
+            _servidor = ThreadingHTTPServer((host, porta), _Handler)
+            threading.Thread(target=_servidor.serve_forever, name="metricas-http", daemon=True).start()
+            print(f"Métricas disponíveis em http://{host}:{porta}/metrics")
+    return _servidor
+
+
+_porta_indisponivel = False
+
+
+def _iniciar_servidor_se_configurado():
+    global _porta_indisponivel
+    if PORTA_METRICAS > 0 and _servidor is None and not _porta_indisponivel:
+        try:
+            iniciar_servidor_metricas(PORTA_METRICAS)
+        except OSError as e:
+            _porta_indisponivel = True  # não tenta de novo a cada pergunta
+            print(f"Aviso: Não foi possível abrir a porta de métricas {PORTA_METRICAS}: {e}")
@@ -0,0 +1,447 @@
+import os
+import time
+import datetime
+import decimal
+from functools import lru_cache
+import mysql.connector
+from pool_conexoes import conexao_mysql, conexao_controle_mysql
+from catalogo_schema import obter_catalogo
+from cache_geracao import obter_cache_geracao, hash_contexto_prompt
+from cache_resultados import obter_cache_resultados, consulta_cacheavel, chave_resultado, ler_marcadores
+from analise_sql import tabelas_referenciadas, dividir_instrucoes, retorna_linhas, palavras_nivel_zero, colunas_desempate
+from execucao_sql import executar_paginado, executar_lote, ResultadoConsulta, ResultadoLote
+from guarda_custo import preparar_execucao, limite_execucao, antecipar_preparacao, ConsultaInterrompidaError, TEMPO_MAX_MS
+from cliente_gemini import obter_modelo, CONFIG_GERACAO_PADRAO
+from gateway_llm import obter_gateway, PRIORIDADE_INTERATIVA
+from selecao_schema import obter_indice, selecionar_schema
+from gravador_historico import obter_gravador
+from prompt_sql import CONTEXTO_PADRAO, carregar_contexto_prompt, montar_prompt, limpar_resposta_sql
+from agregados import com_dicas_resumos, obter_resumos_em_dia
+from validacao_sql import validar_sql, ResultadoValidacao, ATIVA as VALIDACAO_ATIVA
+from banco_local import obter_banco_local, BACKEND
+from metricas import iniciar_rastro, span, anotar, registrar_uso_tokens, registrar_cache, registrar_leitura
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+CAMINHO_PROMPT = os.getenv("QUERYFLOW_PROMPT_PATH", os.path.join(RAIZ, "protocolos", "prompt.json"))
+
+
+@lru_cache(maxsize=8)
+def carregar_contexto(caminho=CAMINHO_PROMPT) -> dict:
+    try:
+        return carregar_contexto_prompt(caminho)
+    except FileNotFoundError:
+        print(f"Alerta: Arquivo '{caminho}' não encontrado. Usando prompt genérico.")
+        return dict(CONTEXTO_PADRAO)
+    except Exception as e:
+        print(f"Erro ao carregar prompt.json: {e}")
+        return {"error": f"Erro ao carregar prompt.json: {str(e)}"}
+
+
+def _valor_json(valor):
+    if isinstance(valor, decimal.Decimal):
+        return float(valor)
+    if isinstance(valor, (datetime.date, datetime.datetime, datetime.time)):
+        return valor.isoformat()
+    if isinstance(valor, datetime.timedelta):
+        return str(valor)
+    if isinstance(valor, (bytes, bytearray)):
+        return valor.hex()
+    return valor
+
+
+def linha_json(linha) -> list:
+    return [_valor_json(v) for v in linha]
+
+
+def resultado_para_json(resultado):
+    """Forma serializável (JSON) de um ResultadoConsulta, ResultadoLote ou dict de status."""
+    if isinstance(resultado, ResultadoConsulta):
+        return {"tipo": "linhas", "colunas": list(resultado.colunas), "linhas": [linha_json(l) for l in resultado.linhas],
+                "inicio": resultado.inicio, "tem_mais": resultado.tem_mais, "truncado": resultado.truncado,
+                "motivo": resultado.motivo, "avisos": list(resultado.avisos)}
+    if isinstance(resultado, ResultadoLote):
+        return {"tipo": "lote", "avisos": list(resultado.avisos),
+                "instrucoes": [{"instrucao": i, "resultado": resultado_para_json(r)}
+                               for i, r in zip(resultado.instrucoes, resultado.resultados)]}
+    if isinstance(resultado, dict):
+        return {"tipo": "status", **resultado}
+    return resultado
+
+
+class RespostaPergunta:
+    """Resultado do pipeline completo para uma pergunta. `etapa_erro` indica onde parou: estrutura, geracao, execucao
+    ou prazo (tempo_max_ms esgotado)."""
+
+    def __init__(self, pergunta):
+        self.pergunta = pergunta
+        self.sql = ""
+        self.chave_cache_geracao = ""
+        self.veio_do_cache = False
+        self.relatorio_schema = None
+        self.resultado = None
+        self.registro = None  # RegistroHistorico, usado pelo feedback
+        self.etapa_erro = None
+        self.erro = None
+        self.detalhes_erro = {}  # query_com_erro, custo (guarda de custo)
+        self.rastro = None
+
+    @property
+    def ok(self) -> bool:
+        return self.etapa_erro is None
+
+    def falhar(self, etapa, erro, **detalhes):
+        self.etapa_erro, self.erro, self.detalhes_erro = etapa, erro, detalhes
+        return self
+
+    def como_dicionario(self) -> dict:
+        return {
+            "pergunta": self.pergunta, "sql": self.sql, "veio_do_cache": self.veio_do_cache,
+            "relatorio_schema": self.relatorio_schema, "resultado": resultado_para_json(self.resultado),
+            "registro_id": getattr(self.registro, "id", None), "etapa_erro": self.etapa_erro, "erro": self.erro,
+            "detalhes_erro": self.detalhes_erro, "rastro": self.rastro,
+        }
+
+
+class MotorQueryFlow:
+    """Pipeline pergunta -> SQL -> resultado (catálogo, geração com cache, guarda de custo, execução, histórico),
+    sem dependência de interface. Usado pelo Streamlit, pelo terminal e pelo servidor HTTP.
+    Com backend="local" o catálogo e a execução vêm dos datasets em processo (banco_local.py), sem MySQL."""
+
+    def __init__(self, host, usuario, senha, banco, chave_api=None, modelo=None, caminho_prompt=CAMINHO_PROMPT, backend=None):
+        self.host, self.usuario, self.senha, self.banco = host, usuario, senha, banco
+        self.chave_api = chave_api
+        self.modelo = modelo or os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash-latest")
+        self.caminho_prompt = caminho_prompt
+        self.backend = backend or BACKEND
+
+    @classmethod
+    def do_ambiente(cls):
+        return cls(os.getenv("MYSQL_HOST", "localhost"), os.getenv("MYSQL_USER", "root"), os.getenv("MYSQL_PASSWORD", ""),
+                   os.getenv("MYSQL_DB", "querypilot"), os.getenv("GEMINI_API_KEY"), os.getenv("GEMINI_MODEL_NAME"))
+
+    @property
+    def local(self) -> bool:
+        return self.backend == "local"
+
+    @property
+    def configurado(self) -> bool:
+        return self.local or all([self.host, self.usuario, self.banco])
+
+    @property
+    def escopo(self) -> tuple:
+        # identifica servidor, usuário e banco em caches de decisões por SQL (a mesma SQL tem outro plano em outro banco)
+        return self.host, self.usuario, self.banco
+
+    def conexao(self):
+        return conexao_mysql(self.host, self.usuario, self.senha, self.banco)
+
+    def conexao_controle(self):
+        # KILL QUERY sai por esta conexão dedicada, nunca por uma vaga do pool
+        return conexao_controle_mysql(self.host, self.usuario, self.senha, self.banco)
+
+    # Dependências externas num método cada: o benchmark troca só estas e roda o resto do pipeline como no app
+    def banco_local(self):
+        return obter_banco_local()
+
+    def cache_geracao(self):
+        return obter_cache_geracao()
+
+    def modelo_gemini(self):
+        return obter_modelo(self.chave_api, self.modelo, CONFIG_GERACAO_PADRAO)
+
+    # --- SCHEMA ---
+    def catalogo(self, forcar=False):
+        if self.local:
+            return self.banco_local().catalogo(forcar)
+        return obter_catalogo(self.host, self.usuario, self.senha, self.banco, forcar=forcar)
+
+    def desempate(self, query_sql):
+        """Chaves primárias que completam o ORDER BY da SQL para as páginas não trocarem linhas empatadas."""
+        if "ORDER" not in palavras_nivel_zero(query_sql):
+            return []
+        try:
+            tabelas = self.catalogo().tabelas
+        except Exception as e:
+            print(f"Aviso: catálogo indisponível para desempatar a paginação: {e}")
+            return []
+        return colunas_desempate(query_sql, {nome: t["chave_primaria"] for nome, t in tabelas.items()})
+
+    def estrutura(self):
+        """{tabela: [colunas]} do catálogo em memória (só recarrega as tabelas cuja impressão mudou), ou dict com "error"."""
+        if not self.configurado:
+            print("Alerta: Configurações do MySQL incompletas para obter estrutura.")
+            return {"error": "Configurações do MySQL incompletas."}
+        try:
+            with span("schema") as atributos:
+                catalogo = self.catalogo()
+                atributos["tabelas"] = len(catalogo.tabelas)
+            if not catalogo.tabelas:
+                print(f"Alerta: Nenhuma tabela encontrada no banco '{self.banco}'.")
+                return {}
+            return catalogo.como_dicionario()
+        except mysql.connector.Error as err:
+            print(f"Erro MySQL (estrutura): {err}")
+            return {"error": f"Erro MySQL (estrutura): {str(err)}"}
+        except Exception as e:
+            print(f"Erro inesperado (estrutura): {e}")
+            return {"error": f"Erro inesperado (estrutura): {str(e)}"}
+
+    # --- GERAÇÃO ---
+    def _gerar_com_gemini(self, pergunta, colunas_db, schema_compacto, contexto_prompt, ao_receber=None, ao_completar_instrucao=None,
+                          prioridade=PRIORIDADE_INTERATIVA, prazo=None):
+        if not self.chave_api: return "Erro: Chave API Gemini não fornecida."
+        if not self.modelo: return "Erro: Modelo Gemini não especificado."
+        if isinstance(colunas_db, dict) and colunas_db.get("error"):
+            return f"Erro: Não foi possível obter estrutura do banco - {colunas_db['error']}"
+        if not colunas_db:
+            return "Erro: Estrutura do banco de dados está vazia ou não pôde ser carregada."
+        try:
+            if isinstance(contexto_prompt, dict) and contexto_prompt.get("error"):
+                return f"Erro: Falha ao carregar contexto do prompt - {contexto_prompt['error']}"
+            prompt_completo = montar_prompt(contexto_prompt, self.banco, schema_compacto or colunas_db, pergunta)
+            # Modelo reaproveitado por (chave, modelo, configuração); a resposta chega em streaming.
+            # O gateway junta prompts idênticos em andamento, respeita a cota RPM/TPM e repete 429/5xx.
+            model = self.modelo_gemini()
+            texto, response = obter_gateway().gerar(model, prompt_completo, ao_receber, ao_completar_instrucao, prioridade, prazo)
+            registrar_uso_tokens(response)
+            query = limpar_resposta_sql(texto)
+            if not query: return "Erro: Gemini retornou uma query vazia."
+            return query
+        except Exception as e:
+            print(f"Erro API Gemini (Modelo: {self.modelo}): {e}")
+            return f"Erro: API Gemini falhou - {str(e)}"
+
+    def gerar_sql(self, pergunta, colunas_db=None, catalogo=None, ao_receber=None, ao_completar_instrucao=None,
+                  prioridade=PRIORIDADE_INTERATIVA, prazo=None):
+        """Retorna (query, chave_cache, veio_do_cache, relatorio_schema); a chave serve para o feedback promover/rejeitar a entrada."""
+        catalogo = catalogo or self.catalogo()
+        colunas_db = colunas_db if colunas_db is not None else catalogo.como_dicionario()
+        # Tabelas de resumo em dia (agregados.py) entram como dicas, para saldo e totais virarem leituras diretas;
+        # resumos atrasados ou sujos por UPDATE/DELETE ficam fora do prompt até a próxima atualização
+        resumos = set() if self.local else obter_resumos_em_dia(self.conexao, (self.host, self.usuario, self.banco), catalogo.tabelas)
+        contexto_prompt = com_dicas_resumos(carregar_contexto(self.caminho_prompt), resumos)
+        cache = self.cache_geracao()
+        chave = cache.chave(pergunta, catalogo.impressao, self.modelo, hash_contexto_prompt(contexto_prompt))
+        with span("cache_geracao"):
+            try:
+                query = cache.obter(chave)
+            except Exception as e:
+                print(f"Aviso: Erro ao ler cache de geração: {e}")
+                query = None
+            registrar_cache("geracao", bool(query))
+        if query:
+            return query, chave, True, None
+        # Só as tabelas relevantes para a pergunta (e suas vizinhas por FK) vão para o prompt
+        instrucoes = contexto_prompt.get("instrucoes_sql", []) if isinstance(contexto_prompt, dict) else []
+        with span("selecao_schema") as atributos:
+            schema_compacto, relatorio_schema = selecionar_schema(obter_indice(catalogo, instrucoes), pergunta)
+            atributos.update(tokens_schema=relatorio_schema["tokens_schema"], tabelas=len(relatorio_schema["tabelas_selecionadas"]))
+        print(f"Schema do prompt: {relatorio_schema['tokens_schema']} tokens (antes {relatorio_schema['tokens_schema_anterior']}, -{relatorio_schema['reducao_pct']}%) em {relatorio_schema['tempo_selecao_ms']} ms")
+        inicio = time.perf_counter()
+        with span("gemini", modelo=self.modelo):
+            query = self._gerar_com_gemini(pergunta, colunas_db, schema_compacto, contexto_prompt, ao_receber, ao_completar_instrucao,
+                                           prioridade, prazo)
+            if not query or query.startswith("Erro"):
+                anotar(erro=query or "resposta vazia")
+        relatorio_schema["tempo_gemini_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+        if query and not query.startswith("Erro"):
+            try:
+                cache.guardar(chave, pergunta, self.modelo, query)
+            except Exception as e:
+                print(f"Aviso: Erro ao gravar cache de geração: {e}")
+        return query, chave, False, relatorio_schema
+
+    def antecipar(self, instrucao):
+        """EXPLAIN em segundo plano de uma instrução já completa (chamado durante o streaming); inválidas nem vão ao banco."""
+        if not self.local and self.validar(instrucao).valida:
+            antecipar_preparacao(self.conexao, instrucao, self.escopo)
+
+    # --- VALIDAÇÃO LOCAL ---
+    def validar(self, query_sql) -> ResultadoValidacao:
+        """Tabelas, colunas, restrições do prompt e ONLY_FULL_GROUP_BY conferidos no processo, contra o catálogo em memória."""
+        if not VALIDACAO_ATIVA:
+            return ResultadoValidacao(query_sql)
+        with span("validacao") as atributos:
+            try:
+                catalogo = self.catalogo()
+            except Exception as e:
+                print(f"Aviso: validação sem catálogo (só sintática): {e}")
+                catalogo = None
+            validacao = validar_sql(query_sql, catalogo, carregar_contexto(self.caminho_prompt))
+            atributos.update(erros=len(validacao.erros), tempo_ms=validacao.tempo_ms)
+        return validacao
+
+    # --- EXECUÇÃO ---
+    def executar(self, query_sql, inicio=0, tempo_max_ms=None):
+        """SELECTs voltam como ResultadoConsulta (uma página de tuplas), várias instruções como ResultadoLote e
+        demais comandos como dict de status; erros como dict com "error". Retorna (status, resultado)."""
+        with span("execucao", inicio=inicio, backend=self.backend):
+            status, res = self._executar(query_sql, inicio, tempo_max_ms or TEMPO_MAX_MS)
+            if isinstance(res, (ResultadoConsulta, ResultadoLote)):
+                registrar_leitura(res.linhas_lidas, res.bytes_lidos)
+                anotar(**({"instrucoes": len(res)} if isinstance(res, ResultadoLote) else {"linhas_pagina": len(res)}))
+            elif isinstance(res, dict) and res.get("error"):
+                anotar(erro=res["error"])
+            return status, res
+
+    def _executar(self, query_sql, inicio, tempo_max_ms):
+        if not query_sql: return [], {"error": "Query SQL está vazia."}
+        if not self.configurado:
+            return None, {"error": "Configurações do MySQL incompletas."}
+        instrucoes = dividir_instrucoes(query_sql)
+        if not instrucoes: return [], {"error": "Query SQL contém apenas comentários."}
+        # SQL que a validação local já sabe que o MySQL rejeitaria não ocupa conexão nem ida ao banco
+        validacao = self.validar(query_sql)
+        if not validacao.valida:
+            return [], {"error": f"SQL inválida: {' '.join(validacao.erros)}", "query_com_erro": query_sql,
+                        "validacao": validacao.como_dicionario()}
+        if self.local:
+            return self._executar_local(query_sql, inicio, tempo_max_ms, validacao)
+        if len(instrucoes) > 1:
+            return self._executar_lote(instrucoes, query_sql, tempo_max_ms, validacao)
+        try:
+            cache = obter_cache_resultados()
+            cacheavel = consulta_cacheavel(query_sql)
+            with self.conexao() as conn:
+                if cacheavel:
+                    # Uma sonda barata no information_schema decide se o resultado guardado ainda vale
+                    chave = chave_resultado(query_sql, self.banco, inicio)
+                    marcadores = ler_marcadores(conn, self.banco, tabelas_referenciadas(query_sql))
+                    res = cache.obter(chave, marcadores)
+                    registrar_cache("resultados", res is not None)
+                    if res is not None:
+                        print("Resultado servido pelo cache de resultados.")
+                        return [], res
+                # EXPLAIN antes de executar: instruções caras demais são rejeitadas ou reescritas
+                guarda = preparar_execucao(conn, query_sql, self.escopo, paginacao=inicio > 0)
+                if guarda.rejeitada:
+                    return [], {"error": f"Consulta rejeitada pela guarda de custo: {guarda.motivo}", "query_com_erro": query_sql,
+                                "custo": guarda.como_dicionario()}
+                with limite_execucao(conn, self.conexao_controle, tempo_max_ms):
+                    if retorna_linhas(query_sql):
+                        res = executar_paginado(conn, guarda.query_sql, inicio=inicio, conexao_auxiliar=self.conexao_controle,
+                                                desempate=self.desempate(guarda.query_sql))
+                        res.avisos.extend(validacao.avisos + guarda.avisos)
+                    else:
+                        cursor = conn.cursor()
+                        cursor.execute(guarda.query_sql)
+                        conn.commit()
+                        res = {"status": "Comando executado com sucesso", "linhas_afetadas": cursor.rowcount,
+                               "avisos": validacao.avisos + guarda.avisos}
+                        cursor.close()
+                        cache.invalidar_tabelas(validacao.tabelas or tabelas_referenciadas(query_sql))
+            if cacheavel and isinstance(res, ResultadoConsulta):
+                cache.guardar(chave, query_sql, res, marcadores)
+            return [], res
+        except ConsultaInterrompidaError as e:
+            print(f"Erro (execução): {e}")
+            return [], {"error": str(e), "query_com_erro": query_sql}
+        except mysql.connector.Error as err:
+            print(f"Erro MySQL (execução): {err}")
+            return [], {"error": f"Erro MySQL ao executar query: {str(err)}", "query_com_erro": query_sql}
+        except Exception as e:
+            print(f"Erro inesperado (execução): {e}")
+            return [], {"error": f"Erro inesperado ao executar query: {str(e)}", "query_com_erro": query_sql}
+
+    def _executar_lote(self, instrucoes, query_sql, tempo_max_ms, validacao):
+        # Várias instruções (ex.: INSERT seguido de SELECT) vão ao servidor numa ida só; cada uma traz o próprio resultado
+        try:
+            cache = obter_cache_resultados()
+            with self.conexao() as conn:
+                guardas = [preparar_execucao(conn, instrucao, self.escopo) for instrucao in instrucoes]
+                for numero, guarda in enumerate(guardas, 1):
+                    if guarda.rejeitada:
+                        return [], {"error": f"Instrução {numero} rejeitada pela guarda de custo: {guarda.motivo}",
+                                    "query_com_erro": instrucoes[numero - 1], "custo": guarda.como_dicionario()}
+                with limite_execucao(conn, self.conexao_controle, tempo_max_ms):
+                    res = executar_lote(conn, [guarda.query_sql for guarda in guardas])
+                res.avisos.extend(validacao.avisos)
+                res.avisos.extend(f"Instrução {numero}: {aviso}" for numero, guarda in enumerate(guardas, 1) for aviso in guarda.avisos)
+                if res.houve_escrita:
+                    # um erro no meio do lote não chega aqui: a conexão volta ao pool com rollback
+                    conn.commit()
+                    cache.invalidar_tabelas(set().union(*(tabelas_referenciadas(i) for i in instrucoes if not retorna_linhas(i))))
+            return [], res
+        except ConsultaInterrompidaError as e:
+            print(f"Erro (execução): {e}")
+            return [], {"error": str(e), "query_com_erro": query_sql}
+        except mysql.connector.Error as err:
+            print(f"Erro MySQL (execução em lote): {err}")
+            return [], {"error": f"Erro MySQL ao executar as instruções: {str(err)}", "query_com_erro": query_sql}
+        except Exception as e:
+            print(f"Erro inesperado (execução em lote): {e}")
+            return [], {"error": f"Erro inesperado ao executar as instruções: {str(e)}", "query_com_erro": query_sql}
+
+    def _executar_local(self, query_sql, inicio, tempo_max_ms, validacao):
+        # Sem guarda de custo nem cache de resultados: o motor em processo varre os datasets sem ocupar o servidor
+        try:
+            res = self.banco_local().executar(query_sql, inicio, tempo_max_ms, banco=self.banco)
+            res.avisos.extend(validacao.avisos)
+            return [], res
+        except ConsultaInterrompidaError as e:
+            print(f"Erro (execução): {e}")
+            return [], {"error": str(e), "query_com_erro": query_sql}
+        except Exception as e:
+            print(f"Erro (execução local): {e}")
+            return [], {"error": f"Erro ao executar query no banco local: {str(e)}", "query_com_erro": query_sql}
+
+    # --- HISTÓRICO E FEEDBACK ---
+    def salvar_historico(self, pergunta, query, resultado):
+        # Só enfileira: a gravação (INSERT em lote) acontece na thread do gravador de histórico.
+        # Retorna o RegistroHistorico, cujo id (PK) é usado depois pelo feedback. O backend local não grava histórico.
+        # O resultado vai como está (tuplas); a conversão para JSON acontece na thread do gravador.
+        if not self.configurado or self.local: return None
+        try:
+            with span("historico"):
+                return obter_gravador(self.host, self.usuario, self.senha, self.banco).registrar_interacao(pergunta, query, resultado)
+        except Exception as e:
+            print(f"Aviso: Erro ao salvar histórico: {e}")
+            return None
+
+    def salvar_feedback(self, pergunta, feedback, registro=None, chave_cache_geracao=None):
+        if not self.configurado: return
+        if not self.local:
+            try:
+                obter_gravador(self.host, self.usuario, self.senha, self.banco).registrar_feedback(registro, feedback, pergunta)
+            except Exception as e:
+                print(f"Aviso: Erro ao salvar feedback: {e}")
+        if chave_cache_geracao:
+            self.cache_geracao().registrar_feedback(chave_cache_geracao, feedback)
+
+    # --- PIPELINE COMPLETO ---
+    def perguntar(self, pergunta, inicio=0, tempo_max_ms=None, ao_receber=None, tipo="pergunta") -> RespostaPergunta:
+        """Estrutura -> SQL (cache ou Gemini em streaming) -> guarda de custo -> execução -> histórico, num rastro só.
+        Com `tempo_max_ms` o prazo vale para o pipeline inteiro: a geração usa parte dele e a execução recebe só o
+        que sobrou (KILL QUERY quando vence)."""
+        resposta = RespostaPergunta(pergunta)
+        prazo = time.monotonic() + tempo_max_ms / 1000 if tempo_max_ms else None
+        with iniciar_rastro(pergunta, tipo=tipo) as rastro:
+            self._perguntar(resposta, inicio, prazo, ao_receber)
+        resposta.rastro = rastro.como_dicionario()
+        return resposta
+
+    def _perguntar(self, resposta, inicio, prazo, ao_receber):
+        estrutura = self.estrutura()
+        if isinstance(estrutura, dict) and estrutura.get("error"):
+            return resposta.falhar("estrutura", f"Falha ao obter estrutura do banco: {estrutura['error']}")
+        if not estrutura:
+            return resposta.falhar("estrutura", "Estrutura do banco de dados está vazia. Verifique as configurações ou se o banco possui tabelas.")
+        # cada instrução completa já segue para o EXPLAIN enquanto o resto da resposta chega
+        resposta.sql, resposta.chave_cache_geracao, resposta.veio_do_cache, resposta.relatorio_schema = self.gerar_sql(
+            resposta.pergunta, estrutura, ao_receber=ao_receber, ao_completar_instrucao=self.antecipar, prazo=prazo
+        )
+        if prazo is not None and time.monotonic() >= prazo:
+            return resposta.falhar("prazo", "Prazo da requisição esgotado durante a geração da SQL.")
+        if not resposta.sql or resposta.sql.startswith("Erro"):
+            return resposta.falhar("geracao", f"Falha ao gerar SQL: {resposta.sql or 'Nenhuma query foi gerada.'}")
+        tempo_max_ms = (prazo - time.monotonic()) * 1000 if prazo is not None else None
+        _, resultado = self.executar(resposta.sql, inicio, tempo_max_ms)
+        if isinstance(resultado, dict) and resultado.get("error"):
+            if prazo is not None and time.monotonic() >= prazo:
+                # interrompida pelo prazo (KILL QUERY): a SQL pode estar certa, o cache de geração fica
+                return resposta.falhar("prazo", resultado["error"], **{k: v for k, v in resultado.items() if k != "error"})
+            self.cache_geracao().descartar(resposta.chave_cache_geracao)  # não reaproveitar SQL que falhou
+            return resposta.falhar("execucao", resultado["error"], **{k: v for k, v in resultado.items() if k != "error"})
+        resposta.resultado = resultado
+        resposta.registro = self.salvar_historico(resposta.pergunta, resposta.sql, resultado)
+        return resposta
@@ -0,0 +1,258 @@
+import os
+import threading
+import time
+import hashlib
+from collections import deque
+from contextlib import contextmanager
+from metricas import metricas
+
+# --- CONFIGURAÇÃO DO POOL (via .env) ---
+TAMANHO_POOL_PADRAO = int(os.getenv("MYSQL_POOL_SIZE", "5"))
+TEMPO_OCIOSO_MAX = float(os.getenv("MYSQL_POOL_IDLE_SECONDS", "300"))  # conexões paradas além disso são fechadas
+TEMPO_ESPERA_CHECKOUT = float(os.getenv("MYSQL_POOL_TIMEOUT", "10"))  # espera máxima por uma conexão livre
+INTERVALO_PING = float(os.getenv("MYSQL_POOL_PING_SECONDS", "30"))  # só faz ping se a conexão ficou parada mais que isso
+CONNECT_TIMEOUT = int(os.getenv("MYSQL_CONNECT_TIMEOUT", "5"))
+
+
+class PoolEsgotadoError(Exception):
+    pass
+
+
+def _verificar_mysql(conn) -> bool:
+    # ping com reconexão: conexões derrubadas pelo servidor (wait_timeout) voltam sem custo extra de fluxo
+    try:
+        conn.ping(reconnect=True, attempts=1, delay=0)
+        return True
+    except Exception:
+        return False
+
+
+def _fechar_silencioso(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class PoolConexoes:
+    """Pool de conexões thread-safe com verificação no checkout e despejo de conexões ociosas."""
+
+    def __init__(self, fabrica, tamanho=TAMANHO_POOL_PADRAO, tempo_ocioso_max=TEMPO_OCIOSO_MAX,
+                 tempo_espera=TEMPO_ESPERA_CHECKOUT, intervalo_ping=INTERVALO_PING, verificar=_verificar_mysql):
+        self._fabrica = fabrica
+        self.tamanho = max(1, int(tamanho))
+        self._tempo_ocioso_max = tempo_ocioso_max
+        self._tempo_espera = tempo_espera
+        self._intervalo_ping = intervalo_ping
+        self._verificar = verificar
+        self._livres = deque()  # (conexao, instante_devolucao)
+        self._abertas = 0
+        self._cond = threading.Condition()
+        self._controle = None  # conexão dedicada ao KILL QUERY, fora das vagas do pool
+        self._controle_lock = threading.Lock()
+        self._geracao = 0  # muda a cada troca de credenciais; conexões de gerações antigas não voltam para o pool
+        self.estatisticas = {"criadas": 0, "reutilizadas": 0, "descartadas": 0, "esperas": 0}
+
+    def _despejar_ociosas(self):
+        # chamada com o lock adquirido; as mais antigas ficam à esquerda do deque
+        agora = time.monotonic()
+        while self._livres and agora - self._livres[0][1] > self._tempo_ocioso_max:
+            conn, _ = self._livres.popleft()
+            self._abertas -= 1
+            self.estatisticas["descartadas"] += 1
+            _fechar_silencioso(conn)
+
+    def obter(self):
+        prazo = time.monotonic() + self._tempo_espera
+        conn, devolvida_em = None, 0.0
+        with self._cond:
+            while True:
+                self._despejar_ociosas()
+                if self._livres:
+                    # LIFO: reaproveita a conexão mais "quente" e deixa as frias envelhecerem até o despejo
+                    conn, devolvida_em = self._livres.pop()
+                    break
+                if self._abertas < self.tamanho:
+                    self._abertas += 1  # reserva a vaga antes de conectar fora do lock
+                    fabrica, geracao = self._fabrica, self._geracao
+                    break
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    raise PoolEsgotadoError(f"Nenhuma conexão livre em {self._tempo_espera}s (tamanho do pool: {self.tamanho}).")
+                self.estatisticas["esperas"] += 1
+                self._cond.wait(restante)
+
+        if conn is not None:
+            if time.monotonic() - devolvida_em < self._intervalo_ping or self._verificar(conn):
+                self.estatisticas["reutilizadas"] += 1
+                return conn
+            self.estatisticas["descartadas"] += 1
+            _fechar_silencioso(conn)
+
+            with self._cond:
+                fabrica, geracao = self._fabrica, self._geracao
+        try:
+            conn = fabrica()
+        except Exception:
+            with self._cond:
+                self._abertas -= 1
+                self._cond.notify()
+            raise
+        conn.geracao_pool = geracao
+        self.estatisticas["criadas"] += 1
+        return conn
+
+    def devolver(self, conn, descartar=False):
+        # execucao_sql marca reutilizavel=False quando abandona um resultado no meio (conexão já fechada)
+        descartar = descartar or not getattr(conn, "reutilizavel", True)
+        if not descartar:
+            try:
+                # encerra transações/snapshots abertos para a próxima sessão não enxergar dados antigos
+                if getattr(conn, "in_transaction", False):
+                    conn.rollback()
+            except Exception:
+                descartar = True
+        with self._cond:
+            if descartar or getattr(conn, "geracao_pool", self._geracao) != self._geracao:
+                self._abertas -= 1
+                self.estatisticas["descartadas"] += 1
+                _fechar_silencioso(conn)
+            else:
+                self._livres.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def conexao(self):
+        conn = self.obter()
+        descartar = False
+        try:
+            yield conn
+        except Exception:
+            # erro de SQL mantém a conexão; queda de rede/servidor descarta
+            descartar = not self._verificar(conn)
+            raise
+        finally:
+            self.devolver(conn, descartar=descartar)
+
+    @contextmanager
+    def conexao_controle(self):
+        """Conexão dedicada para cancelar instruções (KILL QUERY). Não disputa vagas com as consultas: com o pool
+        cheio, pedir outra conexão para o KILL esperaria justamente pela que está presa na consulta lenta."""
+        with self._controle_lock:
+            conn = self._controle
+            if conn is None or not self._verificar(conn):
+                if conn is not None:
+                    _fechar_silencioso(conn)
+                self._controle = None
+                conn = self._controle = self._fabrica()
+            try:
+                yield conn
+            except Exception:
+                self._controle = None
+                _fechar_silencioso(conn)
+                raise
+
+    def trocar_fabrica(self, fabrica, conexao_nova=None):
+        """Credenciais novas para o mesmo (host, usuário, banco): as conexões livres e a de controle são fechadas, as
+        em uso são descartadas quando voltam. `conexao_nova`, já aberta com a fábrica nova, entra como livre."""
+        with self._controle_lock:
+            if self._controle is not None:
+                _fechar_silencioso(self._controle)
+                self._controle = None
+        with self._cond:
+            self._fabrica = fabrica
+            self._geracao += 1
+            while self._livres:
+                conn, _ = self._livres.popleft()
+                self._abertas -= 1
+                self.estatisticas["descartadas"] += 1
+                _fechar_silencioso(conn)
+            if conexao_nova is not None and self._abertas < self.tamanho:
+                conexao_nova.geracao_pool = self._geracao
+                self._abertas += 1
+                self._livres.append((conexao_nova, time.monotonic()))
+                conexao_nova = None
+            self._cond.notify_all()
+        if conexao_nova is not None:
+            _fechar_silencioso(conexao_nova)
+
+    def fechar(self):
+        with self._controle_lock:
+            if self._controle is not None:
+                _fechar_silencioso(self._controle)
+                self._controle = None
+        with self._cond:
+            while self._livres:
+                conn, _ = self._livres.popleft()
+                self._abertas -= 1
+                _fechar_silencioso(conn)
+            self._cond.notify_all()
+
+    def resumo(self) -> dict:
+        with self._cond:
+            return {"tamanho": self.tamanho, "abertas": self._abertas, "livres": len(self._livres), **self.estatisticas}
+
+
+# --- REGISTRO GLOBAL DE POOLS (compartilhado entre sessões do Streamlit e o agente de terminal) ---
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _fabrica_mysql(_mysql_host, _mysql_user, _mysql_password, _mysql_db):
+    def fabrica():
+        import mysql.connector  # só aqui: o backend local importa este módulo sem ter o conector instalado
+        return mysql.connector.connect(
+            host=_mysql_host, user=_mysql_user, password=_mysql_password, database=_mysql_db,
+            connect_timeout=CONNECT_TIMEOUT
+        )
+    return fabrica
+
+
+def obter_pool(_mysql_host, _mysql_user, _mysql_password, _mysql_db, tamanho=None) -> PoolConexoes:
+    """Um pool por (host, usuário, banco), qualquer que seja a senha. Senha diferente da do pool (trocada na sidebar
+    ou rotacionada) só reconstrói as conexões depois de uma conexão de teste com ela dar certo: uma senha errada numa
+    sessão recebe o erro de autenticação e não derruba as conexões das outras."""
+    chave = (_mysql_host, _mysql_user, _mysql_db)
+    digest_senha = hashlib.sha256((_mysql_password or "").encode("utf-8")).hexdigest()
+    fabrica = _fabrica_mysql(_mysql_host, _mysql_user, _mysql_password, _mysql_db)
+    with _pools_lock:
+        registro = _pools.get(chave)
+        if registro is None:
+            pool = PoolConexoes(fabrica, tamanho=tamanho or TAMANHO_POOL_PADRAO)
+            _pools[chave] = (pool, digest_senha)
+            return pool
+        if registro[1] == digest_senha:
+            return registro[0]
+    conexao_nova = fabrica()  # fora do lock; erro de autenticação sobe sem mexer no pool
+    with _pools_lock:
+        pool, digest_atual = _pools[chave]
+        if digest_atual == digest_senha:
+            _fechar_silencioso(conexao_nova)  # outra sessão já trocou para esta senha
+        else:
+            pool.trocar_fabrica(fabrica, conexao_nova)
+            _pools[chave] = (pool, digest_senha)
+        return pool
+
+
+@contextmanager
+def conexao_mysql(_mysql_host, _mysql_user, _mysql_password, _mysql_db):
+    with obter_pool(_mysql_host, _mysql_user, _mysql_password, _mysql_db).conexao() as conn:
+        yield conn
+
+
+@contextmanager
+def conexao_controle_mysql(_mysql_host, _mysql_user, _mysql_password, _mysql_db):
+    with obter_pool(_mysql_host, _mysql_user, _mysql_password, _mysql_db).conexao_controle() as conn:
+        yield conn
+
+
+def resumo_pools() -> dict:
+    with _pools_lock:
+        return {f"{u}@{h}/{d}": p.resumo() for (h, u, d), (p, _) in _pools.items()}
+
+
+metricas.registrar_medidor(
+    "queryflow_pool_conexoes",
+    lambda: {(("pool", nome), ("estado", estado)): r[estado] for nome, r in resumo_pools().items() for estado in ("abertas", "livres")},
+    "Conexões dos pools por estado",
+)
@@ -0,0 +1,158 @@
+import os
+import time
+import atexit
+import hashlib
+import threading
+from analise_sql import dividir_instrucoes
+from cache_resultados import consulta_cacheavel
+
+# --- PRÉ-AQUECIMENTO (via .env) ---
+ATIVO = os.getenv("QUERYFLOW_PRE_AQUECIMENTO", "1") == "1"
+INTERVALO = float(os.getenv("QUERYFLOW_PRE_AQUECIMENTO_SEGUNDOS", "900"))  # renovação periódica dos resultados
+INTERVALO_VERIFICACAO = float(os.getenv("QUERYFLOW_SCHEMA_CHECK_SECONDS", "30"))  # sondagem de mudança no schema
+# Sem nenhuma sessão chamando iniciar_pre_aquecimento por tantos intervalos, a thread para e sai do registro
+INTERVALOS_OCIOSO = float(os.getenv("QUERYFLOW_PRE_AQUECIMENTO_OCIOSO_INTERVALOS", "4"))
+# Perguntas frequentes além das sugestões da interface, separadas por "|"
+PERGUNTAS_QUENTES = [p.strip() for p in os.getenv("QUERYFLOW_PERGUNTAS_QUENTES", "").split("|") if p.strip()]
+
+
+class PreAquecedor:
+    """Thread em segundo plano que deixa as perguntas mais comuns prontas: catálogo carregado, SQL no cache de
+    geração e a primeira página do resultado no cache de resultados. Roda de novo a cada `intervalo` segundos
+    e sempre que a impressão do schema muda (a chave do cache de geração inclui essa impressão)."""
+
+    def __init__(self, nome, perguntas, obter_catalogo, gerar_sql, executar_sql, intervalo=INTERVALO,
+                 intervalo_verificacao=INTERVALO_VERIFICACAO, intervalos_ocioso=INTERVALOS_OCIOSO, ao_parar=None):
+        self.nome = nome
+        self.perguntas = list(dict.fromkeys(perguntas))  # sem repetidas, na ordem dada
+        self._obter_catalogo = obter_catalogo  # () -> CatalogoSchema
+        self._gerar_sql = gerar_sql  # (pergunta, catalogo) -> sql ou texto começando com "Erro"
+        self._executar_sql = executar_sql  # (sql) -> resultado ou dict com "error"
+        self._intervalo = intervalo
+        self._intervalo_verificacao = intervalo_verificacao
+        self._tempo_ocioso = intervalo * intervalos_ocioso
+        self._ao_parar = ao_parar  # chamada quando a thread encerra por ociosidade (tira o aquecedor do registro)
+        self.ultimo_uso = time.monotonic()
+        self._parar = threading.Event()
+        self._thread = None
+        self.estado = {"execucoes": 0, "ultima_execucao": None, "duracao_s": None, "impressao": None,
+                       "perguntas_prontas": 0, "resultados_prontos": 0, "erros": []}
+
+    def iniciar(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._laco, name=f"pre_aquecimento[{self.nome}]", daemon=True)
+            self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+
+    def tocar(self):
+        """Marca o aquecedor como em uso por alguma sessão; sem isso por tempo demais, ele para sozinho."""
+        self.ultimo_uso = time.monotonic()
+
+    @property
+    def ocioso(self) -> bool:
+        return time.monotonic() - self.ultimo_uso > self._tempo_ocioso
+
+    @property
+    def ativo(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _laco(self):
+        proxima = 0.0
+        while not self._parar.is_set():
+            if self.ocioso:
+                print(f"Pré-aquecimento '{self.nome}' parado: nenhuma sessão usou a conexão no último "
+                      f"{self._tempo_ocioso:.0f}s.")
+                self._parar.set()
+                if self._ao_parar:
+                    self._ao_parar(self)
+                break
+            try:
+                catalogo = self._obter_catalogo()
+                if time.monotonic() >= proxima or catalogo.impressao != self.estado["impressao"]:
+                    self.aquecer(catalogo)
+                    proxima = time.monotonic() + self._intervalo
+            except Exception as e:
+                # banco fora do ar ou chave inválida: tenta de novo na próxima verificação
+                print(f"Aviso: pré-aquecimento '{self.nome}' falhou: {e}")
+            self._parar.wait(self._intervalo_verificacao)
+
+    def aquecer(self, catalogo):
+        inicio = time.perf_counter()
+        prontas = resultados = 0
+        erros = []
+        for pergunta in self.perguntas:
+            if self._parar.is_set():
+                break
+            try:
+                sql = self._gerar_sql(pergunta, catalogo)
+                if not sql or sql.startswith("Erro"):
+                    erros.append(f"{pergunta}: {sql or 'SQL vazia'}")
+                    continue
+                prontas += 1
+                # só leituras cacheáveis de uma instrução: o pré-aquecimento nunca escreve no banco
+                if len(dividir_instrucoes(sql)) != 1 or not consulta_cacheavel(sql):
+                    continue
+                resultado = self._executar_sql(sql)
+                if isinstance(resultado, dict) and resultado.get("error"):
+                    erros.append(f"{pergunta}: {resultado['error']}")
+                else:
+                    resultados += 1
+            except Exception as e:
+                erros.append(f"{pergunta}: {e}")
+        self.estado.update(
+            execucoes=self.estado["execucoes"] + 1, ultima_execucao=time.strftime("%Y-%m-%dT%H:%M:%S"),
+            duracao_s=round(time.perf_counter() - inicio, 2), impressao=catalogo.impressao,
+            perguntas_prontas=prontas, resultados_prontos=resultados, erros=erros,
+        )
+        print(f"Pré-aquecimento '{self.nome}': {prontas}/{len(self.perguntas)} SQL e {resultados} resultado(s) em cache "
+              f"({self.estado['duracao_s']}s).")
+
+
+# --- UM PRÉ-AQUECEDOR POR (host, usuário, banco, modelo, credenciais) ---
+_aquecedores = {}  # (*chave, digest das credenciais) -> PreAquecedor
+_aquecedores_lock = threading.Lock()
+
+
+def _digest_credenciais(credenciais) -> str:
+    return hashlib.sha256("\x1f".join(str(c or "") for c in credenciais).encode("utf-8")).hexdigest()
+
+
+def iniciar_pre_aquecimento(chave, perguntas, obter_catalogo, gerar_sql, executar_sql, credenciais=()):
+    """Idempotente: a interface chama a cada rerun e só a primeira chamada para a chave cria a thread. Cada chamada
+    conta como uso (aquecedores sem uso param e saem do registro). As `credenciais` (senha do MySQL, chave da API)
+    fazem parte da chave: outra senha ganha o próprio aquecedor e não para nem reconfigura o das outras sessões;
+    o de uma senha que ninguém usa mais para sozinho por ociosidade."""
+    if not ATIVO:
+        return None
+    digest = _digest_credenciais(credenciais)
+    registro = (*chave, digest)
+    with _aquecedores_lock:
+        aquecedor = _aquecedores.get(registro)
+        if aquecedor is None or not aquecedor.ativo:
+            nome = "/".join(str(parte) for parte in chave) + f"#{digest[:8]}"
+            aquecedor = PreAquecedor(nome, list(perguntas) + PERGUNTAS_QUENTES, obter_catalogo, gerar_sql, executar_sql,
+                                     ao_parar=lambda parado: _remover(registro, parado))
+            _aquecedores[registro] = aquecedor
+        aquecedor.tocar()
+        return aquecedor.iniciar()
+
+
+def _remover(registro, aquecedor):
+    with _aquecedores_lock:
+        if _aquecedores.get(registro) is aquecedor:
+            del _aquecedores[registro]
+
+
+def parar_pre_aquecimento():
+    """Para todos os aquecedores e esvazia o registro (ex.: no encerramento do processo)."""
+    with _aquecedores_lock:
+        for aquecedor in _aquecedores.values():
+            aquecedor.parar()
+        _aquecedores.clear()
+
+
+atexit.register(parar_pre_aquecimento)
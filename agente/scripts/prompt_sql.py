@@ -0,0 +1,38 @@
+import re
+import json
+
+_BLOCO_CODIGO = re.compile(r"```[ \t]*(?:sql|mysql)?[ \t]*\n?(.*?)(?:```|\Z)", re.IGNORECASE | re.DOTALL)
+
+# Prompt usado quando o protocolos/prompt.json não é encontrado
+CONTEXTO_PADRAO = {
+    "model_role": "Você é um assistente SQL para o banco QueryFlow. Gere APENAS a query SQL (MySQL) sem explicações ou markdown.",
+    "restricoes": ["Não use `SELECT *` a menos que explicitamente pedido."], "instrucoes_sql": []
+}
+
+
+def carregar_contexto_prompt(caminho) -> dict:
+    with open(caminho, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def montar_prompt(contexto_prompt_base: dict, db_name: str, estrutura, pergunta: str) -> str:
+    """Monta o prompt de geração; `estrutura` é o DDL compacto (str) ou o dicionário {tabela: [colunas]}."""
+    if not isinstance(estrutura, str):
+        estrutura = json.dumps(estrutura, indent=2, ensure_ascii=False)
+    return f"""{contexto_prompt_base.get('model_role', 'Você é um assistente SQL.')}
+Database: {db_name}
+Estrutura: {estrutura}
+Restrições: {'; '.join(contexto_prompt_base.get('restricoes', []))}
+Instruções SQL: {'; '.join(contexto_prompt_base.get('instrucoes_sql', []))}
+Pergunta: {pergunta}
+Query SQL:"""
+
+
+def limpar_resposta_sql(texto: str) -> str:
+    # O modelo às vezes devolve a SQL dentro de um bloco markdown (```sql, ```SQL, ```mysql), às vezes com texto em volta:
+    # havendo blocos, só o conteúdo deles é SQL. Um bloco ainda aberto (streaming) vale até o fim do texto.
+    texto = (texto or "").strip()
+    blocos = [b.strip() for b in _BLOCO_CODIGO.findall(texto) if b.strip()]
+    if blocos:
+        texto = "\n".join(b if b.endswith(";") or b is blocos[-1] else b + ";" for b in blocos)
+    return texto.replace("```", "").strip()
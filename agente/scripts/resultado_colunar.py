@@ -0,0 +1,92 @@
+import io
+import os
+
+# --- EXIBIÇÃO E DOWNLOAD DE RESULTADOS (via .env) ---
+LINHAS_EXIBICAO = int(os.getenv("QUERYFLOW_LINHAS_EXIBICAO", "10000"))  # acima disso a tabela na tela mostra só o início
+LINHAS_LOTE_EXPORTACAO = 64 * 1024
+# Arquivos de resultado descarregados ficam sem compressão: lidos com memory_map, as colunas apontam direto para as
+# páginas do arquivo (sem cópia nem descompressão a cada rerun) e o sistema operacional decide o que fica em RAM
+COMPRESSAO_ARQUIVO = None
+
+FORMATOS_DOWNLOAD = {"csv": ("text/csv", ".csv"), "parquet": ("application/vnd.apache.parquet", ".parquet")}
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise RuntimeError("Resultados colunares requerem o pacote 'pyarrow' (pip install pyarrow).")
+    return pa
+
+
+def _coluna(pa, valores):
+    try:
+        return pa.array(valores)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        # tipos misturados na mesma coluna (ex.: UNION de número com texto): vira texto, como o MySQL exibiria
+        return pa.array([None if v is None else str(v) for v in valores], type=pa.string())
+
+
+def montar_tabela(colunas, linhas):
+    """Tabela Arrow a partir das tuplas lidas do cursor: uma única transposição para colunas, depois disso
+    exibição e downloads trabalham sobre os mesmos buffers."""
+    pa = _pyarrow()
+    # nomes repetidos (ex.: dois "id" num JOIN) ficam distintos, como o st.dataframe espera
+    nomes, vistos = [], {}
+    for nome in colunas:
+        vistos[nome] = vistos.get(nome, 0) + 1
+        nomes.append(nome if vistos[nome] == 1 else f"{nome}_{vistos[nome]}")
+    valores = list(zip(*linhas)) if linhas else [()] * len(nomes)
+    return pa.table([_coluna(pa, list(v)) for v in valores], names=nomes)
+
+
+def recorte_exibicao(tabela, max_linhas=LINHAS_EXIBICAO):
+    """Fatia sem cópia (slice) para a tela; o download continua com a tabela inteira."""
+    return tabela if tabela.num_rows <= max_linhas else tabela.slice(0, max_linhas)
+
+
+def exportar_tabela(tabela, formato, caminho=None) -> bytes:
+    """CSV ou Parquet escritos em lotes direto dos buffers da tabela Arrow. Com `caminho`, grava no arquivo
+    (sem passar o conteúdo pela memória) e retorna None; senão retorna os bytes."""
+    _pyarrow()
+    if formato not in FORMATOS_DOWNLOAD:
+        raise ValueError(f"Formato de download desconhecido: {formato} (use {', '.join(FORMATOS_DOWNLOAD)}).")
+    if caminho is not None:
+        with open(caminho, "wb") as destino:
+            _escrever_exportacao(tabela, formato, destino)
+        return None
+    destino = io.BytesIO()
+    _escrever_exportacao(tabela, formato, destino)
+    return destino.getvalue()
+
+
+def _escrever_exportacao(tabela, formato, destino):
+    if formato == "csv":
+        import pyarrow.csv as pa_csv
+        with pa_csv.CSVWriter(destino, tabela.schema) as escritor:
+            for lote in tabela.to_batches(max_chunksize=LINHAS_LOTE_EXPORTACAO):
+                escritor.write_batch(lote)
+    elif formato == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(tabela, destino, row_group_size=LINHAS_LOTE_EXPORTACAO)
+
+
+def gravar_arquivo(tabela, caminho) -> int:
+    """Grava a tabela em Arrow IPC (sem compressão, para leitura mapeada); retorna o tamanho em disco."""
+    pa = _pyarrow()
+    opcoes = pa.ipc.IpcWriteOptions(compression=COMPRESSAO_ARQUIVO)
+    with pa.OSFile(caminho, "wb") as destino, pa.ipc.new_file(destino, tabela.schema, options=opcoes) as escritor:
+        for lote in tabela.to_batches(max_chunksize=LINHAS_LOTE_EXPORTACAO):
+            escritor.write_batch(lote)
+    return os.path.getsize(caminho)
+
+
+def ler_arquivo(caminho):
+    """Lê um arquivo de gravar_arquivo mapeado em memória: as colunas apontam para o arquivo, sem cópia."""
+    pa = _pyarrow()
+    with pa.memory_map(caminho, "r") as origem:
+        return pa.ipc.open_file(origem).read_all()
+
+
+def linhas_da_tabela(tabela) -> list:
+    return list(zip(*(coluna.to_pylist() for coluna in tabela.columns)))
@@ -0,0 +1,451 @@
+import os
+import json
+import gzip
+import zlib
+import struct
+import hashlib
+import argparse
+import datetime
+from dotenv import load_dotenv
+from pool_conexoes import conexao_mysql
+
+# --- ARMAZENAMENTO E RETENÇÃO DO HISTÓRICO (via .env) ---
+LINHAS_PREVIA = int(os.getenv("QUERYFLOW_HISTORICO_LINHAS_PREVIA", "20"))  # linhas do resultado guardadas por interação
+BYTES_PREVIA = int(os.getenv("QUERYFLOW_HISTORICO_BYTES_PREVIA", "16384"))  # teto da prévia (JSON) antes da compressão
+RETENCAO_DIAS = int(os.getenv("QUERYFLOW_HISTORICO_RETENCAO_DIAS", "180"))  # 0 guarda para sempre
+MESES_FUTUROS = int(os.getenv("QUERYFLOW_HISTORICO_MESES_FUTUROS", "3"))  # partições mensais criadas com antecedência
+DIR_ARQUIVO = os.getenv("QUERYFLOW_HISTORICO_ARQUIVO_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "dados", "historico_arquivo")
+LOTE_MANUTENCAO = 500  # linhas por transação na compactação e na remoção
+
+# --- ESTRUTURA DA TABELA DE HISTÓRICO ---
+# pergunta_hash (MD5 binário, coluna gerada) indexa as buscas por pergunta sem indexar o TEXT inteiro.
+# O resultado não é mais guardado inteiro: só uma prévia limitada (JSON comprimido no formato do COMPRESS() do MySQL),
+# o total de linhas, o esquema das colunas e o SHA-256 do resultado completo. `resultado` fica só nas linhas antigas.
+# Particionada por mês em `data`: a retenção descarta partições inteiras em vez de apagar linha a linha.
+DDL_HISTORICO = """
+    CREATE TABLE IF NOT EXISTS historico_interacoes (
+        id INT AUTO_INCREMENT,
+        pergunta TEXT,
+        query_gerada TEXT,
+        resultado LONGTEXT,
+        resultado_previa MEDIUMBLOB,
+        resultado_linhas INT,
+        resultado_colunas TEXT,
+        resultado_hash BINARY(32),
+        feedback VARCHAR(10),
+        data TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        pergunta_hash BINARY(16) GENERATED ALWAYS AS (UNHEX(MD5(pergunta))) STORED,
+        PRIMARY KEY (id, data),
+        INDEX idx_historico_data (data),
+        INDEX idx_historico_pergunta_hash (pergunta_hash, data)
+    )
+    PARTITION BY RANGE (UNIX_TIMESTAMP(data)) (PARTITION p_futuro VALUES LESS THAN MAXVALUE)"""
+
+# Migrações para bancos criados com versões antigas (sem hash, índices secundários ou colunas compactas).
+# A conversão de uma tabela antiga para particionada reconstrói a tabela: fica no comando --particionar.
+COLUNAS_NOVAS = {
+    "pergunta_hash": "ADD COLUMN pergunta_hash BINARY(16) GENERATED ALWAYS AS (UNHEX(MD5(pergunta))) STORED",
+    "resultado_previa": "ADD COLUMN resultado_previa MEDIUMBLOB",
+    "resultado_linhas": "ADD COLUMN resultado_linhas INT",
+    "resultado_colunas": "ADD COLUMN resultado_colunas TEXT",
+    "resultado_hash": "ADD COLUMN resultado_hash BINARY(32)",
+}
+INDICES_NOVOS = {
+    "idx_historico_data": "ADD INDEX idx_historico_data (data)",
+    "idx_historico_pergunta_hash": "ADD INDEX idx_historico_pergunta_hash (pergunta_hash, data)",
+}
+SQL_INSERIR = """INSERT INTO historico_interacoes
+    (pergunta, query_gerada, resultado_previa, resultado_linhas, resultado_colunas, resultado_hash)
+    VALUES (%s, %s, %s, %s, %s, %s)"""
+
+
+# --- RESULTADO COMPACTO ---
+def comprimir(dados: bytes) -> bytes:
+    """Mesmo formato do COMPRESS() do MySQL (tamanho original em 4 bytes + zlib): UNCOMPRESS() lê no próprio banco."""
+    return struct.pack("<I", len(dados) & 0x3FFFFFFF) + zlib.compress(dados) if dados else b""
+
+
+def descomprimir(dados) -> bytes:
+    return zlib.decompress(bytes(dados)[4:]) if dados else b""
+
+
+def _tipo(valor) -> str:
+    # nome do tipo SQL equivalente ao valor lido do cursor (bool antes de int: bool é subclasse)
+    for tipo, nome in ((bool, "BOOLEAN"), (int, "BIGINT"), (float, "DOUBLE"), (str, "TEXT"), (bytes, "BLOB"),
+                       (datetime.datetime, "DATETIME"), (datetime.date, "DATE"), (datetime.timedelta, "TIME")):
+        if isinstance(valor, tipo):
+            return nome
+    return "DECIMAL" if type(valor).__name__ == "Decimal" else type(valor).__name__.upper()
+
+
+def _json(valor) -> str:
+    return json.dumps(valor, ensure_ascii=False, default=str)
+
+
+def _partes(resultado, instrucao=None):
+    """(instrucao, colunas, linhas, status) de cada parte do resultado. Aceita ResultadoConsulta, ResultadoLote,
+    dict de status e o formato antigo gravado no histórico (como_dicionarios: lista de dicts)."""
+    if hasattr(resultado, "instrucoes") and hasattr(resultado, "resultados"):
+        for texto, parte in zip(resultado.instrucoes, resultado.resultados):
+            yield from _partes(parte, texto)
+    elif hasattr(resultado, "colunas") and hasattr(resultado, "linhas"):
+        yield instrucao, list(resultado.colunas), resultado.linhas, None
+    elif isinstance(resultado, dict):
+        yield instrucao, [], [], resultado
+    elif isinstance(resultado, list) and resultado and all(
+            isinstance(item, dict) and set(item) == {"instrucao", "resultado"} for item in resultado):
+        for item in resultado:
+            yield from _partes(item["resultado"], item["instrucao"])
+    elif isinstance(resultado, list):
+        colunas = list(dict.fromkeys(chave for item in resultado if isinstance(item, dict) for chave in item))
+        yield instrucao, colunas, [[item.get(c) for c in colunas] for item in resultado if isinstance(item, dict)], None
+    else:
+        yield instrucao, [], [], {"valor": resultado}
+
+
+def compactar_resultado(resultado, linhas_previa=LINHAS_PREVIA, bytes_previa=BYTES_PREVIA) -> dict:
+    """Uma passada pelas linhas: prévia limitada, total, esquema (tipo do 1º valor não nulo) e SHA-256 do conteúdo
+    completo, que é o mesmo para o resultado vivo e para o JSON antigo do mesmo resultado."""
+    resumo = hashlib.sha256()
+    partes, esquemas, total, lote = [], [], 0, False
+    for instrucao, colunas, linhas, status in _partes(resultado):
+        lote = lote or instrucao is not None
+        resumo.update(_json([instrucao, colunas, status]).encode())
+        tipos, previa, quantidade = [None] * len(colunas), [], 0
+        for linha in linhas:
+            linha = list(linha)
+            resumo.update(b"\n" + _json(linha).encode())
+            for posicao, valor in enumerate(linha[:len(tipos)]):
+                if tipos[posicao] is None and valor is not None:
+                    tipos[posicao] = _tipo(valor)
+            if quantidade < linhas_previa:
+                previa.append(linha)
+            quantidade += 1
+        total += quantidade
+        parte = {"tipo": "status", **status} if status is not None else \
+            {"tipo": "linhas", "colunas": colunas, "linhas": previa, "total": quantidade}
+        partes.append(parte if instrucao is None else {"instrucao": instrucao, "resultado": parte})
+        esquemas.append([{"nome": c, "tipo": t or "NULL"} for c, t in zip(colunas, tipos)])
+    lote = lote or not partes  # ResultadoLote sem instruções
+    conteudo = {"tipo": "lote", "instrucoes": partes} if lote else partes[0]
+    texto = _json(conteudo)
+    while len(texto.encode()) > bytes_previa and _cortar_previa(partes):
+        texto = _json(conteudo)
+    return {"previa": comprimir(texto.encode()), "linhas": total,
+            "colunas": _json(esquemas if lote else esquemas[0]), "hash": resumo.digest()}
+
+
+def _cortar_previa(partes) -> bool:
+    # prévia acima do teto em bytes (textos longos): metade das linhas de cada parte até caber
+    cortou = False
+    for parte in partes:
+        parte = parte.get("resultado", parte)
+        if parte.get("linhas"):
+            parte["linhas"] = parte["linhas"][:len(parte["linhas"]) // 2]
+            cortou = True
+    return cortou
+
+
+def ler_previa(dados):
+    """Prévia gravada (bytes da coluna resultado_previa) de volta para o dict."""
+    return json.loads(descomprimir(dados)) if dados else None
+
+
+def migrar(conn) -> list:
+    """Cria a tabela ou aplica as alterações que faltam. Retorna as cláusulas aplicadas."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(DDL_HISTORICO)
+        cursor.execute(
+            "SELECT COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'historico_interacoes'"
+        )
+        colunas = {linha[0] for linha in cursor.fetchall()}
+        cursor.execute(
+            "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'historico_interacoes'"
+        )
+        indices = {linha[0] for linha in cursor.fetchall()}
+        alteracoes = [ddl for nome, ddl in COLUNAS_NOVAS.items() if nome not in colunas]
+        alteracoes += [ddl for nome, ddl in INDICES_NOVOS.items() if nome not in indices]
+        if alteracoes:
+            # Um único ALTER: a tabela é reconstruída uma vez só
+            print(f"Migrando historico_interacoes: {', '.join(alteracoes)}")
+            cursor.execute(f"ALTER TABLE historico_interacoes {', '.join(alteracoes)}")
+        if _particoes(cursor):
+            # partições dos próximos meses criadas antes do uso: a partição MAXVALUE fica sempre vazia
+            alteracoes += _criar_particoes_futuras(cursor, MESES_FUTUROS)
+        conn.commit()
+        return alteracoes
+    finally:
+        cursor.close()
+
+
+# --- PARTIÇÕES MENSAIS ---
+def _mes_seguinte(mes: datetime.date) -> datetime.date:
+    return (mes.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def _meses(primeiro: datetime.date, ultimo: datetime.date) -> list:
+    meses, mes = [], primeiro.replace(day=1)
+    while mes <= ultimo:
+        meses.append(mes)
+        mes = _mes_seguinte(mes)
+    return meses
+
+
+def _definicao_particao(mes: datetime.date) -> str:
+    return f"PARTITION p{mes:%Y%m} VALUES LESS THAN (UNIX_TIMESTAMP('{_mes_seguinte(mes):%Y-%m-%d} 00:00:00'))"
+
+
+def _particoes(cursor) -> dict:
+    """nome -> limite superior (UNIX_TIMESTAMP, ou None na MAXVALUE); vazio se a tabela não é particionada."""
+    cursor.execute("""
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'historico_interacoes' AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION""")
+    return {nome: None if descricao == "MAXVALUE" else int(descricao) for nome, descricao in cursor.fetchall()}
+
+
+def _criar_particoes_futuras(cursor, meses_futuros) -> list:
+    # só meses depois da última partição mensal: REORGANIZE divide a p_futuro (vazia, então é instantâneo)
+    mensais = sorted(nome for nome in _particoes(cursor) if nome != "p_futuro")
+    hoje = datetime.date.today().replace(day=1)
+    ultimo = hoje
+    for _ in range(meses_futuros):
+        ultimo = _mes_seguinte(ultimo)
+    novas = [mes for mes in _meses(hoje, ultimo) if not mensais or f"p{mes:%Y%m}" > mensais[-1]]
+    if not novas:
+        return []
+    clausula = (f"REORGANIZE PARTITION p_futuro INTO ({', '.join(_definicao_particao(mes) for mes in novas)}, "
+                "PARTITION p_futuro VALUES LESS THAN MAXVALUE)")
+    cursor.execute(f"ALTER TABLE historico_interacoes {clausula}")
+    return [clausula]
+
+
+def particionar(conn, meses_futuros=MESES_FUTUROS) -> list:
+    """Converte a tabela antiga para partições mensais (uma reconstrução, em janela de manutenção) ou só cria as
+    partições que faltam. Retorna as cláusulas aplicadas."""
+    cursor = conn.cursor()
+    try:
+        if _particoes(cursor):
+            aplicadas = _criar_particoes_futuras(cursor, meses_futuros)
+        else:
+            cursor.execute("SELECT MIN(data) FROM historico_interacoes")
+            primeiro = cursor.fetchone()[0] or datetime.datetime.now()
+            hoje = datetime.date.today().replace(day=1)
+            ultimo = hoje
+            for _ in range(meses_futuros):
+                ultimo = _mes_seguinte(ultimo)
+            # a coluna de partição precisa fazer parte da chave primária
+            cursor.execute("UPDATE historico_interacoes SET data = CURRENT_TIMESTAMP WHERE data IS NULL")
+            aplicadas = [
+                "DROP PRIMARY KEY, ADD PRIMARY KEY (id, data), "
+                "MODIFY data TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP",
+                "PARTITION BY RANGE (UNIX_TIMESTAMP(data)) ("
+                + ", ".join(_definicao_particao(mes) for mes in _meses(primeiro.date(), ultimo))
+                + ", PARTITION p_futuro VALUES LESS THAN MAXVALUE)",
+            ]
+            for clausula in aplicadas:
+                print(f"Particionando historico_interacoes: {clausula[:80]}...")
+                cursor.execute(f"ALTER TABLE historico_interacoes {clausula}")
+        conn.commit()
+        return aplicadas
+    finally:
+        cursor.close()
+
+
+# --- COMPACTAÇÃO DAS LINHAS ANTIGAS ---
+def compactar(conn, lote=LOTE_MANUTENCAO, otimizar=False) -> dict:
+    """Converte as linhas com o JSON completo em `resultado` para prévia + contagem + esquema + hash, em lotes
+    pela chave primária (uma transação por lote: pode ser interrompida e retomada). Conta as linhas que o UPDATE
+    de fato alterou."""
+    cursor = conn.cursor()
+    estatisticas = {"linhas": 0, "bytes_antes": 0, "bytes_depois": 0}
+    try:
+        # Na tabela antiga (não particionada) `data` aceita NULL e `data = NULL` nunca casa: lá o id basta
+        particionada = bool(_particoes(cursor))
+        filtro = "id = %s AND data = %s" if particionada else "id = %s"
+        ultimo_id = 0
+        while True:
+            cursor.execute("""
+                SELECT id, data, resultado FROM historico_interacoes
+                WHERE id > %s AND resultado IS NOT NULL ORDER BY id LIMIT %s""", (ultimo_id, lote))
+            linhas = cursor.fetchall()
+            if not linhas:
+                break
+            valores = []
+            for id_linha, data, texto in linhas:
+                try:
+                    resultado = json.loads(texto)
+                except ValueError:
+                    resultado = {"texto": texto}  # gravado fora do formato JSON: fica como status
+                compacto = compactar_resultado(resultado)
+                chave = (id_linha, data) if particionada else (id_linha,)
+                valores.append((compacto["previa"], compacto["linhas"], compacto["colunas"], compacto["hash"], *chave))
+                estatisticas["bytes_antes"] += len(texto.encode())
+                estatisticas["bytes_depois"] += len(compacto["previa"])
+            cursor.executemany(f"""
+                UPDATE historico_interacoes SET resultado_previa = %s, resultado_linhas = %s, resultado_colunas = %s,
+                    resultado_hash = %s, resultado = NULL
+                WHERE {filtro}""", valores)
+            estatisticas["linhas"] += max(cursor.rowcount, 0)
+            conn.commit()
+            ultimo_id = linhas[-1][0]
+            print(f"  {estatisticas['linhas']} linha(s) compactada(s)...")
+        if otimizar and estatisticas["linhas"]:
+            # devolve ao sistema o espaço dos LONGTEXT apagados (reconstrói a tabela)
+            cursor.execute("OPTIMIZE TABLE historico_interacoes")
+            cursor.fetchall()
+        return estatisticas
+    finally:
+        cursor.close()
+
+
+# --- RETENÇÃO E ARQUIVAMENTO ---
+COLUNAS_ARQUIVO = ("id", "pergunta", "query_gerada", "resultado", "resultado_previa", "resultado_linhas",
+                   "resultado_colunas", "resultado_hash", "feedback", "data")
+
+
+def _caminho_livre(destino, nome) -> str:
+    caminho, numero = os.path.join(destino, f"{nome}.jsonl.gz"), 1
+    while os.path.exists(caminho):
+        numero += 1
+        caminho = os.path.join(destino, f"{nome}_{numero}.jsonl.gz")
+    return caminho
+
+
+def _exportar(conn, caminho, origem, filtro="", parametros=()) -> int:
+    """Grava as linhas em JSONL com gzip (prévia já descomprimida); o arquivo só aparece com o nome final
+    depois de completo e sincronizado no disco."""
+    cursor = conn.cursor(buffered=False)
+    parcial, quantidade = caminho + ".parcial", 0
+    try:
+        cursor.execute(f"SELECT {', '.join(COLUNAS_ARQUIVO)} FROM historico_interacoes {origem} {filtro} ORDER BY id",
+                       parametros)
+        with gzip.open(parcial, "wt", encoding="utf-8") as arquivo:
+            for linha in cursor:
+                registro = dict(zip(COLUNAS_ARQUIVO, linha))
+                registro["resultado_previa"] = ler_previa(registro["resultado_previa"])
+                registro["resultado_colunas"] = json.loads(registro["resultado_colunas"]) if registro["resultado_colunas"] else None
+                registro["resultado_hash"] = bytes(registro["resultado_hash"]).hex() if registro["resultado_hash"] else None
+                arquivo.write(_json({chave: valor for chave, valor in registro.items() if valor is not None}) + "\n")
+                quantidade += 1
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+        os.replace(parcial, caminho)
+        return quantidade
+    except Exception:
+        if os.path.exists(parcial):
+            os.remove(parcial)
+        raise
+    finally:
+        cursor.close()
+
+
+def arquivar(conn, retencao_dias=RETENCAO_DIAS, destino=DIR_ARQUIVO, lote=LOTE_MANUTENCAO,
+             meses_futuros=MESES_FUTUROS) -> list:
+    """Move para arquivos gzip locais o histórico mais antigo que a retenção e o tira do banco: partições mensais
+    inteiras (DROP PARTITION) ou, na tabela não particionada, mês a mês com DELETE em lotes. Na tabela particionada
+    também cria as partições dos próximos meses, para a p_futuro nunca receber linhas entre duas partidas do app.
+    Retorna [(arquivo, linhas)]."""
+    cursor = conn.cursor()
+    arquivos = []
+    try:
+        particoes = _particoes(cursor)
+        if particoes:
+            # rodízio das partições: o cron do --arquivar roda bem mais vezes do que o app reinicia
+            if _criar_particoes_futuras(cursor, meses_futuros):
+                conn.commit()
+                particoes = _particoes(cursor)
+        if retencao_dias <= 0:
+            return []
+        os.makedirs(destino, exist_ok=True)
+        limite = datetime.datetime.now().replace(microsecond=0) - datetime.timedelta(days=retencao_dias)
+        if particoes:
+            cursor.execute("SELECT UNIX_TIMESTAMP(%s)", (limite,))
+            limite_unix = int(cursor.fetchone()[0])
+            # só partições que terminam antes do limite: o mês do limite espera virar inteiro
+            for nome, fim in particoes.items():
+                if fim is None or fim > limite_unix:
+                    continue
+                caminho = _caminho_livre(destino, f"historico_interacoes_{nome}")
+                quantidade = _exportar(conn, caminho, f"PARTITION ({nome})")
+                cursor.execute(f"ALTER TABLE historico_interacoes DROP PARTITION {nome}")
+                if quantidade:
+                    arquivos.append((caminho, quantidade))
+                else:
+                    os.remove(caminho)
+            return arquivos
+        cursor.execute("SELECT MIN(data) FROM historico_interacoes WHERE data < %s", (limite,))
+        primeiro = cursor.fetchone()[0]
+        for mes in _meses(primeiro.date(), limite.date()) if primeiro else []:
+            fim = min(datetime.datetime.combine(_mes_seguinte(mes), datetime.time()), limite)
+            inicio = datetime.datetime.combine(mes, datetime.time())
+            caminho = _caminho_livre(destino, f"historico_interacoes_p{mes:%Y%m}")
+            quantidade = _exportar(conn, caminho, "", "WHERE data >= %s AND data < %s", (inicio, fim))
+            while True:
+                cursor.execute("DELETE FROM historico_interacoes WHERE data >= %s AND data < %s LIMIT %s", (inicio, fim, lote))
+                conn.commit()
+                if cursor.rowcount < lote:
+                    break
+            if quantidade:
+                arquivos.append((caminho, quantidade))
+            else:
+                os.remove(caminho)
+        return arquivos
+    finally:
+        cursor.close()
+
+
+def ler_modo_autoincremento(conn):
+    """Retorna (ids_consecutivos, incremento). Com innodb_autoinc_lock_mode 0/1, um INSERT de várias linhas
+    recebe ids consecutivos; no modo 2 (padrão do MySQL 8) não há essa garantia."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT @@innodb_autoinc_lock_mode, @@auto_increment_increment")
+        modo, incremento = cursor.fetchone()
+        return int(modo) in (0, 1), int(incremento or 1)
+    except Exception:
+        return False, 1
+    finally:
+        cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migração, compactação e retenção da tabela historico_interacoes.")
+    parser.add_argument("--particionar", action="store_true",
+                        help="Converte a tabela para partições mensais (reconstrói a tabela) ou cria as que faltam")
+    parser.add_argument("--arquivar", action="store_true",
+                        help="Grava em gzip e remove do banco o histórico mais antigo que a retenção")
+    parser.add_argument("--compactar", action="store_true",
+                        help="Converte as linhas com o resultado JSON completo para prévia comprimida")
+    parser.add_argument("--retencao-dias", type=int, default=RETENCAO_DIAS, help="Dias mantidos no banco (0 = todos)")
+    parser.add_argument("--destino", default=DIR_ARQUIVO, help="Diretório dos arquivos do histórico arquivado")
+    parser.add_argument("--meses-futuros", type=int, default=MESES_FUTUROS, help="Partições mensais criadas com antecedência")
+    parser.add_argument("--lote", type=int, default=LOTE_MANUTENCAO, help="Linhas por transação")
+    parser.add_argument("--otimizar", action="store_true", help="OPTIMIZE TABLE depois de compactar (libera o espaço)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    with conexao_mysql(os.getenv("MYSQL_HOST", "localhost"), os.getenv("MYSQL_USER", "root"),
+                       os.getenv("MYSQL_PASSWORD", ""), os.getenv("MYSQL_DB", "querypilot")) as conn:
+        aplicadas = migrar(conn)
+        print("Nenhuma alteração necessária." if not aplicadas else f"{len(aplicadas)} alteração(ões) aplicada(s).")
+        if args.particionar:
+            aplicadas = particionar(conn, args.meses_futuros)
+            print(f"{len(aplicadas)} alteração(ões) de partição aplicada(s).")
+        # arquiva antes de compactar: o que sai do banco leva o resultado antigo inteiro para o arquivo
+        if args.arquivar:
+            arquivos = arquivar(conn, args.retencao_dias, args.destino, args.lote, args.meses_futuros)
+            for caminho, quantidade in arquivos:
+                print(f"  {quantidade} linha(s) -> {caminho}")
+            print(f"{sum(q for _, q in arquivos)} linha(s) arquivada(s) em {len(arquivos)} arquivo(s).")
+        if args.compactar:
+            estatisticas = compactar(conn, args.lote, args.otimizar)
+            print(f"{estatisticas['linhas']} linha(s) compactada(s): "
+                  f"{estatisticas['bytes_antes'] / 1024 / 1024:.1f} MB -> {estatisticas['bytes_depois'] / 1024 / 1024:.1f} MB.")
+
+
+if __name__ == "__main__":
+    # Uso: python schema_historico.py [--particionar] [--arquivar] [--compactar]  (banco do .env)
+    main()
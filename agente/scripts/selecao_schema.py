@@ -0,0 +1,168 @@
+import os
+import re
+import json
+import time
+from cache_geracao import normalizar_pergunta
+
+ORCAMENTO_TOKENS = int(os.getenv("QUERYFLOW_SCHEMA_MAX_TOKENS", "1500"))
+MAX_TABELAS = int(os.getenv("QUERYFLOW_SCHEMA_MAX_TABELAS", "8"))
+CARACTERES_POR_TOKEN = 4  # aproximação usual para texto/SQL
+
+PESO_TABELA = 3.0
+PESO_COLUNA = 1.0
+PESO_DICA = 1.5
+CORTE_RELATIVO = 0.4  # tabelas com menos que essa fração da maior pontuação ficam de fora
+
+
+def estimar_tokens(texto: str) -> int:
+    return (len(texto) + CARACTERES_POR_TOKEN - 1) // CARACTERES_POR_TOKEN
+
+
+def _radical(palavra: str) -> str:
+    # Radical grosseiro: "movimentações", "movimentacao" e "movimentacoes" caem todos em "movime"
+    return palavra[:6] if len(palavra) >= 4 else palavra
+
+
+def _radicais(texto: str) -> set:
+    texto = normalizar_pergunta(texto.replace("_", " "))
+    return {_radical(p) for p in texto.split() if len(p) >= 3 and p not in ("id", "ids")}
+
+
+class IndiceSchema:
+    """Índice invertido (radical -> tabelas) sobre nomes de tabelas, colunas e dicas do prompt.json."""
+
+    def __init__(self, catalogo, instrucoes_sql=()):
+        self.catalogo = catalogo
+        self.impressao = catalogo.impressao
+        self.pesos = {}  # radical -> {tabela: peso}
+        self.vizinhos = {}  # tabela -> tabelas que ela referencia por FK (pais, usados em joins de descrição)
+        self.filhos = {}  # tabela -> tabelas que a referenciam por FK (endereços, pagamentos... de um cliente)
+        self.por_coluna = {}  # radical -> tabelas com uma coluna que o contém
+        tabelas = catalogo.tabelas
+        # Linha de base para o relatório: o schema inteiro no formato JSON enviado antes da seleção
+        self.tokens_schema_json = estimar_tokens(json.dumps(catalogo.como_dicionario(), indent=2, ensure_ascii=False))
+        for tabela, info in tabelas.items():
+            self._indexar(_radicais(tabela), tabela, PESO_TABELA)
+            colunas_fk = {fk["coluna"] for fk in info["chaves_estrangeiras"]}
+            for coluna in info["colunas"]:
+                # cliente_id em pagamentos "pertence" a clientes; indexá-la puxaria toda tabela filha
+                if coluna["nome"] not in colunas_fk:
+                    self._indexar(_radicais(coluna["nome"]), tabela, PESO_COLUNA)
+                    for r in _radicais(coluna["nome"]):
+                        self.por_coluna.setdefault(r, set()).add(tabela)
+            for fk in info["chaves_estrangeiras"]:
+                self.vizinhos.setdefault(tabela, set()).add(fk["tabela_ref"])
+                self.filhos.setdefault(fk["tabela_ref"], set()).add(tabela)
+        # Uma dica que cita tabelas ("saldo ... 'movimentacoes' e 'pagamentos'") liga os termos dela a essas tabelas
+        for dica in instrucoes_sql or ():
+            citadas = [t for t in tabelas if re.search(rf"\b{re.escape(t)}\b", dica, re.IGNORECASE)]
+            for tabela in citadas:
+                self._indexar(_radicais(dica), tabela, PESO_DICA / len(citadas))
+
+    def _indexar(self, radicais, tabela, peso):
+        for r in radicais:
+            por_tabela = self.pesos.setdefault(r, {})
+            por_tabela[tabela] = max(por_tabela.get(tabela, 0.0), peso)
+
+    def pontuar(self, pergunta: str) -> dict:
+        pontos = {}
+        for r in _radicais(pergunta):
+            for tabela, peso in self.pesos.get(r, {}).items():
+                pontos[tabela] = pontos.get(tabela, 0.0) + peso
+        return pontos
+
+    def tabelas_por_coluna(self, pergunta: str) -> set:
+        return {t for r in _radicais(pergunta) for t in self.por_coluna.get(r, ())}
+
+
+def _ddl_tabela(tabela, info, colunas_prioritarias=None, max_colunas=None) -> str:
+    fks = {fk["coluna"]: f"{fk['tabela_ref']}.{fk['coluna_ref']}" for fk in info["chaves_estrangeiras"]}
+    pk = set(info["chave_primaria"])
+    colunas = info["colunas"]
+    if max_colunas is not None and len(colunas) > max_colunas:
+        # mantém chaves e as colunas citadas na pergunta; o resto é resumido
+        importantes = [c for c in colunas if c["nome"] in pk or c["nome"] in fks or c["nome"] in (colunas_prioritarias or ())]
+        outras = [c for c in colunas if c not in importantes]
+        colunas = importantes + outras[:max(0, max_colunas - len(importantes))]
+    partes = []
+    for c in colunas:
+        sufixo = " PK" if c["nome"] in pk else ""
+        if c["nome"] in fks:
+            sufixo += f" FK>{fks[c['nome']]}"
+        partes.append(f"{c['nome']} {c['tipo']}{sufixo}")
+    omitidas = len(info["colunas"]) - len(colunas)
+    if omitidas > 0:
+        partes.append(f"...+{omitidas} colunas")
+    return f"{tabela}({', '.join(partes)})"
+
+
+def selecionar_schema(indice: IndiceSchema, pergunta: str, orcamento_tokens=ORCAMENTO_TOKENS, max_tabelas=MAX_TABELAS):
+    """Escolhe as tabelas relevantes (+ vizinhas por FK) e serializa em DDL compacto dentro do orçamento.
+    Retorna (texto_schema, relatorio)."""
+    inicio = time.perf_counter()
+    tabelas = indice.catalogo.tabelas
+    pontos = indice.pontuar(pergunta)
+    maior = max(pontos.values(), default=0.0)
+    # uma coluna citada ("email", "cidade") mantém a tabela mesmo abaixo do corte relativo
+    por_coluna = indice.tabelas_por_coluna(pergunta)
+    diretas = sorted((t for t in pontos if t in tabelas and (pontos[t] >= maior * CORTE_RELATIVO or t in por_coluna)),
+                     key=lambda t: (-pontos[t], t))[:max_tabelas]
+    if not diretas:
+        # Nada casou: manda tudo o que couber, na ordem alfabética
+        diretas = sorted(tabelas)
+    ordem = list(diretas)
+    for tabela in diretas:
+        for vizinha in sorted(indice.vizinhos.get(tabela, ())):
+            if vizinha in tabelas and vizinha not in ordem:
+                ordem.append(vizinha)
+    # Filhas por FK por último ("clientes de Curitiba" está em enderecos): entram até max_tabelas e só se couberem no
+    # orçamento, para um schema estrela não trazer o banco inteiro
+    filhas = []
+    for tabela in diretas:
+        for filha in sorted(indice.filhos.get(tabela, ())):
+            if filha in tabelas and filha not in ordem + filhas and len(ordem) + len(filhas) < max_tabelas:
+                filhas.append(filha)
+
+    radicais_pergunta = _radicais(pergunta)
+    linhas, usados, omitidas = [], 0, []
+    for tabela in ordem + filhas:
+        info = tabelas[tabela]
+        citadas = {c["nome"] for c in info["colunas"] if _radicais(c["nome"]) & radicais_pergunta}
+        ddl = _ddl_tabela(tabela, info, citadas)
+        if tabela in filhas:
+            if usados + estimar_tokens(ddl) + 1 > orcamento_tokens:
+                continue  # opcional: não é resumida nem conta como omitida
+            ordem.append(tabela)
+        elif usados + estimar_tokens(ddl) > orcamento_tokens:
+            ddl = _ddl_tabela(tabela, info, citadas, max_colunas=8)
+        custo = estimar_tokens(ddl) + 1
+        if usados + custo > orcamento_tokens and linhas:
+            omitidas.append(tabela)
+            continue
+        linhas.append(ddl)
+        usados += custo
+
+    texto = "\n".join(linhas)
+    tokens_texto = estimar_tokens(texto)
+    relatorio = {
+        "tabelas_selecionadas": [t for t in ordem if t not in omitidas],
+        "tabelas_omitidas_orcamento": omitidas,
+        "tokens_schema": tokens_texto,
+        "tokens_schema_anterior": indice.tokens_schema_json,
+        "reducao_pct": round(100.0 * (1 - tokens_texto / indice.tokens_schema_json), 1) if indice.tokens_schema_json else 0.0,
+        "tempo_selecao_ms": round((time.perf_counter() - inicio) * 1000, 2),
+    }
+    return texto, relatorio
+
+
+_indices = {}
+
+
+def obter_indice(catalogo, instrucoes_sql=()) -> IndiceSchema:
+    # Reconstrói só quando o schema ou as dicas mudam
+    chave = (id(catalogo), catalogo.impressao, tuple(instrucoes_sql or ()))
+    indice = _indices.get(id(catalogo))
+    if indice is None or indice[0] != chave:
+        indice = (chave, IndiceSchema(catalogo, instrucoes_sql))
+        _indices[id(catalogo)] = indice
+    return indice[1]
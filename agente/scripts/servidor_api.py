@@ -0,0 +1,410 @@
+# Servidor HTTP do QueryFlow: expõe o MotorQueryFlow (schema, geração, guarda de custo, execução, histórico)
+# sem interface, para outros serviços e para escalar horizontalmente atrás de um balanceador.
+#
+# Uso:
+#   QUERYFLOW_API_TOKEN=... python servidor_api.py [--host 127.0.0.1] [--porta 8080] [--workers 4]
+#
+# Toda rota exige "Authorization: Bearer <QUERYFLOW_API_TOKEN>"; sem o token no ambiente o servidor não sobe.
+#
+# Rotas:
+#   POST /v1/perguntas  {"pergunta": "...", "inicio": 0, "timeout_s": 30}
+#   POST /v1/executar   {"sql": "SELECT ...", "inicio": 500}   (só leituras; paginação da SQL já gerada)
+#   POST /v1/feedback   {"id": "<id da resposta>", "feedback": "👍 Sim", "pergunta": "..."}
+#   GET  /v1/schema
+#   GET  /metrics       (Prometheus)
+#   GET  /saude
+#
+# Com "?formato=ndjson" (ou Accept: application/x-ndjson) a resposta sai em streaming, um evento JSON por linha:
+# sql_parcial enquanto o Gemini gera, sql, colunas, lotes de linhas e fim.
+import os
+import hmac
+import json
+import asyncio
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from motor_queryflow import MotorQueryFlow, resultado_para_json, linha_json
+from analise_sql import dividir_instrucoes, retorna_linhas
+from execucao_sql import ResultadoConsulta, ResultadoLote
+from prompt_sql import limpar_resposta_sql
+from guarda_custo import MARGEM_KILL_S
+from metricas import metricas, iniciar_rastro
+
+# --- SERVIDOR (via .env) ---
+HOST = os.getenv("QUERYFLOW_API_HOST", "127.0.0.1")  # só a máquina local; 0.0.0.0 expõe na rede
+TOKEN = os.getenv("QUERYFLOW_API_TOKEN", "")  # obrigatório: /v1/perguntas executa a SQL gerada com as credenciais do serviço
+PORTA = int(os.getenv("QUERYFLOW_API_PORTA", "8080"))
+WORKERS = int(os.getenv("QUERYFLOW_API_WORKERS", "4"))  # perguntas processadas ao mesmo tempo
+FILA = int(os.getenv("QUERYFLOW_API_FILA", "32"))  # perguntas aguardando worker; além disso responde 503
+TIMEOUT_S = float(os.getenv("QUERYFLOW_API_TIMEOUT_S", "60"))  # prazo padrão por requisição (o corpo pode reduzir)
+LINHAS_POR_EVENTO = int(os.getenv("QUERYFLOW_API_LINHAS_POR_EVENTO", "100"))  # linhas por evento NDJSON
+MAX_CORPO = 1024 * 1024
+RESPOSTAS_RECENTES = 1000  # RegistroHistorico guardados para o feedback
+
+STATUS_ERRO = {"estrutura": 503, "geracao": 502, "execucao": 422, "prazo": 504}
+MOTIVOS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           422: "Unprocessable Entity", 500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable",
+           504: "Gateway Timeout"}
+
+
+class ErroHttp(Exception):
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+
+class Requisicao:
+    def __init__(self, metodo, caminho, consulta, cabecalhos, corpo):
+        self.metodo = metodo
+        self.caminho = caminho
+        self.consulta = consulta
+        self.cabecalhos = cabecalhos
+        self.corpo = corpo
+        self.rota = "desconhecida"  # rótulo das métricas: só caminhos de rotas existentes, nunca o caminho pedido
+
+    def json(self) -> dict:
+        if not self.corpo:
+            return {}
+        try:
+            dados = json.loads(self.corpo)
+        except ValueError as e:
+            raise ErroHttp(400, f"JSON inválido: {e}")
+        if not isinstance(dados, dict):
+            raise ErroHttp(400, "O corpo deve ser um objeto JSON.")
+        return dados
+
+    @property
+    def ndjson(self) -> bool:
+        return (self.consulta.get("formato", [""])[0] == "ndjson"
+                or "application/x-ndjson" in self.cabecalhos.get("accept", ""))
+
+    @property
+    def manter_conexao(self) -> bool:
+        return self.cabecalhos.get("connection", "").lower() != "close"
+
+
+class ServidorQueryFlow:
+    """HTTP/1.1 sobre asyncio: o laço de eventos só faz I/O e todo o pipeline (bloqueante: MySQL, Gemini) roda num
+    ThreadPoolExecutor de `workers` threads. Acima de `workers + fila` requisições em andamento responde 503, e cada
+    requisição tem um prazo só para geração e execução, repassado ao motor: a fila do Gemini, o streaming e o
+    KILL QUERY respeitam o mesmo prazo, então o worker termina junto com o 504."""
+
+    def __init__(self, motor, token, workers=WORKERS, fila=FILA, timeout_s=TIMEOUT_S):
+        if not token:
+            raise ValueError("Defina QUERYFLOW_API_TOKEN: a API executa SQL no banco e não roda sem autenticação.")
+        self.motor = motor
+        self._token = token.encode("utf-8")
+        self.workers = workers
+        self.capacidade = workers + fila
+        self.timeout_s = timeout_s
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="queryflow-api")
+        self._em_andamento = 0
+        self._respostas = OrderedDict()  # id da resposta -> (pergunta, RegistroHistorico, chave do cache de geração)
+        self._respostas_lock = threading.Lock()
+        metricas.registrar_medidor("queryflow_api_em_andamento", lambda: self._em_andamento,
+                                   "Requisições da API ocupando ou aguardando um worker")
+
+    # --- POOL DE WORKERS ---
+    async def _no_worker(self, funcao, *args, timeout_s=None):
+        if self._em_andamento >= self.capacidade:
+            metricas.incrementar("queryflow_api_rejeitadas_total", motivo="lotado")
+            raise ErroHttp(503, "Servidor lotado; tente novamente em instantes.")
+        self._em_andamento += 1
+        futuro = asyncio.get_running_loop().run_in_executor(self._executor, funcao, *args)
+
+        def liberar(_):
+            # só libera a vaga quando a thread termina, mesmo que o cliente já tenha recebido o 504
+            self._em_andamento -= 1
+        futuro.add_done_callback(liberar)
+        # o motor encerra sozinho no prazo (KILL QUERY após MARGEM_KILL_S); a folga só cobre o que não é interrompível
+        espera = (timeout_s or self.timeout_s) + MARGEM_KILL_S + 1.0
+        try:
+            return await asyncio.wait_for(asyncio.shield(futuro), espera)
+        except asyncio.TimeoutError:
+            metricas.incrementar("queryflow_api_rejeitadas_total", motivo="timeout")
+            raise ErroHttp(504, f"Prazo de {timeout_s or self.timeout_s:.0f}s excedido.")
+
+    def _prazo(self, dados) -> float:
+        try:
+            prazo = float(dados.get("timeout_s") or self.timeout_s)
+        except (TypeError, ValueError):
+            raise ErroHttp(400, "'timeout_s' deve ser numérico.")
+        return min(max(prazo, 1.0), self.timeout_s)
+
+    @staticmethod
+    def _inicio(dados) -> int:
+        try:
+            return max(0, int(dados.get("inicio") or 0))
+        except (TypeError, ValueError):
+            raise ErroHttp(400, "'inicio' deve ser inteiro.")
+
+    def _guardar_resposta(self, resposta):
+        if not resposta.rastro:
+            return
+        with self._respostas_lock:
+            self._respostas[resposta.rastro["id"]] = (resposta.pergunta, resposta.registro, resposta.chave_cache_geracao)
+            while len(self._respostas) > RESPOSTAS_RECENTES:
+                self._respostas.popitem(last=False)
+
+    def _autenticar(self, requisicao):
+        esquema, _, credencial = requisicao.cabecalhos.get("authorization", "").partition(" ")
+        if esquema.lower() != "bearer" or not hmac.compare_digest(credencial.strip().encode("utf-8"), self._token):
+            metricas.incrementar("queryflow_api_rejeitadas_total", motivo="autenticacao")
+            raise ErroHttp(401, "Informe 'Authorization: Bearer <token>'.")
+
+    # --- ROTAS ---
+    async def tratar(self, requisicao, escritor):
+        rotas = {
+            ("POST", "/v1/perguntas"): self.rota_perguntas,
+            ("POST", "/v1/executar"): self.rota_executar,
+            ("POST", "/v1/feedback"): self.rota_feedback,
+            ("GET", "/v1/schema"): self.rota_schema,
+            ("GET", "/metrics"): self.rota_metricas,
+            ("GET", "/saude"): self.rota_saude,
+        }
+        if any(caminho == requisicao.caminho for _, caminho in rotas):
+            requisicao.rota = requisicao.caminho
+        self._autenticar(requisicao)
+        rota = rotas.get((requisicao.metodo, requisicao.caminho))
+        if rota is None:
+            if any(caminho == requisicao.caminho for _, caminho in rotas):
+                raise ErroHttp(405, f"Método {requisicao.metodo} não permitido em {requisicao.caminho}.")
+            raise ErroHttp(404, f"Rota {requisicao.caminho} não existe.")
+        return await rota(requisicao, escritor)
+
+    async def rota_saude(self, requisicao, escritor):
+        return 200, {"status": "ok", "workers": self.workers, "em_andamento": self._em_andamento, "capacidade": self.capacidade}
+
+    async def rota_metricas(self, requisicao, escritor):
+        return 200, metricas.texto_prometheus()
+
+    async def rota_schema(self, requisicao, escritor):
+        estrutura = await self._no_worker(self.motor.estrutura)
+        if isinstance(estrutura, dict) and estrutura.get("error"):
+            return 503, {"erro": estrutura["error"]}
+        return 200, {"banco": self.motor.banco, "tabelas": estrutura}
+
+    async def rota_perguntas(self, requisicao, escritor):
+        dados = requisicao.json()
+        pergunta = str(dados.get("pergunta") or "").strip()
+        if not pergunta:
+            raise ErroHttp(400, "Informe 'pergunta'.")
+        inicio, prazo = self._inicio(dados), self._prazo(dados)
+        if requisicao.ndjson:
+            return await self._perguntar_ndjson(pergunta, inicio, prazo, escritor)
+        resposta = await self._no_worker(self.motor.perguntar, pergunta, inicio, prazo * 1000, None, "api", timeout_s=prazo)
+        self._guardar_resposta(resposta)
+        return STATUS_ERRO.get(resposta.etapa_erro, 200), {"id": (resposta.rastro or {}).get("id"), **resposta.como_dicionario()}
+
+    def _executar_leitura(self, sql, inicio, prazo):
+        with iniciar_rastro(sql, tipo="api_executar") as rastro:
+            _, resultado = self.motor.executar(sql, inicio, prazo * 1000)
+        return resultado, rastro.como_dicionario()
+
+    async def rota_executar(self, requisicao, escritor):
+        dados = requisicao.json()
+        sql = str(dados.get("sql") or "").strip()
+        instrucoes = dividir_instrucoes(sql)
+        # execução direta só para ler (paginar) uma SQL já gerada; escritas passam pela pergunta
+        if len(instrucoes) != 1 or not retorna_linhas(instrucoes[0]):
+            raise ErroHttp(400, "Informe em 'sql' uma única instrução de leitura.")
+        inicio, prazo = self._inicio(dados), self._prazo(dados)
+        resultado, rastro = await self._no_worker(self._executar_leitura, instrucoes[0], inicio, prazo, timeout_s=prazo)
+        if isinstance(resultado, dict) and resultado.get("error"):
+            return 422, {"erro": resultado["error"], "detalhes_erro": {k: v for k, v in resultado.items() if k != "error"}, "rastro": rastro}
+        if requisicao.ndjson:
+            await self._enviar_ndjson(escritor, self._eventos_resultado(resultado) + [{"evento": "fim", "rastro": rastro}])
+            return None
+        return 200, {"sql": instrucoes[0], "resultado": resultado_para_json(resultado), "rastro": rastro}
+
+    async def rota_feedback(self, requisicao, escritor):
+        dados = requisicao.json()
+        feedback = str(dados.get("feedback") or "").strip()
+        if not feedback:
+            raise ErroHttp(400, "Informe 'feedback'.")
+        with self._respostas_lock:
+            pergunta, registro, chave = self._respostas.get(dados.get("id"), (None, None, None))
+        # em outra instância (ou após reinício) o registro não está aqui: o gravador usa a pergunta
+        pergunta = pergunta or dados.get("pergunta")
+        if not pergunta:
+            raise ErroHttp(400, "Resposta desconhecida nesta instância; informe também 'pergunta'.")
+        await self._no_worker(self.motor.salvar_feedback, pergunta, feedback, registro, chave)
+        return 200, {"status": "Feedback registrado", "vinculado": registro is not None}
+
+    # --- STREAMING NDJSON ---
+    @staticmethod
+    def _eventos_resultado(resultado) -> list:
+        if isinstance(resultado, ResultadoLote):
+            return [{"evento": "lote", "avisos": list(resultado.avisos),
+                     "instrucoes": [{"instrucao": i, "resultado": resultado_para_json(r)} for i, r in zip(resultado.instrucoes, resultado.resultados)]}]
+        if not isinstance(resultado, ResultadoConsulta):
+            return [{"evento": "status", **resultado_para_json(resultado)}]
+        eventos = [{"evento": "colunas", "colunas": list(resultado.colunas), "inicio": resultado.inicio, "avisos": list(resultado.avisos)}]
+        for i in range(0, len(resultado.linhas), LINHAS_POR_EVENTO):
+            eventos.append({"evento": "linhas", "linhas": [linha_json(l) for l in resultado.linhas[i:i + LINHAS_POR_EVENTO]]})
+        eventos.append({"evento": "pagina", "inicio": resultado.inicio, "linhas": len(resultado), "tem_mais": resultado.tem_mais,
+                        "proximo_inicio": resultado.inicio + len(resultado) if resultado.tem_mais else None,
+                        "truncado": resultado.truncado, "motivo": resultado.motivo})
+        return eventos
+
+    async def _iniciar_ndjson(self, escritor):
+        escritor.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson; charset=utf-8\r\n"
+                       b"Transfer-Encoding: chunked\r\nCache-Control: no-store\r\n\r\n")
+        await escritor.drain()
+
+    @staticmethod
+    async def _enviar_evento(escritor, evento):
+        dados = (json.dumps(evento, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        escritor.write(f"{len(dados):X}\r\n".encode("ascii") + dados + b"\r\n")
+        await escritor.drain()
+
+    async def _encerrar_ndjson(self, escritor):
+        escritor.write(b"0\r\n\r\n")
+        await escritor.drain()
+
+    async def _enviar_ndjson(self, escritor, eventos):
+        await self._iniciar_ndjson(escritor)
+        for evento in eventos:
+            await self._enviar_evento(escritor, evento)
+        await self._encerrar_ndjson(escritor)
+
+    async def _perguntar_ndjson(self, pergunta, inicio, prazo, escritor):
+        loop = asyncio.get_running_loop()
+        eventos = asyncio.Queue()
+        # o Gemini chama ao_receber na thread do worker; o texto parcial atravessa para o laço pela fila
+        ao_receber = lambda texto: loop.call_soon_threadsafe(eventos.put_nowait, {"evento": "sql_parcial", "texto": limpar_resposta_sql(texto)})
+        tarefa = asyncio.ensure_future(self._no_worker(self.motor.perguntar, pergunta, inicio, prazo * 1000, ao_receber, "api", timeout_s=prazo))
+        tarefa.add_done_callback(lambda _: loop.call_soon_threadsafe(eventos.put_nowait, None))
+        iniciado = False
+        while True:
+            evento = await eventos.get()
+            if evento is None:
+                break
+            if not iniciado:
+                await self._iniciar_ndjson(escritor)
+                iniciado = True
+            await self._enviar_evento(escritor, evento)
+        try:
+            resposta = tarefa.result()
+        except ErroHttp as e:
+            if not iniciado:
+                raise  # ainda dá para responder com o status certo (503/504)
+            await self._enviar_evento(escritor, {"evento": "erro", "status": e.status, "erro": str(e)})
+            await self._encerrar_ndjson(escritor)
+            return None
+        self._guardar_resposta(resposta)
+        finais = [{"evento": "sql", "sql": resposta.sql, "veio_do_cache": resposta.veio_do_cache, "relatorio_schema": resposta.relatorio_schema}]
+        if resposta.ok:
+            finais += self._eventos_resultado(resposta.resultado)
+        else:
+            finais.append({"evento": "erro", "status": STATUS_ERRO.get(resposta.etapa_erro, 500), "etapa": resposta.etapa_erro,
+                           "erro": resposta.erro, "detalhes_erro": resposta.detalhes_erro})
+        finais.append({"evento": "fim", "id": resposta.rastro["id"], "rastro": resposta.rastro})
+        if not iniciado:
+            await self._iniciar_ndjson(escritor)
+        for evento in finais:
+            await self._enviar_evento(escritor, evento)
+        await self._encerrar_ndjson(escritor)
+        return None
+
+    # --- HTTP ---
+    async def _ler_requisicao(self, leitor):
+        linha = await leitor.readline()
+        if not linha:
+            return None
+        try:
+            metodo, alvo, _ = linha.decode("latin-1").split()
+        except ValueError:
+            raise ErroHttp(400, "Linha de requisição inválida.")
+        cabecalhos = {}
+        while True:
+            linha = await leitor.readline()
+            if linha in (b"\r\n", b"\n", b""):
+                break
+            nome, _, valor = linha.decode("latin-1").partition(":")
+            cabecalhos[nome.strip().lower()] = valor.strip()
+        tamanho = int(cabecalhos.get("content-length") or 0)
+        if tamanho > MAX_CORPO:
+            raise ErroHttp(413, "Corpo da requisição grande demais.")
+        corpo = await leitor.readexactly(tamanho) if tamanho else b""
+        partes = urlsplit(alvo)
+        return Requisicao(metodo.upper(), partes.path.rstrip("/") or "/", parse_qs(partes.query), cabecalhos, corpo)
+
+    @staticmethod
+    async def _responder(escritor, status, corpo, manter_conexao):
+        if isinstance(corpo, str):
+            dados, tipo = corpo.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            dados, tipo = json.dumps(corpo, ensure_ascii=False, default=str).encode("utf-8"), "application/json; charset=utf-8"
+        escritor.write(
+            f"HTTP/1.1 {status} {MOTIVOS.get(status, '')}\r\nContent-Type: {tipo}\r\nContent-Length: {len(dados)}\r\n"
+            f"Connection: {'keep-alive' if manter_conexao else 'close'}\r\n\r\n".encode("latin-1") + dados
+        )
+        await escritor.drain()
+
+    async def conexao(self, leitor, escritor):
+        try:
+            while True:
+                requisicao = None
+                try:
+                    requisicao = await self._ler_requisicao(leitor)
+                    if requisicao is None:
+                        break
+                    resposta = await self.tratar(requisicao, escritor)
+                except ErroHttp as e:
+                    resposta = e.status, {"erro": str(e)}
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as e:
+                    print(f"Erro inesperado (API): {e}")
+                    resposta = 500, {"erro": f"Erro inesperado: {str(e)}"}
+                manter = requisicao is not None and requisicao.manter_conexao
+                if resposta is not None:
+                    status, corpo = resposta
+                    metricas.incrementar("queryflow_api_requisicoes_total", rota=requisicao.rota if requisicao else "desconhecida", status=str(status))
+                    await self._responder(escritor, status, corpo, manter)
+                elif requisicao is not None:
+                    metricas.incrementar("queryflow_api_requisicoes_total", rota=requisicao.rota, status="200")
+                if not manter:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            escritor.close()
+
+    async def servir(self, host=HOST, porta=PORTA):
+        servidor = await asyncio.start_server(self.conexao, host, porta)
+        print(f"API do QueryFlow em http://{host}:{porta} ({self.workers} workers, até {self.capacidade} requisições em andamento)")
+        async with servidor:
+            await servidor.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API HTTP do QueryFlow (pergunta -> SQL -> resultado).")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--porta", type=int, default=PORTA)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--fila", type=int, default=FILA)
+    parser.add_argument("--timeout", type=float, default=TIMEOUT_S, help="prazo máximo por requisição, em segundos")
+    args = parser.parse_args()
+
+    if not TOKEN:
+        parser.error("defina QUERYFLOW_API_TOKEN no ambiente (.env); toda rota exige 'Authorization: Bearer <token>'.")
+    motor = MotorQueryFlow.do_ambiente()
+    if not motor.chave_api:
+        print("Aviso: GEMINI_API_KEY não definida; /v1/perguntas só responderá o que estiver no cache de geração.")
+    servidor = ServidorQueryFlow(motor, TOKEN, workers=args.workers, fila=args.fila, timeout_s=args.timeout)
+    try:
+        asyncio.run(servidor.servir(args.host, args.porta))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
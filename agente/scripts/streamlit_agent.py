@@ -1,11 +1,20 @@
 
 import streamlit as st
-import mysql.connector
-import google.generativeai as genai
-# import google.generativeai as genai
 import os
 from dotenv import load_dotenv
-import json
+import uuid
+import pandas as pd
+from motor_queryflow import MotorQueryFlow
+from cliente_gemini import listar_modelos
+from banco_local import BACKENDS, BACKEND
+from gateway_llm import PRIORIDADE_FUNDO
+from analise_sql import retorna_linhas, primeira_palavra
+from execucao_sql import ResultadoConsulta, ResultadoLote, TAMANHO_PAGINA
+from resultado_colunar import recorte_exibicao, FORMATOS_DOWNLOAD
+from armazem_resultados import obter_armazem
+from prompt_sql import limpar_resposta_sql
+from pre_aquecimento import iniciar_pre_aquecimento
+from metricas import iniciar_rastro
 
 load_dotenv()
 
@@ -37,10 +46,9 @@ def listar_modelos_disponiveis_no_streamlit(chave_api): # Sua função
         st.sidebar.error("Chave da API Gemini não fornecida para listar modelos.")
         return
     try:
-        genai.configure(api_key=chave_api)
         model_list_str = "Modelos Gemini disponíveis que suportam 'generateContent':\n"
         found_models = False
-        for m in genai.list_models():
+        for m in listar_modelos(chave_api):
          if 'generateContent' in m.supported_generation_methods:
             model_list_str += f"- {m.name}\n"
             found_models = True
@@ -51,141 +59,36 @@ def listar_modelos_disponiveis_no_streamlit(chave_api): # Sua função
     except Exception as e:
         st.sidebar.error(f"Erro ao listar modelos Gemini: {e}")
 
-@st.cache_data(ttl=3600)
-def obter_estruturas_tabelas_cached(_mysql_host, _mysql_user, _mysql_password, _mysql_db): # Sua função
-    if not all([_mysql_host, _mysql_user, _mysql_db]): 
-        print("Alerta: Configurações do MySQL incompletas para obter estrutura.")
-        return {"error": "Configurações do MySQL incompletas."}
-    try:
-        conn = mysql.connector.connect(
-            host=_mysql_host, user=_mysql_user, password=_mysql_password, database=_mysql_db,
-            connect_timeout=5
-        )
-        cursor = conn.cursor()
-        cursor.execute("SHOW TABLES;")
-        tabelas_raw = cursor.fetchall()
-        if not tabelas_raw:
-            print(f"Alerta: Nenhuma tabela encontrada no banco '{_mysql_db}'.")
-            cursor.close(); conn.close(); return {} 
-        tabelas = [t[0] for t in tabelas_raw]
-        colunas_dict = {}
-        for tabela_nome in tabelas:
-            cursor.execute(f"DESCRIBE `{tabela_nome}`;")
-            colunas_tabela_raw = cursor.fetchall()
-            colunas_dict[tabela_nome] = [col[0] for col in colunas_tabela_raw]
-        cursor.close(); conn.close()
-        return colunas_dict
-    except mysql.connector.Error as err: 
-        print(f"Erro MySQL (estrutura): {err}")
-        return {"error": f"Erro MySQL (estrutura): {str(err)}"}
-    except Exception as e: 
-        print(f"Erro inesperado (estrutura): {e}")
-        return {"error": f"Erro inesperado (estrutura): {str(e)}"}
-
-@st.cache_data
-def carregar_prompt_contexto_cached(): # Sua função
-    try:
-        with open("/protocolos/prompt.json", "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print("Alerta: Arquivo '/protocolos/prompt.json' não encontrado. Usando prompt genérico.")
-        return {
-            "model_role": "Você é um assistente SQL para o banco QueryFlow. Gere APENAS a query SQL (MySQL) sem explicações ou markdown.",
-            "restricoes": ["Não use `SELECT *` a menos que explicitamente pedido."], "instrucoes_sql": []
-        }
-    except Exception as e: 
-        print(f"Erro ao carregar prompt.json: {e}")
-        return {"error": f"Erro ao carregar prompt.json: {str(e)}"}
-
-def gerar_query_sql_com_gemini(pergunta_user: str, colunas_db: dict, chave_api: str, modelo_gemini: str, db_name_from_input: str): # Sua função
-    if not chave_api: return "Erro: Chave API Gemini não fornecida."
-    if not modelo_gemini: return "Erro: Modelo Gemini não especificado."
-    if isinstance(colunas_db, dict) and colunas_db.get("error"): 
-        return f"Erro: Não foi possível obter estrutura do banco - {colunas_db['error']}"
-    if not colunas_db:
-        return "Erro: Estrutura do banco de dados está vazia ou não pôde ser carregada."
-    try:
-        genai.configure(api_key=chave_api)
-        contexto_prompt_base = carregar_prompt_contexto_cached()
-        if isinstance(contexto_prompt_base, dict) and contexto_prompt_base.get("error"): 
-            return f"Erro: Falha ao carregar contexto do prompt - {contexto_prompt_base['error']}"
-        
-        prompt_completo = f"""{contexto_prompt_base.get('model_role', 'Você é um assistente SQL.')}
-Database: {db_name_from_input} 
-Estrutura: {json.dumps(colunas_db, indent=2, ensure_ascii=False)}
-Restrições: {'; '.join(contexto_prompt_base.get('restricoes', []))}
-Instruções SQL: {'; '.join(contexto_prompt_base.get('instrucoes_sql', []))}
-Pergunta: {pergunta_user}
-Query SQL:"""
-        generation_config = {"temperature": 0.05, "max_output_tokens": 2048}
-        model = genai.GenerativeModel(model_name=modelo_gemini, generation_config=generation_config)
-        response = model.generate_content(prompt_completo)
-        query = response.text.strip().replace("```sql", "").replace("```", "").strip()
-        if not query: return "Erro: Gemini retornou uma query vazia."
-        return query
-    except Exception as e:
-        print(f"Erro API Gemini (Modelo: {modelo_gemini}): {e}")
-        return f"Erro: API Gemini falhou - {str(e)}"
+def exibir_tabela(resultado, chave):
+    # A tabela Arrow fica no próprio resultado (st.session_state): reruns (toggle da SQL, feedback) não reconvertem nada
+    tabela = resultado.tabela()
+    exibida = recorte_exibicao(tabela)
+    # o resultado guardado é uma página: os downloads trazem exatamente as linhas dela
+    if exibida.num_rows < tabela.num_rows:
+        st.caption(f"Exibindo {exibida.num_rows} de {tabela.num_rows} linhas; os downloads trazem as {tabela.num_rows}.")
+    if resultado.inicio > 0 or resultado.tem_mais:
+        st.caption(f"Os downloads trazem só esta página (linhas {resultado.inicio + 1} a {resultado.inicio + tabela.num_rows}).")
+    st.dataframe(exibida, use_container_width=True, hide_index=True)
+    download_cols = st.columns(len(FORMATOS_DOWNLOAD) + 2)
+    for coluna, (formato, (mime, extensao)) in zip(download_cols, FORMATOS_DOWNLOAD.items()):
+        # data como função: o arquivo só é codificado quando o botão é clicado, não a cada rerun
+        coluna.download_button(f"⬇️ {formato.upper()}", data=lambda formato=formato: resultado.exportar(formato),
+                               file_name=f"queryflow_{chave}{extensao}", mime=mime, key=f"btn_download_{chave}_{formato}",
+                               use_container_width=True)
 
-def executar_query_mysql(query_sql: str, _mysql_host, _mysql_user, _mysql_password, _mysql_db): # Sua função
-    if not query_sql: return [], {"error": "Query SQL está vazia."}
-    if not all([_mysql_host, _mysql_user, _mysql_db]): 
-        return None, {"error": "Configurações do MySQL incompletas."} 
-    try:
-        conn = mysql.connector.connect(
-            host=_mysql_host, user=_mysql_user, password=_mysql_password, database=_mysql_db,
-            connect_timeout=5
-        )
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(query_sql)
-        res = []
-        if query_sql.strip().upper().startswith("SELECT"):
-            res = cursor.fetchall()
-        else: 
-            conn.commit()
-            res = {"status": "Comando executado com sucesso", "linhas_afetadas": cursor.rowcount}
-        cursor.close(); conn.close()
-        return [], res 
-    except mysql.connector.Error as err:
-        print(f"Erro MySQL (execução): {err}")
-        return [], {"error": f"Erro MySQL ao executar query: {str(err)}", "query_com_erro": query_sql}
-    except Exception as e:
-        print(f"Erro inesperado (execução): {e}")
-        return [], {"error": f"Erro inesperado ao executar query: {str(e)}", "query_com_erro": query_sql}
 
-def salvar_historico_db(pergunta, query, resultado, _mysql_host, _mysql_user, _mysql_password, _mysql_db): # Sua função
-    if not all([_mysql_host, _mysql_user, _mysql_db]): return
-    try:
-        conn = mysql.connector.connect(host=_mysql_host, user=_mysql_user, password=_mysql_password, database=_mysql_db)
-        cursor = conn.cursor()
-        cursor.execute("CREATE TABLE IF NOT EXISTS historico_interacoes (id INT AUTO_INCREMENT PRIMARY KEY, pergunta TEXT, query_gerada TEXT, resultado LONGTEXT, feedback VARCHAR(10), data TIMESTAMP DEFAULT CURRENT_TIMESTAMP);")
-        cursor.execute("INSERT INTO historico_interacoes (pergunta, query_gerada, resultado) VALUES (%s, %s, %s)", (pergunta, query, json.dumps(resultado, ensure_ascii=False, default=str)))
-        conn.commit(); cursor.close(); conn.close()
-    except Exception as e: 
-        print(f"Aviso: Erro ao salvar histórico: {e}")
-
-def salvar_feedback_db(pergunta, feedback, _mysql_host, _mysql_user, _mysql_password, _mysql_db): # Sua função
-    if not all([_mysql_host, _mysql_user, _mysql_db]): return
-    try:
-        conn = mysql.connector.connect(host=_mysql_host, user=_mysql_user, password=_mysql_password, database=_mysql_db)
-        cursor = conn.cursor()
-        cursor.execute("CREATE TABLE IF NOT EXISTS historico_interacoes (id INT AUTO_INCREMENT PRIMARY KEY, pergunta TEXT, query_gerada TEXT, resultado LONGTEXT, feedback VARCHAR(10), data TIMESTAMP DEFAULT CURRENT_TIMESTAMP);")
-        update_query = """
-            UPDATE historico_interacoes SET feedback = %s 
-            WHERE id = (
-                SELECT id FROM (
-                    SELECT id FROM historico_interacoes 
-                    WHERE pergunta = %s 
-                    ORDER BY data DESC LIMIT 1
-                ) AS subquery
-            )"""
-        cursor.execute(update_query, (feedback, pergunta))
-        conn.commit()
-        if cursor.rowcount == 0: 
-            print("Aviso: Histórico não encontrado para salvar feedback.")
-        cursor.close(); conn.close()
-    except Exception as e: 
-        print(f"Aviso: Erro ao salvar feedback: {e}")
+# O resultado não fica no st.session_state: o armazém do processo o guarda com orçamento de memória por sessão e global,
+# descarrega em disco o que passa do início e libera sessões ociosas. A sessão só lembra se tinha um resultado.
+armazem = obter_armazem()
+
+
+def guardar_resultado(resultado):
+    if resultado is None:
+        armazem.descartar(st.session_state.id_sessao)
+    else:
+        armazem.guardar(st.session_state.id_sessao, resultado)
+    st.session_state.tem_resultado = resultado is not None
+
 
 # --- TÍTULO E SUBTÍTULO ---
 st.markdown("<div style='text-align: center; margin-bottom: 10px;'><span style='font-size: 2.5em; font-weight: bold;'>🌊 QueryFlow</span> <span style='font-size: 1.2em; color: #B0BEC5; margin-bottom:10px  vertical-align: middle;'>Consultas com Gemini AI</span></div>", unsafe_allow_html=True)
@@ -202,16 +105,29 @@ with st.sidebar:
     if st.button("Listar Modelos Gemini", key="btn_list_models_sidebar", use_container_width=True):
         listar_modelos_disponiveis_no_streamlit(gemini_api_key)
     st.markdown("---")
+    # "local": datasets de banco_de_dados/datasets num motor em processo (sem servidor MySQL, somente leitura)
+    backend_execucao = st.selectbox("🗄️ Execução", BACKENDS, index=BACKENDS.index(BACKEND) if BACKEND in BACKENDS else 0,
+                                    format_func=lambda b: {"mysql": "MySQL", "local": "Local (datasets)"}[b], key="backend_sidebar")
     st.subheader("📦 Banco de Dados MySQL")
     mysql_host = st.text_input("Host", value=os.getenv("MYSQL_HOST", "localhost"), key="my_host_sidebar")
     mysql_user = st.text_input("Usuário", value=os.getenv("MYSQL_USER", "root"), key="my_user_sidebar")
     mysql_password = st.text_input("Senha", type="password", value=os.getenv("MYSQL_PASSWORD", ""), key="my_pass_sidebar")
     mysql_db_name_input = st.text_input("Nome do Banco", value=os.getenv("MYSQL_DB", "querypilot"), key="my_db_sidebar") # Mudado para querypilot no .env
 
+# O pipeline (catálogo, geração, guarda de custo, execução, histórico) fica no MotorQueryFlow; esta página só o exibe.
+# O motor não guarda estado próprio (catálogo, caches e pools são do processo), então é recriado a cada rerun.
+motor = MotorQueryFlow(mysql_host, mysql_user, mysql_password, mysql_db_name_input, gemini_api_key, MODELO_GEMINI_ESCOLHIDO,
+                       backend=backend_execucao)
+
 # --- ESTADO DA SESSÃO ---
 if "pergunta" not in st.session_state: st.session_state.pergunta = ""
 if "query_sql" not in st.session_state: st.session_state.query_sql = ""
-if "resultados_db" not in st.session_state: st.session_state.resultados_db = []
+if "id_sessao" not in st.session_state: st.session_state.id_sessao = uuid.uuid4().hex
+if "tem_resultado" not in st.session_state: st.session_state.tem_resultado = False
+if "chave_cache_geracao" not in st.session_state: st.session_state.chave_cache_geracao = ""
+if "registro_historico" not in st.session_state: st.session_state.registro_historico = None
+if "feedback_enviado" not in st.session_state: st.session_state.feedback_enviado = {}
+if "ultimo_rastro" not in st.session_state: st.session_state.ultimo_rastro = None
 
 # --- SUGESTÕES DE PERGUNTAS ---
 st.subheader("💡 Sugestões de Perguntas")
@@ -224,9 +140,26 @@ for i, (texto_botao, pergunta_sugerida) in enumerate(botoes_sugestao.items()):
     if sugestoes_cols[i].button(texto_botao, key=f"btn_sug_{i}_main", use_container_width=True): 
         st.session_state.pergunta = pergunta_sugerida
         st.session_state.query_sql = ""
-        st.session_state.resultados_db = []
+        guardar_resultado(None)
         # st.experimental_rerun()
 
+# --- PRÉ-AQUECIMENTO (sugestões e perguntas frequentes prontas antes do primeiro clique) ---
+if gemini_api_key and MODELO_GEMINI_ESCOLHIDO and motor.configurado:
+    aquecedor = iniciar_pre_aquecimento(
+        (backend_execucao, mysql_host, mysql_user, mysql_db_name_input, MODELO_GEMINI_ESCOLHIDO),
+        botoes_sugestao.values(),
+        obter_catalogo=motor.catalogo,
+        # prioridade de fundo: o pré-aquecimento só usa a cota do Gemini que as perguntas interativas deixam livre
+        gerar_sql=lambda pergunta, catalogo: motor.gerar_sql(pergunta, catalogo=catalogo, prioridade=PRIORIDADE_FUNDO)[0],
+        executar_sql=lambda sql: motor.executar(sql)[1],
+        credenciais=(mysql_password, gemini_api_key),
+    )
+    if aquecedor and aquecedor.estado["ultima_execucao"]:
+        st.sidebar.caption(
+            f"🔥 Pré-aquecimento: {aquecedor.estado['perguntas_prontas']} SQL e {aquecedor.estado['resultados_prontos']} resultado(s) "
+            f"prontos ({aquecedor.estado['ultima_execucao']})"
+        )
+
 # --- PERGUNTA PERSONALIZADA E EXECUÇÃO ---
 st.subheader("⌨️ Faça sua Pergunta")
 input_layout_cols = st.columns([0.5, 3, 0.5]) # [espaço_esq, conteúdo, espaço_dir]
@@ -250,40 +183,40 @@ with input_layout_cols[1]:
             # ... (lógica do botão de executar como antes) ...
             if pergunta_usuario_input:
                 st.session_state.pergunta = pergunta_usuario_input
+                st.session_state.registro_historico = None
                 if not gemini_api_key: st.error("Chave da API Gemini não fornecida!"); st.stop()
                 if not MODELO_GEMINI_ESCOLHIDO: st.error("Nome do Modelo Gemini não especificado!"); st.stop()
-                if not all([mysql_host, mysql_user, mysql_db_name_input]): st.error("Configurações do MySQL incompletas!"); st.stop()
-
-                with st.spinner("Obtendo estrutura do banco... ⏳"):
-                    estrutura_db = obter_estruturas_tabelas_cached(mysql_host, mysql_user, mysql_password, mysql_db_name_input)
-                
-                if isinstance(estrutura_db, dict) and estrutura_db.get("error"):
-                    st.error(f"Falha ao obter estrutura do banco: {estrutura_db['error']}")
-                    st.session_state.query_sql, st.session_state.resultados_db = "", []
-                elif not estrutura_db :
-                    st.error("Estrutura do banco de dados está vazia. Verifique as configurações ou se o banco possui tabelas.")
-                    st.session_state.query_sql, st.session_state.resultados_db = "", []
-                else:
-                    st.toast("Estrutura do banco obtida.", icon="📄")
-                    with st.spinner(f"Gerando SQL com {MODELO_GEMINI_ESCOLHIDO}... 🤖"):
-                        st.session_state.query_sql = gerar_query_sql_com_gemini(
-                            st.session_state.pergunta, estrutura_db, gemini_api_key, MODELO_GEMINI_ESCOLHIDO, mysql_db_name_input
-                        )
-                    if st.session_state.query_sql and not st.session_state.query_sql.startswith("Erro"):
-                        with st.spinner("Executando SQL no banco..."):
-                            _, st.session_state.resultados_db = executar_query_mysql(
-                                st.session_state.query_sql, mysql_host, mysql_user, mysql_password, mysql_db_name_input
-                            )
-                        if isinstance(st.session_state.resultados_db, dict) and st.session_state.resultados_db.get("error"):
-                            st.error(f"Erro ao executar query: {st.session_state.resultados_db['error']}")
-                            if st.session_state.resultados_db.get("query_com_erro"):
-                                 st.code(st.session_state.resultados_db["query_com_erro"], language="sql")
-                            st.session_state.resultados_db = [] 
-                        else:
-                            salvar_historico_db(st.session_state.pergunta, st.session_state.query_sql, st.session_state.resultados_db, mysql_host, mysql_user, mysql_password, mysql_db_name_input)
-                    else: 
-                        st.error(f"Falha ao gerar SQL: {st.session_state.query_sql if st.session_state.query_sql else 'Nenhuma query foi gerada.'}")
-                        st.session_state.resultados_db = []
+                if not motor.configurado: st.error("Configurações do MySQL incompletas!"); st.stop()
+
+                # Um rastro por pergunta: cada estágio (schema, cache, Gemini, execução, histórico) vira um span
+                sql_parcial = st.empty()  # a SQL aparece aqui enquanto o Gemini gera
+                with st.spinner(f"Gerando e executando SQL com {MODELO_GEMINI_ESCOLHIDO}... 🤖"):
+                    resposta = motor.perguntar(
+                        st.session_state.pergunta, ao_receber=lambda texto: sql_parcial.code(limpar_resposta_sql(texto), language="sql")
+                    )
+                sql_parcial.empty()
+                st.session_state.query_sql = resposta.sql
+                st.session_state.chave_cache_geracao = resposta.chave_cache_geracao
+                guardar_resultado(resposta.resultado if resposta.ok else None)
+                st.session_state.registro_historico = resposta.registro
+                if resposta.etapa_erro == "execucao":
+                    st.error(f"Erro ao executar query: {resposta.erro}")
+                    for alerta in resposta.detalhes_erro.get("custo", {}).get("alertas", []):
+                        st.caption(f"⚠️ {alerta}")
+                    if resposta.detalhes_erro.get("query_com_erro"):
+                         st.code(resposta.detalhes_erro["query_com_erro"], language="sql")
+                elif resposta.etapa_erro:
+                    st.error(resposta.erro)
+                if resposta.veio_do_cache:
+                    st.toast("SQL recuperada do cache de geração.", icon="⚡")
+                elif resposta.relatorio_schema:
+                    relatorio_schema = resposta.relatorio_schema
+                    st.caption(
+                        f"📐 Schema no prompt: {relatorio_schema['tokens_schema']} tokens (antes {relatorio_schema['tokens_schema_anterior']}, "
+                        f"-{relatorio_schema['reducao_pct']}%) · {len(relatorio_schema['tabelas_selecionadas'])} tabela(s) · "
+                        f"seleção {relatorio_schema['tempo_selecao_ms']} ms · Gemini {relatorio_schema['tempo_gemini_ms']} ms"
+                    )
+                st.session_state.ultimo_rastro = resposta.rastro
             else:
                 st.warning("Por favor, digite uma pergunta.")
         st.markdown('</div>', unsafe_allow_html=True)
@@ -294,7 +227,7 @@ with input_layout_cols[1]:
         if st.button("🧹 Limpar Busca", key="btn_limpar_busca_main", type="primary", use_container_width=True):
             st.session_state.pergunta = ""
             st.session_state.query_sql = ""
-            st.session_state.resultados_db = []
+            guardar_resultado(None)
 
 # --- EXIBIÇÃO DE RESULTADOS E FEEDBACK ---
 # ... (Restante da sua seção de exibição de resultados e feedback, como antes) ...
@@ -306,29 +239,97 @@ if st.session_state.query_sql and not st.session_state.query_sql.startswith("Err
         if st.toggle("👁️ Mostrar Consulta SQL Gerada", value=True, key="toggle_sql_disp_main"): 
             st.code(st.session_state.query_sql, language="sql")
 
-        if st.session_state.resultados_db:
-            if isinstance(st.session_state.resultados_db, dict) and "status" in st.session_state.resultados_db :
-                 st.success(f"{st.session_state.resultados_db['status']}. Linhas afetadas: {st.session_state.resultados_db.get('linhas_afetadas', 'N/A')}")
-            elif isinstance(st.session_state.resultados_db, list) and len(st.session_state.resultados_db) > 0:
-                st.success(f"✅ Consulta realizada! {len(st.session_state.resultados_db)} linha(s) retornada(s).")
-                st.dataframe(st.session_state.resultados_db, use_container_width=True, hide_index=True)
-            elif isinstance(st.session_state.resultados_db, list) and len(st.session_state.resultados_db) == 0: 
-                st.info("ℹ️ A consulta SQL foi executada, mas não retornou dados.")
-        elif isinstance(st.session_state.resultados_db, dict) and st.session_state.resultados_db.get("error"):
+        resultado = armazem.obter(st.session_state.id_sessao)
+        if resultado is None and st.session_state.tem_resultado:
+            st.info("ℹ️ O resultado desta sessão foi liberado da memória (sessão ociosa ou servidor no limite). Execute a pergunta novamente.")
+        elif isinstance(resultado, ResultadoLote):
+            st.success(f"✅ {len(resultado)} instruções executadas.")
+            for aviso in resultado.avisos:
+                st.info(f"🛡️ {aviso}")
+            # Uma aba por instrução, sem paginação: cada leitura traz até QUERYFLOW_MAX_LINHAS_INSTRUCAO linhas
+            abas = st.tabs([f"{numero}. {(primeira_palavra(instrucao) or 'SQL').title()}" for numero, instrucao in enumerate(resultado.instrucoes, 1)])
+            for instrucao_numero, (aba, instrucao, parcial) in enumerate(zip(abas, resultado.instrucoes, resultado.resultados), 1):
+                with aba:
+                    st.code(instrucao, language="sql")
+                    if isinstance(parcial, dict):
+                        st.success(f"{parcial['status']}. Linhas afetadas: {parcial.get('linhas_afetadas', 'N/A')}")
+                    elif len(parcial) == 0:
+                        st.info("ℹ️ A instrução não retornou dados.")
+                    else:
+                        if parcial.truncado:
+                            st.warning(f"Exibindo as primeiras {len(parcial)} linhas: {parcial.motivo}.")
+                        exibir_tabela(parcial, f"instrucao_{instrucao_numero}")
+        elif isinstance(resultado, dict) and "status" in resultado:
+            st.success(f"{resultado['status']}. Linhas afetadas: {resultado.get('linhas_afetadas', 'N/A')}")
+            for aviso in resultado.get("avisos", []):
+                st.info(f"🛡️ {aviso}")
+        elif isinstance(resultado, ResultadoConsulta) and (len(resultado) > 0 or resultado.inicio > 0):
+            fim = resultado.inicio + len(resultado)
+            st.success(f"✅ Consulta realizada! Exibindo linhas {resultado.inicio + 1}–{fim}{' (há mais linhas)' if resultado.tem_mais else ''}.")
+            if resultado.truncado:
+                st.warning(f"Leitura interrompida: {resultado.motivo}.")
+            for aviso in getattr(resultado, "avisos", []):
+                st.info(f"🛡️ {aviso}")
+            exibir_tabela(resultado, f"pagina_{resultado.pagina + 1}")
+            # Cada página reexecuta a consulta em streaming e guarda só as linhas dela
+            paginacao_cols = st.columns([1, 2, 1])
+            nova_pagina_inicio = None
+            if resultado.inicio > 0 and paginacao_cols[0].button("◀ Anterior", key="btn_pagina_anterior", use_container_width=True):
+                nova_pagina_inicio = max(0, resultado.inicio - TAMANHO_PAGINA)
+            paginacao_cols[1].markdown(f"<p style='text-align: center;'>Página {resultado.inicio // TAMANHO_PAGINA + 1}</p>", unsafe_allow_html=True)
+            if resultado.tem_mais and paginacao_cols[2].button("Próxima ▶", key="btn_pagina_proxima", use_container_width=True):
+                nova_pagina_inicio = fim
+            if nova_pagina_inicio is not None:
+                with st.spinner("Carregando página..."), iniciar_rastro(st.session_state.pergunta, tipo="paginacao") as rastro:
+                    _, pagina = motor.executar(st.session_state.query_sql, inicio=nova_pagina_inicio)
+                st.session_state.ultimo_rastro = rastro.como_dicionario()
+                if isinstance(pagina, dict) and pagina.get("error"):
+                    st.error(f"Erro ao carregar página: {pagina['error']}")
+                else:
+                    guardar_resultado(pagina)
+                    st.rerun()
+        elif isinstance(resultado, ResultadoConsulta):
+            st.info("ℹ️ A consulta SQL foi executada, mas não retornou dados.")
+        elif isinstance(resultado, dict) and resultado.get("error"):
             pass # O erro já foi mostrado na lógica de execução
-        elif st.session_state.query_sql.strip().upper().startswith("SELECT"): 
+        elif retorna_linhas(st.session_state.query_sql): 
             st.info("ℹ️ A consulta SQL foi executada, mas não retornou dados (ou erro na execução).")
-        
+        # a tabela Arrow acabou de ser montada (e um download, se clicado): o armazém remede a sessão
+        armazem.atualizar_uso(st.session_state.id_sessao)
+        uso_sessao = armazem.uso(st.session_state.id_sessao)
+        st.sidebar.caption(f"💾 Resultado desta sessão: {uso_sessao['bytes_memoria'] / 1024:.0f} KB em memória · "
+                           f"{uso_sessao['bytes_disco'] / 1024:.0f} KB em disco")
+
         st.markdown("---")
         st.subheader("⭐ Feedback")
         feedback_key = f"fb_radio_main_{hash(st.session_state.pergunta)}_{hash(st.session_state.query_sql)}"
         feedback_selecionado = st.radio(
             "A resposta foi útil?", ("👍 Sim", "👎 Não"), index=None, key=feedback_key, horizontal=True
         )
-        if feedback_selecionado:
-            salvar_feedback_db(st.session_state.pergunta, feedback_selecionado, mysql_host, mysql_user, mysql_password, mysql_db_name_input)
+        # O radio continua marcado nos reruns seguintes; só grava quando o valor muda
+        if feedback_selecionado and st.session_state.feedback_enviado.get(feedback_key) != feedback_selecionado:
+            st.session_state.feedback_enviado = {feedback_key: feedback_selecionado}
+            motor.salvar_feedback(st.session_state.pergunta, feedback_selecionado, registro=st.session_state.registro_historico,
+                                  chave_cache_geracao=st.session_state.chave_cache_geracao)
             st.toast(f"Obrigado pelo seu feedback: '{feedback_selecionado}'!", icon="🙌")
 
+# --- PERFORMANCE (rastro da última pergunta) ---
+if st.session_state.ultimo_rastro:
+    rastro_exibido = st.session_state.ultimo_rastro
+    with st.expander(f"⏱️ Performance · {rastro_exibido['duracao_ms']:.0f} ms", expanded=False):
+        atributos_rastro = {k: v for span_ in rastro_exibido["spans"] for k, v in span_["atributos"].items()}
+        metricas_cols = st.columns(4)
+        metricas_cols[0].metric("Total", f"{rastro_exibido['duracao_ms']:.0f} ms")
+        metricas_cols[1].metric("Tokens (prompt/resposta)", f"{atributos_rastro.get('tokens_prompt', '—')} / {atributos_rastro.get('tokens_resposta', '—')}")
+        metricas_cols[2].metric("Linhas lidas", atributos_rastro.get("linhas", "—"))
+        metricas_cols[3].metric("Bytes lidos", atributos_rastro.get("bytes", "—"))
+        st.dataframe(pd.DataFrame([
+            {"estágio": span_["nome"], "início (ms)": span_["inicio_ms"], "duração (ms)": span_["duracao_ms"],
+             "detalhes": ", ".join(f"{k}={v}" for k, v in span_["atributos"].items())}
+            for span_ in sorted(rastro_exibido["spans"], key=lambda s: s["inicio_ms"])
+        ]), use_container_width=True, hide_index=True)
+        st.caption(f"Rastro {rastro_exibido['id']} ({rastro_exibido['tipo']})")
+
 # --- RODAPÉ ---
 st.markdown("---")
 footer_cols = st.columns([1,2,1])
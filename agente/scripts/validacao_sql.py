@@ -0,0 +1,236 @@
+import os
+import time
+from analise_sql import (tokenizar, dividir_instrucoes, primeira_palavra, normalizar_sql, referencias_tabelas, nomes_cte,
+                         nomes_definidos, uso_colunas, palavras_nivel_zero, estrutura_agrupamento, e_somente_leitura)
+from metricas import metricas
+
+# --- VALIDAÇÃO LOCAL (via .env) ---
+ATIVA = os.getenv("QUERYFLOW_VALIDACAO", "1") == "1"
+VALIDAR_GROUP_BY = os.getenv("QUERYFLOW_VALIDACAO_GROUP_BY", "1") == "1"  # o sql_mode padrão do MySQL 8 inclui ONLY_FULL_GROUP_BY
+
+COMANDOS_SQL = {
+    "SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE", "SHOW", "DESCRIBE", "DESC", "EXPLAIN", "TABLE", "VALUES",
+    "CREATE", "DROP", "ALTER", "TRUNCATE", "RENAME", "SET", "CALL", "START", "BEGIN", "COMMIT", "ROLLBACK", "USE",
+    "GRANT", "REVOKE", "LOCK", "UNLOCK", "ANALYZE", "OPTIMIZE", "DO",
+}
+_COMANDOS_COM_TABELAS = {"SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE", "TABLE"}
+# Palavras que o analisador de colunas pode tomar por coluna: unidades de INTERVAL, tipos do CAST, modificadores
+# (inclusive os do TRIM)
+_NAO_COLUNAS = {
+    "microsecond", "second", "minute", "hour", "day", "week", "month", "quarter", "year", "second_microsecond",
+    "minute_microsecond", "minute_second", "hour_microsecond", "hour_second", "hour_minute", "day_microsecond",
+    "day_second", "day_minute", "day_hour", "year_month", "char", "signed", "unsigned", "decimal", "date", "datetime",
+    "time", "json", "binary", "integer", "int", "double", "float", "nchar", "separator", "escape", "dual", "rollup",
+    "unknown", "current_date", "current_time", "current_timestamp", "localtime", "localtimestamp", "utc_date",
+    "utc_time", "utc_timestamp", "leading", "trailing", "both",
+}
+_TABELAS_SEM_CATALOGO = {"dual"}
+
+
+class ResultadoValidacao:
+    """Veredito da validação local: `erros` impedem a execução; `avisos` só são exibidos."""
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.instrucoes = dividir_instrucoes(sql)
+        self.normalizada = ";\n".join(normalizar_sql(i) for i in self.instrucoes)  # chave estável para caches
+        self.tabelas = set()  # tabelas do banco referenciadas (minúsculas), para invalidação de cache
+        self.erros = []
+        self.avisos = []
+        self.tempo_ms = 0.0
+
+    @property
+    def valida(self) -> bool:
+        return not self.erros
+
+    def como_dicionario(self) -> dict:
+        return {"valida": self.valida, "erros": self.erros, "avisos": self.avisos, "tabelas": sorted(self.tabelas),
+                "normalizada": self.normalizada, "tempo_ms": self.tempo_ms}
+
+
+def regras_do_contexto(contexto_prompt) -> set:
+    """Traduz as restrições em texto do prompt.json em verificações estruturais. Reconhece:
+    UPDATE/DELETE só com WHERE, ONLY_FULL_GROUP_BY e a preferência por apenas consultas (vira aviso).
+    DROP/CREATE/ALTER DATABASE é sempre bloqueado."""
+    regras = {"sem_ddl_banco"}
+    if VALIDAR_GROUP_BY:
+        regras.add("full_group_by")
+    if not isinstance(contexto_prompt, dict):
+        return regras
+    for item in contexto_prompt.get("restricoes", []) + contexto_prompt.get("instrucoes_sql", []):
+        texto = item.upper()
+        if "UPDATE" in texto and "WHERE" in texto:
+            regras.add("escrita_com_where")
+        if "ONLY_FULL_GROUP_BY" in texto:
+            regras.add("full_group_by")
+        if ("EVIT" in texto and "INSERT" in texto) or "APENAS CONSULTAS" in texto:
+            regras.add("preferir_consultas")
+    return regras
+
+
+def _verificar_comando(instrucao, numero, regras, resultado):
+    comando = primeira_palavra(instrucao)
+    if comando not in COMANDOS_SQL:
+        inicio = " ".join(t[1] for t in tokenizar(instrucao)[:6])
+        resultado.erros.append(f"Instrução {numero} não é SQL (resto de markdown ou texto explicativo?): '{inicio}…'")
+        return None
+    palavras = palavras_nivel_zero(instrucao)
+    if "sem_ddl_banco" in regras and comando in ("DROP", "CREATE", "ALTER") and palavras & {"DATABASE", "SCHEMA"}:
+        resultado.erros.append(f"Instrução {numero}: {comando} DATABASE não é permitido (restrição do prompt).")
+    if "escrita_com_where" in regras and comando in ("UPDATE", "DELETE") and "WHERE" not in palavras:
+        resultado.erros.append(f"Instrução {numero}: {comando} sem WHERE não é permitido (restrição do prompt).")
+    if "preferir_consultas" in regras and comando not in ("SELECT", "WITH", "SHOW", "DESCRIBE", "DESC", "EXPLAIN") \
+            and not e_somente_leitura(instrucao):
+        resultado.avisos.append(f"Instrução {numero} altera dados ({comando}); o prompt pede apenas consultas.")
+    return comando
+
+
+def _colunas(catalogo, tabela) -> set:
+    return {c["nome"].lower() for c in catalogo.tabelas[tabela]["colunas"]}
+
+
+def _verificar_referencias(instrucao, numero, catalogo, tabelas_catalogo, resultado):
+    """Resolve tabelas e colunas contra o catálogo; em caso de dúvida (CTE, tabela derivada, outro banco) não acusa erro."""
+    ctes = nomes_cte(instrucao)
+    definidos = nomes_definidos(instrucao)
+    banco = (getattr(catalogo, "nome_banco", "") or "").lower()
+    tabelas = {}  # alias ou nome -> tabela do catálogo
+    tokens = tokenizar(instrucao)
+    # tabelas derivadas ("FROM (SELECT ...) x") e CTEs têm colunas que o catálogo não conhece
+    incertas = bool(ctes) or any(t[1].upper() in ("FROM", "JOIN") and tokens[i + 1][1] == "(" for i, t in enumerate(tokens[:-1]))
+    for banco_ref, nome, alias in referencias_tabelas(instrucao):
+        nome_min = nome.lower()
+        if banco_ref and banco_ref.lower() != banco:
+            incertas = True  # information_schema, outro banco: fora do catálogo
+            continue
+        if nome_min in ctes or nome_min in _TABELAS_SEM_CATALOGO:
+            continue
+        tabela = tabelas_catalogo.get(nome_min)
+        if tabela is None:
+            erro = f"Instrução {numero}: tabela desconhecida '{nome}'."
+            if erro not in resultado.erros:
+                resultado.erros.append(erro)
+            incertas = True
+            continue
+        resultado.tabelas.add(nome_min)
+        tabelas[nome_min] = tabela
+        if alias:
+            tabelas[alias.lower()] = tabela
+    referenciadas = set(tabelas.values())
+    _, usos = uso_colunas(instrucao)
+    desconhecidas = []
+    for _, qualificador, coluna, _ in usos:
+        coluna_min = coluna.lower()
+        if coluna == "*" or coluna_min in _NAO_COLUNAS:
+            continue
+        if qualificador:
+            tabela = tabelas.get(qualificador)
+            if tabela is None:
+                if qualificador not in definidos and qualificador not in ctes and qualificador != banco and not incertas:
+                    desconhecidas.append(f"{qualificador}.{coluna} (tabela ou alias '{qualificador}' não aparece na instrução)")
+                continue
+            if coluna_min not in _colunas(catalogo, tabela):
+                desconhecidas.append(f"{qualificador}.{coluna} (não existe em '{tabela}')")
+        elif not incertas and coluna_min not in definidos and referenciadas and \
+                not any(coluna_min in _colunas(catalogo, t) for t in referenciadas):
+            desconhecidas.append(f"{coluna} (não existe em {', '.join(sorted(referenciadas))})")
+    for descricao in dict.fromkeys(desconhecidas):
+        resultado.erros.append(f"Instrução {numero}: coluna desconhecida {descricao}.")
+    return tabelas, incertas
+
+
+def _tabela_da_coluna(item, tabelas, catalogo):
+    if item["qualificador"]:
+        return tabelas.get(item["qualificador"])
+    donas = {t for t in set(tabelas.values()) if item["coluna"] in _colunas(catalogo, t)}
+    return donas.pop() if len(donas) == 1 else None
+
+
+def _fechar_dependencias(agrupadas, igualdades, tabelas, catalogo):
+    """Fecha o conjunto de colunas agrupadas: a = b com a agrupada determina b, e a chave primária inteira
+    agrupada determina a linha da tabela (marcada como (tabela, "*"))."""
+    pares = []
+    for esquerda, direita in igualdades:
+        lados = [(_tabela_da_coluna({"qualificador": q, "coluna": c}, tabelas, catalogo), c) for q, c in (esquerda, direita)]
+        if all(t is not None for t, _ in lados):
+            pares.append(lados)
+    mudou = True
+    while mudou:
+        mudou = False
+        for a, b in pares:
+            for origem, destino in ((a, b), (b, a)):
+                if origem in agrupadas and destino not in agrupadas:
+                    agrupadas.add(destino)
+                    mudou = True
+        for tabela in set(tabelas.values()):
+            chave = [c.lower() for c in catalogo.tabelas[tabela]["chave_primaria"]]
+            if (tabela, "*") not in agrupadas and chave and all((tabela, c) in agrupadas for c in chave):
+                agrupadas.update((tabela, c) for c in _colunas(catalogo, tabela))
+                agrupadas.add((tabela, "*"))
+                mudou = True
+
+
+def _verificar_group_by(instrucao, numero, tabelas, catalogo, resultado):
+    """ONLY_FULL_GROUP_BY: toda coluna da projeção está no GROUP BY, dentro de agregação ou é determinada
+    funcionalmente pelas agrupadas (chave primária e igualdades em ON/WHERE, como no MySQL 5.7+). É uma
+    heurística local, então o resultado é aviso: quem decide se a consulta roda é o MySQL."""
+    estrutura = estrutura_agrupamento(instrucao)
+    if estrutura is None:
+        return
+    projecao, agrupamento = estrutura["projecao"], estrutura["agrupamento"]
+    agregada = any(item["tipo"] == "expressao" and item["agregada"] for item in projecao)
+    if not estrutura["tem_group_by"]:
+        if agregada:
+            soltas = [item for item in projecao if item["tipo"] in ("coluna", "estrela")]
+            if soltas:
+                nome = soltas[0].get("coluna") or "*"
+                resultado.avisos.append(f"Instrução {numero}: '{nome}' aparece junto de agregações sem GROUP BY "
+                                       f"(incompatível com ONLY_FULL_GROUP_BY).")
+        return
+    agrupadas = set()  # (tabela ou None, coluna)
+    for item in agrupamento:
+        if item["tipo"] == "coluna":
+            agrupadas.add((_tabela_da_coluna(item, tabelas, catalogo), item["coluna"]))
+            agrupadas.add((None, item["coluna"]))
+        elif item["tipo"] == "posicao" and 0 < item["posicao"] <= len(projecao):
+            alvo = projecao[item["posicao"] - 1]
+            if alvo["tipo"] == "coluna":
+                agrupadas.add((_tabela_da_coluna(alvo, tabelas, catalogo), alvo["coluna"]))
+        elif item["tipo"] == "expressao":
+            return  # GROUP BY por expressão: a equivalência com a projeção fica para o MySQL
+    _fechar_dependencias(agrupadas, estrutura["igualdades"], tabelas, catalogo)
+    aliases_agrupados = {item["coluna"] for item in agrupamento if item["tipo"] == "coluna" and not item["qualificador"]}
+    for item in projecao:
+        if item["tipo"] != "coluna":
+            continue
+        tabela = _tabela_da_coluna(item, tabelas, catalogo)
+        if (tabela, item["coluna"]) in agrupadas or (not item["qualificador"] and (None, item["coluna"]) in agrupadas):
+            continue
+        if item["alias"] and item["alias"] in aliases_agrupados:
+            continue
+        if tabela is None or (tabela, "*") in agrupadas:
+            continue  # dona ambígua/desconhecida, ou linha da tabela determinada pela chave primária
+        nome = f"{item['qualificador']}.{item['coluna']}" if item["qualificador"] else item["coluna"]
+        resultado.avisos.append(f"Instrução {numero}: coluna '{nome}' não está no GROUP BY nem em uma agregação "
+                               f"(incompatível com ONLY_FULL_GROUP_BY).")
+
+
+def validar_sql(sql: str, catalogo=None, contexto_prompt=None) -> ResultadoValidacao:
+    """Analisa a SQL no processo, sem ir ao banco: comando reconhecível, restrições do prompt, tabelas e colunas
+    resolvidas no catálogo em memória e ONLY_FULL_GROUP_BY. Sem catálogo, só as verificações sintáticas rodam."""
+    inicio = time.perf_counter()
+    resultado = ResultadoValidacao(sql)
+    if not resultado.instrucoes:
+        resultado.erros.append("SQL vazia ou só com comentários.")
+    regras = regras_do_contexto(contexto_prompt)
+    tabelas_catalogo = {nome.lower(): nome for nome in getattr(catalogo, "tabelas", {})}
+    for numero, instrucao in enumerate(resultado.instrucoes, 1):
+        comando = _verificar_comando(instrucao, numero, regras, resultado)
+        if comando not in _COMANDOS_COM_TABELAS or not tabelas_catalogo:
+            continue
+        tabelas, incertas = _verificar_referencias(instrucao, numero, catalogo, tabelas_catalogo, resultado)
+        if "full_group_by" in regras and comando in ("SELECT", "WITH") and not incertas:
+            _verificar_group_by(instrucao, numero, tabelas, catalogo, resultado)
+    resultado.tempo_ms = round((time.perf_counter() - inicio) * 1000, 3)
+    metricas.incrementar("queryflow_validacao_total", resultado="valida" if resultado.valida else "invalida")
+    return resultado
@@ -1,144 +1,396 @@
+import argparse
 import csv
+import gzip
+import io
+import os
 import random
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import date
+from itertools import islice
 import mysql.connector
 from faker import Faker
-from datetime import datetime
-import os
 from dotenv import load_dotenv
 
-# Carregar credenciais do MYSQL e declarar variaveis
+# Carregar credenciais do MYSQL
 load_dotenv()
 database = os.getenv("MYSQL_DB")
-n = 1000
-
-# Conectar ao MySQL (sem especificar o banco de dados para criar o banco)
-conn = mysql.connector.connect(
-    host=os.getenv("MYSQL_HOST"),
-    user=os.getenv("MYSQL_USER"),
-    password= os.getenv("MYSQL_PASSWORD"),
-    port=os.getenv("MYSQL_PORT")
-)
-
-cursor = conn.cursor()
-
-# Criar o banco de dados se não existir
-cursor.execute(f"CREATE DATABASE IF NOT EXISTS {database}")
-conn.commit()
-
-# Agora, conectar ao banco de dados correto
-conn.database = database
-
-# Criar as tabelas no banco de dados
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS clientes (
-        cliente_id INT AUTO_INCREMENT PRIMARY KEY,
-        nome VARCHAR(100),
-        cpf VARCHAR(11),
-        email VARCHAR(100)
-    )
-""")
-
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS enderecos (
-        endereco_id INT AUTO_INCREMENT PRIMARY KEY,
-        cliente_id INT,
-        rua VARCHAR(255),
-        cidade VARCHAR(100),
-        estado VARCHAR(50),
-        cep VARCHAR(8),
-        FOREIGN KEY (cliente_id) REFERENCES clientes(cliente_id)
-    )
-""")
-
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS pagamentos (
-        pagamento_id INT AUTO_INCREMENT PRIMARY KEY,
-        cliente_id INT,
-        valor DECIMAL(10, 2),
-        data_pagamento DATE,
-        FOREIGN KEY (cliente_id) REFERENCES clientes(cliente_id)
-    )
-""")
-
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS movimentacoes (
-        movimentacao_id INT AUTO_INCREMENT PRIMARY KEY,
-        cliente_id INT,
-        tipo_movimentacao VARCHAR(50),
-        valor DECIMAL(10, 2),
-        data_movimentacao DATE,
-        FOREIGN KEY (cliente_id) REFERENCES clientes(cliente_id)
+
+CLIENTES_POR_ESCALA = 1000  # --scale 1 = 1000 clientes (o volume antigo), --scale 100 = 100 mil
+
+TABELAS = {
+    "clientes": ["cliente_id", "nome", "cpf", "email"],
+    "enderecos": ["endereco_id", "cliente_id", "rua", "cidade", "estado", "cep"],
+    "movimentacoes": ["movimentacao_id", "cliente_id", "tipo_movimentacao", "valor", "data_movimentacao"],
+    "pagamentos": ["pagamento_id", "cliente_id", "valor", "data_pagamento"],
+}
+
+
+def conectar(com_banco=True):
+    return mysql.connector.connect(
+        host=os.getenv("MYSQL_HOST"),
+        user=os.getenv("MYSQL_USER"),
+        password=os.getenv("MYSQL_PASSWORD"),
+        port=int(os.getenv("MYSQL_PORT", "3306")),
+        database=database if com_banco else None,
+        allow_local_infile=True,
     )
-""")
-
-# Inicializar o Faker para gerar dados fictícios
-fake = Faker()
-
-# Função para exportar os dados para CSV
-def export_to_csv(query, filename, headers):
-    cursor.execute(query)
-    data = cursor.fetchall()
-
-    if data:
-        with open(filename, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(headers)
-            writer.writerows(data)
-        print(f"Exportado para {filename}")
-    else:
-        print(f"Sem dados para exportar na consulta: {query}")
 
-# Gerar dados e inserir no banco de dados
-for linha in range(n):
-    nome = fake.name()
-    cpf = random.randint(11111111111,99999999999)
-    email = fake.email()
 
-    cursor.execute("""
-        INSERT INTO clientes (nome, cpf, email)
-        VALUES (%s, %s, %s)
-    """, (nome, cpf, email))
-    cliente_id = cursor.lastrowid
+def criar_banco_e_tabelas():
+    # Conectar ao MySQL sem especificar o banco de dados para criar o banco
+    conn = conectar(com_banco=False)
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS {database}")
+    conn.commit()
+    conn.database = database
 
-    # Gerar endereço
-    rua = fake.street_address()
-    cidade = fake.city()
-    estado = fake.state()
-    cep = fake.zipcode()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS clientes (
+            cliente_id INT AUTO_INCREMENT PRIMARY KEY,
+            nome VARCHAR(100),
+            cpf VARCHAR(11),
+            email VARCHAR(100)
+        )
+    """)
 
     cursor.execute("""
-        INSERT INTO enderecos (cliente_id, rua, cidade, estado, cep)
-        VALUES (%s, %s, %s, %s, %s)
-    """, (cliente_id, rua, cidade, estado, cep))
+        CREATE TABLE IF NOT EXISTS enderecos (
+            endereco_id INT AUTO_INCREMENT PRIMARY KEY,
+            cliente_id INT,
+            rua VARCHAR(255),
+            cidade VARCHAR(100),
+            estado VARCHAR(50),
+            cep VARCHAR(8),
+            FOREIGN KEY (cliente_id) REFERENCES clientes(cliente_id)
+        )
+    """)
 
-    # Gerar movimentação bancária
-    tipo_movimentacao = random.choice(['depósito', 'saque', 'transferência'])
-    valor = round(random.uniform(50.0, 5000.0), 2)
-    data_movimentacao = fake.date_this_year()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pagamentos (
+            pagamento_id INT AUTO_INCREMENT PRIMARY KEY,
+            cliente_id INT,
+            valor DECIMAL(10, 2),
+            data_pagamento DATE,
+            FOREIGN KEY (cliente_id) REFERENCES clientes(cliente_id)
+        )
+    """)
 
     cursor.execute("""
-        INSERT INTO movimentacoes (cliente_id, tipo_movimentacao, valor, data_movimentacao)
-        VALUES (%s, %s, %s, %s)
-    """, (cliente_id, tipo_movimentacao, valor, data_movimentacao))
+        CREATE TABLE IF NOT EXISTS movimentacoes (
+            movimentacao_id INT AUTO_INCREMENT PRIMARY KEY,
+            cliente_id INT,
+            tipo_movimentacao VARCHAR(50),
+            valor DECIMAL(10, 2),
+            data_movimentacao DATE,
+            FOREIGN KEY (cliente_id) REFERENCES clientes(cliente_id)
+        )
+    """)
+    cursor.close()
+    conn.close()
 
-    # Gerar pagamento
-    valor_pagamento = round(random.uniform(20.0, 1000.0), 2)
-    data_pagamento = fake.date_this_year()
 
-    cursor.execute("""
-        INSERT INTO pagamentos (cliente_id, valor, data_pagamento)
-        VALUES (%s, %s, %s)
-    """, (cliente_id, valor_pagamento, data_pagamento))
-
-# Commit as mudanças no banco
-conn.commit()
-
-# Exportar os dados das tabelas para CSV
-export_to_csv("SELECT * FROM clientes", 'banco_de_dados/datasets/clientes.csv', ['cliente_id', 'nome', 'cpf', 'email'])
-export_to_csv("SELECT * FROM enderecos", 'banco_de_dados/datasets/enderecos.csv', ['endereco_id', 'cliente_id', 'rua', 'cidade', 'estado', 'cep'])
-export_to_csv("SELECT * FROM movimentacoes", 'banco_de_dados/datasets/movimentacoes.csv', ['movimentacao_id', 'cliente_id', 'tipo_movimentacao', 'valor', 'data_movimentacao'])
-export_to_csv("SELECT * FROM pagamentos", 'banco_de_dados/datasets/pagamentos.csv', ['pagamento_id', 'cliente_id', 'valor', 'data_pagamento'])
-
-# Fechar a conexão com o banco de dados
-cursor.close()
-conn.close()
+def ler_ids_iniciais(cursor):
+    # Novos dados continuam a numeração existente; os ids são gerados aqui para os blocos serem independentes
+    ids = {}
+    for tabela, colunas in TABELAS.items():
+        cursor.execute(f"SELECT COALESCE(MAX({colunas[0]}), 0) FROM {tabela}")
+        ids[tabela] = cursor.fetchone()[0]
+    return ids
+
+
+# --- GERAÇÃO EM PARALELO ---
+_fake = None
+
+
+def _iniciar_trabalhador():
+    # Uma instância de Faker por processo; a semente é redefinida em cada bloco
+    global _fake
+    _fake = Faker()
+
+
+def gerar_bloco(parametros):
+    """Gera um bloco de clientes com ids explícitos. A semente depende só do índice do bloco,
+    então a saída é a mesma para qualquer número de processos."""
+    (indice, tamanho_bloco, qtd_clientes, ids_base, mov_por_cliente, pag_por_cliente, semente, ano, dir_csv) = parametros
+    fake = _fake or Faker()
+    fake.seed_instance(semente + indice)
+    rnd = random.Random(semente + indice)
+    inicio_ano, fim_ano = date(ano, 1, 1), date(ano, 12, 31)
+
+    primeiro = indice * tamanho_bloco
+    linhas = {tabela: [] for tabela in TABELAS}
+    for k in range(qtd_clientes):
+        n = primeiro + k  # posição global do cliente nesta execução
+        cliente_id = ids_base["clientes"] + n + 1
+        linhas["clientes"].append((cliente_id, fake.name(), str(rnd.randint(11111111111, 99999999999)), fake.email()))
+        linhas["enderecos"].append((ids_base["enderecos"] + n + 1, cliente_id, fake.street_address(), fake.city(),
+                                    fake.state(), fake.zipcode()))
+        for j in range(mov_por_cliente):
+            linhas["movimentacoes"].append((
+                ids_base["movimentacoes"] + n * mov_por_cliente + j + 1, cliente_id,
+                rnd.choice(['depósito', 'saque', 'transferência']), round(rnd.uniform(50.0, 5000.0), 2),
+                fake.date_between_dates(inicio_ano, fim_ano),
+            ))
+        for j in range(pag_por_cliente):
+            linhas["pagamentos"].append((
+                ids_base["pagamentos"] + n * pag_por_cliente + j + 1, cliente_id,
+                round(rnd.uniform(20.0, 1000.0), 2), fake.date_between_dates(inicio_ano, fim_ano),
+            ))
+
+    if dir_csv is None:
+        return indice, linhas
+    # Modo LOAD DATA: o próprio processo escreve os CSVs do bloco
+    arquivos = {}
+    for tabela, registros in linhas.items():
+        caminho = os.path.join(dir_csv, f"{tabela}_{indice:06d}.csv")
+        with open(caminho, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f, lineterminator="\n").writerows(registros)
+        arquivos[tabela] = (caminho, len(registros))
+    return indice, arquivos
+
+
+# --- CARGA NO BANCO ---
+def inserir_executemany(cursor, tabela, registros, tamanho_lote):
+    colunas = TABELAS[tabela]
+    sql = f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join(['%s'] * len(colunas))})"
+    for i in range(0, len(registros), tamanho_lote):
+        # o conector reescreve executemany de INSERT em um único INSERT de várias linhas
+        cursor.executemany(sql, registros[i:i + tamanho_lote])
+
+
+def inserir_load_data(cursor, tabela, caminho):
+    colunas = TABELAS[tabela]
+    cursor.execute(
+        f"LOAD DATA LOCAL INFILE %s INTO TABLE {tabela} CHARACTER SET utf8mb4 "
+        f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\n' ({', '.join(colunas)})",
+        (caminho,),
+    )
+    os.remove(caminho)
+
+
+def gerar_e_carregar(args):
+    criar_banco_e_tabelas()
+    conn = conectar()
+    cursor = conn.cursor()
+    # Os ids e as FKs já saem consistentes do gerador: sem checagens linha a linha durante a carga
+    cursor.execute("SET SESSION unique_checks = 0, foreign_key_checks = 0")
+    ids_base = ler_ids_iniciais(cursor)
+
+    total_clientes = int(args.scale * CLIENTES_POR_ESCALA)
+    qtd_blocos = (total_clientes + args.bloco - 1) // args.bloco
+    dir_csv = tempfile.mkdtemp(prefix="queryflow_carga_") if args.modo == "load-data" else None
+    print(f"Gerando {total_clientes} clientes em {qtd_blocos} bloco(s) com {args.workers} processo(s) (modo {args.modo})...")
+
+    inicio = time.perf_counter()
+    linhas_totais, linhas_desde_commit = 0, 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_iniciar_trabalhador) as executor:
+        # Os próximos blocos são gerados enquanto o atual é carregado; no máximo 2 por processo ficam em memória
+        pendentes = deque()
+        parametros = _parametros_blocos(args, total_clientes, ids_base, dir_csv)
+        for p in islice(parametros, 2 * args.workers):
+            pendentes.append(executor.submit(gerar_bloco, p))
+        while pendentes:
+            indice, dados = pendentes.popleft().result()
+            for p in islice(parametros, 1):
+                pendentes.append(executor.submit(gerar_bloco, p))
+            for tabela in TABELAS:  # clientes primeiro, por causa das FKs quando reativadas
+                if dir_csv is None:
+                    inserir_executemany(cursor, tabela, dados[tabela], args.lote)
+                    qtd = len(dados[tabela])
+                else:
+                    caminho, qtd = dados[tabela]
+                    inserir_load_data(cursor, tabela, caminho)
+                linhas_totais += qtd
+                linhas_desde_commit += qtd
+            if linhas_desde_commit >= args.commit_a_cada:
+                conn.commit()
+                linhas_desde_commit = 0
+            decorrido = time.perf_counter() - inicio
+            print(f"  bloco {indice + 1}/{qtd_blocos}: {linhas_totais} linhas, {linhas_totais / decorrido:,.0f} linhas/s")
+
+    conn.commit()
+    cursor.execute("SET SESSION unique_checks = 1, foreign_key_checks = 1")
+    decorrido = time.perf_counter() - inicio
+    print(f"Carga concluída: {linhas_totais} linhas em {decorrido:.1f}s ({linhas_totais / decorrido:,.0f} linhas/s)")
+    if dir_csv is not None:
+        try:
+            os.rmdir(dir_csv)
+        except OSError:
+            pass
+    return conn, cursor
+
+
+def _parametros_blocos(args, total_clientes, ids_base, dir_csv):
+    # Todos os blocos têm o tamanho nominal (o último pode ser menor), então os ids de cada um são calculáveis
+    for indice in range((total_clientes + args.bloco - 1) // args.bloco):
+        qtd = min(args.bloco, total_clientes - indice * args.bloco)
+        yield (indice, args.bloco, qtd, ids_base, args.movimentacoes_por_cliente, args.pagamentos_por_cliente, args.seed, args.ano, dir_csv)
+
+
+# --- EXPORTAÇÃO EM STREAMING ---
+DIR_DATASETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "datasets")
+EXTENSOES = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+SUFIXO_COMPRESSAO = {"nenhuma": "", "gzip": ".gz", "zstd": ".zst"}
+LINHAS_GRUPO_PARQUET = 128 * 1024  # linhas por row group: grupos de um lote só (10 mil) deixam o arquivo lento de ler
+
+
+def _tipo_arrow(pa, coluna):
+    # Mesmos tipos do DDL acima: *_id INT, valor DECIMAL(10, 2), data_* DATE, o resto VARCHAR
+    if coluna.endswith("_id"):
+        return pa.int32()
+    if coluna == "valor":
+        return pa.decimal128(10, 2)
+    if coluna.startswith("data_"):
+        return pa.date32()
+    return pa.string()
+
+
+def _abrir_texto(caminho, compressao):
+    if compressao == "gzip":
+        return gzip.open(caminho, "wt", newline="", encoding="utf-8", compresslevel=6)
+    if compressao == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("Compressão zstd requer o pacote 'zstandard' (pip install zstandard).")
+        bruto = open(caminho, "wb")
+        return io.TextIOWrapper(zstandard.ZstdCompressor(level=3).stream_writer(bruto), newline="", encoding="utf-8")
+    return open(caminho, "w", newline="", encoding="utf-8")
+
+
+@contextmanager
+def _escritor_colunar(caminho, tabela, formato, compressao):
+    """Abre o arquivo Parquet/Arrow e entrega `escrever(lote)`; o arquivo é fechado mesmo se a exportação falhar.
+    No Parquet os lotes do cursor são juntados até LINHAS_GRUPO_PARQUET linhas antes de virar um row group."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError(f"O formato {formato} requer o pacote 'pyarrow' (pip install pyarrow).")
+    schema = pa.schema([(c, _tipo_arrow(pa, c)) for c in TABELAS[tabela]])
+    if formato == "parquet":
+        escritor = pq.ParquetWriter(caminho, schema, compression="none" if compressao == "nenhuma" else compressao)
+    else:
+        if compressao == "gzip":
+            raise RuntimeError("Arrow IPC só suporta compressão zstd ou lz4.")
+        opcoes = pa.ipc.IpcWriteOptions(compression="zstd" if compressao == "zstd" else None)
+        escritor = pa.ipc.new_file(caminho, schema, options=opcoes)
+    pendentes = []
+
+    def descarregar(final=False):
+        # grupos cheios vão para o arquivo; a sobra espera o próximo lote (ou sai no fim)
+        tabela_pendente = pa.Table.from_batches(pendentes, schema=schema)
+        cheias = len(tabela_pendente) if final else len(tabela_pendente) // LINHAS_GRUPO_PARQUET * LINHAS_GRUPO_PARQUET
+        if cheias:
+            escritor.write_table(tabela_pendente.slice(0, cheias), row_group_size=LINHAS_GRUPO_PARQUET)
+        pendentes[:] = tabela_pendente.slice(cheias).to_batches()
+
+    def escrever(lote):
+        colunas = list(zip(*lote))
+        lote_arrow = pa.RecordBatch.from_arrays(
+            [pa.array(valores, type=campo.type) for valores, campo in zip(colunas, schema)], schema=schema)
+        if formato != "parquet":
+            escritor.write_batch(lote_arrow)
+            return
+        pendentes.append(lote_arrow)
+        if sum(len(p) for p in pendentes) >= LINHAS_GRUPO_PARQUET:
+            descarregar()
+
+    with escritor:
+        yield escrever
+        if pendentes:
+            descarregar(final=True)
+
+
+def exportar_tabela(tabela, destino=DIR_DATASETS, formato="csv", compressao="nenhuma", tamanho_lote=10000):
+    """Exporta uma tabela lendo em lotes de um cursor sem buffer: a memória usada é a de um lote,
+    qualquer que seja o tamanho da tabela. Abre a própria conexão para rodar em paralelo com as outras."""
+    sufixo = SUFIXO_COMPRESSAO[compressao] if formato == "csv" else ""
+    caminho = os.path.join(destino, tabela + EXTENSOES[formato] + sufixo)
+    inicio = time.perf_counter()
+    total = 0
+    # Para parquet/arrow, falta de pyarrow aparece antes de abrir a conexão
+    with _escritor_colunar(caminho, tabela, formato, compressao) if formato != "csv" else nullcontext() as escrever:
+        conn = conectar()
+        cursor = conn.cursor(buffered=False)  # as linhas vêm do servidor conforme o fetchmany pede
+        try:
+            cursor.execute(f"SELECT {', '.join(TABELAS[tabela])} FROM {tabela}")
+            if formato == "csv":
+                with _abrir_texto(caminho, compressao) as f:
+                    writer = csv.writer(f)
+                    writer.writerow(TABELAS[tabela])
+                    while True:
+                        lote = cursor.fetchmany(tamanho_lote)
+                        if not lote:
+                            break
+                        writer.writerows(lote)
+                        total += len(lote)
+            else:
+                while True:
+                    lote = cursor.fetchmany(tamanho_lote)
+                    if not lote:
+                        break
+                    escrever(lote)
+                    total += len(lote)
+        finally:
+            cursor.close()
+            conn.close()
+    return caminho, total, time.perf_counter() - inicio
+
+
+def exportar_tabelas(destino=DIR_DATASETS, formato="csv", compressao="nenhuma", workers=len(TABELAS)):
+    """Exporta as quatro tabelas em paralelo, uma conexão e um processo por tabela."""
+    os.makedirs(destino, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(TABELAS)))) as executor:
+        futuros = {tabela: executor.submit(exportar_tabela, tabela, destino, formato, compressao) for tabela in TABELAS}
+        for tabela, futuro in futuros.items():
+            try:
+                caminho, total, segundos = futuro.result()
+            except Exception as e:
+                print(f"Erro ao exportar {tabela}: {e}")
+                continue
+            if total:
+                print(f"Exportado para {caminho} ({total} linhas em {segundos:.1f}s)")
+            else:
+                print(f"Sem dados para exportar na tabela: {tabela}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera a massa de dados fictícia do QueryFlow no MySQL.")
+    parser.add_argument("--scale", type=float, default=1, help="Fator de escala: 1 = 1000 clientes, 100 = 100 mil")
+    parser.add_argument("--movimentacoes-por-cliente", type=int, default=1)
+    parser.add_argument("--pagamentos-por-cliente", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processos geradores")
+    parser.add_argument("--bloco", type=int, default=5000, help="Clientes por bloco de geração")
+    parser.add_argument("--lote", type=int, default=2000, help="Linhas por INSERT no modo executemany")
+    parser.add_argument("--commit-a-cada", type=int, default=100000, help="Linhas entre commits")
+    parser.add_argument("--modo", choices=["executemany", "load-data"], default="executemany",
+                        help="load-data usa LOAD DATA LOCAL INFILE (requer local_infile=ON no servidor)")
+    parser.add_argument("--seed", type=int, default=42, help="Semente para saída reprodutível")
+    parser.add_argument("--ano", type=int, default=2025, help="Ano das datas geradas")
+    parser.add_argument("--sem-exportar", action="store_true", help="Não exporta os CSVs de banco_de_dados/datasets")
+    parser.add_argument("--somente-exportar", action="store_true", help="Só exporta as tabelas já existentes")
+    parser.add_argument("--formato", choices=list(EXTENSOES), default="csv",
+                        help="parquet/arrow requerem pyarrow")
+    parser.add_argument("--compressao", choices=list(SUFIXO_COMPRESSAO), default="nenhuma",
+                        help="zstd requer o pacote zstandard (CSV) ou pyarrow (parquet/arrow)")
+    parser.add_argument("--destino", default=DIR_DATASETS, help="Diretório dos arquivos exportados")
+    args = parser.parse_args()
+
+    if not args.somente_exportar:
+        conn, cursor = gerar_e_carregar(args)
+        # Fechar a conexão com o banco de dados
+        cursor.close()
+        conn.close()
+
+    if not args.sem_exportar:
+        # Exportar os dados das tabelas (cada uma pela própria conexão, em paralelo)
+        exportar_tabelas(args.destino, args.formato, args.compressao, args.workers)
+
+
+if __name__ == "__main__":
+    main()
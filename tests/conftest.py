@@ -0,0 +1,25 @@
+import os
+import sys
+import types
+
+# Os módulos do agente são importados pelo nome, como quando os scripts rodam de dentro de agente/scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "agente", "scripts"))
+
+# cliente_gemini importa google.generativeai no topo; os testes não chamam o Gemini
+try:
+    import google.generativeai  # noqa: F401
+except ImportError:
+    google = sys.modules.setdefault("google", types.ModuleType("google"))
+    genai = types.ModuleType("google.generativeai")
+    genai.configure = lambda **_: None
+    genai.GenerativeModel = lambda *a, **k: None
+    google.generativeai = genai
+    sys.modules["google.generativeai"] = genai
+
+# load_dotenv só é chamado pelo main() dos scripts; os testes configuram tudo pelos parâmetros
+try:
+    import dotenv  # noqa: F401
+except ImportError:
+    dotenv = types.ModuleType("dotenv")
+    dotenv.load_dotenv = lambda *a, **k: False
+    sys.modules["dotenv"] = dotenv
@@ -0,0 +1,54 @@
+from analise_sql import tabelas_referenciadas, e_somente_leitura, retorna_linhas, paginar, colunas_desempate, dividir_instrucoes
+from cache_resultados import consulta_cacheavel
+
+
+def test_tabelas_de_cte_subconsulta_e_juncao():
+    sql = ("WITH t AS (SELECT cliente_id FROM movimentacoes) SELECT c.nome FROM clientes c "
+           "JOIN t ON t.cliente_id = c.cliente_id WHERE c.cliente_id IN (SELECT cliente_id FROM pagamentos)")
+    assert tabelas_referenciadas(sql) == {"clientes", "movimentacoes", "pagamentos"}
+    assert tabelas_referenciadas("SELECT EXTRACT(YEAR FROM data_pagamento) FROM pagamentos") == {"pagamentos"}
+
+
+def test_divisao_ignora_ponto_e_virgula_em_string_e_comentario():
+    assert dividir_instrucoes("SELECT ';' FROM a; UPDATE b SET x = 1; -- fim") == ["SELECT ';' FROM a", "UPDATE b SET x = 1"]
+    assert dividir_instrucoes("-- só comentário") == []
+
+
+def test_funcoes_replace_e_insert_sao_leitura():
+    for sql in ("SELECT REPLACE(nome, 'a', 'b') FROM clientes", "SELECT INSERT(cpf, 4, 3, '***') FROM clientes",
+                "SELECT x FROM (SELECT REPLACE(nome, 'a', 'b') AS x FROM clientes) s"):
+        assert e_somente_leitura(sql) and retorna_linhas(sql), sql
+        assert consulta_cacheavel(sql), sql
+
+
+def test_escritas_e_travas_continuam_recusadas():
+    for sql in ("REPLACE INTO clientes VALUES (1, 'a')", "WITH t AS (SELECT 1) DELETE FROM clientes",
+                "SELECT * FROM clientes FOR UPDATE", "SELECT * FROM clientes INTO OUTFILE '/tmp/x'",
+                "SELECT 1; DELETE FROM clientes"):
+        assert not e_somente_leitura(sql), sql
+
+
+CHAVES = {"clientes": ["cliente_id"], "enderecos": ["endereco_id"], "movimentacoes": []}
+
+
+def test_paginacao_sem_order_by_nao_ordena():
+    assert paginar("SELECT nome, cpf FROM clientes", 500, 500) == "SELECT nome, cpf FROM clientes LIMIT 500, 500"
+    assert colunas_desempate("SELECT nome FROM clientes", CHAVES) == ["`clientes`.`cliente_id`"]
+    # o desempate só entra quando já existe um ORDER BY
+    assert paginar("SELECT nome FROM clientes", 0, 10, ["`clientes`.`cliente_id`"]) == "SELECT nome FROM clientes LIMIT 0, 10"
+
+
+def test_order_by_ganha_chave_primaria_e_respeita_limite_existente():
+    sql = "SELECT c.nome FROM clientes c JOIN enderecos e ON e.cliente_id = c.cliente_id ORDER BY c.nome LIMIT 700;"
+    desempate = colunas_desempate(sql, CHAVES)
+    assert desempate == ["`c`.`cliente_id`", "`e`.`endereco_id`"]
+    # o LIMIT 700 da SQL deixa só 200 linhas para a segunda página
+    assert paginar(sql, 500, 500, desempate) == ("SELECT c.nome FROM clientes c JOIN enderecos e ON e.cliente_id = "
+                                                 "c.cliente_id ORDER BY c.nome, `c`.`cliente_id`, `e`.`endereco_id` LIMIT 500, 200;")
+
+
+def test_sem_desempate_quando_a_chave_nao_cabe_no_order_by():
+    for sql in ("SELECT DISTINCT nome FROM clientes ORDER BY nome", "SELECT uf, COUNT(*) FROM enderecos GROUP BY uf ORDER BY 2",
+                "SELECT COUNT(*) FROM clientes ORDER BY 1", "SELECT x FROM (SELECT nome AS x FROM clientes) d ORDER BY x",
+                "SELECT valor FROM movimentacoes ORDER BY valor"):
+        assert colunas_desempate(sql, CHAVES) == [], sql
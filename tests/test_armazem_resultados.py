@@ -0,0 +1,31 @@
+import os
+import pytest
+from execucao_sql import ResultadoConsulta
+from armazem_resultados import ArmazemResultados
+
+
+def _resultado(linhas):
+    return ResultadoConsulta(("id", "nome"), [(i, f"cliente {i}") for i in range(linhas)])
+
+
+def test_resultado_grande_vai_para_o_disco_e_volta_inteiro(tmp_path):
+    pytest.importorskip("pyarrow")  # o descarregamento grava Arrow IPC
+    armazem = ArmazemResultados(linhas_memoria=10, linhas_inicio=3, diretorio=str(tmp_path))
+    original = _resultado(50)
+    guardado = armazem.guardar("sessao", original)
+    assert guardado.arquivo and os.path.exists(guardado.arquivo)
+    assert len(guardado) == 50 and guardado.linhas == original.linhas
+    assert original.arquivo is None  # o original (talvez no cache de resultados) não muda
+    armazem.descartar("sessao")
+    assert not os.path.exists(guardado.arquivo)
+
+
+def test_orcamento_global_despeja_a_sessao_menos_usada(tmp_path):
+    pequeno = _resultado(5)
+    armazem = ArmazemResultados(memoria_max=int(pequeno.bytes_em_memoria * 2.5), diretorio=str(tmp_path))
+    armazem.guardar("a", pequeno)
+    armazem.guardar("b", _resultado(5))
+    armazem.obter("a")  # "b" passa a ser a menos usada
+    armazem.guardar("c", _resultado(5))
+    assert armazem.obter("b") is None
+    assert armazem.obter("a") is not None and armazem.obter("c") is not None
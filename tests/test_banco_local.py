@@ -0,0 +1,44 @@
+import pytest
+from banco_local import BancoLocal, traduzir_sql
+from execucao_sql import ResultadoLote
+
+SQL_FUNCOES_MYSQL = "SELECT IF(COUNT(*) > 0, 'sim', 'nao'), RAND() < 1, REPLACE(MIN(nome), 'x', 'x') IS NOT NULL FROM clientes"
+
+
+@pytest.fixture(scope="module")
+def banco():
+    return BancoLocal(motor="sqlite")
+
+
+def test_paginas_do_banco_local(banco):
+    primeira = banco.executar("SELECT cliente_id FROM clientes ORDER BY cliente_id", inicio=0)
+    segunda = banco.executar("SELECT cliente_id FROM clientes ORDER BY cliente_id", inicio=len(primeira))
+    assert primeira.tem_mais and not segunda.tem_mais
+    ids = [l[0] for l in primeira.linhas + segunda.linhas]
+    assert ids == sorted(set(ids)) and len(ids) == len(primeira) + len(segunda)
+
+
+def test_funcoes_if_e_rand_do_mysql(banco):
+    assert list(banco.executar(SQL_FUNCOES_MYSQL).linhas) == [("sim", 1, 1)]
+
+
+def test_funcoes_if_e_rand_no_duckdb():
+    pytest.importorskip("duckdb")
+    banco = BancoLocal(motor="duckdb")
+    assert banco.motor == "duckdb"
+    assert list(banco.executar(SQL_FUNCOES_MYSQL).linhas) == [("sim", True, True)]
+
+
+def test_somente_leitura_e_lote(banco):
+    with pytest.raises(ValueError):
+        banco.executar("DELETE FROM clientes")
+    with pytest.raises(ValueError):
+        banco.executar("SELECT 1; UPDATE clientes SET nome = 'x'")
+    lote = banco.executar("SELECT COUNT(*) FROM clientes; SELECT COUNT(*) FROM enderecos")
+    assert isinstance(lote, ResultadoLote) and len(lote) == 2
+
+
+def test_traducao_do_dialeto():
+    assert traduzir_sql("SELECT `nome` FROM `db`.clientes LIMIT 10, 5", "duckdb", "db") == \
+        'SELECT "nome" FROM clientes LIMIT 5 OFFSET 10'
+    assert traduzir_sql("SELECT nome FROM clientes LIMIT 10, 5", "sqlite") == "SELECT nome FROM clientes LIMIT 10, 5"
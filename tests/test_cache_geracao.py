@@ -0,0 +1,12 @@
+from cache_geracao import normalizar_pergunta
+
+
+def test_operadores_mudam_a_chave():
+    assert normalizar_pergunta("Clientes com saldo > 1000") != normalizar_pergunta("Clientes com saldo < 1000")
+    assert normalizar_pergunta("saldo >= 10") != normalizar_pergunta("saldo > 10")
+    assert normalizar_pergunta("variação de -5%") == "variacao menos 5 porcento"
+
+
+def test_acentos_caixa_e_palavras_vazias_nao_mudam_a_chave():
+    assert normalizar_pergunta("Me mostre todos os clientes, por favor!") == normalizar_pergunta("mostre todos clientes")
+    assert normalizar_pergunta("Movimentações em São Paulo") == normalizar_pergunta("movimentacoes sao paulo")
@@ -0,0 +1,73 @@
+from cache_resultados import CacheResultados, consulta_cacheavel, ler_marcadores
+from execucao_sql import ResultadoConsulta
+
+
+class CursorMarcadores:
+    """Responde à consulta de marcadores com as linhas de um information_schema.TABLES falso."""
+
+    def __init__(self, tabelas):
+        self.tabelas = tabelas
+        self.linhas = []
+
+    def execute(self, sql, parametros=None):
+        if "information_schema" in sql:
+            pedidas = parametros[1:]
+            self.linhas = [(nome, *self.tabelas[nome]) for nome in pedidas if nome in self.tabelas]
+
+    def fetchall(self):
+        return self.linhas
+
+    def close(self):
+        pass
+
+
+class ConexaoMarcadores:
+    def __init__(self, tabelas):
+        self.tabelas = tabelas
+
+    def cursor(self):
+        return CursorMarcadores(self.tabelas)
+
+
+def _resultado():
+    return ResultadoConsulta(("id",), [(1,), (2,)])
+
+
+def test_escrita_muda_o_marcador_e_invalida():
+    tabelas = {"clientes": ("2024-01-01|2024-05-01 10:00:00", 0, 1)}
+    conn = ConexaoMarcadores(tabelas)
+    cache = CacheResultados()
+    marcadores = ler_marcadores(conn, "banco", {"clientes"})
+    assert cache.guardar("k", "SELECT id FROM clientes", _resultado(), marcadores)
+    assert cache.obter("k", ler_marcadores(conn, "banco", {"clientes"})) is not None
+    tabelas["clientes"] = ("2024-01-01|2024-05-01 10:00:07", 0, 1)
+    assert cache.obter("k", ler_marcadores(conn, "banco", {"clientes"})) is None
+    assert cache.estatisticas["invalidadas"] == 1
+
+
+def test_view_tabela_ausente_e_escrita_recente_nao_sao_guardadas():
+    conn = ConexaoMarcadores({
+        "clientes": ("2024-01-01|2024-05-01 10:00:00", 0, 1),
+        "resumo_clientes": ("2024-01-01|", 0, 0),  # view: sem UPDATE_TIME
+        "movimentacoes": ("2024-01-01|2024-05-01 10:00:00", 1, 1),
+    })
+    cache = CacheResultados()
+    for tabelas in ({"clientes", "resumo_clientes"}, {"clientes", "nao_existe"}, {"movimentacoes"}):
+        marcadores = ler_marcadores(conn, "banco", tabelas)
+        assert not cache.guardar("k", "SELECT 1", _resultado(), marcadores)
+    assert cache.estatisticas["recusadas"] == 3
+
+
+def test_invalidacao_explicita_por_tabela():
+    cache = CacheResultados()
+    cache.guardar("k", "SELECT id FROM clientes", _resultado(), {"clientes": "a|b"})
+    cache.invalidar_tabelas({"CLIENTES"})
+    assert cache.obter("k", {"clientes": "a|b"}) is None
+
+
+def test_consulta_cacheavel():
+    assert consulta_cacheavel("SELECT nome FROM clientes WHERE cliente_id = 1")
+    assert not consulta_cacheavel("SELECT NOW(), nome FROM clientes")
+    assert not consulta_cacheavel("UPDATE clientes SET nome = 'x' WHERE cliente_id = 1")
+    assert not consulta_cacheavel("SELECT * FROM outro_banco.clientes")
+    assert not consulta_cacheavel("SELECT EXTRACT(YEAR FROM NOW())")
@@ -0,0 +1,35 @@
+import sys
+import time
+import types
+import pytest
+import catalogo_schema
+import pool_conexoes
+from catalogo_schema import CatalogoSchema, obter_catalogo
+
+
+class ConexaoFalsa:
+    def close(self):
+        pass
+
+
+def test_catalogo_em_cache_nao_vai_para_senha_errada(monkeypatch):
+    def connect(password=None, **_):
+        if password == "errada":
+            raise PermissionError("Access denied")
+        return ConexaoFalsa()
+
+    mysql = types.ModuleType("mysql")
+    mysql.connector = types.ModuleType("mysql.connector")
+    mysql.connector.connect = connect
+    monkeypatch.setitem(sys.modules, "mysql", mysql)
+    monkeypatch.setitem(sys.modules, "mysql.connector", mysql.connector)
+    monkeypatch.setattr(pool_conexoes, "_pools", {})
+    # catálogo já carregado e dentro do intervalo de verificação: nenhuma sonda ao information_schema
+    catalogo = CatalogoSchema("db")
+    catalogo.tabelas = {"clientes": {"colunas": [], "chave_primaria": [], "chaves_estrangeiras": [], "indices": {}}}
+    catalogo.ultima_verificacao = time.monotonic()
+    monkeypatch.setattr(catalogo_schema, "_catalogos", {("h", "u", "db"): catalogo})
+
+    assert obter_catalogo("h", "u", "certa", "db") is catalogo
+    with pytest.raises(PermissionError):
+        obter_catalogo("h", "u", "errada", "db")
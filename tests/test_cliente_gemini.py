@@ -0,0 +1,37 @@
+import threading
+import cliente_gemini
+from cliente_gemini import obter_modelo, gerar_em_streaming
+
+
+class Pedaco:
+    def __init__(self, text):
+        self.text = text
+
+
+def test_primeira_chamada_de_cada_modelo_usa_a_propria_chave(monkeypatch):
+    configurada = {}
+
+    class ModeloFalso:
+        def __init__(self, model_name, generation_config):
+            self.chave_do_cliente = None
+
+        def generate_content(self, prompt, stream=False, request_options=None):
+            # como o SDK: o cliente padrão é pego na primeira chamada e guardado
+            if self.chave_do_cliente is None:
+                self.chave_do_cliente = configurada["api_key"]
+            return iter([Pedaco("SELECT 1;")])
+
+    monkeypatch.setattr(cliente_gemini.genai, "configure", lambda api_key: configurada.update(api_key=api_key))
+    monkeypatch.setattr(cliente_gemini.genai, "GenerativeModel", ModeloFalso)
+    monkeypatch.setattr(cliente_gemini, "_chave_configurada", None)
+    modelo_a = obter_modelo("chave-a", "gemini-teste-chaves")
+    modelo_b = obter_modelo("chave-b", "gemini-teste-chaves")
+    assert modelo_a is not modelo_b and obter_modelo("chave-a", "gemini-teste-chaves") is modelo_a
+    threads = [threading.Thread(target=gerar_em_streaming, args=(m, "p")) for m in (modelo_b, modelo_a)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert (modelo_a.chave_do_cliente, modelo_b.chave_do_cliente) == ("chave-a", "chave-b")
+    # a chave configurada depois não muda o cliente que o modelo já guardou
+    assert gerar_em_streaming(modelo_a, "p")[0] == "SELECT 1;" and modelo_a.chave_do_cliente == "chave-a"
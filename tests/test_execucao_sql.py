@@ -0,0 +1,90 @@
+import sqlite3
+import pytest
+from execucao_sql import ler_pagina, executar_lote, ResultadoConsulta
+
+
+@pytest.fixture
+def cursor():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (id INTEGER, texto TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?, ?)", [(i, "x" * 10) for i in range(25)])
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, texto FROM t ORDER BY id")
+    yield cursor
+    conn.close()
+
+
+def test_pagina_do_meio_para_na_primeira_linha_seguinte(cursor):
+    linhas, parou_cedo, truncado, _, lidas, _ = ler_pagina(cursor, inicio=10, tamanho_pagina=5, tamanho_lote=4)
+    assert [l[0] for l in linhas] == [10, 11, 12, 13, 14]
+    assert parou_cedo and not truncado
+    assert lidas == 15
+
+
+def test_ultima_pagina_e_linhas_puladas_pelo_servidor(cursor):
+    # o cursor já começa na linha 20 (LIMIT 20, n no servidor)
+    cursor.execute("SELECT id, texto FROM t ORDER BY id LIMIT 20, 10")
+    linhas, parou_cedo, truncado, _, lidas, _ = ler_pagina(cursor, inicio=20, tamanho_pagina=10, puladas=20)
+    assert [l[0] for l in linhas] == [20, 21, 22, 23, 24]
+    assert not parou_cedo and not truncado and lidas == 5
+
+
+def test_limites_de_linhas_e_de_bytes(cursor):
+    _, parou_cedo, truncado, motivo, _, _ = ler_pagina(cursor, tamanho_pagina=100, max_linhas=8)
+    assert parou_cedo and truncado and "8 linhas" in motivo
+    cursor.execute("SELECT id, texto FROM t ORDER BY id")
+    linhas, _, truncado, motivo, _, _ = ler_pagina(cursor, tamanho_pagina=100, max_bytes=100)
+    assert truncado and "MB" in motivo and len(linhas) < 25
+
+
+
+class CursorMultiplo:
+    """Cursor do conector novo: execute() aceita várias instruções e os resultados seguintes vêm por nextset()."""
+
+    def __init__(self, resultados):
+        self.resultados = resultados
+        self.enviado = None
+
+    def execute(self, sql, multi=None):
+        if multi is not None:
+            raise TypeError("execute() got an unexpected keyword argument 'multi'")
+        self.enviado = sql
+        self._atual = 0
+
+    def _resultado(self):
+        return self.resultados[self._atual]
+
+    @property
+    def with_rows(self):
+        return "linhas" in self._resultado()
+
+    @property
+    def column_names(self):
+        return self._resultado().get("colunas")
+
+    @property
+    def rowcount(self):
+        return self._resultado().get("afetadas", -1)
+
+    def fetchmany(self, n):
+        linhas = self._resultado()["linhas"]
+        lote, self._resultado()["linhas"] = linhas[:n], linhas[n:]
+        return lote
+
+    def nextset(self):
+        self._atual += 1
+        return self._atual < len(self.resultados) or None
+
+    def close(self):
+        pass
+
+
+def test_lote_envia_tudo_de_uma_vez_e_limita_cada_leitura():
+    cursor = CursorMultiplo([{"afetadas": 1}, {"colunas": ("id",), "linhas": [(i,) for i in range(5)]}])
+    conn = type("Conexao", (), {"cursor": lambda self, buffered=None: cursor})()
+    lote = executar_lote(conn, ["UPDATE t SET x = 1 WHERE id = 1", "SELECT id FROM t"], max_linhas=3)
+    assert cursor.enviado == "UPDATE t SET x = 1 WHERE id = 1\n;\nSELECT id FROM t LIMIT 4"
+    assert lote.resultados[0] == {"status": "Comando executado com sucesso", "linhas_afetadas": 1}
+    leitura = lote.resultados[1]
+    assert isinstance(leitura, ResultadoConsulta) and [l[0] for l in leitura.linhas] == [0, 1, 2]
+    assert leitura.truncado and "3 linhas" in leitura.motivo
@@ -0,0 +1,86 @@
+import threading
+import pytest
+import gateway_llm
+from gateway_llm import GatewayLLM, Balde, CotaGeminiError
+
+
+class Pedaco:
+    def __init__(self, text):
+        self.text = text
+
+
+class ModeloFalso:
+    """generate_content(stream=True) que pode segurar a resposta até `liberar` e falhar nas primeiras chamadas."""
+
+    def __init__(self, texto="SELECT 1;", falhas=()):
+        self.texto = texto
+        self.falhas = list(falhas)
+        self.chamadas = 0
+        self.chamado = threading.Event()
+        self.liberar = threading.Event()
+        self.liberar.set()
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        self.chamadas += 1
+        self.chamado.set()
+        if self.falhas:
+            raise self.falhas.pop(0)
+        self.liberar.wait(5)
+        return iter([Pedaco(self.texto)])
+
+
+def test_balde_enche_de_forma_continua():
+    balde = Balde(60)
+    balde.consumir(60)
+    agora = balde._atualizado
+    assert balde.espera_para(1, agora) == pytest.approx(1.0)
+    assert balde.espera_para(1, agora + 1.0) == pytest.approx(0.0)
+    # pedido maior que a capacidade espera só o balde cheio
+    assert balde.espera_para(600, agora + 1.0) == pytest.approx(59.0)
+
+
+def test_pedidos_identicos_simultaneos_fazem_uma_chamada(monkeypatch):
+    gateway = GatewayLLM()
+    modelo = ModeloFalso()
+    modelo.liberar.clear()
+    acompanhando = threading.Event()
+    acompanhar = gateway_llm._Voo.acompanhar
+
+    def acompanhar_avisando(voo, *args, **kwargs):
+        acompanhando.set()
+        return acompanhar(voo, *args, **kwargs)
+
+    monkeypatch.setattr(gateway_llm._Voo, "acompanhar", acompanhar_avisando)
+    respostas = []
+    lider = threading.Thread(target=lambda: respostas.append(gateway.gerar(modelo, "prompt")[0]))
+    lider.start()
+    assert modelo.chamado.wait(5)
+    carona = threading.Thread(target=lambda: respostas.append(gateway.gerar(modelo, "prompt")[0]))
+    carona.start()
+    assert acompanhando.wait(5)
+    modelo.liberar.set()
+    lider.join(5)
+    carona.join(5)
+    assert respostas == ["SELECT 1;", "SELECT 1;"] and modelo.chamadas == 1
+    # prompts diferentes não se juntam
+    gateway.gerar(modelo, "outro prompt")
+    assert modelo.chamadas == 2
+
+
+def test_cota_esgotada_recusa_depois_da_espera_maxima():
+    gateway = GatewayLLM(rpm=1, espera_max=0.05)
+    modelo = ModeloFalso()
+    gateway.gerar(modelo, "primeira")
+    with pytest.raises(CotaGeminiError):
+        gateway.gerar(modelo, "segunda")
+    assert modelo.chamadas == 1
+
+
+def test_erro_transitorio_e_repetido_e_permanente_nao():
+    gateway = GatewayLLM(espera_base=0.0)
+    modelo = ModeloFalso(falhas=[ConnectionError("reset")])
+    assert gateway.gerar(modelo, "p")[0] == "SELECT 1;" and modelo.chamadas == 2
+    modelo = ModeloFalso(falhas=[ValueError("API key not valid")])
+    with pytest.raises(ValueError):
+        gateway.gerar(modelo, "p")
+    assert modelo.chamadas == 1
@@ -0,0 +1,102 @@
+import sys
+import types
+from contextlib import contextmanager
+import pytest
+import gravador_historico
+import pool_conexoes
+from gravador_historico import GravadorHistorico, obter_gravador
+
+
+class BancoFalso:
+    """Guarda as linhas de historico_interacoes; uma pergunta "ruim" faz a instrução falhar."""
+
+    def __init__(self):
+        self.linhas = []
+        self.instrucoes = 0
+        self.conexoes = 0
+
+    @contextmanager
+    def abrir(self):
+        self.conexoes += 1
+        yield ConexaoFalsa(self)
+
+
+class ConexaoFalsa:
+    def __init__(self, banco):
+        self.banco = banco
+        self.pendentes = []
+
+    def cursor(self):
+        return CursorFalso(self)
+
+    def commit(self):
+        self.banco.linhas.extend(self.pendentes)
+        self.pendentes = []
+
+
+class CursorFalso:
+    def __init__(self, conn):
+        self.conn = conn
+        self.lastrowid = None
+
+    def executemany(self, sql, linhas):
+        self.conn.banco.instrucoes += 1
+        if any(linha[0] == "ruim" for linha in linhas):
+            raise ValueError("Incorrect string value")
+        self.lastrowid = len(self.conn.banco.linhas) + len(self.conn.pendentes) + 1
+        self.conn.pendentes.extend(linhas)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def sem_ddl(monkeypatch):
+    # migrar() e o modo de auto-incremento dependem do MySQL; aqui os ids são sempre consecutivos
+    def aplicar(self, conn):
+        self._ids_consecutivos, self._incremento, self._ddl_aplicada = True, 1, True
+    monkeypatch.setattr(GravadorHistorico, "_aplicar_ddl", aplicar)
+    monkeypatch.setattr(gravador_historico, "TENTATIVAS", 1)
+
+
+def test_interacoes_seguidas_viram_um_insert_com_ids():
+    banco = BancoFalso()
+    gravador = GravadorHistorico(banco.abrir, espera_lote=0.2)
+    registros = [gravador.registrar_interacao(f"p{i}", "SELECT 1", {"status": "ok"}) for i in range(5)]
+    gravador.fechar()
+    assert [r.id for r in registros] == [1, 2, 3, 4, 5]
+    assert all(r.gravado.is_set() for r in registros)
+    assert banco.instrucoes == 1 and [linha[0] for linha in banco.linhas] == ["p0", "p1", "p2", "p3", "p4"]
+    assert gravador.resumo()["gravados"] == 5 and gravador.resumo()["lotes"] == 1
+
+
+def test_registro_ruim_nao_derruba_o_lote():
+    banco = BancoFalso()
+    gravador = GravadorHistorico(banco.abrir, espera_lote=0.2)
+    registros = [gravador.registrar_interacao(p, "SELECT 1", {"status": "ok"}) for p in ("a", "ruim", "b")]
+    gravador.fechar()
+    assert [linha[0] for linha in banco.linhas] == ["a", "b"]
+    assert registros[0].gravado.is_set() and not registros[1].gravado.is_set()
+    resumo = gravador.resumo()
+    assert resumo["gravados"] == 2 and resumo["descartados_erro"] == 1
+
+
+def test_senha_errada_nao_troca_a_conexao_do_gravador(monkeypatch):
+    def connect(password=None, **_):
+        if password == "errada":
+            raise PermissionError("Access denied")
+        return types.SimpleNamespace(senha=password, close=lambda: None)
+
+    mysql = types.ModuleType("mysql")
+    mysql.connector = types.ModuleType("mysql.connector")
+    mysql.connector.connect = connect
+    monkeypatch.setitem(sys.modules, "mysql", mysql)
+    monkeypatch.setitem(sys.modules, "mysql.connector", mysql.connector)
+    monkeypatch.setattr(pool_conexoes, "_pools", {})
+    monkeypatch.setattr(gravador_historico, "_gravadores", {})
+    gravador = obter_gravador("h", "u", "certa", "db")
+    with pytest.raises(PermissionError):
+        obter_gravador("h", "u", "errada", "db")
+    with gravador._abrir_conexao() as conn:
+        assert conn.senha == "certa"
+    gravador.fechar()
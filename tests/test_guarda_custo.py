@@ -0,0 +1,89 @@
+import json
+import time
+import pytest
+import guarda_custo
+from analise_sql import adicionar_limite
+from execucao_sql import MAX_LINHAS
+from guarda_custo import preparar_execucao, limite_execucao, ConsultaInterrompidaError, TEMPO_MAX_MS
+
+
+def _plano(custo, linhas, acesso="ALL"):
+    return {"query_block": {"cost_info": {"query_cost": str(custo)},
+                            "table": {"table_name": "movimentacoes", "access_type": acesso, "rows_examined_per_scan": linhas}}}
+
+
+class ConexaoExplain:
+    """Responde EXPLAIN FORMAT=JSON com um plano fixo e conta quantos foram pedidos."""
+
+    def __init__(self, plano):
+        self.plano = plano
+        self.explains = 0
+
+    def cursor(self):
+        conexao = self
+
+        class Cursor:
+            linhas = []
+
+            def execute(self, sql):
+                assert sql.startswith("EXPLAIN FORMAT=JSON ")
+                conexao.explains += 1
+                self.linhas = [(json.dumps(conexao.plano),)]
+
+            def fetchone(self):
+                return self.linhas.pop(0) if self.linhas else None
+
+            def close(self):
+                pass
+
+        return Cursor()
+
+
+def test_limite_entra_antes_do_comentario_e_nao_duplica():
+    assert adicionar_limite("SELECT * FROM a -- c", 10) == "SELECT * FROM a LIMIT 10 -- c"
+    assert adicionar_limite("SELECT * FROM a LIMIT 5", 10) is None
+
+
+def test_leitura_cara_e_reescrita_e_escrita_cara_rejeitada():
+    conn = ConexaoExplain(_plano(guarda_custo.CUSTO_REESCREVER * 2, 10))
+    decisao = preparar_execucao(conn, "SELECT * FROM movimentacoes", escopo=("h", "u", "reescrita"))
+    assert decisao.decisao == "reescrever"
+    assert decisao.query_sql == (f"SELECT /*+ MAX_EXECUTION_TIME({TEMPO_MAX_MS}) */ * FROM movimentacoes "
+                                 f"LIMIT {MAX_LINHAS + 1}")
+    assert any("varredura completa em movimentacoes" in aviso for aviso in decisao.avisos)
+    escrita = preparar_execucao(conn, "DELETE FROM movimentacoes WHERE valor < 0", escopo=("h", "u", "reescrita"))
+    assert escrita.rejeitada and escrita.query_sql == "DELETE FROM movimentacoes WHERE valor < 0"
+
+
+def test_consulta_acima_do_maximo_e_rejeitada_e_barata_passa_intacta():
+    caro = ConexaoExplain(_plano(1.0, guarda_custo.LINHAS_MAX * 2))
+    assert preparar_execucao(caro, "SELECT * FROM movimentacoes", escopo=("h", "u", "maximo")).rejeitada
+    barato = ConexaoExplain(_plano(10.0, 10, acesso="ref"))
+    decisao = preparar_execucao(barato, "SELECT * FROM movimentacoes WHERE cliente_id = 1", escopo=("h", "u", "maximo"))
+    assert decisao.decisao == "aceitar" and decisao.query_sql.endswith("cliente_id = 1") and decisao.avisos == []
+
+
+def test_proximas_paginas_reaproveitam_a_decisao():
+    conn = ConexaoExplain(_plano(10.0, 10))
+    escopo = ("h", "u", "paginas")
+    primeira = preparar_execucao(conn, "SELECT * FROM clientes", escopo=escopo)
+    assert preparar_execucao(conn, "select *  from clientes", escopo=escopo, paginacao=True) is primeira
+    assert conn.explains == 1
+    preparar_execucao(conn, "SELECT * FROM clientes", escopo=("h", "u", "outro banco"), paginacao=True)
+    assert conn.explains == 2
+
+
+def test_prazo_estourado_vira_kill_e_erro_proprio(monkeypatch):
+    mortas = []
+    monkeypatch.setattr(guarda_custo, "MARGEM_KILL_S", 0.0)
+    monkeypatch.setattr(guarda_custo, "cancelar_consulta", lambda conn, aux: mortas.append(conn))
+    with pytest.raises(ConsultaInterrompidaError):
+        with limite_execucao("conn", None, tempo_ms=10) as expirou:
+            assert expirou.wait(2)
+            raise RuntimeError("Query execution was interrupted")
+    assert mortas == ["conn"]
+    # instrução que termina dentro do prazo não recebe KILL depois
+    with limite_execucao("outra", None, tempo_ms=10):
+        pass
+    time.sleep(0.05)
+    assert mortas == ["conn"]
@@ -0,0 +1,95 @@
+import sys
+import types
+import pytest
+import pool_conexoes
+from pool_conexoes import PoolConexoes, PoolEsgotadoError, obter_pool
+
+
+class ConexaoFalsa:
+    def __init__(self, senha="certa"):
+        self.senha = senha
+        self.fechada = False
+        self.in_transaction = False
+
+    def ping(self, **_):
+        pass
+
+    def rollback(self):
+        self.in_transaction = False
+
+    def close(self):
+        self.fechada = True
+
+
+@pytest.fixture
+def mysql_falso(monkeypatch):
+    """mysql.connector falso: só a senha "errada" é recusada."""
+    abertas = []
+
+    def connect(password=None, **_):
+        if password == "errada":
+            raise PermissionError("Access denied")
+        abertas.append(ConexaoFalsa(password))
+        return abertas[-1]
+
+    mysql = types.ModuleType("mysql")
+    mysql.connector = types.ModuleType("mysql.connector")
+    mysql.connector.connect = connect
+    monkeypatch.setitem(sys.modules, "mysql", mysql)
+    monkeypatch.setitem(sys.modules, "mysql.connector", mysql.connector)
+    monkeypatch.setattr(pool_conexoes, "_pools", {})
+    return abertas
+
+
+def test_checkout_reaproveita_e_esgota():
+    pool = PoolConexoes(ConexaoFalsa, tamanho=1, tempo_espera=0.05, verificar=lambda c: True)
+    primeira = pool.obter()
+    with pytest.raises(PoolEsgotadoError):
+        pool.obter()
+    pool.devolver(primeira)
+    assert pool.obter() is primeira
+    assert pool.resumo()["criadas"] == 1 and pool.resumo()["reutilizadas"] == 1
+
+
+def test_conexao_transacao_aberta_e_descartada_volta_certo():
+    pool = PoolConexoes(ConexaoFalsa, tamanho=2, verificar=lambda c: True)
+    conn = pool.obter()
+    conn.in_transaction = True
+    pool.devolver(conn)
+    assert not conn.in_transaction  # rollback antes de voltar para o pool
+    conn = pool.obter()
+    conn.reutilizavel = False
+    pool.devolver(conn)
+    assert conn.fechada and pool.resumo()["abertas"] == 0
+
+
+def test_troca_de_fabrica_descarta_conexoes_da_geracao_anterior():
+    pool = PoolConexoes(ConexaoFalsa, tamanho=2, verificar=lambda c: True)
+    em_uso, livre = pool.obter(), pool.obter()
+    pool.devolver(livre)
+    pool.trocar_fabrica(lambda: ConexaoFalsa("nova"))
+    assert livre.fechada and not em_uso.fechada
+    pool.devolver(em_uso)
+    assert em_uso.fechada and pool.resumo()["abertas"] == 0
+    assert pool.obter().senha == "nova"
+
+
+def test_senha_errada_nao_derruba_o_pool(mysql_falso):
+    pool = obter_pool("h", "u", "certa", "db")
+    pool.devolver(pool.obter())
+    with pytest.raises(PermissionError):
+        obter_pool("h", "u", "errada", "db")
+    conn = pool.obter()
+    assert conn.senha == "certa" and not conn.fechada
+    pool.devolver(conn)
+
+
+def test_senha_nova_valida_troca_as_conexoes_do_mesmo_pool(mysql_falso):
+    pool = obter_pool("h", "u", "certa", "db")
+    antiga = pool.obter()
+    pool.devolver(antiga)
+    assert obter_pool("h", "u", "nova", "db") is pool
+    assert antiga.fechada
+    # a conexão de teste da senha nova já entra como livre
+    assert pool.obter() is mysql_falso[-1] and mysql_falso[-1].senha == "nova"
+    assert len(pool_conexoes._pools) == 1
@@ -0,0 +1,22 @@
+import types
+import pre_aquecimento
+from pre_aquecimento import iniciar_pre_aquecimento, parar_pre_aquecimento
+
+
+def test_outra_senha_nao_para_o_aquecedor_existente(monkeypatch):
+    monkeypatch.setattr(pre_aquecimento, "ATIVO", True)
+    catalogo = types.SimpleNamespace(impressao="x")
+
+    def iniciar(senha):
+        return iniciar_pre_aquecimento(("mysql", "h", "u", "db", "modelo"), ["Quantos clientes?"], lambda: catalogo,
+                                       lambda pergunta, cat: "Erro: sem Gemini", lambda sql: {}, credenciais=(senha, "k"))
+
+    try:
+        certo = iniciar("certa")
+        errado = iniciar("errada")
+        assert errado is not certo and certo.ativo and errado.ativo
+        assert iniciar("certa") is certo
+        assert len(pre_aquecimento._aquecedores) == 2
+    finally:
+        parar_pre_aquecimento()
+    assert not pre_aquecimento._aquecedores
@@ -0,0 +1,38 @@
+import zlib
+import struct
+from execucao_sql import ResultadoConsulta, ResultadoLote
+from schema_historico import compactar_resultado, ler_previa, comprimir
+
+
+def test_previa_limitada_com_total_esquema_e_hash():
+    resultado = ResultadoConsulta(("id", "valor"), [(i, i * 1.5) for i in range(100)])
+    compacto = compactar_resultado(resultado, linhas_previa=5)
+    previa = ler_previa(compacto["previa"])
+    assert previa["linhas"] == [[i, i * 1.5] for i in range(5)] and previa["total"] == 100
+    assert compacto["linhas"] == 100
+    assert compacto["colunas"] == '[{"nome": "id", "tipo": "BIGINT"}, {"nome": "valor", "tipo": "DOUBLE"}]'
+    assert len(compacto["hash"]) == 32
+
+
+def test_hash_igual_para_resultado_vivo_e_json_antigo():
+    vivo = ResultadoConsulta(("id", "nome"), [(1, "Ana"), (2, "Bia")])
+    antigo = [{"id": 1, "nome": "Ana"}, {"id": 2, "nome": "Bia"}]  # formato gravado antes da compactação
+    assert compactar_resultado(vivo)["hash"] == compactar_resultado(antigo)["hash"]
+
+
+def test_teto_em_bytes_e_lote():
+    lote = ResultadoLote(["SELECT texto FROM t", "UPDATE t SET x = 1"],
+                         [ResultadoConsulta(("texto",), [("x" * 1000,)] * 20), {"linhas_afetadas": 3}])
+    compacto = compactar_resultado(lote, linhas_previa=20, bytes_previa=4000)
+    previa = ler_previa(compacto["previa"])
+    assert previa["tipo"] == "lote" and compacto["linhas"] == 20
+    assert len(previa["instrucoes"][0]["resultado"]["linhas"]) < 4
+    assert previa["instrucoes"][1]["resultado"] == {"tipo": "status", "linhas_afetadas": 3}
+
+
+def test_formato_do_compress_do_mysql():
+    dados = b'{"a": 1}'
+    comprimido = comprimir(dados)
+    assert struct.unpack("<I", comprimido[:4])[0] == len(dados)
+    assert zlib.decompress(comprimido[4:]) == dados
+    assert comprimir(b"") == b""
@@ -0,0 +1,31 @@
+import os
+import pytest
+from banco_local import BancoLocal
+from prompt_sql import carregar_contexto_prompt
+from selecao_schema import IndiceSchema, selecionar_schema
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def indice():
+    # schema do create_table.py (o mesmo do banco local) e as dicas do prompt.json do projeto
+    catalogo = BancoLocal(motor="sqlite").catalogo()
+    dicas = carregar_contexto_prompt(os.path.join(RAIZ, "protocolos", "prompt.json"))["instrucoes_sql"]
+    return IndiceSchema(catalogo, dicas)
+
+
+@pytest.mark.parametrize("pergunta", ["Qual o email dos clientes de Curitiba?", "Quais clientes moram em São Paulo?"])
+def test_cidade_do_cliente_traz_enderecos(indice, pergunta):
+    texto, relatorio = selecionar_schema(indice, pergunta)
+    assert {"clientes", "enderecos"} <= set(relatorio["tabelas_selecionadas"])
+    assert "enderecos(" in texto and "cidade" in texto
+
+
+def test_filhas_so_entram_se_couberem(indice):
+    # pagamentos não tem filhas: só a tabela pai (clientes) entra junto
+    _, relatorio = selecionar_schema(indice, "Quais pagamentos foram feitos em 2023?")
+    assert relatorio["tabelas_selecionadas"] == ["pagamentos", "clientes"]
+    _, relatorio = selecionar_schema(indice, "Qual o email dos clientes de Curitiba?", orcamento_tokens=40)
+    # filhas opcionais que não cabem ficam de fora sem virar "omitidas"
+    assert relatorio["tabelas_selecionadas"] == ["clientes"] and relatorio["tabelas_omitidas_orcamento"] == []
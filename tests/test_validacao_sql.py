@@ -0,0 +1,36 @@
+from validacao_sql import validar_sql
+
+
+class CatalogoFalso:
+    nome_banco = "banco_queryflow"
+    tabelas = {
+        "clientes": {"colunas": [{"nome": "cliente_id"}, {"nome": "nome"}, {"nome": "cpf"}], "chave_primaria": ["cliente_id"]},
+        "movimentacoes": {"colunas": [{"nome": "id"}, {"nome": "cliente_id"}, {"nome": "valor"}, {"nome": "data_pagamento"}],
+                          "chave_primaria": ["id"]},
+    }
+
+
+def test_from_dentro_de_funcao_nao_e_tabela():
+    resultado = validar_sql("SELECT EXTRACT(YEAR FROM data_pagamento) AS ano, SUM(valor) FROM movimentacoes "
+                            "GROUP BY EXTRACT(YEAR FROM data_pagamento)", CatalogoFalso())
+    assert resultado.valida, resultado.erros
+    assert resultado.tabelas == {"movimentacoes"}
+    resultado = validar_sql("SELECT TRIM(LEADING '0' FROM cpf) FROM clientes", CatalogoFalso())
+    assert resultado.valida, resultado.erros
+
+
+def test_group_by_com_dependencia_pela_chave_da_juncao():
+    resultado = validar_sql("SELECT m.cliente_id, c.nome, MAX(m.valor) FROM movimentacoes m "
+                            "JOIN clientes c ON c.cliente_id = m.cliente_id GROUP BY m.cliente_id", CatalogoFalso())
+    assert resultado.valida and not resultado.avisos
+
+
+def test_group_by_incompleto_so_avisa():
+    resultado = validar_sql("SELECT cliente_id, valor, COUNT(*) FROM movimentacoes GROUP BY cliente_id", CatalogoFalso())
+    assert resultado.valida
+    assert any("ONLY_FULL_GROUP_BY" in aviso for aviso in resultado.avisos)
+
+
+def test_tabela_desconhecida_bloqueia_uma_vez():
+    resultado = validar_sql("SELECT * FROM contas, contas", CatalogoFalso())
+    assert resultado.erros == ["Instrução 1: tabela desconhecida 'contas'."]